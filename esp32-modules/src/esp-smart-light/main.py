@@ -6,12 +6,18 @@ import os
 from machine import Pin, reset
 from umqtt.simple import MQTTClient
 import random
+import compact
 
 # Constants
 client_id = "L-21.09-0001"
 csv_file = "buffer.csv"
+FLUSH_BATCH_READINGS = 50    # Buffered readings per message when flushing csv_file
 T_SENSOR_PUBLISH = b"sensor/publish"
+T_SENSOR_PUBLISH_COMPACT = b"sensor/publish/mp"
 T_SENSOR_CTRL_PREFIX = b"sensor/update/" + client_id.encode()
+T_SENSOR_GROUP_PREFIX = b"sensor/group/"
+T_SENSOR_GROUPS_REPORT = b"sensor/groups/" + client_id.encode()
+groups_file = "groups.json"
 S_TYPE = 'light'
 
 # Load config
@@ -22,6 +28,31 @@ except Exception as e:
     print("Config load failed:", e)
     reset()
 
+# "compact": true in config.json sends readings in the compact binary form
+COMPACT = config.get("compact", False)
+
+# User-defined groups (rooms, ...) the core assigned to this module
+def load_groups():
+    try:
+        with open(groups_file) as f:
+            return ujson.load(f)
+    except Exception:
+        return []
+
+groups = load_groups()
+regroup = False
+
+def save_groups(new_groups):
+    global groups, regroup
+    groups = new_groups
+    try:
+        with open(groups_file, "w") as f:
+            ujson.dump(groups, f)
+    except Exception as e:
+        print("Groups save failed:", e)
+    # Subscribed again by the main loop, not from inside the MQTT callback
+    regroup = True
+
 # Setup Wi-Fi
 wlan = network.WLAN(network.STA_IF)
 wlan.active(True)
@@ -84,6 +115,14 @@ def connect_mqtt():
         client.connect()
         client.subscribe(T_SENSOR_CTRL_PREFIX)
         print("MQTT connected and subscribed:", T_SENSOR_CTRL_PREFIX)
+
+        # Batch commands reach every module of a group with one publish
+        subscribed = ["category/" + S_TYPE] + groups
+        for group in subscribed:
+            client.subscribe(T_SENSOR_GROUP_PREFIX + group.encode())
+        # Retained, the core sends group commands once the report arrives
+        client.publish(T_SENSOR_GROUPS_REPORT, ujson.dumps({"groups": subscribed}), True)
+        print("Subscribed to groups:", subscribed)
         return True
     except Exception as e:
         print("MQTT connection failed:", e)
@@ -97,6 +136,13 @@ last_button_state = 1
 brightness = 3
 
 
+def publish_reading(msg):
+    if COMPACT:
+        client.publish(T_SENSOR_PUBLISH_COMPACT, compact.encode(msg))
+    else:
+        client.publish(T_SENSOR_PUBLISH, ujson.dumps(msg))
+
+
 def save_to_csv(timestamp, state):
     try:
         data = {
@@ -117,6 +163,8 @@ def save_to_csv(timestamp, state):
             print("Failed to create CSV")
 
 def flush_csv():
+    # The buffered readings go out FLUSH_BATCH_READINGS at a time, as version 2
+    # (batch) messages the core stores in one transaction each
     try:
         if csv_file not in os.listdir():
             return
@@ -125,15 +173,30 @@ def flush_csv():
             lines = f.readlines()
         os.remove(csv_file)
         
+        readings = []
         for line in lines:
             try:
                 msg_obj = ujson.loads(line.strip())
-                client.publish(T_SENSOR_PUBLISH, ujson.dumps(msg_obj))
-                print("Flushed:", msg_obj)
-                time.sleep(0.1)
+                readings.append({k: v for k, v in msg_obj.items() if k not in ("type", "client_id")})
             except Exception as e:
                 print("Failed to process line:", line, "Error:", e)
-                save_to_csv(msg_obj["time"], msg_obj["data"])
+
+        for i in range(0, len(readings), FLUSH_BATCH_READINGS):
+            batch = readings[i:i + FLUSH_BATCH_READINGS]
+            try:
+                publish_reading({
+                    "v": 2,
+                    "type": S_TYPE,
+                    "client_id": client_id,
+                    "readings": batch
+                })
+                print("Flushed", len(batch), "readings")
+            except Exception as e:
+                print("Flush publish failed:", e)
+                # Keep what wasn't sent for the next flush
+                for reading in readings[i:]:
+                    save_to_csv(reading["time"], reading["data"])
+                return
                 
     except Exception as e:
         print("Flush failed:", e)
@@ -162,7 +225,7 @@ def mqtt_submit_current_state():
     if mqtt_ok:
         try:
             flush_csv()
-            client.publish(T_SENSOR_PUBLISH, ujson.dumps(msg))
+            publish_reading(msg)
             print(f"Published: {msg}")
         except Exception as e:
             print("Publish failed, saving to CSV:", e)
@@ -186,6 +249,13 @@ def mqtt_callback(topic, msg):
 
     try:
         payload = ujson.loads(msg)
+
+        if "groups" in payload:
+            save_groups(payload["groups"])
+            return
+        # A group command reaches the other categories of the group too
+        if payload.get("category", S_TYPE) != S_TYPE:
+            return
         
         # Normalize the command to uppercase
         cmd = payload["state"].upper()
@@ -218,12 +288,12 @@ client.subscribe(T_SENSOR_CTRL_PREFIX + ("/").encode() + client_id.encode())
 
 now = time.localtime()
 timestamp = "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(*now[:6])
-client.publish(T_SENSOR_PUBLISH, ujson.dumps({
+publish_reading({
                 "client_id": client_id,
                 "type": S_TYPE,
                 "time": timestamp,
                 "data": "imOnline",
-            }));
+            });
 
 # Main loop
 while True:
@@ -235,6 +305,9 @@ while True:
             print("MQTT check_msg error:", e)
             mqtt_ok = connect_mqtt()
 
+        if regroup:
+            regroup = False
+            mqtt_ok = connect_mqtt()
         
         now = time.localtime()
         timestamp = "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(*now[:6])
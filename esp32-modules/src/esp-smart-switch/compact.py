@@ -0,0 +1,93 @@
+# Compact (MessagePack) form of the sensor/publish messages, published on
+# sensor/publish/mp. Same payload with one letter keys and "time" as seconds
+# since 1970-01-01 UTC. The core decodes it with src/sensor/compact.py.
+import struct
+
+KEYS = {"v": "v", "client_id": "c", "type": "k", "time": "t", "data": "d", "power": "p", "readings": "r"}
+
+
+def epoch(timestamp):
+    # "YYYY-MM-DD HH:MM:SS" (UTC) -> seconds since 1970, whatever epoch the port's time module uses
+    y, m, d = int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10])
+    y -= m <= 2
+    era = y // 400
+    yoe = y - era * 400
+    doy = (153 * (m + (-3 if m > 2 else 9)) + 2) // 5 + d - 1
+    days = era * 146097 + yoe * 365 + yoe // 4 - yoe // 100 + doy - 719468
+    return days * 86400 + int(timestamp[11:13]) * 3600 + int(timestamp[14:16]) * 60 + int(timestamp[17:19])
+
+
+def _shorten(data):
+    short = {}
+    for key, value in data.items():
+        if key == "time" and isinstance(value, str):
+            value = epoch(value)
+        elif key == "readings":
+            value = [_shorten(reading) for reading in value]
+        short[KEYS.get(key, key)] = value
+    return short
+
+
+def _pack(obj, out):
+    if obj is None:
+        out.append(b'\xc0')
+    elif obj is True:
+        out.append(b'\xc3')
+    elif obj is False:
+        out.append(b'\xc2')
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x80:
+            out.append(bytes([obj]))
+        elif -32 <= obj < 0:
+            out.append(bytes([obj & 0xff]))
+        elif 0 <= obj <= 0xff:
+            out.append(struct.pack('>BB', 0xcc, obj))
+        elif 0 <= obj <= 0xffff:
+            out.append(struct.pack('>BH', 0xcd, obj))
+        elif 0 <= obj <= 0xffffffff:
+            out.append(struct.pack('>BI', 0xce, obj))
+        elif -0x80 <= obj < 0:
+            out.append(struct.pack('>Bb', 0xd0, obj))
+        elif -0x8000 <= obj < 0:
+            out.append(struct.pack('>Bh', 0xd1, obj))
+        elif -0x80000000 <= obj < 0:
+            out.append(struct.pack('>Bi', 0xd2, obj))
+        elif obj > 0:
+            out.append(struct.pack('>BQ', 0xcf, obj))
+        else:
+            out.append(struct.pack('>Bq', 0xd3, obj))
+    elif isinstance(obj, float):
+        single = struct.pack('>f', obj)
+        if struct.unpack('>f', single)[0] == obj:
+            out.append(b'\xca' + single)
+        else:
+            out.append(struct.pack('>Bd', 0xcb, obj))
+    elif isinstance(obj, str):
+        data = obj.encode('utf-8')
+        n = len(data)
+        if n < 32:
+            out.append(bytes([0xa0 | n]))
+        elif n <= 0xff:
+            out.append(struct.pack('>BB', 0xd9, n))
+        else:
+            out.append(struct.pack('>BH', 0xda, n))
+        out.append(data)
+    elif isinstance(obj, (list, tuple)):
+        n = len(obj)
+        out.append(bytes([0x90 | n]) if n < 16 else struct.pack('>BH', 0xdc, n))
+        for item in obj:
+            _pack(item, out)
+    elif isinstance(obj, dict):
+        n = len(obj)
+        out.append(bytes([0x80 | n]) if n < 16 else struct.pack('>BH', 0xde, n))
+        for key in obj:
+            _pack(key, out)
+            _pack(obj[key], out)
+    else:
+        raise TypeError("Can't encode value")
+
+
+def encode(data):
+    out = []
+    _pack(_shorten(data), out)
+    return b''.join(out)
@@ -1,11 +1,24 @@
 import os
 from utils.console import *
-from ai.predict import ai_predict, load_model
+from ai.predict import ai_predict, read_model
+from ai.scheduler import InferenceScheduler
+from ai.feature_window import FeatureWindow
+from ai.runtime import load_runtime
+from ai.model_manager import ModelManager
 from datetime import datetime
 from sensor.topics import *
 import json
 import time
-from database.database import db_get_light_sensor_names, db_get_radar_current_data
+from threading import Thread
+from database.database import db_get_light_sensor_names, db_get_radar_current_data, db_get_light_and_temp_sensors, \
+    db_save_predictions, db_score_predictions
+
+AI_TICK_SECONDS = 10   # How often the loop checks for new readings and model updates
+AI_INFERENCE_BACKEND = os.getenv("AI_INFERENCE_BACKEND", "keras")   # keras, function or tflite
+PREDICTION_SCORE_SECONDS = 5 * 60   # How often predictions are scored against the readings that followed
+
+# Model input kept up to date from published readings while init_ai runs
+feature_window = None
 
 
 def adjust_predictions(preds, radar, light_keys):
@@ -44,10 +57,13 @@ def run_predictions_and_publish(model, client):
     # Function to run predictions and publish data
     try:
         print("Running predictions...")
-        results = ai_predict(model)
+        results = ai_predict(model) if feature_window is None else ai_predict(model, feature_window)
 
         if results:
             print("Predictions completed successfully.")
+            # The model's own output goes to the history, so its accuracy can be tracked
+            db_save_predictions(datetime.now().strftime('%Y-%m-%d %H:%M:%S'), results)
+
             light_keys = db_get_light_sensor_names()
             radar_data = db_get_radar_current_data()
 
@@ -68,27 +84,62 @@ def run_predictions_and_publish(model, client):
     except Exception as e:
         print(f"Exception in run_predictions_and_publish: {e}")
 
-def init_ai(client):
-    global model
+def init_ai(client, backend=AI_INFERENCE_BACKEND):
+    global model, scheduler, feature_window, model_manager
     model_h5_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model.h5")
     new_model_h5_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_new.h5")
-    model = load_model(model_h5_path)
-
-    while True:
-        try:
-            if os.path.isfile(new_model_h5_path):
-                print(f"{YELLOW}New version found, Updating to new model{RESET}")
-                if os.path.isfile(model_h5_path):
-                    os.remove(model_h5_path)
-                os.rename(new_model_h5_path, model_h5_path)
-                model = load_model(model_h5_path)
-                # TODO : Improve the update logic
-            
-            print(f"{GREEN}Using {model_h5_path}{RESET}")
-            run_predictions_and_publish(model, client)
-        except Exception as e:
-            print(f"Exception in main: {e}")
-
-        print(f"Waiting for 15 mins before running again... (Current time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')})")
-        time.sleep(10)
 
+    # New models are loaded and validated in the background, predictions keep
+    # using the current one until the swap
+    model_manager = ModelManager(model_h5_path, new_model_h5_path,
+                                 load=lambda path: load_runtime(path, backend, read_model),
+                                 layout=db_get_light_and_temp_sensors)
+    model = model_manager.load_initial()
+
+    # Only run inference when modules have published new readings, and keep
+    # the model input up to date from those readings instead of the database
+    scheduler = InferenceScheduler()
+    feature_window = FeatureWindow()
+
+    def on_sensor_publish(client, userdata, msg):
+        feature_window.on_message(client, userdata, msg)
+        scheduler.notify()
+
+    client.message_callback_add(T_SENSOR_PUBLISH, on_sensor_publish)
+    client.message_callback_add(T_SENSOR_PUBLISH_COMPACT, on_sensor_publish)
+    client.message_callback_add(T_MODULES_CHANGED, feature_window.on_modules_changed)
+    client.subscribe(T_SENSOR_PUBLISH)
+    client.subscribe(T_SENSOR_PUBLISH_COMPACT)
+    client.subscribe(T_MODULES_CHANGED)
+
+    # Scoring runs in the background, so it never delays an inference run
+    scorer = None
+    last_scored = time.monotonic()
+
+    try:
+        while True:
+            try:
+                if time.monotonic() - last_scored >= PREDICTION_SCORE_SECONDS and not (scorer and scorer.is_alive()):
+                    scorer = Thread(target=db_score_predictions, name="prediction-scorer", daemon=True)
+                    scorer.start()
+                    last_scored = time.monotonic()
+
+                if model_manager.poll():
+                    model = model_manager.current
+                    scheduler.request()
+
+                if scheduler.should_run():
+                    print(f"{GREEN}Using {model_h5_path} ({backend}){RESET}")
+                    run_predictions_and_publish(model, client)
+                    stats = scheduler.stats
+                    print(f"Inference runs executed: {stats['executed']} ({stats['executed_stale']} without new data), "
+                          f"skipped: {stats['skipped']} (Current time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')})")
+            except Exception as e:
+                print(f"Exception in main: {e}")
+
+            time.sleep(AI_TICK_SECONDS)
+    finally:
+        client.message_callback_remove(T_SENSOR_PUBLISH)
+        client.message_callback_remove(T_SENSOR_PUBLISH_COMPACT)
+        client.message_callback_remove(T_MODULES_CHANGED)
+        feature_window = None
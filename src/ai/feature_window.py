@@ -0,0 +1,153 @@
+"""
+Rolling window of the last SEQ_LEN normalized feature vectors for predict.py.
+
+The window is seeded from the database by predict.load_and_preprocess_data
+and then follows the readings published on T_SENSOR_PUBLISH, the same way
+the database rebuilds rows from the stored readings: every light/temp reading
+adds a row with that sensor's new value and the last value of every other
+sensor. Producing
+X is then a copy of SEQ_LEN rows instead of a database scan.
+
+Anything the window can't replay exactly (a reading older than the newest
+row, an unknown sensor, a module change) invalidates it and the next
+prediction reseeds it from the database.
+"""
+from datetime import datetime, timedelta
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+
+from utils.utils import get_localtime
+from database.registry import ModuleRegistry
+from sensor.payload import readings, decode
+
+SEQ_LEN = 24
+WINDOW_DAYS = 1                 # Same history as predict.load_and_preprocess_data
+WINDOW_RESEED_SECONDS = 3600    # Reseed from the database at least this often
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def normalize_row(values, temp_start, timestamp):
+    """Feature vector for one timestamp: lights, (temp - 20) / 10, hour / 23, day / 6."""
+    ts = datetime.strptime(timestamp, TIME_FORMAT)
+    row = np.empty(len(values) + 2)
+    row[:-2] = values
+    row[temp_start:-2] = (row[temp_start:-2] - 20) / 10.0
+    row[-2] = ts.hour / 23.0
+    row[-1] = ts.weekday() / 6.0
+    return row.astype(np.float32)
+
+
+class FeatureWindow:
+    def __init__(self, seq_len=SEQ_LEN, days=WINDOW_DAYS, reseed_seconds=WINDOW_RESEED_SECONDS, registry=None):
+        self.seq_len = seq_len
+        self.days = days
+        self.reseed_seconds = reseed_seconds
+        self.registry = registry if registry is not None else ModuleRegistry()
+        self._lock = Lock()
+        self._ready = False
+        self.stats = {'seeds': 0, 'appended': 0, 'updated': 0, 'invalidated': 0}
+
+    def ready(self):
+        with self._lock:
+            return self._ready and (datetime.now() - self._seeded_at).total_seconds() < self.reseed_seconds
+
+    def invalidate(self, *args):
+        """Reseed on the next prediction. Usable directly as an MQTT message callback."""
+        with self._lock:
+            if self._ready:
+                self.stats['invalidated'] += 1
+            self._ready = False
+
+    def on_modules_changed(self, *args):
+        self.registry.invalidate()
+        self.invalidate()
+
+    def seed(self, X, timestamps, light_sensors, temp_sensors, last_values):
+        """
+        Start from the output of the database path: X of shape (1, SEQ_LEN, features),
+        the timestamps of its rows (fewer than SEQ_LEN when X is zero padded) and
+        the raw sensor values of the newest row.
+        """
+        timestamps = [ts.strftime(TIME_FORMAT) if hasattr(ts, 'strftime') else str(ts)
+                      for ts in timestamps[-self.seq_len:]]
+        with self._lock:
+            self.light_sensors = list(light_sensors)
+            self.temp_sensors = list(temp_sensors)
+            self._columns = {name: i for i, name in enumerate(self.light_sensors + self.temp_sensors)}
+            self._temp_start = len(self.light_sensors)
+            self._rows = np.array(X[0, -self.seq_len:], dtype=np.float32)
+            self._timestamps = [None] * (self.seq_len - len(timestamps)) + timestamps
+            self._head = 0      # Index of the oldest row
+            self.stats['seeds'] += 1
+            self._seeded_at = datetime.now()
+            # Without a row to carry values forward from, new rows can't match the database
+            self._ready = bool(timestamps)
+            self._last_values = np.array(last_values, dtype=np.float64)
+
+    def add_reading(self, timestamp, name, value):
+        """
+        Replay one light/temp reading. timestamp is local time, as stored in
+        sensor_data; name is None for modules that aren't named yet.
+        """
+        with self._lock:
+            if not self._ready:
+                return
+            if name is not None and name not in self._columns:
+                self._invalidate_locked()
+                return
+
+            newest = self._timestamps[(self._head - 1) % self.seq_len]
+            if timestamp < newest:
+                self._invalidate_locked()
+                return
+
+            if name is not None:
+                try:
+                    self._last_values[self._columns[name]] = float(value)
+                except (TypeError, ValueError):
+                    self._last_values[self._columns[name]] = np.nan
+            row = normalize_row(self._last_values, self._temp_start, timestamp)
+
+            if timestamp == newest:
+                self._rows[(self._head - 1) % self.seq_len] = row
+                self.stats['updated'] += 1
+            else:
+                self._rows[self._head] = row
+                self._timestamps[self._head] = timestamp
+                self._head = (self._head + 1) % self.seq_len
+                self.stats['appended'] += 1
+
+    def _invalidate_locked(self):
+        self.stats['invalidated'] += 1
+        self._ready = False
+
+    def on_message(self, client, userdata, msg):
+        """MQTT callback for T_SENSOR_PUBLISH and T_SENSOR_PUBLISH_COMPACT, single readings and batches."""
+        try:
+            for data in readings(decode(msg.topic, msg.payload)):
+                if data.get("data") == "imOnline" or data.get("type") not in ('light', 'temp'):
+                    continue
+                module = self.registry.get(data["client_id"])
+                name = module['name'] if module is not None else None
+                self.add_reading(get_localtime(data["time"]), name, data["data"])
+        except Exception as e:
+            print(f"Feature window could not use reading: {e}")
+            self.invalidate()
+
+    def snapshot(self):
+        """Same result as predict.load_and_preprocess_data: (X, last_timestamp, light_sensors, temp_sensors)."""
+        cutoff = (datetime.now() - timedelta(days=self.days)).strftime(TIME_FORMAT)
+        with self._lock:
+            order = [(self._head + i) % self.seq_len for i in range(self.seq_len)]
+            X = self._rows[order]
+            timestamps = [self._timestamps[i] for i in order]
+            # Rows that fell out of the history window become padding
+            for i, ts in enumerate(timestamps):
+                if ts is None or ts < cutoff:
+                    X[i] = 0.0
+            newest = timestamps[-1]
+            last_timestamp = pd.Timestamp(newest) if newest is not None and newest >= cutoff else datetime.now()
+            return (X.reshape(1, self.seq_len, X.shape[1]), last_timestamp,
+                    list(self.light_sensors), list(self.temp_sensors))
@@ -0,0 +1,178 @@
+"""
+Hot-swaps the model served by the AI loop.
+
+train.py writes model_new.h5 next to model.h5. The manager loads that
+candidate on a background thread, warms it up with one prediction and checks
+that its input and output match the current light/temp sensors. Only then is
+it swapped in, between two inference runs, and the files are promoted:
+model.h5 becomes model_prev.h5 and model_new.h5 becomes model.h5. The
+previous model stays loaded so rollback() can switch back to it. A candidate
+that fails to load or validate is renamed to model_rejected.h5 and the
+current model keeps serving.
+"""
+import os
+import time
+from threading import Thread, Lock
+
+import numpy as np
+
+from utils.console import *
+
+SEQ_LEN = 24
+
+
+def _sibling(path, suffix):
+    """model.h5 -> model<suffix>.h5"""
+    base, ext = os.path.splitext(path)
+    return base + suffix + ext
+
+
+class ModelManager:
+    def __init__(self, model_path, candidate_path, load, layout=None, background=True):
+        """
+        load(path) returns a model with predict(X), input_shape and output_shape.
+        layout() returns (light_sensors, temp_sensors), the features the model must match.
+        """
+        self.model_path = model_path
+        self.candidate_path = candidate_path
+        self.previous_path = _sibling(model_path, '_prev')
+        self.rejected_path = _sibling(model_path, '_rejected')
+        self.load = load
+        self.layout = layout
+        self.background = background
+        self._lock = Lock()
+        self._loader = None
+        self._ready = None          # Validated candidate waiting to be swapped in
+        self.current = None
+        self.previous = None
+        self.stats = {'swaps': 0, 'rejected': 0, 'rollbacks': 0,
+                      'load_seconds': None, 'first_inference_seconds': None}
+        self.history = []
+
+    def load_initial(self):
+        """Load model.h5 on the calling thread, there is nothing to serve until it is loaded."""
+        start = time.perf_counter()
+        self.current = self.load(self.model_path)
+        self._record('initial', load_seconds=time.perf_counter() - start)
+        return self.current
+
+    def poll(self):
+        """
+        Call between inference runs. Swaps in a validated candidate (returns True)
+        or starts loading a new model_new.h5 in the background.
+        """
+        with self._lock:
+            ready, self._ready = self._ready, None
+        if ready is not None:
+            return self._swap(ready)
+
+        if self.loading() or not os.path.isfile(self.candidate_path):
+            return False
+        print(f"{YELLOW}New version found, loading {self.candidate_path} in the background{RESET}")
+        if self.background:
+            self._loader = Thread(target=self._prepare, name="model-loader", daemon=True)
+            self._loader.start()
+            return False
+        self._prepare()
+        return self.poll()
+
+    def loading(self):
+        return self._loader is not None and self._loader.is_alive()
+
+    def wait(self, timeout=None):
+        """Block until a background load has finished."""
+        if self._loader is not None:
+            self._loader.join(timeout)
+
+    def rollback(self):
+        """Serve the previous model again and restore its file. Returns True on success."""
+        with self._lock:
+            if self.previous is None:
+                return False
+            self.current, self.previous = self.previous, None
+        for suffix in ('.h5', '.tflite'):
+            self._move(os.path.splitext(self.model_path)[0] + suffix, os.path.splitext(self.rejected_path)[0] + suffix)
+            self._move(os.path.splitext(self.previous_path)[0] + suffix, os.path.splitext(self.model_path)[0] + suffix)
+        self.stats['rollbacks'] += 1
+        self._record('rollback')
+        print(f"{YELLOW}Rolled back to the previous model{RESET}")
+        return True
+
+    def _prepare(self):
+        """Load, warm up and validate the candidate. Runs on the loader thread."""
+        try:
+            start = time.perf_counter()
+            candidate = self.load(self.candidate_path)
+            load_seconds = time.perf_counter() - start
+
+            X = np.zeros((1,) + tuple(candidate.input_shape[1:]), dtype=np.float32)
+            start = time.perf_counter()
+            output = np.asarray(candidate.predict(X))
+            first_inference_seconds = time.perf_counter() - start
+
+            self._validate(candidate, output)
+        except Exception as e:
+            print(f"{RED}Rejected {self.candidate_path}: {e}{RESET}")
+            self._move(self.candidate_path, self.rejected_path)
+            self.stats['rejected'] += 1
+            self._record('rejected', error=str(e))
+            return
+
+        with self._lock:
+            self._ready = (candidate, load_seconds, first_inference_seconds)
+
+    def _validate(self, candidate, output):
+        if self.layout is None:
+            return
+        light_sensors, temp_sensors = self.layout()
+        targets = len(light_sensors) + len(temp_sensors)
+        if tuple(candidate.input_shape[1:]) != (SEQ_LEN, targets + 2):
+            raise ValueError(f"input shape {candidate.input_shape} does not match {targets} sensors")
+        if output.shape != (1, targets):
+            raise ValueError(f"output shape {output.shape} does not match {targets} sensors")
+
+    def _swap(self, ready):
+        candidate, load_seconds, first_inference_seconds = ready
+        # Promote the files first, so a restart loads the model being served
+        if not self._promote_files():
+            return False
+        with self._lock:
+            self.previous, self.current = self.current, candidate
+        self.stats['swaps'] += 1
+        self.stats['load_seconds'] = load_seconds
+        self.stats['first_inference_seconds'] = first_inference_seconds
+        self._record('swap', load_seconds=load_seconds, first_inference_seconds=first_inference_seconds)
+        print(f"{GREEN}Swapped in the new model (load {load_seconds:.2f} s, "
+              f"first inference {first_inference_seconds * 1000:.1f} ms){RESET}")
+        return True
+
+    def _promote_files(self):
+        try:
+            for suffix in ('.h5', '.tflite'):
+                current = os.path.splitext(self.model_path)[0] + suffix
+                candidate = os.path.splitext(self.candidate_path)[0] + suffix
+                if suffix != '.h5' and not os.path.isfile(candidate):
+                    continue
+                previous = os.path.splitext(self.previous_path)[0] + suffix
+                if os.path.isfile(current):
+                    if os.path.isfile(previous):
+                        os.remove(previous)
+                    os.rename(current, previous)
+                os.rename(candidate, current)
+            return True
+        except OSError as e:
+            print(f"{RED}Could not promote {self.candidate_path}: {e}{RESET}")
+            self._record('promote_failed', error=str(e))
+            return False
+
+    def _move(self, src, dst):
+        try:
+            if os.path.isfile(src):
+                if os.path.isfile(dst):
+                    os.remove(dst)
+                os.rename(src, dst)
+        except OSError as e:
+            print(f"{RED}Could not move {src} to {dst}: {e}{RESET}")
+
+    def _record(self, event, **details):
+        self.history.append(dict(details, event=event, time=time.time()))
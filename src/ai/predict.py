@@ -1,22 +1,32 @@
 import numpy as np
 import pandas as pd
-import tensorflow as tf
-from tensorflow import keras
 import datetime
 from database.database import db_get_sensor_data_for_prediction, db_get_light_and_temp_sensors
 
+def read_model(model_h5_path):
+    """Load the trained model, raises when the file can't be read (for callers that go on without it)"""
+    # TensorFlow is only imported by the processes that run the Keras model
+    from tensorflow import keras
+
+    model = keras.models.load_model(model_h5_path, compile=False)
+    print(f"Model successfully loaded from {model_h5_path}")
+    return model
+
+
 def load_model(model_h5_path):
     # Load the trained model
     try:
-        model = keras.models.load_model(model_h5_path, compile=False)
-        print(f"Model successfully loaded from {model_h5_path}")
-        return model
+        return read_model(model_h5_path)
     except Exception as e:
         print(f"Error loading model: {e}")
         exit(1)
 
 
-def load_and_preprocess_data():
+def load_and_preprocess_data(window=None):
+    # Serve X from the rolling feature window when it is up to date
+    if window is not None and window.ready():
+        return window.snapshot()
+
     # Load test data from database
     try:
         # Get sensor data for the last day
@@ -35,6 +45,10 @@ def load_and_preprocess_data():
         timestamps = df['timestamp'].tolist()
         last_timestamp = timestamps[-1] if timestamps else datetime.datetime.now()
 
+        # Raw values of the newest row, the feature window carries them forward
+        last_values = [df[name].iloc[-1] if name in df.columns and len(df) else np.nan
+                       for name in light_sensors + temp_sensors]
+
         # Normalize time features
         df['hour'] = df['hour'] / 23.0  # Normalize hour (0-23 → 0-1)
         df['day_of_week'] = df['day_of_week'] / 6.0  # Normalize day (0-6 → 0-1)
@@ -72,6 +86,9 @@ def load_and_preprocess_data():
         # Reshape for LSTM input: (samples, timesteps, features)
         X = X.reshape(1, SEQ_LEN, len(features))
 
+        if window is not None:
+            window.seed(X, timestamps, light_sensors, temp_sensors, last_values)
+
         return X, last_timestamp, light_sensors, temp_sensors
 
     except Exception as e:
@@ -117,11 +134,11 @@ def process_predictions(predictions, light_sensors, temp_sensors):
     return final_predictions, results
 
 
-def ai_predict(model):
+def ai_predict(model, window=None):
     try:
         print("Starting prediction process...")
-        # Load and preprocess sensor data from database
-        X, last_timestamp, light_sensors, temp_sensors = load_and_preprocess_data()
+        # Load and preprocess sensor data from the feature window or the database
+        X, last_timestamp, light_sensors, temp_sensors = load_and_preprocess_data(window)
         print(f"Preprocessed data shape: {X.shape}")
         print(f"Last timestamp: {last_timestamp}")
 
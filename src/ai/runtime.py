@@ -0,0 +1,135 @@
+"""
+Inference backends for the LSTM.
+
+Keras' model.predict sets up a whole prediction loop on every call, which
+dominates the cost of a single (1, SEQ_LEN, features) batch. Two lighter
+backends run the same model:
+
+  'function' - the model traced once as a tf.function with a fixed input signature
+  'tflite'   - the model exported to TFLite (model.tflite next to model.h5) and run
+               with the LiteRT / tflite_runtime interpreter when installed, or
+               tf.lite.Interpreter otherwise
+
+Both expose predict(X) like a Keras model, so predict.make_predictions works
+with any of them. Choose one with init_ai(client, backend) or AI_INFERENCE_BACKEND.
+
+load_runtime runs an up-to-date .tflite without loading the .h5, so with the
+LiteRT / tflite_runtime wheel the AI process never imports TensorFlow; only
+an export (a new or retrained model) needs it.
+"""
+import os
+import warnings
+
+import numpy as np
+
+INFERENCE_BACKENDS = ('keras', 'function', 'tflite')
+
+
+def export_tflite(model, path):
+    """Convert a Keras model to TFLite for batches of one and write it to path."""
+    import tensorflow as tf
+    from tensorflow import keras
+
+    # The converter needs static shapes to lower the LSTM loop
+    fixed = keras.models.clone_model(model, input_tensors=keras.Input(batch_shape=(1,) + tuple(model.input_shape[1:])))
+    fixed.set_weights(model.get_weights())
+    tflite_model = tf.lite.TFLiteConverter.from_keras_model(fixed).convert()
+    with open(path, 'wb') as f:
+        f.write(tflite_model)
+    print(f"TFLite model saved at: {path}")
+    return path
+
+
+def _interpreter_class():
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+class CompiledModel:
+    """A Keras model called through a tf.function traced once for (1, SEQ_LEN, features)."""
+    def __init__(self, model):
+        import tensorflow as tf
+
+        self.model = model
+        self._tf = tf
+        signature = [tf.TensorSpec(shape=(1,) + tuple(model.input_shape[1:]), dtype=tf.float32)]
+        self._predict = tf.function(self._call, input_signature=signature)
+
+    def _call(self, x):
+        return self.model(x, training=False)
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        return np.concatenate([self._predict(X[i:i + 1]).numpy() for i in range(len(X))])
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+class TFLiteModel:
+    """A model exported with export_tflite, run by the TFLite interpreter."""
+    def __init__(self, path):
+        self.path = path
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')   # tf.lite.Interpreter's deprecation notice
+            self._interpreter = _interpreter_class()(model_path=path)
+        self._interpreter.allocate_tensors()
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self.input_shape = (None,) + tuple(int(d) for d in self._input['shape'][1:])
+        self.output_shape = (None,) + tuple(int(d) for d in self._output['shape'][1:])
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        predictions = []
+        for i in range(len(X)):
+            self._interpreter.set_tensor(self._input['index'], X[i:i + 1])
+            self._interpreter.invoke()
+            predictions.append(self._interpreter.get_tensor(self._output['index']).copy())
+        return np.concatenate(predictions)
+
+
+def _tflite_path(model_path):
+    return os.path.splitext(model_path)[0] + '.tflite'
+
+
+def _tflite_current(model_path):
+    """Whether the .tflite next to model_path exists and is no older than it"""
+    tflite_path = _tflite_path(model_path)
+    return os.path.isfile(tflite_path) and os.path.getmtime(tflite_path) >= os.path.getmtime(model_path)
+
+
+def load_runtime(model_path, backend='keras', load=None):
+    """
+    The model at model_path in the chosen backend. load(path) reads the .h5,
+    which 'tflite' skips while the .tflite export is up to date.
+    """
+    if backend == 'tflite' and _tflite_current(model_path):
+        return TFLiteModel(_tflite_path(model_path))
+    return make_runtime(load(model_path), backend, model_path)
+
+
+def make_runtime(model, backend='keras', model_path=None):
+    """
+    Wrap a loaded Keras model in the chosen backend. 'tflite' uses the .tflite
+    file next to model_path, exporting it first when it is missing or older.
+    """
+    if backend == 'keras':
+        return model
+    if backend == 'function':
+        return CompiledModel(model)
+    if backend == 'tflite':
+        if model_path is None:
+            raise ValueError("The tflite backend needs the path of the .h5 model")
+        tflite_path = _tflite_path(model_path)
+        if not _tflite_current(model_path):
+            export_tflite(model, tflite_path)
+        return TFLiteModel(tflite_path)
+    raise ValueError(f"Unknown inference backend: {backend}")
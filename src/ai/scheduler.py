@@ -0,0 +1,79 @@
+"""
+Decides when the AI loop should run inference.
+
+Inference only runs after new sensor readings have arrived (announced on
+T_SENSOR_PUBLISH), once the burst of messages has settled for
+AI_DEBOUNCE_SECONDS. AI_MAX_STALENESS_SECONDS bounds how old the last
+predictions may get when no readings arrive at all.
+
+Modules answer every control message with a new reading, so the predictions
+themselves cause a burst of readings. AI_MIN_INTERVAL_SECONDS keeps that from
+turning into back to back inference runs, and also bounds how long a steady
+stream of readings can keep the debounce from settling.
+"""
+import time
+from threading import Lock
+
+AI_DEBOUNCE_SECONDS = 5
+AI_MIN_INTERVAL_SECONDS = 60
+AI_MAX_STALENESS_SECONDS = 15 * 60
+
+
+class InferenceScheduler:
+    def __init__(self, debounce=AI_DEBOUNCE_SECONDS, min_interval=AI_MIN_INTERVAL_SECONDS,
+                 max_staleness=AI_MAX_STALENESS_SECONDS, clock=time.monotonic):
+        self.debounce = debounce
+        self.min_interval = min_interval
+        self.max_staleness = max_staleness
+        self.clock = clock
+        self._lock = Lock()
+        self._first_event = None    # Oldest and newest reading not yet predicted on
+        self._last_event = None
+        self._last_run = None
+        self._requested = True      # Run once at startup
+        self.stats = {'events': 0, 'executed': 0, 'executed_stale': 0, 'skipped': 0}
+
+    def notify(self, *args):
+        """New readings arrived. Usable directly as an MQTT message callback."""
+        with self._lock:
+            self._last_event = self.clock()
+            if self._first_event is None:
+                self._first_event = self._last_event
+            self.stats['events'] += 1
+
+    def request(self):
+        """Run inference on the next check regardless of new readings (e.g. after a model update)."""
+        with self._lock:
+            self._requested = True
+
+    def _reason(self, now):
+        if self._requested:
+            return 'requested'
+        if self._last_event is not None and now - self._last_run >= self.min_interval:
+            if now - self._last_event >= self.debounce or now - self._first_event >= self.min_interval:
+                return 'data'
+        if now - self._last_run >= self.max_staleness:
+            return 'stale'
+        return None
+
+    def due(self):
+        """Reason to run inference now ('requested', 'data', 'stale') or None."""
+        with self._lock:
+            return self._reason(self.clock())
+
+    def should_run(self):
+        """Like due(), but counts the decision as an executed or skipped run."""
+        with self._lock:
+            now = self.clock()
+            reason = self._reason(now)
+            if reason is None:
+                self.stats['skipped'] += 1
+                return False
+            self.stats['executed'] += 1
+            if reason == 'stale':
+                self.stats['executed_stale'] += 1
+            # Readings arriving from here on belong to the next run
+            self._first_event = self._last_event = None
+            self._requested = False
+            self._last_run = now
+            return True
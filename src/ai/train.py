@@ -4,92 +4,122 @@ But for demonstration run every 10s or 20s or just make it run only once.
 """
 
 import os
-import pandas as pd
+import argparse
 import numpy as np
 import tensorflow as tf
 import sys
+from numpy.lib.stride_tricks import sliding_window_view
 
 # Add database directory to path to import database module
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-from database.database import db_get_sensor_types, db_get_sensors_by_category, db_get_all_sensor_data
+from database.database import db_get_sensor_matrix
+from ai.runtime import export_tflite
 
-def load_and_preprocess_data():
-    # Get all sensor data from the database
-    all_sensor_data = db_get_all_sensor_data(days=14)  # Get 2 weeks of data
+SEQ_LEN = 24            # Use last 24 hours for prediction
+TRAIN_DAYS = 14         # Get 2 weeks of data
+COMPACT_CHUNK_ROWS = 65536
 
-    # Separate light and temp sensors
-    light_sensors = [name for name, info in all_sensor_data.items() if info['category'] == 'light']
-    temp_sensors = [name for name, info in all_sensor_data.items() if info['category'] == 'temp']
 
-    # Create a dataframe with all timestamps
-    all_timestamps = set()
-    for sensor_name, info in all_sensor_data.items():
-        for timestamp, _ in info['data']:
-            all_timestamps.add(timestamp)
+def load_and_preprocess_data(days=TRAIN_DAYS, mmap_path=None):
+    """
+    Load the training matrix (light sensors, temp sensors, hour, day_of_week).
+    With mmap_path the matrix lives in a memory-mapped .npy file instead of RAM.
+    """
+    matrix = db_get_sensor_matrix(days=days, categories=('light', 'temp'), out_path=mmap_path)
+    data = matrix['values']
+    sensors = matrix['sensors']
 
-    # Create dataframe with all timestamps
-    df = pd.DataFrame(sorted(all_timestamps), columns=['timestamp'])
-
-    # Add sensor data to dataframe
-    for sensor_name, info in all_sensor_data.items():
-        # Convert sensor data to dictionary for easy lookup
-        sensor_dict = {timestamp: value for timestamp, value in info['data']}
-
-        # Add sensor data to dataframe
-        df[sensor_name] = df['timestamp'].map(sensor_dict)
-
-    # Convert timestamp to datetime
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-
-    # Extract time features
-    df['hour'] = df['timestamp'].dt.hour
-    df['day_of_week'] = df['timestamp'].dt.dayofweek
+    light_sensors = [name for name, category in sensors if category == 'light']
+    temp_sensors = [name for name, category in sensors if category == 'temp']
 
     # Normalize time features
-    df['hour'] = df['hour'] / 23.0  # Normalize hour (0–23 → 0–1)
-    df['day_of_week'] = df['day_of_week'] / 6.0  # Normalize day (0–6 → 0–1)
+    data[:, -2] /= 23.0  # Normalize hour (0–23 → 0–1)
+    data[:, -1] /= 6.0  # Normalize day (0–6 → 0–1)
 
     # Normalize temperature data dynamically
-    for sensor in temp_sensors:
+    for col in range(len(light_sensors), len(sensors)):
         # Use mean and std for normalization instead of hardcoded values
-        mean_temp = df[sensor].mean()
-        std_temp = df[sensor].std()
-        if std_temp == 0:  # Prevent division by zero
+        mean_temp = np.nanmean(data[:, col]) if len(data) else 0.0
+        std_temp = np.nanstd(data[:, col], ddof=1) if len(data) > 1 else 0.0
+        if std_temp == 0 or np.isnan(std_temp):  # Prevent division by zero
             std_temp = 1.0
-        df[sensor] = (df[sensor] - mean_temp) / std_temp
+        data[:, col] -= mean_temp
+        data[:, col] /= std_temp
 
     # Drop rows with missing values
-    df = df.dropna()
+    data = _drop_incomplete_rows(data)
 
     # Define features dynamically based on available sensors
     features = light_sensors + temp_sensors + ['hour', 'day_of_week']
     target_features = light_sensors + temp_sensors
 
-    # Convert to numpy
-    data = df[features].values.astype(np.float32)
-
     return data, features, target_features
 
 
+def _drop_incomplete_rows(data):
+    """Move complete rows to the front in place, chunk by chunk, and return a view of them."""
+    kept = 0
+    for start in range(0, len(data), COMPACT_CHUNK_ROWS):
+        chunk = data[start:start + COMPACT_CHUNK_ROWS]
+        complete = chunk[~np.isnan(chunk).any(axis=1)]
+        data[kept:kept + len(complete)] = complete
+        kept += len(complete)
+    return data[:kept]
+
+
+def _target_indices(features, target_features):
+    return [features.index(feature) for feature in target_features]
+
+
 def prepare_sequences(data, features, target_features):
-    SEQ_LEN = 24  # Use last 24 hours for prediction
-    X, y = [], []
+    """
+    Every SEQ_LEN window of data and the row that follows it.
+    X is a strided view over data, no window is copied.
+    """
+    target_indices = _target_indices(features, target_features)
+    if len(data) <= SEQ_LEN:
+        return (np.empty((0, SEQ_LEN, len(features)), dtype=np.float32),
+                np.empty((0, len(target_indices)), dtype=np.float32), SEQ_LEN)
+
+    # (samples, features, SEQ_LEN) -> (samples, SEQ_LEN, features)
+    X = sliding_window_view(data[:-1], SEQ_LEN, axis=0).transpose(0, 2, 1)
+    y = data[SEQ_LEN:, target_indices]
 
-    for i in range(len(data) - SEQ_LEN):
-        X.append(data[i:i + SEQ_LEN])  # 24 hours of data
+    return X, y, SEQ_LEN
 
-        # Get indices of target features
-        target_indices = [features.index(feature) for feature in target_features]
 
-        # Extract target values using indices
-        target_values = [data[i + SEQ_LEN][idx] for idx in target_indices]
+def make_dataset(data, features, target_features, mode='generator', batch_size=32, shuffle=True):
+    """
+    Stream training windows to model.fit as a tf.data.Dataset.
 
-        y.append(target_values)
+    'generator' copies one batch of windows at a time out of data, so it also
+                works on a memory-mapped matrix.
+    'tfdata'    uses tf.keras.utils.timeseries_dataset_from_array, which keeps
+                one copy of data as a tensor and slices windows in the graph.
+    """
+    target_indices = _target_indices(features, target_features)
+    num_features = len(features)
 
-    X = np.array(X)
-    y = np.array(y)
+    if mode == 'tfdata':
+        return tf.keras.utils.timeseries_dataset_from_array(
+            data[:-1], data[SEQ_LEN:, target_indices], sequence_length=SEQ_LEN,
+            batch_size=batch_size, shuffle=shuffle)
 
-    return X, y, SEQ_LEN
+    if mode != 'generator':
+        raise ValueError(f"Unknown dataset mode: {mode}")
+
+    X, y, _ = prepare_sequences(data, features, target_features)
+
+    def batches():
+        order = np.random.permutation(len(X)) if shuffle else np.arange(len(X))
+        for start in range(0, len(order), batch_size):
+            idx = np.sort(order[start:start + batch_size])  # Sorted reads are sequential on a memmap
+            yield X[idx], y[idx]
+
+    return tf.data.Dataset.from_generator(batches, output_signature=(
+        tf.TensorSpec(shape=(None, SEQ_LEN, num_features), dtype=tf.float32),
+        tf.TensorSpec(shape=(None, len(target_indices)), dtype=tf.float32),
+    )).prefetch(tf.data.AUTOTUNE)
 
 
 def create_lstm_model(SEQ_LEN, features, target_features):
@@ -104,9 +134,12 @@ def create_lstm_model(SEQ_LEN, features, target_features):
     return model
 
 
-def train_model(model, X, y):
-    # Train
-    model.fit(X, y, epochs=10, batch_size=32)
+def train_model(model, X, y=None, epochs=10, batch_size=32):
+    # Train, X is either an array of windows or a batched tf.data.Dataset
+    if y is None:
+        model.fit(X, epochs=epochs)
+    else:
+        model.fit(X, y, epochs=epochs, batch_size=batch_size)
     return model
 
 
@@ -118,12 +151,26 @@ def save_model(model):
     print(f"Model saved at: {model_save_path}")
 
 
-def main():
-    data, features, target_features = load_and_preprocess_data()
-    X, y, SEQ_LEN = prepare_sequences(data, features, target_features)
-    model = create_lstm_model(SEQ_LEN, features, target_features)
-    model = train_model(model, X, y)
+def main(days=TRAIN_DAYS, input_mode='array', mmap_path=None, tflite=False):
+    data, features, target_features = load_and_preprocess_data(days, mmap_path)
+    if input_mode == 'array':
+        X, y, seq_len = prepare_sequences(data, features, target_features)
+        model = create_lstm_model(seq_len, features, target_features)
+        model = train_model(model, X, y)
+    else:
+        dataset = make_dataset(data, features, target_features, mode=input_mode)
+        model = create_lstm_model(SEQ_LEN, features, target_features)
+        model = train_model(model, dataset)
     save_model(model)
+    if tflite:
+        export_tflite(model, os.path.join(os.path.dirname(__file__), 'model_new.tflite'))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Train the LSTM model on recent sensor data')
+    parser.add_argument('--days', type=int, default=TRAIN_DAYS, help='Days of history to train on')
+    parser.add_argument('--input', choices=['array', 'generator', 'tfdata'], default='array',
+                        help='array: windows in memory, generator/tfdata: stream batches to model.fit')
+    parser.add_argument('--mmap', metavar='PATH', help='Keep the training matrix in a memory-mapped .npy file')
+    parser.add_argument('--tflite', action='store_true', help='Also export model_new.tflite for the tflite backend')
+    args = parser.parse_args()
+    main(args.days, args.input, args.mmap, args.tflite)
\ No newline at end of file
@@ -9,11 +9,15 @@ Status: {GREEN}Running...{RESET}
 ===================================================
 """)
 from ai.ai import init_ai
+from database.database import DB_NAME
+from database.metrics import start_export
 
 
 if __name__ == "__main__":
     utils.globals.client_id = "central_main_ai"
     client = MQTTConnection.get_client("central_main_ai")
+    # Database timings for the web UI, see database/metrics.py
+    start_export('ai', DB_NAME)
 
     try:
         print("Press CTRL+C to quit")
@@ -0,0 +1,93 @@
+"""
+Retention and archive benchmark.
+
+Fills a database migrated to the newest schema with 12 light/temp and 4
+radar/door sensors, one reading every 2 minutes on average, for 120 days.
+A copy keeps the last 30 days in SQLite and archives the rest with
+db_archive_sensor_data. Compares the file sizes and the latency of the
+long-range queries, which must return the same result from both copies.
+From schema version 4 the archive is the sensor_chunks table inside the
+SQLite file rather than the archive files.
+
+Usage: python benchmarks/bench_archive.py [days] [days_to_keep]
+"""
+import os
+import sys
+import time
+import shutil
+import sqlite3
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from common import create_temp_db, remove_db, print_table, quiet
+from bench_schema import FrozenDatetime, fill, file_size, timed
+from database import database
+from database import archive
+from database import schema
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def same(a, b):
+    if isinstance(a, pd.DataFrame):
+        pd.testing.assert_frame_equal(a, b)
+    elif isinstance(a, dict) and 'values' in a:
+        np.testing.assert_array_equal(a['values'], b['values'])
+    else:
+        assert a == b
+
+
+@patch.object(database, 'datetime', FrozenDatetime)
+def main(days=120, days_to_keep=30):
+    hot_path = create_temp_db()
+    archived_path = hot_path + '.archived'
+    try:
+        with quiet():
+            schema.migrate(hot_path)
+        light, _ = fill(hot_path, days)
+        # Checkpoints the WAL, so the copy holds every row
+        hot_size = file_size(hot_path)
+        shutil.copy(hot_path, archived_path)
+        with quiet():
+            start = time.perf_counter()
+            archived = database.db_archive_sensor_data(days_to_keep, db_name=archived_path)
+            archive_time = time.perf_counter() - start
+        archived_size = file_size(archived_path)
+        cold_size = directory_size(archive.archive_dir(archived_path))
+        with sqlite3.connect(archived_path) as conn:
+            has_chunks = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sensor_chunks'").fetchone()
+            chunk_size = conn.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM sensor_chunks").fetchone()[0] \
+                if has_chunks else 0
+
+        rows = [
+            ("archiving", f"{archived} readings in {archive_time * 1000:.0f} ms"),
+            ("SQLite file", f"{hot_size / 1024:8.0f} KiB -> {archived_size / 1024:8.0f} KiB"),
+            ("archive files", f"{cold_size / 1024:8.0f} KiB"),
+            ("sensor_chunks blobs", f"{chunk_size / 1024:8.0f} KiB"),
+        ]
+        queries = [
+            (f"training matrix ({days} days)", lambda db: database.db_get_sensor_matrix(days, db_name=db)),
+            (f"one sensor ({days} days)", lambda db: database.db_get_sensor_data(light, days, db)),
+            (f"training matrix ({days_to_keep} days)", lambda db: database.db_get_sensor_matrix(days_to_keep, db_name=db)),
+            ("prediction (1 day)", lambda db: database.db_get_sensor_data_for_prediction(1, db)),
+        ]
+        for name, query in queries:
+            hot_result, hot_time = timed(lambda: query(hot_path))
+            archived_result, archived_time = timed(lambda: query(archived_path))
+            same(hot_result, archived_result)
+            rows.append((name, f"{hot_time * 1000:8.2f} ms -> {archived_time * 1000:8.2f} ms"))
+
+        print_table(f"{days} days of readings, {days_to_keep} kept in SQLite (all in SQLite -> archived)", rows)
+        print(f"{archived_size + cold_size:,} bytes on disk instead of {hot_size:,}, all queries return the same result")
+    finally:
+        shutil.rmtree(archive.archive_dir(archived_path), ignore_errors=True)
+        remove_db(hot_path)
+        remove_db(archived_path)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,128 @@
+"""
+Bulk ingest benchmark.
+
+Loads a week of readings shaped like database/insert_sample_sensor_data.py
+(8 light, 4 temp and 8 radar sensors every 15 minutes) into an empty
+database: the loader's old per-row cursor.execute loop against
+db_bulk_ingest from rows and from NumPy arrays, with and without
+synchronous=OFF, on the legacy and the newest schema. Then times one cycle
+of sensor_data_generator.py: 12 timestamps x all sensors, written one
+transaction per timestamp before and in one bulk call now.
+
+Usage: python benchmarks/bench_bulk_ingest.py [days]
+"""
+import sys
+import time
+import sqlite3
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from common import create_temp_db, remove_db, print_table, quiet
+from database import database
+from database import schema
+
+SENSORS = (('light', 8), ('temp', 4), ('radar', 8))
+CYCLES = 20
+
+
+def sample_rows(sensor_ids, days):
+    rng = np.random.default_rng(0)
+    now = datetime(2024, 3, 1)
+    rows = []
+    for interval in range(days * 96):
+        timestamp = (now - timedelta(minutes=15 * interval)).strftime('%Y-%m-%d %H:%M:%S')
+        for sensor_id, category in sensor_ids:
+            value = round(rng.uniform(12.0, 40.0), 2) if category == 'temp' else \
+                int(rng.integers(0, 4 if category == 'light' else 2))
+            rows.append((sensor_id, timestamp, value))
+    return rows
+
+
+def per_row_load(db_path, rows):
+    """insert_sample_sensor_data.py as it used to be"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    for row in rows:
+        try:
+            cursor.execute('''
+                INSERT INTO sensor_data (sensor_id, timestamp, sensor_value)
+                VALUES (?, ?, ?)
+            ''', row)
+        except sqlite3.IntegrityError:
+            continue
+    conn.commit()
+    conn.close()
+
+
+def fresh_db(latest):
+    db_path = create_temp_db()
+    with quiet():
+        sensor_ids = [(database.db_add_sensor(f"{category}-{i:04d}", f"{category}{i}", category, db_path), category)
+                      for category, count in SENSORS for i in range(count)]
+        if latest:
+            schema.migrate(db_path)
+    return db_path, sensor_ids
+
+
+def timed_load(latest, days, load, prepare=list):
+    db_path, sensor_ids = fresh_db(latest)
+    try:
+        rows = sample_rows(sensor_ids, days)
+        prepared = prepare(rows)
+        with quiet():
+            start = time.perf_counter()
+            load(db_path, prepared)
+            elapsed = time.perf_counter() - start
+        return f"{len(rows) / elapsed:10,.0f} rows/s"
+    finally:
+        database.db_close_connections(db_path)
+        remove_db(db_path)
+
+
+def as_arrays(rows):
+    sensor_ids, timestamps, values = zip(*rows)
+    return np.array(sensor_ids), np.array(timestamps, dtype='datetime64[s]'), np.array(values, dtype=np.float64)
+
+
+def generator_cycle(latest, bulk):
+    db_path, sensor_ids = fresh_db(latest)
+    try:
+        sensors_dict = {category: [sensor_id for sensor_id, c in sensor_ids if c == category]
+                        for category, _ in SENSORS}
+        base = datetime(2024, 3, 1)
+        with quiet():
+            start = time.perf_counter()
+            for cycle in range(CYCLES):
+                timestamps = [(base + timedelta(minutes=5 * (cycle * 12 + i))).strftime('%Y-%m-%d %H:%M:%S')
+                              for i in range(12)]
+                if bulk:
+                    database.db_insert_sensor_data_for_timestamp(timestamps, sensors_dict, db_path)
+                else:
+                    for timestamp in timestamps:
+                        database.db_insert_sensor_data_for_timestamp(timestamp, sensors_dict, db_path)
+            return (time.perf_counter() - start) / CYCLES
+    finally:
+        database.db_close_connections(db_path)
+        remove_db(db_path)
+
+
+def main(days=7):
+    rows = []
+    for latest in (False, True):
+        layout = f"v{schema.SCHEMA_VERSION}" if latest else "legacy"
+        if not latest:
+            rows.append((f"{layout}: per-row execute", timed_load(latest, days, per_row_load)))
+        rows.append((f"{layout}: bulk rows", timed_load(
+            latest, days, lambda db, r: database.db_bulk_ingest(r, db_name=db))))
+        rows.append((f"{layout}: bulk rows, synchronous=OFF", timed_load(
+            latest, days, lambda db, r: database.db_bulk_ingest(r, synchronous_off=True, db_name=db))))
+        rows.append((f"{layout}: bulk arrays, synchronous=OFF", timed_load(
+            latest, days, lambda db, r: database.db_bulk_ingest(r, synchronous_off=True, db_name=db), as_arrays)))
+        rows.append((f"{layout}: generator cycle", f"{generator_cycle(latest, False) * 1000:7.1f} ms -> "
+                                                  f"{generator_cycle(latest, True) * 1000:7.1f} ms"))
+    print_table(f"Bulk load of {days} days x {sum(count for _, count in SENSORS)} sensors every 15 minutes", rows)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
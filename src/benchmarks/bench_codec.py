@@ -0,0 +1,79 @@
+"""
+Chunk codec benchmark.
+
+Generates readings shaped like database/insert_sample_sensor_data.py: 8
+light sensors (0 to 3), 4 temperature sensors (12 to 40 C, 2 decimals) and
+8 radar sensors (0 or 1), one reading every 15 minutes, and cuts them into
+the day chunks of the sensor_chunks table. Compares the bytes per reading of
+codec.encode with the raw int64 + float64 columns and with the compressed
+.npz month files of the archive, then measures encode and decode throughput.
+
+Usage: python benchmarks/bench_codec.py [days]
+"""
+import io
+import sys
+import time
+
+import numpy as np
+
+from common import print_table
+from database import codec
+from database.chunks import CHUNK_SECONDS
+
+READING_SECONDS = 15 * 60
+REPEATS = 5
+KINDS = {
+    'light': (8, lambda rng, n: rng.integers(0, 4, n).astype(np.float64)),
+    'temp': (4, lambda rng, n: np.round(rng.uniform(12.0, 40.0, n), 2)),
+    'radar': (8, lambda rng, n: rng.integers(0, 2, n).astype(np.float64)),
+}
+
+
+def day_chunks(rng, days, sensors, values):
+    """(ts, values) of every sensor's day chunks"""
+    ts = 1700006400 + READING_SECONDS * np.arange(days * CHUNK_SECONDS // READING_SECONDS)
+    result = []
+    for _ in range(sensors):
+        sensor_values = values(rng, len(ts))
+        for start in range(0, len(ts), CHUNK_SECONDS // READING_SECONDS):
+            end = start + CHUNK_SECONDS // READING_SECONDS
+            result.append((ts[start:end], sensor_values[start:end]))
+    return result
+
+
+def npz_size(series):
+    f = io.BytesIO()
+    np.savez_compressed(f, ts=np.concatenate([ts for ts, _ in series]),
+                        value=np.concatenate([values for _, values in series]))
+    return f.tell()
+
+
+def best_time(function):
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(days=28):
+    rng = np.random.default_rng(0)
+    rows = []
+    for kind, (sensors, values) in KINDS.items():
+        series = day_chunks(rng, days, sensors, values)
+        readings = sum(len(ts) for ts, _ in series)
+        blobs = [codec.encode(ts, values) for ts, values in series]
+        # One month file per sensor, as archive.write lays them out
+        per_sensor = len(series) // sensors
+        npz = sum(npz_size(series[i:i + per_sensor]) for i in range(0, len(series), per_sensor))
+        encode_time = best_time(lambda: [codec.encode(ts, values) for ts, values in series])
+        decode_time = best_time(lambda: [codec.decode(blob) for blob in blobs])
+        rows.append((kind, f"{16:5.2f} B -> npz {npz / readings:5.2f} B -> chunks {sum(map(len, blobs)) / readings:5.2f} B"
+                           f" | encode {readings / encode_time / 1e6:5.2f} M/s, decode {readings / decode_time / 1e6:5.2f} M/s"))
+
+    print_table(f"{days} days every 15 minutes in day chunks, bytes per reading (raw -> npz -> chunks)", rows)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
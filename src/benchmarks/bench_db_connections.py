@@ -0,0 +1,71 @@
+"""
+Connection pooling micro-benchmark.
+
+Compares db_add_sensor_data / db_get_id throughput against the old
+connect-per-call pattern (open, PRAGMA journal_mode=WAL, query, close).
+
+Usage: python benchmarks/bench_db_connections.py [num_ops]
+"""
+import sys
+import sqlite3
+from threading import Lock
+from datetime import datetime, timedelta
+
+from common import create_temp_db, remove_db, ops_per_sec, print_table, quiet
+from database import database
+
+legacy_lock = Lock()
+
+def legacy_add_sensor_data(timestamp, id, data, db_name):
+    with legacy_lock:
+        conn = sqlite3.connect(db_name, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL;")
+        try:
+            conn.execute("""
+                INSERT INTO sensor_data (sensor_id, timestamp, sensor_value)
+                VALUES (?, ?, ?)
+            """, (id, timestamp, data))
+            conn.commit()
+        finally:
+            conn.close()
+
+def legacy_get_id(client_id, db_name):
+    with legacy_lock:
+        conn = sqlite3.connect(db_name, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL;")
+        try:
+            row = conn.execute("SELECT id FROM sensors WHERE client_id = ?", (client_id,)).fetchone()
+            return row[0] if row else None
+        finally:
+            conn.close()
+
+
+def main(n=2000):
+    db_path = create_temp_db()
+    try:
+        with quiet():
+            sensor_id = database.db_add_sensor("BENCH-0001", "bench", "temp", db_path)
+        base = datetime(2024, 1, 1)
+
+        def ts(offset, i):
+            return (base + timedelta(seconds=offset + i)).strftime('%Y-%m-%d %H:%M:%S')
+
+        with quiet():
+            legacy_write = ops_per_sec(lambda i: legacy_add_sensor_data(ts(0, i), sensor_id, i, db_path), n)
+            pooled_write = ops_per_sec(lambda i: database.db_add_sensor_data(ts(n, i), sensor_id, i, db_path), n)
+            legacy_read = ops_per_sec(lambda i: legacy_get_id("BENCH-0001", db_path), n)
+            pooled_read = ops_per_sec(lambda i: database.db_get_id("BENCH-0001", db_path), n)
+
+        print_table(f"Connection pooling ({n} ops each)", [
+            ("db_add_sensor_data  connect-per-call", f"{legacy_write:10.0f} ops/s"),
+            ("db_add_sensor_data  pooled", f"{pooled_write:10.0f} ops/s  (x{pooled_write / legacy_write:.1f})"),
+            ("db_get_id           connect-per-call", f"{legacy_read:10.0f} ops/s"),
+            ("db_get_id           pooled", f"{pooled_read:10.0f} ops/s  (x{pooled_read / legacy_read:.1f})"),
+        ])
+    finally:
+        database.db_close_connections(db_path)
+        remove_db(db_path)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,110 @@
+"""
+Group command benchmark: an "all lights off" to N modules.
+
+Sends the batch command through GroupFanout, as sensor_ctrl_handler does,
+to N modules that all predate groups (one publish each), half of which
+subscribed to the category group, and all of which did. Counts the
+publishes per command and measures the core's time to send it.
+
+The time until the last module answered is simulated, there is no broker
+here: the core's publishes go out one after the other PUBLISH_MS apart, the
+broker forwards a message to each subscriber FORWARD_MS apart, and a module
+answers with a reading REPLY_MS after it got the command. The readings are
+acknowledged through GroupFanout.ack at their simulated arrival.
+
+Usage: python benchmarks/bench_fanout.py [modules ...]
+"""
+import sys
+import json
+import time
+from types import SimpleNamespace
+
+from common import print_table, quiet
+from sensor.groups import GroupFanout, category_group, group_topic
+from sensor.topics import T_SENSOR_CTRL_PREFIX, T_SENSOR_GROUPS_REPORT
+
+PUBLISH_MS = 2.0        # Core -> broker, per message (Wi-Fi round trip of the Pi's client)
+FORWARD_MS = 0.2        # Broker -> each subscriber of a message
+REPLY_MS = 25.0         # Module switches and publishes its reading
+COMMANDS = 200
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class SimulatedBroker:
+    """Client for GroupFanout: records when each module gets the command."""
+    def __init__(self, group_members):
+        self.group_members = group_members      # group topic -> client_ids subscribed to it
+        self.sent_at = 0.0
+        self.received = []                      # (time, client_id)
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.sent_at += PUBLISH_MS / 1000
+        if topic.startswith(T_SENSOR_CTRL_PREFIX + '/'):
+            subscribers = [topic.rsplit('/', 1)[1]]
+        else:
+            subscribers = self.group_members.get(topic, [])
+        for i, client_id in enumerate(subscribers):
+            self.received.append((self.sent_at + (i + 1) * FORWARD_MS / 1000, client_id))
+
+
+def subscribe(fanout, client_ids, group):
+    """The retained group reports of client_ids"""
+    for client_id in client_ids:
+        fanout.on_report(None, None, SimpleNamespace(topic=f"{T_SENSOR_GROUPS_REPORT}/{client_id}",
+                                                     payload=json.dumps({"groups": [group]}).encode()))
+
+
+def command(n, capable):
+    """(publishes, seconds until the last answer) of one command to n modules, capable of them in the group"""
+    clock = Clock()
+    fanout = GroupFanout(clock=clock)
+    client_ids = [f"L-{i:04d}" for i in range(n)]
+    group = category_group("light")
+    subscribe(fanout, client_ids[:capable], group)
+    broker = SimulatedBroker({group_topic(group): client_ids[:capable]})
+
+    publishes = fanout.publish(broker, group, client_ids, {'state': 0})
+    for received_at, client_id in sorted(broker.received):
+        clock.now = received_at + REPLY_MS / 1000
+        fanout.ack(client_id)
+    stats = fanout.stats()
+    assert stats['acked'] == 1, stats
+    return publishes, stats['last_ack_seconds']
+
+
+def send_time(n, capable):
+    """Core time of GroupFanout.publish per command, without the simulated network"""
+    fanout = GroupFanout()
+    client_ids = [f"L-{i:04d}" for i in range(n)]
+    group = category_group("light")
+    subscribe(fanout, client_ids[:capable], group)
+    broker = SimulatedBroker({})
+    start = time.perf_counter()
+    for _ in range(COMMANDS):
+        fanout.publish(broker, group, client_ids, {'state': 0})
+    return (time.perf_counter() - start) / COMMANDS
+
+
+def main(sizes=(10, 50, 200)):
+    for n in sizes:
+        rows = []
+        for name, capable in [("per module (old firmware)", 0), ("half in the group", n // 2),
+                              ("all in the group", n)]:
+            with quiet():
+                publishes, last_ack = command(n, capable)
+                seconds = send_time(n, capable)
+            rows.append((name, f"{publishes:4d} publishes, last answer after {last_ack * 1000:7.1f} ms, "
+                               f"{seconds * 1e6:7.1f} us to send"))
+        print_table(f"{n} modules, one command (simulated network: {PUBLISH_MS} ms per publish, "
+                    f"{FORWARD_MS} ms per forward, {REPLY_MS} ms reply)", rows)
+
+
+if __name__ == "__main__":
+    main(*([tuple(int(arg) for arg in sys.argv[1:])] if len(sys.argv) > 1 else []))
@@ -0,0 +1,82 @@
+"""
+Prediction input benchmark.
+
+Compares building X for make_predictions from the database (a day of
+history through db_get_sensor_data_for_prediction and a DataFrame) against
+copying it out of a seeded FeatureWindow, and measures what a published
+reading costs the window. Data is shaped like insert_sample_sensor_data.
+
+Usage: python benchmarks/bench_feature_window.py [repeats]
+"""
+import sys
+import time
+import json
+from datetime import datetime, timedelta
+from functools import partial
+from unittest.mock import patch, MagicMock
+
+from common import create_temp_db, remove_db, print_table, quiet
+from database import database
+from ai import predict
+from ai.feature_window import FeatureWindow
+
+NUM_SENSORS = 12
+
+
+def per_call(repeats, fn):
+    start = time.perf_counter()
+    with quiet():
+        for _ in range(repeats):
+            fn()
+    return (time.perf_counter() - start) / repeats
+
+
+def main(repeats=200):
+    db_path = create_temp_db()
+    try:
+        with quiet():
+            sensor_ids = [database.db_add_sensor(f"BENCH-{i:04d}", f"sensor{i}", "light" if i % 2 else "temp", db_path)
+                          for i in range(NUM_SENSORS)]
+        now = datetime.now().replace(second=0, microsecond=0)
+        rows = []
+        for step in range(24 * 4, 0, -1):
+            ts = (now - timedelta(minutes=15 * step)).strftime('%Y-%m-%d %H:%M:%S')
+            rows.extend((ts, sensor_id, 21.0 if i % 2 == 0 else step % 4) for i, sensor_id in enumerate(sensor_ids))
+        with quiet():
+            database.db_add_sensor_data_batch(rows, db_path)
+
+        registry = MagicMock()
+        registry.get.return_value = {'name': 'sensor1'}
+        window = FeatureWindow(registry=registry)
+        with patch.object(predict, 'db_get_sensor_data_for_prediction',
+                          partial(database.db_get_sensor_data_for_prediction, db_name=db_path)), \
+                patch.object(predict, 'db_get_light_and_temp_sensors',
+                             partial(database.db_get_light_and_temp_sensors, db_name=db_path)):
+            db_time = per_call(max(repeats // 10, 1), predict.load_and_preprocess_data)
+            with quiet():
+                predict.load_and_preprocess_data(window)
+            window_time = per_call(repeats, lambda: predict.load_and_preprocess_data(window))
+
+        msg = MagicMock()
+        second = [0]
+
+        def publish():
+            second[0] += 1
+            utc = now - timedelta(hours=5, minutes=30) + timedelta(seconds=second[0])
+            msg.payload = json.dumps({"type": "light", "time": utc.strftime('%Y-%m-%d %H:%M:%S'),
+                                      "client_id": "BENCH-0001", "data": second[0] % 4}).encode()
+            window.on_message(None, None, msg)
+        reading_time = per_call(repeats, publish)
+
+        print_table(f"Prediction input, {NUM_SENSORS} sensors, 1 day at 15 min", [
+            ("X from database", f"{db_time * 1000:8.2f} ms"),
+            ("X from feature window", f"{window_time * 1000:8.3f} ms  ({db_time / window_time:.0f}x)"),
+            ("window update per reading", f"{reading_time * 1000:8.3f} ms"),
+        ])
+    finally:
+        database.db_close_connections(db_path)
+        remove_db(db_path)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,89 @@
+"""
+Inference backend benchmark.
+
+Runs ai/model.h5 on a (1, SEQ_LEN, features) batch, as make_predictions does
+every cycle, with each backend in ai/runtime.py, loaded with load_runtime as
+init_ai does. Every backend runs in its own process so peak RSS is
+comparable. 'tflite (export)' is the first start after a new model, which
+loads the .h5 and writes model.tflite; 'tflite' is every later start, which
+runs model.tflite without Keras. The TF column says whether the process
+imported TensorFlow: without the LiteRT / tflite_runtime wheel the
+interpreter comes from tf.lite, so it still does.
+
+Usage: python benchmarks/bench_inference.py [calls]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import resource
+import subprocess
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_PATH = os.path.join(SRC_DIR, "ai", "model.h5")
+BACKENDS = ['keras', 'function', 'tflite (export)', 'tflite']   # 'tflite' reuses the export of the row before
+
+
+def child(backend, calls, model_path):
+    sys.path.insert(0, SRC_DIR)
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '3')
+    import numpy as np
+
+    backend = backend.split()[0]
+    start = time.perf_counter()
+    from ai.predict import read_model
+    from ai.runtime import load_runtime
+    model = load_runtime(model_path, backend, read_model)
+    load_time = time.perf_counter() - start
+
+    X = np.random.rand(1, *model.input_shape[1:]).astype(np.float32)
+    predict = (lambda: model.predict(X, verbose=0)) if backend == 'keras' else (lambda: model.predict(X))
+    start = time.perf_counter()
+    predict()
+    first_call = time.perf_counter() - start
+
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        predict()
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    print(json.dumps({
+        'load': load_time, 'first': first_call,
+        'p50': latencies[len(latencies) // 2], 'p99': latencies[int(len(latencies) * 0.99)],
+        'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,   # MiB on Linux
+        'tensorflow': 'tensorflow' in sys.modules,
+    }))
+
+
+def main(calls=200):
+    from common import print_table
+
+    # Work on a copy, the tflite backend writes model.tflite next to the model
+    temp_dir = tempfile.mkdtemp()
+    model_path = os.path.join(temp_dir, "model.h5")
+    shutil.copy(MODEL_PATH, model_path)
+    try:
+        rows = []
+        results = {}
+        for backend in BACKENDS:
+            out = subprocess.run([sys.executable, __file__, '--child', backend, str(calls), model_path],
+                                 check=True, capture_output=True, text=True).stdout
+            results[backend] = r = json.loads(out.strip().splitlines()[-1])
+            rows.append((backend, f"p50 {r['p50'] * 1000:7.3f} ms  p99 {r['p99'] * 1000:7.3f} ms  "
+                               f"first {r['first'] * 1000:7.1f} ms  load {r['load']:5.2f} s  "
+                                  f"RSS {r['rss']:6.0f} MiB  TF {'yes' if r['tensorflow'] else 'no'}"))
+        print_table(f"Inference, {calls} calls on (1, 24, features)", rows)
+        print(f"function: {results['keras']['p50'] / results['function']['p50']:.0f}x, "
+              f"tflite: {results['keras']['p50'] / results['tflite']['p50']:.0f}x faster than keras per call")
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        child(sys.argv[2], int(sys.argv[3]), sys.argv[4])
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,70 @@
+"""
+Write-behind ingest benchmark.
+
+Simulates sensor_publish_handler for light/temp messages, which store one row
+per light/temp module (12 with the sample sensors). Compares writing each
+row synchronously with db_add_sensor_data against queueing them on an
+IngestQueue, measuring the time the MQTT thread is blocked and the end to
+end throughput until everything is committed.
+
+Usage: python benchmarks/bench_ingest.py [num_messages]
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+
+from common import create_temp_db, remove_db, print_table, quiet
+from database import database
+from database.ingest import IngestQueue
+
+NUM_MODULES = 12
+
+
+def main(n=500):
+    db_path = create_temp_db()
+    try:
+        with quiet():
+            sensor_ids = [database.db_add_sensor(f"BENCH-{i:04d}", f"b{i}", "light", db_path) for i in range(NUM_MODULES)]
+        base = datetime(2024, 1, 1)
+
+        def messages(offset):
+            for i in range(n):
+                ts = (base + timedelta(seconds=offset + i)).strftime('%Y-%m-%d %H:%M:%S')
+                yield [(ts, sensor_id, i % 4) for sensor_id in sensor_ids]
+
+        # Synchronous: one transaction per row, on the MQTT thread
+        with quiet():
+            start = time.perf_counter()
+            for rows in messages(0):
+                for ts, sensor_id, value in rows:
+                    database.db_add_sensor_data(ts, sensor_id, value, db_path)
+            sync_elapsed = time.perf_counter() - start
+
+        # Write-behind: the handler only enqueues
+        ingest = IngestQueue(write_batch=lambda rows: database.db_add_sensor_data_batch(rows, db_path))
+        ingest.start()
+        with quiet():
+            start = time.perf_counter()
+            handler_time = 0.0
+            for rows in messages(n):
+                t0 = time.perf_counter()
+                ingest.put_many(rows)
+                handler_time += time.perf_counter() - t0
+            ingest.stop()
+            queued_elapsed = time.perf_counter() - start
+
+        rows_total = n * NUM_MODULES
+        print_table(f"Ingest ({n} messages x {NUM_MODULES} rows)", [
+            ("sync   handler time / message", f"{sync_elapsed / n * 1000:8.3f} ms"),
+            ("queued handler time / message", f"{handler_time / n * 1000:8.3f} ms"),
+            ("sync   throughput", f"{rows_total / sync_elapsed:8.0f} rows/s"),
+            ("queued throughput (until committed)", f"{rows_total / queued_elapsed:8.0f} rows/s"),
+            ("queued transactions", f"{ingest.stats['batches']:8d} (vs {rows_total} sync)"),
+        ])
+    finally:
+        database.db_close_connections(db_path)
+        remove_db(db_path)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
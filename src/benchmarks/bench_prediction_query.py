@@ -0,0 +1,104 @@
+"""
+Prediction query benchmark.
+
+Compares the original db_get_sensor_data_for_prediction, which ran one query
+per (timestamp, sensor) pair, against the single range scan that replaced it.
+Data is shaped like insert_sample_sensor_data: one reading per light/temp
+sensor every 15 minutes, ending now.
+
+Usage: python benchmarks/bench_prediction_query.py [repeats]
+"""
+import sys
+import time
+import sqlite3
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from common import create_temp_db, remove_db, print_table, quiet
+from database import database
+
+DAYS = [1, 3, 7]
+SENSORS = [6, 12, 24]
+
+
+def legacy_data_for_prediction(db_name, days):
+    """The N x M query loop db_get_sensor_data_for_prediction used to run."""
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT id, name, category
+        FROM sensors
+        WHERE category IN ('light', 'temp') AND name IS NOT NULL
+    """)
+    sensors = cursor.fetchall()
+    days_ago = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+    data_dict = {'timestamp': []}
+    for sensor_id, name, category in sensors:
+        data_dict[name] = []
+    cursor.execute("""
+        SELECT DISTINCT sd.timestamp
+        FROM sensor_data sd
+        JOIN sensors s ON sd.sensor_id = s.id
+        WHERE sd.timestamp >= ?
+        AND s.category IN ('light', 'temp')
+        ORDER BY sd.timestamp
+    """, (days_ago,))
+    timestamps = [row[0] for row in cursor.fetchall()]
+    data_dict['timestamp'] = timestamps
+    for ts in timestamps:
+        for sensor_id, name, category in sensors:
+            cursor.execute("SELECT sensor_value FROM sensor_data WHERE sensor_id = ? AND timestamp = ?", (sensor_id, ts))
+            result = cursor.fetchone()
+            data_dict[name].append(result[0] if result else None)
+    conn.close()
+    df = pd.DataFrame(data_dict)
+    print(df)
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    df['hour'] = df['timestamp'].dt.hour
+    df['day_of_week'] = df['timestamp'].dt.dayofweek
+    return df
+
+
+def populate(db_path, days, num_sensors):
+    with quiet():
+        sensor_ids = [database.db_add_sensor(f"BENCH-{i:04d}", f"sensor{i}", "light" if i % 2 else "temp", db_path)
+                      for i in range(num_sensors)]
+    now = datetime.now().replace(second=0, microsecond=0)
+    rows = []
+    for step in range(days * 24 * 4):
+        ts = (now - timedelta(minutes=15 * step)).strftime('%Y-%m-%d %H:%M:%S')
+        rows.extend((ts, sensor_id, step % 4) for sensor_id in sensor_ids)
+    with quiet():
+        database.db_add_sensor_data_batch(rows, db_path)
+
+
+def best_of(repeats, fn):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with quiet():
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(repeats=3):
+    rows = []
+    for days in DAYS:
+        for num_sensors in SENSORS:
+            db_path = create_temp_db()
+            try:
+                populate(db_path, days, num_sensors)
+                legacy = best_of(repeats, lambda: legacy_data_for_prediction(db_path, days))
+                scan = best_of(repeats, lambda: database.db_get_sensor_data_for_prediction(days=days, db_name=db_path))
+                rows.append((f"{days}d x {num_sensors:2d} sensors",
+                             f"{legacy * 1000:9.1f} ms -> {scan * 1000:7.1f} ms  ({legacy / scan:5.1f}x)"))
+            finally:
+                database.db_close_connections(db_path)
+                remove_db(db_path)
+    print_table(f"db_get_sensor_data_for_prediction (legacy -> range scan, best of {repeats})", rows)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
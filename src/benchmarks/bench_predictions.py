@@ -0,0 +1,99 @@
+"""
+Prediction history benchmark.
+
+Keeps one prediction set every 10 minutes for 8 light and 4 temperature
+sensors, with readings of the same sensors every 5 minutes. Compares reading
+the latest set from the same rows in the old predictions table (MAX(timestamp)
+scan, then the set) and from prediction_history through prediction_latest,
+then times db_save_predictions and scoring the whole history with
+db_score_predictions (the migration marks the old rows scored, they are
+reset first as if they had been saved on the new schema).
+
+Usage: python benchmarks/bench_predictions.py [days]
+"""
+import sys
+import time
+import sqlite3
+from datetime import timedelta
+from unittest.mock import patch
+
+import numpy as np
+
+from common import create_temp_db, remove_db, print_table, quiet
+from bench_schema import FrozenDatetime
+from database import database
+from database import predictions
+from database import schema
+
+SENSORS = (('light', 8), ('temp', 4))
+SET_SECONDS = 10 * 60
+READING_SECONDS = 5 * 60
+REPEATS = 200
+
+
+def fill(db_path, days):
+    """Sensors, their readings and the prediction history in the old predictions table"""
+    rng = np.random.default_rng(0)
+    with quiet():
+        sensors = [(database.db_add_sensor(f"{category}-{i:04d}", f"{category}{i}", category, db_path),
+                    f"{category}{i}", category) for category, count in SENSORS for i in range(count)]
+    now = FrozenDatetime.frozen
+    readings = [(sensor_id, (now - timedelta(seconds=i * READING_SECONDS)).strftime('%Y-%m-%d %H:%M:%S'),
+                 float(rng.uniform(18, 30)) if category == 'temp' else int(rng.integers(0, 4)))
+                for i in range(days * 86400 // READING_SECONDS, 0, -1) for sensor_id, _, category in sensors]
+    with quiet():
+        database.db_bulk_ingest(readings, synchronous_off=True, db_name=db_path)
+
+    conn = sqlite3.connect(db_path)
+    conn.executemany("INSERT INTO predictions (timestamp, sensor_name, predicted_value, category) VALUES (?, ?, ?, ?)",
+                     [((now - timedelta(seconds=i * SET_SECONDS)).strftime('%Y-%m-%d %H:%M:%S'), name,
+                       float(rng.uniform(18, 30)) if category == 'temp' else int(rng.integers(0, 4)), category)
+                      for i in range(days * 86400 // SET_SECONDS, 0, -1) for _, name, category in sensors])
+    conn.commit()
+    conn.close()
+    return sensors
+
+
+def per_call(function):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        function()
+    return (time.perf_counter() - start) / REPEATS
+
+
+def main(days=30):
+    db_path = create_temp_db()
+    try:
+        with patch.object(database, 'datetime', FrozenDatetime):
+            sensors = fill(db_path, days)
+            sets = {'lights': {name: 1 for _, name, category in sensors if category == 'light'},
+                    'temperatures': {name: 21.5 for _, name, category in sensors if category == 'temp'}}
+            with quiet():
+                old = per_call(lambda: database.db_get_latest_predictions(db_path))
+                schema.migrate(db_path)
+                new = per_call(lambda: database.db_get_latest_predictions(db_path))
+                later = [(FrozenDatetime.frozen + timedelta(seconds=i)).strftime('%Y-%m-%d %H:%M:%S')
+                         for i in range(REPEATS)]
+                save = per_call(lambda: database.db_save_predictions(later.pop(), sets, db_path))
+
+                with sqlite3.connect(db_path) as conn:
+                    conn.execute("UPDATE prediction_history SET scored = 0")
+                start = time.perf_counter()
+                scored = database.db_score_predictions(db_name=db_path)
+                score = time.perf_counter() - start
+
+        rows = days * 86400 // SET_SECONDS * len(sensors)
+        print_table(f"{rows:,} predictions over {days} days, {len(sensors)} sensors", [
+            ("latest set", f"{old * 1000:7.3f} ms -> {new * 1000:7.3f} ms"),
+            ("save a set", f"{save * 1000:7.3f} ms"),
+            ("score history", f"{scored:,} rows in {score:5.2f} s ({scored / score:,.0f} rows/s)"),
+            ("accuracy", f"{len(database.db_get_prediction_accuracy(db_path))} sensors, "
+                         f"alpha {predictions.PREDICTION_ERROR_ALPHA}"),
+        ])
+    finally:
+        database.db_close_connections(db_path)
+        remove_db(db_path)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
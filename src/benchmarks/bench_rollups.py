@@ -0,0 +1,112 @@
+"""
+Rollup benchmark.
+
+Fills a database with 2 temperature sensors reporting once a minute for
+180 days and migrates copies to schema version 2 (compact readings) and 3
+(readings plus rollups). Compares reading one sensor's full history with
+db_get_sensor_data against db_get_sensor_history at its default point budget,
+and what the rollups add to the cost of writing a batch of readings.
+
+Usage: python benchmarks/bench_rollups.py [days]
+"""
+import sys
+import time
+import shutil
+import sqlite3
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from common import create_temp_db, remove_db, print_table, quiet
+from database import database
+from database import schema
+
+SENSORS = 2
+READING_SECONDS = 60
+BATCH = 1000
+REPEATS = 5
+
+
+class FrozenDatetime(datetime):
+    """Keeps the query windows still between repeats."""
+    frozen = datetime.now().replace(microsecond=0)
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.frozen
+
+
+def fill(db_path, days):
+    with quiet():
+        sensor_ids = [database.db_add_sensor(f"temp-{i:04d}", f"temp{i}", 'temp', db_path) for i in range(SENSORS)]
+    now = FrozenDatetime.frozen
+    rows = []
+    for i in range(days * 24 * 3600 // READING_SECONDS, 0, -1):
+        timestamp = (now - timedelta(seconds=i * READING_SECONDS)).strftime('%Y-%m-%d %H:%M:%S')
+        rows.extend((timestamp, sensor_id, 20 + (i % 120) / 10) for sensor_id in sensor_ids)
+    with quiet():
+        database.db_add_sensor_data_batch(rows, db_path)
+    return sensor_ids, len(rows)
+
+
+def timed(func, repeats=REPEATS):
+    with quiet():
+        result = func()
+        start = time.perf_counter()
+        for _ in range(repeats):
+            func()
+    return result, (time.perf_counter() - start) / repeats
+
+
+def batch_write_time(db_path, sensor_ids):
+    """Average time of writing BATCH new readings, newer than everything stored"""
+    now = FrozenDatetime.frozen
+    total = 0
+    for r in range(REPEATS):
+        rows = [((now + timedelta(seconds=(r * BATCH + i) * READING_SECONDS)).strftime('%Y-%m-%d %H:%M:%S'),
+                 sensor_ids[i % SENSORS], 21.5) for i in range(BATCH)]
+        _, seconds = timed(lambda: database.db_add_sensor_data_batch(rows, db_path), repeats=1)
+        total += seconds
+    return total / REPEATS
+
+
+@patch.object(database, 'datetime', FrozenDatetime)
+def main(days=180):
+    legacy_path = create_temp_db()
+    compact_path = legacy_path + '.v2'
+    rollup_path = legacy_path + '.v3'
+    try:
+        sensor_ids, num_rows = fill(legacy_path, days)
+        shutil.copy(legacy_path, compact_path)
+        with quiet():
+            schema.migrate(compact_path, schema.COMPACT_SCHEMA_VERSION)
+        shutil.copy(compact_path, rollup_path)
+        with quiet():
+            start = time.perf_counter()
+            schema.migrate(rollup_path)
+            migrate_time = time.perf_counter() - start
+
+        rows = [("migration to v3", f"{migrate_time * 1000:8.0f} ms")]
+        sensor = sensor_ids[0]
+        for window in (1, 7, 30, days):
+            raw, raw_time = timed(lambda: database.db_get_sensor_data(sensor, window, rollup_path))
+            history, history_time = timed(lambda: database.db_get_sensor_history(sensor, window, db_name=rollup_path))
+            rows.append((f"{window} days", f"{len(raw):7d} readings {raw_time * 1000:8.2f} ms -> "
+                                           f"{len(history['data']):4d} {history['resolution']:4s} points "
+                                           f"{history_time * 1000:6.2f} ms"))
+
+        compact_write = batch_write_time(compact_path, sensor_ids)
+        rollup_write = batch_write_time(rollup_path, sensor_ids)
+        rows.append((f"batch of {BATCH} readings", f"{compact_write * 1000:8.2f} ms -> {rollup_write * 1000:8.2f} ms"))
+
+        with sqlite3.connect(rollup_path) as conn:
+            buckets = conn.execute("SELECT COUNT(*) FROM rollups").fetchone()[0]
+        print_table(f"{num_rows} readings, {buckets} rollup buckets "
+                    f"(db_get_sensor_data -> db_get_sensor_history, v2 -> v3 writes)", rows)
+    finally:
+        remove_db(legacy_path)
+        remove_db(compact_path)
+        remove_db(rollup_path)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 180)
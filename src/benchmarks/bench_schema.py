@@ -0,0 +1,126 @@
+"""
+Compact schema benchmark.
+
+Fills a database with the original sensor_data layout: 12 light/temp and
+4 radar/door sensors, one reading every 2 minutes on average, for 30 days.
+A copy is migrated with database.schema.migrate. Compares the file size and
+the latency of the time-range queries the AI and the UI run, before and
+after. Every function must return the same result on both files.
+
+Usage: python benchmarks/bench_schema.py [days]
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import sqlite3
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from common import create_temp_db, remove_db, print_table, quiet
+from database import database
+from database import schema
+
+SENSORS = [('light', 8), ('temp', 4), ('radar', 2), ('door', 2)]
+READING_SECONDS = 120
+REPEATS = 5
+
+
+class FrozenDatetime(datetime):
+    """Keeps the query windows still, so both files are read over the same readings."""
+    frozen = datetime.now().replace(microsecond=0)
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.frozen
+
+
+def fill(db_path, days):
+    with quiet():
+        sensor_ids = [(database.db_add_sensor(f"{category}-{i:04d}", f"{category}{i}", category, db_path), category)
+                      for category, count in SENSORS for i in range(count)]
+    rng = random.Random(0)
+    now = FrozenDatetime.frozen
+    rows = []
+    for i in range(days * 24 * 3600 // READING_SECONDS, 0, -1):
+        sensor_id, category = rng.choice(sensor_ids)
+        timestamp = (now - timedelta(seconds=i * READING_SECONDS)).strftime('%Y-%m-%d %H:%M:%S')
+        rows.append((timestamp, sensor_id, round(rng.uniform(18, 32), 1) if category == 'temp' else rng.randint(0, 3)))
+    with quiet():
+        database.db_add_sensor_data_batch(rows, db_path)
+    return sensor_ids[0][0], rows[len(rows) // 2][0]
+
+
+def file_size(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    return os.path.getsize(db_path)
+
+
+def timed(func):
+    with quiet():
+        result = func()
+        start = time.perf_counter()
+        for _ in range(REPEATS):
+            func()
+    return result, (time.perf_counter() - start) / REPEATS
+
+
+def same(a, b):
+    if isinstance(a, pd.DataFrame):
+        pd.testing.assert_frame_equal(a, b)
+    elif isinstance(a, dict) and 'values' in a:
+        np.testing.assert_array_equal(a['values'], b['values'])
+    else:
+        assert a == b
+
+
+@patch.object(database, 'datetime', FrozenDatetime)
+def main(days=30):
+    legacy_path = create_temp_db()
+    compact_path = legacy_path + '.compact'
+    try:
+        light, timestamp = fill(legacy_path, days)
+        legacy_size = file_size(legacy_path)
+        shutil.copy(legacy_path, compact_path)
+        with quiet():
+            start = time.perf_counter()
+            schema.migrate(compact_path)
+            migrate_time = time.perf_counter() - start
+        compact_size = file_size(compact_path)
+
+        queries = [
+            ("prediction (1 day)", lambda db: database.db_get_sensor_data_for_prediction(1, db)),
+            ("training matrix (14 days)", lambda db: database.db_get_sensor_matrix(14, db_name=db)),
+            ("one sensor (7 days)", lambda db: database.db_get_sensor_data(light, 7, db)),
+            ("timestamps since (1 day)", lambda db: database.db_get_timestamps_since(1, db)),
+            ("recent timestamps (24)", lambda db: database.db_get_recent_timestamps(24, db)),
+            ("readings at a timestamp", lambda db: database.db_get_sensor_readings_for_timestamp(timestamp, db)),
+        ]
+        rows = [
+            ("file size", f"{legacy_size / 1024:8.0f} KiB -> {compact_size / 1024:8.0f} KiB"),
+            ("migration", f"{migrate_time * 1000:8.1f} ms"),
+        ]
+        for name, query in queries:
+            legacy_result, legacy_time = timed(lambda: query(legacy_path))
+            compact_result, compact_time = timed(lambda: query(compact_path))
+            same(legacy_result, compact_result)
+            rows.append((name, f"{legacy_time * 1000:8.2f} ms -> {compact_time * 1000:8.2f} ms"))
+
+        with sqlite3.connect(compact_path) as conn:
+            num_rows = conn.execute("SELECT COUNT(*) FROM readings").fetchone()[0]
+        print_table(f"sensor_data layout, {num_rows} readings over {days} days (legacy -> compact)", rows)
+        print(f"{legacy_size / compact_size:.1f}x smaller, all queries return the same result")
+    finally:
+        remove_db(legacy_path)
+        remove_db(compact_path)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 30)
@@ -0,0 +1,127 @@
+"""
+Sparse sensor storage benchmark.
+
+Replays a day of light/temp messages from the 12 sample modules (8 lights,
+4 temperature sensors) the way sensor_publish_handler stored them before and
+after the change: dense, one row per module per message copying the other
+modules' last values, and sparse, the reading only. Reports rows written per
+message, database growth per day, write and prediction query time, and what
+db_compact_sensor_data makes of the dense day. The prediction DataFrame is
+checked to be identical for all three.
+
+Usage: python benchmarks/bench_sparse_storage.py [messages_per_day]
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from common import create_temp_db, remove_db, print_table, quiet
+from database import database
+
+NUM_LIGHTS = 8
+NUM_TEMPS = 4
+BATCH_ROWS = 200        # IngestQueue's INGEST_BATCH_ROWS
+
+
+def messages(n, start, sensor_ids, temps):
+    """n readings spread over the day after start, from random modules, in time order."""
+    rng = random.Random(0)
+    step = (24 * 3600 - 120) / n
+    for i in range(n):
+        sensor_id = rng.choice(sensor_ids)
+        value = round(rng.uniform(18, 32), 1) if sensor_id in temps else rng.randint(0, 3)
+        yield (start + timedelta(seconds=int(i * step))).strftime('%Y-%m-%d %H:%M:%S'), sensor_id, value
+
+
+def db_size(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return os.path.getsize(db_path)
+    finally:
+        conn.close()
+
+
+def store(db_path, n, start_time, dense):
+    with quiet():
+        lights = [database.db_add_sensor(f"L-{i:04d}", f"light{i}", "light", db_path) for i in range(NUM_LIGHTS)]
+        temps = [database.db_add_sensor(f"T-{i:04d}", f"temp{i}", "temp", db_path) for i in range(NUM_TEMPS)]
+    sensor_ids = lights + temps
+    empty_size = db_size(db_path)
+
+    last_vals = {}
+    batch = []
+    written = 0
+    start = time.perf_counter()
+    with quiet():
+        for timestamp, sensor_id, value in messages(n, start_time, sensor_ids, set(temps)):
+            if dense:
+                batch.extend((timestamp, mod, value if mod == sensor_id else last_vals.get(mod)) for mod in sensor_ids)
+            else:
+                batch.append((timestamp, sensor_id, value))
+            last_vals[sensor_id] = value
+            if len(batch) >= BATCH_ROWS:
+                written += database.db_add_sensor_data_batch(batch, db_path)
+                batch = []
+        written += database.db_add_sensor_data_batch(batch, db_path)
+    elapsed = time.perf_counter() - start
+    return written, elapsed, db_size(db_path) - empty_size
+
+
+def query(db_path, repeats=5):
+    with quiet():
+        start = time.perf_counter()
+        for _ in range(repeats):
+            df = database.db_get_sensor_data_for_prediction(days=1, db_name=db_path)
+    return df, (time.perf_counter() - start) / repeats
+
+
+def main(n=5000):
+    dense_path = create_temp_db()
+    sparse_path = create_temp_db()
+    try:
+        start_time = datetime.now().replace(microsecond=0) - timedelta(days=1) + timedelta(minutes=1)
+        dense_rows, dense_time, dense_growth = store(dense_path, n, start_time, dense=True)
+        sparse_rows, sparse_time, sparse_growth = store(sparse_path, n, start_time, dense=False)
+        dense_df, dense_query = query(dense_path)
+        sparse_df, sparse_query = query(sparse_path)
+        pd.testing.assert_frame_equal(sparse_df, dense_df)
+
+        # Migrating the dense day
+        with quiet():
+            start = time.perf_counter()
+            deleted = database.db_compact_sensor_data(dense_path)
+            compact_time = time.perf_counter() - start
+        conn = sqlite3.connect(dense_path)
+        conn.execute("VACUUM")
+        conn.close()
+        compacted_df, compacted_query = query(dense_path)
+        pd.testing.assert_frame_equal(compacted_df, dense_df)
+
+        print_table(f"Light/temp storage, {n} messages/day from {NUM_LIGHTS + NUM_TEMPS} modules", [
+            ("dense  rows / message", f"{dense_rows / n:8.1f}"),
+            ("sparse rows / message", f"{sparse_rows / n:8.1f}"),
+            ("dense  growth / day", f"{dense_growth / 1024:8.0f} KiB"),
+            ("sparse growth / day", f"{sparse_growth / 1024:8.0f} KiB"),
+            ("dense  write time / day", f"{dense_time * 1000:8.1f} ms"),
+            ("sparse write time / day", f"{sparse_time * 1000:8.1f} ms"),
+            ("dense  prediction query", f"{dense_query * 1000:8.1f} ms"),
+            ("sparse prediction query", f"{sparse_query * 1000:8.1f} ms"),
+            ("migration rows removed", f"{deleted:8d} of {dense_rows}"),
+            ("migration time", f"{compact_time * 1000:8.1f} ms"),
+            ("migrated size", f"{db_size(dense_path) / 1024:8.0f} KiB"),
+            ("migrated prediction query", f"{compacted_query * 1000:8.1f} ms"),
+        ])
+        print(f"{dense_growth / sparse_growth:.1f}x less growth, prediction DataFrame identical")
+    finally:
+        remove_db(dense_path)
+        remove_db(sparse_path)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
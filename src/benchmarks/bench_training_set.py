@@ -0,0 +1,113 @@
+"""
+Training-set builder benchmark.
+
+Compares the original ai/train.py pipeline (per-sensor queries, pandas map
+per column, one Python slice per window) against the SQL pivot into a
+float32 matrix plus sliding_window_view. Data is shaped like
+insert_sample_sensor_data: 12 light/temp sensors, one reading every 15 minutes.
+Peak memory is measured with tracemalloc and covers numpy buffers too.
+
+Usage: python benchmarks/bench_training_set.py [days ...]
+"""
+import sys
+import time
+import tracemalloc
+from functools import partial
+from unittest.mock import patch
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from common import create_temp_db, remove_db, print_table, quiet
+from database import database
+from ai import train
+
+NUM_SENSORS = 12
+
+
+def legacy_training_set(db_path, days):
+    """load_and_preprocess_data + prepare_sequences as they used to be."""
+    all_sensor_data = database.db_get_all_sensor_data(days=days, db_name=db_path)
+    light_sensors = [name for name, info in all_sensor_data.items() if info['category'] == 'light']
+    temp_sensors = [name for name, info in all_sensor_data.items() if info['category'] == 'temp']
+    all_timestamps = set()
+    for sensor_name, info in all_sensor_data.items():
+        for timestamp, _ in info['data']:
+            all_timestamps.add(timestamp)
+    df = pd.DataFrame(sorted(all_timestamps), columns=['timestamp'])
+    for sensor_name, info in all_sensor_data.items():
+        sensor_dict = {timestamp: value for timestamp, value in info['data']}
+        df[sensor_name] = df['timestamp'].map(sensor_dict)
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    df['hour'] = df['timestamp'].dt.hour / 23.0
+    df['day_of_week'] = df['timestamp'].dt.dayofweek / 6.0
+    for sensor in temp_sensors:
+        std_temp = df[sensor].std() or 1.0
+        df[sensor] = (df[sensor] - df[sensor].mean()) / std_temp
+    df = df.dropna()
+    features = light_sensors + temp_sensors + ['hour', 'day_of_week']
+    target_features = light_sensors + temp_sensors
+    data = df[features].values.astype(np.float32)
+
+    X, y = [], []
+    for i in range(len(data) - train.SEQ_LEN):
+        X.append(data[i:i + train.SEQ_LEN])
+        target_indices = [features.index(feature) for feature in target_features]
+        y.append([data[i + train.SEQ_LEN][idx] for idx in target_indices])
+    return np.array(X), np.array(y)
+
+
+def vectorized_training_set(days):
+    data, features, target_features = train.load_and_preprocess_data(days)
+    X, y, _ = train.prepare_sequences(data, features, target_features)
+    return X, y
+
+
+def populate(db_path, days):
+    with quiet():
+        sensor_ids = [database.db_add_sensor(f"BENCH-{i:04d}", f"sensor{i}", "light" if i % 2 else "temp", db_path)
+                      for i in range(NUM_SENSORS)]
+    now = datetime.now().replace(second=0, microsecond=0)
+    rows = []
+    for step in range(days * 24 * 4):
+        ts = (now - timedelta(minutes=15 * step)).strftime('%Y-%m-%d %H:%M:%S')
+        rows.extend((ts, sensor_id, 20 + step % 7 if i % 2 == 0 else step % 4)
+                    for i, sensor_id in enumerate(sensor_ids))
+    with quiet():
+        database.db_add_sensor_data_batch(rows, db_path)
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    with quiet():
+        X, y = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, X, y
+
+
+def main(days_list=(14, 30, 90)):
+    rows = []
+    for days in days_list:
+        db_path = create_temp_db()
+        try:
+            populate(db_path, days)
+            legacy_time, legacy_peak, legacy_X, legacy_y = measure(lambda: legacy_training_set(db_path, days))
+            # train.load_and_preprocess_data reads the default database
+            with patch.object(train, 'db_get_sensor_matrix', partial(database.db_get_sensor_matrix, db_name=db_path)):
+                new_time, new_peak, X, y = measure(lambda: vectorized_training_set(days))
+            assert X.shape == legacy_X.shape and np.allclose(X, legacy_X, atol=1e-6) and np.allclose(y, legacy_y, atol=1e-6)
+            rows.append((f"{days:3d} days, {len(X)} windows",
+                         f"{legacy_time * 1000:8.0f} ms {legacy_peak / 2**20:7.1f} MiB -> "
+                         f"{new_time * 1000:6.0f} ms {new_peak / 2**20:6.1f} MiB"))
+        finally:
+            database.db_close_connections(db_path)
+            remove_db(db_path)
+    print_table(f"Training set, {NUM_SENSORS} sensors (legacy -> vectorized, time / peak memory)", rows)
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or (14, 30, 90))
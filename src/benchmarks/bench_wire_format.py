@@ -0,0 +1,83 @@
+"""
+Wire format benchmark for sensor/publish messages.
+
+Builds the messages the ESP32 modules send: single light readings with
+power, single temperature readings, and batches of 50 buffered readings as
+flush_csv sends them. Compares the bytes on the wire of JSON and of the
+compact form (sensor/compact.py), then the time the core needs to turn one
+message into readings with local times: payload.decode + payload.readings +
+get_localtime, as sensor_publish_handler does. The compact form is timed
+with the MessagePack subset of the module, and with the msgpack package too
+when it is installed.
+
+Usage: python benchmarks/bench_wire_format.py [messages]
+"""
+import sys
+import json
+import time
+import random
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from common import print_table
+from sensor import compact, payload
+from sensor.topics import T_SENSOR_PUBLISH, T_SENSOR_PUBLISH_COMPACT
+from utils.utils import get_localtime
+
+BATCH_READINGS = 50
+
+
+def utc(i):
+    return (datetime(2025, 5, 1) + timedelta(seconds=i * 15)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def messages(n):
+    rng = random.Random(0)
+    return {
+        'light': [{"type": "light", "time": utc(i), "client_id": "L-21.09-0001", "data": rng.randint(0, 3),
+                   "power": rng.randint(0, 40)} for i in range(n)],
+        'temp': [{"type": "temp", "time": utc(i), "client_id": "T-21.09-0001",
+                  "data": round(rng.uniform(18, 32), 2)} for i in range(n)],
+        f'batch of {BATCH_READINGS}': [payload.batch('switch', "SW-21.09-0001",
+                                                    [{"time": utc(i * BATCH_READINGS + j), "data": rng.randint(0, 40)}
+                                                     for j in range(BATCH_READINGS)])
+                                      for i in range(max(1, n // BATCH_READINGS))],
+    }
+
+
+def handle(topic, message):
+    """What sensor_publish_handler does before looking the module up"""
+    for reading in payload.readings(payload.decode(topic, message)):
+        reading["time"] = get_localtime(reading["time"])
+
+
+def per_message(topic, encoded):
+    start = time.perf_counter()
+    for message in encoded:
+        handle(topic, message)
+    return (time.perf_counter() - start) / len(encoded)
+
+
+def main(n=20000):
+    codecs = [('compact', None)]
+    if compact.msgpack is not None:
+        codecs.append(('compact (msgpack)', compact.msgpack))
+
+    for name, data in messages(n).items():
+        as_json = [json.dumps(message).encode() for message in data]
+        json_bytes = sum(map(len, as_json)) / len(data)
+        json_time = per_message(T_SENSOR_PUBLISH, as_json)
+        rows = [("JSON", f"{json_bytes:7.1f} B {json_time * 1e6:8.2f} us")]
+        for codec_name, module in codecs:
+            with patch.object(compact, 'msgpack', module):
+                as_compact = [compact.encode(message) for message in data]
+                compact_bytes = sum(map(len, as_compact)) / len(data)
+                compact_time = per_message(T_SENSOR_PUBLISH_COMPACT, as_compact)
+            rows.append((codec_name, f"{compact_bytes:7.1f} B {compact_time * 1e6:8.2f} us "
+                                     f"({compact_bytes / json_bytes:.0%} of the bytes, "
+                                     f"{json_time / compact_time:.1f}x faster)"))
+        print_table(f"{name}: {len(data):,} messages, bytes and decode time per message", rows)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
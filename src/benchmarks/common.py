@@ -0,0 +1,91 @@
+"""
+Shared helpers for the benchmark scripts.
+"""
+import os
+import sys
+import io
+import contextlib
+import sqlite3
+import tempfile
+import time
+
+# Add parent directory to path to import database module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def create_temp_db():
+    """Create an empty database with the production tables and return its path."""
+    fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE sensor_data (
+            sensor_id TEXT,
+            timestamp TEXT,
+            sensor_value REAL,
+            PRIMARY KEY (sensor_id, timestamp)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE sensors (
+            id TEXT,
+            client_id TEXT,
+            name TEXT,
+            category TEXT,
+            last_val TEXT,
+            PRIMARY KEY (id, client_id)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE predictions (
+            timestamp TEXT,
+            sensor_name TEXT,
+            predicted_value REAL,
+            category TEXT
+        )
+    """)
+    cursor.execute("""
+        CREATE TRIGGER update_last_val
+        AFTER INSERT ON sensor_data
+        FOR EACH ROW
+        BEGIN
+            UPDATE sensors
+            SET last_val = NEW.sensor_value
+            WHERE id = NEW.sensor_id;
+        END
+    """)
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def remove_db(db_path):
+    for suffix in ('', '-wal', '-shm'):
+        try:
+            os.remove(db_path + suffix)
+        except OSError:
+            pass
+
+
+def ops_per_sec(func, n):
+    """Call func(i) n times and return the achieved rate."""
+    start = time.perf_counter()
+    for i in range(n):
+        func(i)
+    elapsed = time.perf_counter() - start
+    return n / elapsed if elapsed else float('inf')
+
+
+def quiet():
+    """Swallow the print() logging done by the db_* functions."""
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def print_table(title, rows):
+    print(f"\n{title}")
+    print("-" * 60)
+    for name, value in rows:
+        print(f"{name:<40} {value}")
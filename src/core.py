@@ -1,4 +1,4 @@
-from sensor.s_module import init_modules
+from sensor.s_module import init_modules, stop_modules
 from threading import Thread
 import time
 from utils.console import *
@@ -6,6 +6,8 @@ from utils.utils import get_local_ip
 from zeroconf import ServiceInfo, Zeroconf
 import socket
 from sensor.S_server import init_data_server
+from database.database import DB_NAME
+from database.metrics import start_export
 import utils.globals
 
 ip = get_local_ip()
@@ -43,12 +45,15 @@ Status: {GREEN}Running...{RESET}
     utils.globals.client_id = 'central_main'
     init_modules()
     init_data_server()
+    # Database timings for the web UI, see database/metrics.py
+    start_export('core', DB_NAME)
 
     try:
         print("Press CTRL+C to quit")
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
+        stop_modules()
         zeroconf.unregister_service(info1)
         zeroconf.unregister_service(info2)
         zeroconf.close()
@@ -0,0 +1,131 @@
+"""
+Cold storage for sensor readings older than the retention horizon.
+
+Up to schema version 3 db_archive_sensor_data moves them out of SQLite into
+one compressed NumPy file per sensor per month, next to the database (from
+version 4 they go to the sensor_chunks table instead, see chunks.py):
+
+  <database>_archive/<sensor_id>/<YYYY-MM>.npz   ts (int64), value (float64, NaN for NULL)
+  <database>_archive/manifest.json               {"horizon": ts}
+
+ts counts seconds like readings.ts, from the local wall-clock timestamp.
+Every reading before the horizon had been archived when it was set. The
+long-range read functions take the window before the horizon from here and
+the rest from SQLite; rows written to SQLite below the horizon afterwards
+override the archived reading with the same timestamp.
+
+Run from src: python -m database.archive [days_to_keep] [database.db]
+"""
+import os
+import sys
+import json
+
+import numpy as np
+
+MANIFEST = 'manifest.json'
+
+
+def archive_dir(db_name):
+    """database.db -> database_archive"""
+    return os.path.splitext(db_name)[0] + '_archive'
+
+
+def _replace(path, write):
+    """Write a file through a temporary one, so readers never see it half written."""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        write(f)
+    os.replace(temp_path, path)
+
+
+def horizon(directory):
+    """The archive horizon as a ts, None if nothing was archived."""
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)['horizon']
+    except FileNotFoundError:
+        return None
+
+
+def set_horizon(directory, ts):
+    """Move the horizon forward to ts, it never moves back."""
+    current = horizon(directory)
+    if current is not None and current >= ts:
+        return
+    os.makedirs(directory, exist_ok=True)
+    _replace(os.path.join(directory, MANIFEST), lambda f: f.write(json.dumps({'horizon': int(ts)}).encode()))
+
+
+def _month_path(directory, sensor_id, month):
+    return os.path.join(directory, sensor_id, f"{month}.npz")
+
+
+def _load(path):
+    with np.load(path) as data:
+        return data['ts'], data['value']
+
+
+def write(directory, sensor_id, ts, values):
+    """Merge readings into the sensor's month files, replacing archived readings with the same ts."""
+    ts = np.asarray(ts, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    months = ts.astype('datetime64[s]').astype('datetime64[M]')
+    os.makedirs(os.path.join(directory, sensor_id), exist_ok=True)
+    for month in np.unique(months):
+        path = _month_path(directory, sensor_id, month)
+        month_ts, month_values = ts[months == month], values[months == month]
+        if os.path.isfile(path):
+            old_ts, old_values = _load(path)
+            keep = ~np.isin(old_ts, month_ts)
+            month_ts = np.concatenate([old_ts[keep], month_ts])
+            month_values = np.concatenate([old_values[keep], month_values])
+        order = np.argsort(month_ts, kind='stable')
+        _replace(path, lambda f: np.savez_compressed(f, ts=month_ts[order], value=month_values[order]))
+
+
+def read(directory, sensor_ids, start, end):
+    """
+    Archived readings of sensor_ids with start <= ts < end. Returns the arrays
+    ts, sensor (an index into sensor_ids) and value, sorted by ts.
+    """
+    months = np.arange(np.datetime64(int(start), 's').astype('datetime64[M]'),
+                       np.datetime64(int(end) - 1, 's').astype('datetime64[M]') + 1)
+    parts = []
+    for index, sensor_id in enumerate(sensor_ids):
+        for month in months:
+            path = _month_path(directory, sensor_id, month)
+            if not os.path.isfile(path):
+                continue
+            ts, values = _load(path)
+            mask = (ts >= start) & (ts < end)
+            parts.append((ts[mask], np.full(mask.sum(), index), values[mask]))
+    if not parts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    ts, sensors, values = (np.concatenate(column) for column in zip(*parts))
+    order = np.argsort(ts, kind='stable')
+    return ts[order], sensors[order], values[order]
+
+
+def last_before(directory, sensor_id, ts):
+    """The sensor's newest archived (ts, value) before ts that is not NULL, or None."""
+    sensor_dir = os.path.join(directory, sensor_id)
+    if not os.path.isdir(sensor_dir):
+        return None
+    month = str(np.datetime64(int(ts) - 1, 's').astype('datetime64[M]'))
+    names = sorted((name for name in os.listdir(sensor_dir) if name.endswith('.npz')), reverse=True)
+    for name in names:
+        if name[:-len('.npz')] > month:
+            continue
+        month_ts, values = _load(os.path.join(sensor_dir, name))
+        mask = (month_ts < ts) & ~np.isnan(values)
+        if mask.any():
+            return int(month_ts[mask][-1]), float(values[mask][-1])
+    return None
+
+
+if __name__ == "__main__":
+    from .database import DB_NAME, SENSOR_DATA_RETENTION_DAYS, db_archive_sensor_data
+
+    days_to_keep = int(sys.argv[1]) if len(sys.argv) > 1 else SENSOR_DATA_RETENTION_DAYS
+    db_name = sys.argv[2] if len(sys.argv) > 2 else DB_NAME
+    db_archive_sensor_data(days_to_keep, db_name=db_name)
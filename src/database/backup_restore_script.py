@@ -165,6 +165,8 @@ class DatabaseBackupRestore:
             # Create new database
             conn = sqlite3.connect(target_path)
             cursor = conn.cursor()
+            # A fresh file restored from scratch, no need to fsync every batch
+            cursor.execute("PRAGMA synchronous=OFF")
             
             # Recreate schema (using the same SQL from original script)
             cursor.execute("""
@@ -205,10 +207,10 @@ class DatabaseBackupRestore:
                 # Get all documents in the table's subcollection
                 docs = self.db.collection(backup_id).document(table).collection('data').stream()
                 
-                # Process in batches for better performance
+                # Process in batches for better performance, one executemany per column set
                 batch_size = 1000
                 count = 0
-                batch_data = []
+                batch_data = {}
                 
                 for doc in docs:
                     row_dict = doc.to_dict()
@@ -221,27 +223,25 @@ class DatabaseBackupRestore:
                     placeholders = ','.join(['?' for _ in columns])
                     
                     # Add to batch
-                    batch_data.append((
-                        f"INSERT OR REPLACE INTO {table} ({','.join(columns)}) VALUES ({placeholders})",
-                        values
-                    ))
+                    query = f"INSERT OR REPLACE INTO {table} ({','.join(columns)}) VALUES ({placeholders})"
+                    batch_data.setdefault(query, []).append(values)
                     count += 1
                     
                     # Execute batch if it's full
                     if count >= batch_size:
                         with conn:
-                            for query, params in batch_data:
-                                cursor.execute(query, params)
+                            for query, params in batch_data.items():
+                                cursor.executemany(query, params)
                         print(f"Restored {count} rows to {table}")
-                        batch_data = []
+                        batch_data = {}
                         count = 0
                 
                 # Execute any remaining items
                 if batch_data:
                     with conn:
-                        for query, params in batch_data:
-                            cursor.execute(query, params)
-                    print(f"Restored {len(batch_data)} rows to {table}")
+                        for query, params in batch_data.items():
+                            cursor.executemany(query, params)
+                    print(f"Restored {count} rows to {table}")
             
             conn.commit()
             print(f"Restore completed successfully to: {target_path}")
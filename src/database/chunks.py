@@ -0,0 +1,96 @@
+"""
+Archived readings packed into the sensor_chunks table, from schema version 4.
+
+On this version db_archive_sensor_data keeps the archive inside the database:
+one row per sensor per day holding the day's readings encoded by codec.py,
+written in the same transaction that deletes them from readings. The
+horizon is the end of the newest chunk, every reading before it had been
+archived when it was written (see archive.py for the read side).
+"""
+import numpy as np
+
+from . import codec
+
+CHUNK_SECONDS = 86400
+
+_SENSOR_KEY = "(SELECT sensor_key FROM sensor_keys WHERE sensor_id = ?)"
+
+
+def create_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE sensor_chunks (
+            sensor_key INTEGER NOT NULL,
+            chunk_start INTEGER NOT NULL,
+            last_ts INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (sensor_key, chunk_start)
+        )
+    """)
+
+
+def write(cursor, sensor_id, ts, values):
+    """Merge readings into the sensor's chunks, replacing chunked readings with the same ts."""
+    ts = np.asarray(ts, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    starts = ts - ts % CHUNK_SECONDS
+    for start in np.unique(starts).tolist():
+        chunk_ts, chunk_values = ts[starts == start], values[starts == start]
+        cursor.execute(f"SELECT data FROM sensor_chunks WHERE sensor_key = {_SENSOR_KEY} AND chunk_start = ?",
+                       (sensor_id, start))
+        row = cursor.fetchone()
+        if row:
+            old_ts, old_values = codec.decode(row[0])
+            keep = ~np.isin(old_ts, chunk_ts)
+            chunk_ts = np.concatenate([old_ts[keep], chunk_ts])
+            chunk_values = np.concatenate([old_values[keep], chunk_values])
+        order = np.argsort(chunk_ts, kind='stable')
+        chunk_ts, chunk_values = chunk_ts[order], chunk_values[order]
+        cursor.execute(f"""
+            INSERT OR REPLACE INTO sensor_chunks (sensor_key, chunk_start, last_ts, count, data)
+            VALUES ({_SENSOR_KEY}, ?, ?, ?, ?)
+        """, (sensor_id, start, int(chunk_ts[-1]), len(chunk_ts), codec.encode(chunk_ts, chunk_values)))
+
+
+def read(cursor, sensor_ids, start, end):
+    """
+    Chunked readings of sensor_ids with start <= ts < end. Returns the arrays
+    ts, sensor (an index into sensor_ids) and value, sorted by ts.
+    """
+    parts = []
+    for index, sensor_id in enumerate(sensor_ids):
+        cursor.execute(f"""
+            SELECT data FROM sensor_chunks
+            WHERE sensor_key = {_SENSOR_KEY} AND chunk_start > ? AND chunk_start < ?
+            ORDER BY chunk_start
+        """, (sensor_id, start - CHUNK_SECONDS, end))
+        for data, in cursor.fetchall():
+            ts, values = codec.decode(data)
+            mask = (ts >= start) & (ts < end)
+            parts.append((ts[mask], np.full(mask.sum(), index), values[mask]))
+    if not parts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    ts, sensors, values = (np.concatenate(column) for column in zip(*parts))
+    order = np.argsort(ts, kind='stable')
+    return ts[order], sensors[order], values[order]
+
+
+def last_before(cursor, sensor_id, ts):
+    """The sensor's newest chunked (ts, value) before ts that is not NULL, or None."""
+    cursor.execute(f"""
+        SELECT data FROM sensor_chunks
+        WHERE sensor_key = {_SENSOR_KEY} AND chunk_start < ?
+        ORDER BY chunk_start DESC
+    """, (sensor_id, ts))
+    for data, in cursor:
+        chunk_ts, values = codec.decode(data)
+        mask = (chunk_ts < ts) & ~np.isnan(values)
+        if mask.any():
+            return int(chunk_ts[mask][-1]), float(values[mask][-1])
+    return None
+
+
+def horizon(cursor):
+    """The horizon as a ts, None if nothing was archived."""
+    cursor.execute("SELECT MAX(last_ts) + 1 FROM sensor_chunks")
+    return cursor.fetchone()[0]
@@ -0,0 +1,164 @@
+"""
+Gorilla-style compression of one sensor's readings, after Facebook's Gorilla
+time series database.
+
+Timestamps are stored as delta-of-deltas: readings at a regular interval cost
+one bit each. Values are XORed with the value before them: a repeated value
+costs one bit, a changed one 12 bits plus the bits between the leading and
+trailing zeros of the XOR. A NULL reading is stored as NaN.
+
+Gorilla interleaves the control bits with the payloads, so a decoder has to
+walk the stream field by field. Here the same fields are laid out as
+columns, one after the other in a single bit stream, so that NumPy can
+encode and decode whole columns at once: every field of a fixed width
+column is at a known offset, and the payloads start at the cumulative sum
+of their widths.
+
+  header            version (1 byte), count (uint32), first ts (int64),
+                    first value (float64 bits)
+  for the readings after the first:
+  ts changed        1 bit each, whether the delta-of-delta d is not 0
+  ts class          2 bits per changed d, the width of its zigzag encoding:
+                    7, 9, 12 or 60 bits
+  ts payload        the zigzag encoded d's
+  value changed     1 bit each, whether the XOR x with the previous value is not 0
+  value window      11 bits per changed x: leading zeros (5 bits), length - 1 (6 bits)
+  value payload     the bits of each x between its leading and trailing zeros
+"""
+import struct
+
+import numpy as np
+
+VERSION = 1
+_HEADER = struct.Struct('<BIqQ')
+_TS_WIDTHS = np.array([7, 9, 12, 60])
+_BLOCK_FIELDS = 8192
+
+
+def _to_bits(codes, widths):
+    """The low widths[i] bits of codes[i], most significant first, as one array of 0s and 1s."""
+    codes = np.asarray(codes, dtype=np.uint64)
+    widths = np.broadcast_to(np.asarray(widths, dtype=np.int64), codes.shape)
+    bits = [np.empty(0, dtype=np.uint8)]
+    for start in range(0, len(codes), _BLOCK_FIELDS):
+        block_codes, block_widths = codes[start:start + _BLOCK_FIELDS], widths[start:start + _BLOCK_FIELDS]
+        shifts = block_widths[:, None] - 1 - np.arange(int(block_widths.max()))
+        matrix = (block_codes[:, None] >> np.clip(shifts, 0, 63).astype(np.uint64)) & np.uint64(1)
+        bits.append(matrix[shifts >= 0].astype(np.uint8))
+    return np.concatenate(bits)
+
+
+class _BitReader:
+    """Reads columns off a bit array, front to back."""
+
+    def __init__(self, data):
+        self.bits = np.unpackbits(data)
+        self.offset = 0
+
+    def fixed(self, count, width):
+        """count width bit unsigned integers."""
+        end = self.offset + count * width
+        if end > len(self.bits):
+            raise ValueError("truncated chunk")
+        matrix = self.bits[self.offset:end].reshape(count, width).astype(np.uint64)
+        self.offset = end
+        weights = np.uint64(1) << np.arange(width - 1, -1, -1, dtype=np.uint64)
+        return (matrix * weights).sum(axis=1, dtype=np.uint64)
+
+    def variable(self, widths):
+        """One unsigned integer of widths[i] bits for each i."""
+        widths = np.asarray(widths, dtype=np.int64)
+        values = np.zeros(len(widths), dtype=np.uint64)
+        if not len(widths):
+            return values
+        ends = self.offset + np.cumsum(widths)
+        if ends[-1] > len(self.bits):
+            raise ValueError("truncated chunk")
+        for start in range(0, len(widths), _BLOCK_FIELDS):
+            block_widths = widths[start:start + _BLOCK_FIELDS]
+            columns = np.arange(int(block_widths.max()))
+            inside = columns < block_widths[:, None]
+            positions = ends[start:start + _BLOCK_FIELDS, None] - block_widths[:, None] + columns
+            bits = self.bits[np.where(inside, positions, 0)].astype(np.uint64)
+            shifts = np.clip(block_widths[:, None] - 1 - columns, 0, 63).astype(np.uint64)
+            values[start:start + _BLOCK_FIELDS] = np.where(inside, bits << shifts, np.uint64(0)).sum(axis=1, dtype=np.uint64)
+        self.offset = int(ends[-1])
+        return values
+
+
+def _zigzag(values):
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def _unzigzag(values):
+    return (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64)
+
+
+def _bit_length(values):
+    """Number of bits of each uint64, log2 is exact on the 32 bit halves."""
+    with np.errstate(divide='ignore'):
+        high = np.log2((values >> np.uint64(32)).astype(np.float64))
+        low = np.log2((values & np.uint64(0xFFFFFFFF)).astype(np.float64))
+    return np.where(high >= 0, 33 + np.floor(high), np.where(low >= 0, 1 + np.floor(low), 0)).astype(np.int64)
+
+
+def _encode_ts(ts):
+    zigzag = _zigzag(np.diff(np.diff(ts), prepend=0))
+    changed = zigzag != 0
+    zigzag = zigzag[changed]
+    if (zigzag >= np.uint64(1 << 60)).any():
+        raise ValueError("timestamps too far apart to encode")
+    classes = np.searchsorted(_TS_WIDTHS, _bit_length(zigzag))
+    return [_to_bits(changed, 1), _to_bits(classes, 2), _to_bits(zigzag, _TS_WIDTHS[classes])]
+
+
+def _decode_ts(reader, first, count):
+    changed = reader.fixed(count - 1, 1).astype(bool)
+    classes = reader.fixed(int(changed.sum()), 2).astype(np.int64)
+    dod = np.zeros(count - 1, dtype=np.int64)
+    dod[changed] = _unzigzag(reader.variable(_TS_WIDTHS[classes]))
+    return np.concatenate([[first], first + np.cumsum(np.cumsum(dod))])
+
+
+def _encode_values(values):
+    words = values.view(np.uint64)
+    xors = words[1:] ^ words[:-1]
+    changed = xors != 0
+    xors = xors[changed]
+    # The lowest set bit is a power of two, which log2 gets exactly
+    lowest = np.log2((xors & (~xors + np.uint64(1))).astype(np.float64)).astype(np.int64)
+    leading = np.minimum(64 - _bit_length(xors), 31)
+    length = 64 - leading - lowest
+    return [_to_bits(changed, 1), _to_bits((leading << 6) | (length - 1), 11),
+            _to_bits(xors >> lowest.astype(np.uint64), length)]
+
+
+def _decode_values(reader, first, count):
+    changed = reader.fixed(count - 1, 1).astype(bool)
+    windows = reader.fixed(int(changed.sum()), 11).astype(np.int64)
+    leading, length = windows >> 6, (windows & 0x3F) + 1
+    xors = np.zeros(count - 1, dtype=np.uint64)
+    xors[changed] = reader.variable(length) << (64 - leading - length).astype(np.uint64)
+    words = np.bitwise_xor.accumulate(np.concatenate([[np.uint64(first)], xors]))
+    return words.view(np.float64)
+
+
+def encode(ts, values):
+    """Pack readings sorted by ts (seconds, int) with float values (NaN for NULL) into bytes."""
+    ts = np.asarray(ts, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    if len(ts) == 0:
+        raise ValueError("nothing to encode")
+    header = _HEADER.pack(VERSION, len(ts), int(ts[0]), int(values[:1].view(np.uint64)[0]))
+    return header + np.packbits(np.concatenate(_encode_ts(ts) + _encode_values(values))).tobytes()
+
+
+def decode(data):
+    """Unpack encode's bytes. Returns the arrays ts (int64) and values (float64)."""
+    version, count, first_ts, first_value = _HEADER.unpack_from(data)
+    if version != VERSION:
+        raise ValueError(f"unknown chunk version {version}")
+    reader = _BitReader(np.frombuffer(data, dtype=np.uint8, offset=_HEADER.size))
+    ts = _decode_ts(reader, first_ts, count)
+    values = _decode_values(reader, first_value, count)
+    return ts, values
@@ -0,0 +1,126 @@
+"""
+Pooled SQLite connections.
+
+Opening a connection and switching it to WAL mode costs more than most of the
+queries in database.py, so connections are kept open per db_name and reused.
+PRAGMAs are applied once, when a connection is created. Connections hand
+out cursors that time their statements, see metrics.py.
+"""
+import sqlite3
+from threading import Lock
+from contextlib import contextmanager
+
+from .metrics import TracedConnection
+
+CONNECT_TIMEOUT = 10
+POOL_MAX_IDLE = 4
+
+# Applied once per new connection
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",   # Safe with WAL, avoids an fsync per commit
+)
+
+
+class ConnectionPool:
+    """A small pool of long-lived connections to a single database file."""
+    def __init__(self, db_name, max_idle=POOL_MAX_IDLE):
+        self.db_name = db_name
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = Lock()
+        self.created = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_name, timeout=CONNECT_TIMEOUT, check_same_thread=False,
+                               factory=TracedConnection)
+        try:
+            for pragma in CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+        except sqlite3.Error:
+            conn.close()
+            raise
+        with self._lock:
+            self.created += 1
+        return conn
+
+    def acquire(self):
+        """Take an idle connection, or open a new one if none are available."""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._connect()
+
+    def release(self, conn):
+        """Return a connection to the pool, dropping any uncommitted work."""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self.discard(conn)
+            return
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def discard(self, conn):
+        """Close a connection that should not be reused."""
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        """Close every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self.discard(conn)
+
+
+_pools = {}
+_pools_lock = Lock()
+
+def get_pool(db_name):
+    with _pools_lock:
+        pool = _pools.get(db_name)
+        if pool is None:
+            pool = _pools[db_name] = ConnectionPool(db_name)
+        return pool
+
+@contextmanager
+def db_connection(db_name, snapshot=False):
+    """
+    Borrow a pooled connection for the duration of a with-block.
+    With snapshot=True the block runs inside a read transaction, so several
+    SELECTs see the same WAL snapshot even while another connection writes.
+    """
+    pool = get_pool(db_name)
+    conn = pool.acquire()
+    try:
+        if snapshot:
+            conn.execute("BEGIN")
+        yield conn
+    except sqlite3.OperationalError:
+        # The file or connection may be broken, don't hand it out again
+        pool.discard(conn)
+        raise
+    except BaseException:
+        pool.release(conn)
+        raise
+    else:
+        pool.release(conn)
+
+def close_connections(db_name=None):
+    """Close pooled connections for db_name, or for every database if None."""
+    with _pools_lock:
+        if db_name is None:
+            pools = list(_pools.values())
+            _pools.clear()
+        else:
+            pool = _pools.pop(db_name, None)
+            pools = [pool] if pool else []
+    for pool in pools:
+        pool.close()
@@ -2,19 +2,20 @@
 Database queries.
 """
 import sqlite3
-from threading import Lock
+from threading import local
 import uuid
 import os, time
+import itertools
+import functools
+import inspect
 from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
 import sys
-
-# Import from utils.console if available
-try:
-    from ..utils.console import RED, RESET
-except ImportError:
-    RED = "\033[91m"
-    RESET = "\033[0m"
+from .connection import db_connection, close_connections as db_close_connections
+from .schema import sensor_data_layout
+from . import archive, chunks, groups, metrics, predictions, resilience, rollups
+from .resilience import DatabaseError, DatabaseUnavailable
 
 # Try to import globals, but don't fail if not available
 try:
@@ -26,25 +27,80 @@ except ImportError:
     utils = PlaceholderGlobals()
 
 ui_client_id = 'central_main_ui'
-DB_ERROR_RETRY_TIMEOUT = 60
-
-class DatabaseError(Exception):
-    """A custom DatabaseError class."""
-    def __init__(self, message):
-        super().__init__(message)
+SENSOR_MATRIX_FETCH_ROWS = 4096
+SENSOR_HISTORY_MAX_POINTS = 500
+SENSOR_DATA_RETENTION_DAYS = 90
+ARCHIVE_BATCH_ROWS = 10000
+BULK_INGEST_CHUNK_ROWS = 5000
+PREDICTION_HORIZON_SECONDS = 15 * 60    # A prediction is scored against the value this much later
+PREDICTION_SCORE_BATCH_ROWS = 5000
 
 DB_NAME = os.path.join(os.path.dirname(__file__), "database.db")
-db_lock = Lock()
+
+# The database runs in WAL mode, so readers never block the writer or each
+# other. Only writes are serialized, db_get_* functions take no lock. The wait
+# for it and the time it is held are recorded per call, see metrics.py.
+db_write_lock = metrics.TimedLock()
+db_lock = db_write_lock  # Old name, kept for existing imports
+
+# Failed calls are retried with backoff, and fail fast while the database is
+# down, see resilience.py
+db_retry_policy = resilience.RetryPolicy()
+_db_call_state = local()
+
+def _db_call(function, db_name, name):
+    """
+    Run function() as the db_* call name, with db_retry_policy and the circuit
+    breaker of db_name, and record its timing in metrics. The UI gets
+    DatabaseError at the first failure. A db_* call made inside another one
+    runs as it is, the outer call retries and is timed.
+    """
+    if getattr(_db_call_state, 'active', False):
+        return function()
+    _db_call_state.active = True
+    try:
+        return metrics.measure(
+            lambda: resilience.call(function, resilience.get_breaker(db_name), db_retry_policy,
+                                    fail_fast=getattr(utils, 'client_id', None) == ui_client_id),
+            name, db_name)
+    finally:
+        _db_call_state.active = False
+
+def _resilient(function):
+    """Decorator running a db_* function through _db_call, for the db_name it was called with"""
+    parameters = inspect.signature(function).parameters
+    position = list(parameters).index('db_name')
+    default = parameters['db_name'].default
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        db_name = args[position] if len(args) > position else kwargs.get('db_name', default)
+        return _db_call(lambda: function(*args, **kwargs), db_name, function.__name__)
+    return wrapper
+
+# Callbacks run after rows in 'sensors' are added, renamed, replaced or deleted
+_module_change_listeners = []
+
+def db_add_module_change_listener(callback):
+    """Register callback(db_name), called after the sensors table changes in this process."""
+    _module_change_listeners.append(callback)
+
+def db_remove_module_change_listener(callback):
+    if callback in _module_change_listeners:
+        _module_change_listeners.remove(callback)
+
+def _notify_module_change(db_name):
+    for callback in list(_module_change_listeners):
+        try:
+            callback(db_name)
+        except Exception as e:
+            print(f"Module change listener failed: {e}")
 
 # UI and sensor handling
+@_resilient
 def db_add_module(client_id, name, category, db_name=DB_NAME):
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
     try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
-
+        with db_write_lock, db_connection(db_name) as conn:
             cursor = conn.cursor()
 
             # Check if client_id already exists
@@ -62,508 +118,446 @@ def db_add_module(client_id, name, category, db_name=DB_NAME):
             """, (sensor_id, client_id, name, category, None))
             conn.commit()
             print(f"Sensor added: {sensor_id} - {name}")
+            _notify_module_change(db_name)
             return sensor_id
     except sqlite3.IntegrityError:
         print(f"Sensor ID already exists: {sensor_id}")
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_add_module(client_id, name, category, db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
 
+@_resilient
 def db_get_available_all_modules(db_name=DB_NAME):
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
-
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                SELECT id, client_id, name, category, last_val
-                FROM sensors
-                WHERE name IS NOT NULL
-            """)
-            rows = cursor.fetchall()
-            modules = [
-                {"id": r[0], "client_id": r[1], "name": r[2], "category": r[3], "last_val": r[4]} for r in rows
-            ]
-            return modules
-        
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_get_available_all_modules(db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
-
+    with db_connection(db_name) as conn:
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT id, client_id, name, category, last_val
+            FROM sensors
+            WHERE name IS NOT NULL
+        """)
+        rows = cursor.fetchall()
+        modules = [
+            {"id": r[0], "client_id": r[1], "name": r[2], "category": r[3], "last_val": r[4]} for r in rows
+        ]
+        return modules
+
+@_resilient
 def db_get_available_all_modules_ctrl(db_name=DB_NAME):
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
-
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                SELECT client_id, name, category
-                FROM sensors
-                WHERE name IS NOT NULL AND (category = 'light' OR category = 'switch' OR category = 'door')
-            """)
-            rows = cursor.fetchall()
-            modules = [
-                {"client_id": r[0], "name": r[1], "category": r[2]} for r in rows
-            ]
-            return modules
-
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_get_available_all_modules_ctrl(db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
-
+    with db_connection(db_name) as conn:
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT client_id, name, category
+            FROM sensors
+            WHERE name IS NOT NULL AND (category = 'light' OR category = 'switch' OR category = 'door')
+        """)
+        rows = cursor.fetchall()
+        modules = [
+            {"client_id": r[0], "name": r[1], "category": r[2]} for r in rows
+        ]
+        return modules
+
+@_resilient
 def db_get_module_current_power_data(db_name=DB_NAME):
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
-
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                SELECT client_id, name, category, last_val
-                FROM sensors
-                WHERE name IS NOT NULL AND (category = 'light' OR category = 'switch')
-            """)
-            rows = cursor.fetchall()
-            modules = [
-                {"client_id": r[0], "name": r[1], "category": r[2], "power": r[3]} for r in rows
-            ]
-            return modules
-        
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_get_module_current_power_data(db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass      
-
+    with db_connection(db_name) as conn:
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT client_id, name, category, last_val
+            FROM sensors
+            WHERE name IS NOT NULL AND (category = 'light' OR category = 'switch')
+        """)
+        rows = cursor.fetchall()
+        modules = [
+            {"client_id": r[0], "name": r[1], "category": r[2], "power": r[3]} for r in rows
+        ]
+        return modules
+
+@_resilient
 def db_get_new_modules(db_name=DB_NAME):
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
-
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                SELECT id, client_id, name, category, last_val
-                FROM sensors
-                WHERE name IS NULL
-            """)
-            rows = cursor.fetchall()
-            modules = [
-                {"id": r[0], "client_id": r[1], "name": r[2], "category": r[3], "last_val": r[4]} for r in rows
-            ]
-            return modules
-
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_get_new_modules(db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
-
+    with db_connection(db_name) as conn:
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT id, client_id, name, category, last_val
+            FROM sensors
+            WHERE name IS NULL
+        """)
+        rows = cursor.fetchall()
+        modules = [
+            {"id": r[0], "client_id": r[1], "name": r[2], "category": r[3], "last_val": r[4]} for r in rows
+        ]
+        return modules
+
+@_resilient
 def db_assign_module(client_id, new_name, db_name=DB_NAME):
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
-
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                UPDATE sensors
-                SET name = ?
-                WHERE client_id = ?
-            """, (new_name, client_id))
-            
-            # Commit the changes and close the connection
-            conn.commit()
-            # Check how many rows were affected (useful for error handling)
-            rows_affected = cursor.rowcount
-            
-            # Return the number of rows affected
-            return rows_affected
+    with db_write_lock, db_connection(db_name) as conn:
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            UPDATE sensors
+            SET name = ?
+            WHERE client_id = ?
+        """, (new_name, client_id))
         
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_assign_module(client_id, new_name, db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
+        # Commit the changes and close the connection
+        conn.commit()
+        # Check how many rows were affected (useful for error handling)
+        rows_affected = cursor.rowcount
+        if rows_affected:
+            _notify_module_change(db_name)
+        
+        # Return the number of rows affected
+        return rows_affected
 
+@_resilient
 def db_replace_module(id, new_client_id, db_name=DB_NAME):
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
-
-            cursor = conn.cursor()
-
-            # Check if there's a sensor with this client_id and name IS NULL
+    with db_write_lock, db_connection(db_name) as conn:
+        cursor = conn.cursor()
+
+        # Check if there's a sensor with this client_id and name IS NULL
+        cursor.execute("""
+            SELECT id FROM sensors
+            WHERE client_id = ? AND name IS NULL
+        """, (new_client_id,))
+        placeholder = cursor.fetchone()
+
+        if placeholder:
+            # Delete the placeholder sensor
             cursor.execute("""
-                SELECT id FROM sensors
+                DELETE FROM sensors
                 WHERE client_id = ? AND name IS NULL
             """, (new_client_id,))
-            placeholder = cursor.fetchone()
-
-            if placeholder:
-                # Delete the placeholder sensor
-                cursor.execute("""
-                    DELETE FROM sensors
-                    WHERE client_id = ? AND name IS NULL
-                """, (new_client_id,))
-
-                # Update the target sensor's client_id
-                cursor.execute("""
-                    UPDATE sensors
-                    SET client_id = ?
-                    WHERE id = ?
-                """, (new_client_id, id))
-            
-            # Commit the changes and close the connection
-            conn.commit()
-            # Check how many rows were affected (useful for error handling)
-            rows_affected = cursor.rowcount
-            
-            # Return the number of rows affected
-            return rows_affected
-
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_replace_module(id, new_client_id, db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
 
+            # Update the target sensor's client_id
+            cursor.execute("""
+                UPDATE sensors
+                SET client_id = ?
+                WHERE id = ?
+            """, (new_client_id, id))
+        
+        # Commit the changes and close the connection
+        conn.commit()
+        # Check how many rows were affected (useful for error handling)
+        rows_affected = cursor.rowcount
+        if rows_affected:
+            _notify_module_change(db_name)
+        
+        # Return the number of rows affected
+        return rows_affected
+
+@_resilient
 def db_delete_module(id, db_name=DB_NAME):
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
+    with db_write_lock, db_connection(db_name) as conn:
+        cursor = conn.cursor()
 
-            cursor = conn.cursor()
+        cursor.execute("""
+            DELETE FROM sensors
+            WHERE id = ? AND category != 'temp' AND category != 'radar' AND category != 'door'
+        """, (id,))
+        
+        # Commit the changes and close the connection
+        conn.commit()
+        # Check how many rows were affected (useful for error handling)
+        rows_affected = cursor.rowcount
+        if rows_affected:
+            _notify_module_change(db_name)
+        
+        # Return the number of rows affected
+        return rows_affected
 
-            cursor.execute("""
-                DELETE FROM sensors
-                WHERE id = ? AND category != 'temp' AND category != 'radar' AND category != 'door'
-            """, (id,))
-            
-            # Commit the changes and close the connection
+@_resilient
+def db_add_sensor_data(timestamp, id, data, db_name=DB_NAME):
+    with db_write_lock, db_connection(db_name) as conn:
+        cursor = conn.cursor()
+
+        if sensor_data_layout(cursor)['rollups']:
+            _write_readings(cursor, [(timestamp, id, data)])
             conn.commit()
-            # Check how many rows were affected (useful for error handling)
-            rows_affected = cursor.rowcount
-            
-            # Return the number of rows affected
-            return rows_affected
-
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_delete_module(id, db_name)
-    finally:
+            print(f"Data added for timestamp: {timestamp}")
+            return
+
         try:
-            if conn:
-                conn.close()
-        except:
-            pass
+            cursor.execute("""
+                INSERT INTO sensor_data (sensor_id, timestamp, sensor_value)
+                VALUES (?, ?, ?)
+            """, (id, timestamp, data))
+            conn.commit()
+            print(f"Data added for timestamp: {timestamp}")
+        except sqlite3.IntegrityError:
+            print(f"Timestamp already exists, Updating: {timestamp}")
+            cursor.execute("""
+                UPDATE sensor_data
+                SET sensor_value = ?
+                WHERE sensor_id = ? AND timestamp = ?
+            """, (data, id, timestamp))
+            cursor.execute("""
+                UPDATE sensors
+                SET last_val = ?
+                WHERE id = ?
+            """, (data, id))
+            conn.commit()
 
-def db_add_sensor_data(timestamp, id, data, db_name=DB_NAME):
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
+def _write_readings(cursor, rows):
+    """
+    Insert or update (timestamp, id, data) readings and set last_val, without
+    committing. Returns the rows written.
+    """
+    layout = sensor_data_layout(cursor)
+
+    if layout['table'] == 'readings':
+        # Readings without a sensor id can't be keyed
+        rows = [row for row in rows if row[1] is not None]
+        cursor.executemany("""
+            INSERT OR IGNORE INTO sensor_keys (sensor_id)
+            VALUES (?)
+        """, [(id,) for id in {id for _, id, _ in rows}])
+
+    if layout['rollups']:
+        _write_readings_with_rollups(cursor, rows)
+    else:
+        # Existing (sensor, time) pairs are updated in place
+        cursor.executemany(f"""
+            INSERT INTO {layout['table']} ({layout['sensor']}, {layout['time']}, sensor_value)
+            VALUES ({layout['sensor_param']}, {layout['time_param']}, ?)
+            ON CONFLICT({layout['sensor']}, {layout['time']}) DO UPDATE SET sensor_value = excluded.sensor_value
+        """, [(id, timestamp, data) for timestamp, id, data in rows])
+
+    # The trigger only fires on INSERT, so set last_val for updated rows as well
+    last_vals = {}
+    for timestamp, id, data in rows:
+        last_vals[id] = data
+    cursor.executemany("""
+        UPDATE sensors
+        SET last_val = ?
+        WHERE id = ?
+    """, [(data, id) for id, data in last_vals.items()])
+    return rows
+
+def _write_readings_with_rollups(cursor, rows):
+    """Upsert readings through a staging table, folding new readings into the rollups"""
+    layout = sensor_data_layout(cursor)
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS incoming_readings (
+            sensor_key INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            sensor_value REAL,
+            existed INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (sensor_key, ts)
+        ) WITHOUT ROWID
+    """)
+    # The last of several readings for the same (sensor, time) wins, as with the upsert
+    cursor.executemany(f"""
+        INSERT OR REPLACE INTO incoming_readings (sensor_key, ts, sensor_value)
+        VALUES ({layout['sensor_param']}, {layout['time_param']}, ?)
+    """, [(id, timestamp, data) for timestamp, id, data in rows])
+    # Readings before the archive horizon may replace archived ones, their buckets are rebuilt
+    horizon = _horizon(cursor, _database_file(cursor))
+    cursor.execute("""
+        UPDATE incoming_readings
+        SET existed = ts < ? OR EXISTS (SELECT 1 FROM readings r
+                                        WHERE r.sensor_key = incoming_readings.sensor_key AND r.ts = incoming_readings.ts)
+    """, (horizon if horizon is not None else -1,))
+    cursor.execute("""
+        INSERT INTO readings (sensor_key, ts, sensor_value)
+        SELECT sensor_key, ts, sensor_value FROM incoming_readings
+        WHERE true
+        ON CONFLICT(sensor_key, ts) DO UPDATE SET sensor_value = excluded.sensor_value
+    """)
+    rollups.fold(cursor, "(SELECT sensor_key, ts, sensor_value FROM temp.incoming_readings WHERE NOT existed)")
+    _rebuild_rollups(cursor, "(SELECT sensor_key, ts FROM temp.incoming_readings WHERE existed)", horizon)
+    cursor.execute("DELETE FROM temp.incoming_readings")
+
+def _database_file(cursor):
+    """Path of the database the cursor is connected to"""
+    for _, name, path in cursor.execute("PRAGMA database_list").fetchall():
+        if name == 'main':
+            return path
+
+def _stage_archived_readings(cursor, touched, horizon, db_name):
+    """
+    Put the archived readings of the days of touched (a table with sensor_key
+    and ts) that start before the horizon in temp.archived_readings, for
+    rollups.rebuild. Returns whether there is an archive to count.
+    """
+    rollups.create_archived_table(cursor)
+    if horizon is None:
+        return False
+    day = rollups.DAY_SECONDS
+    cursor.execute(f"""
+        SELECT DISTINCT k.sensor_id, t.sensor_key, t.ts - t.ts % {day}
+        FROM {touched} t
+        JOIN sensor_keys k ON k.sensor_key = t.sensor_key
+        WHERE t.ts - t.ts % {day} < ?
+    """, (horizon,))
+    rows = []
+    for sensor_id, sensor_key, start in cursor.fetchall():
+        ts, _, values = _archive_read(cursor, db_name, [sensor_id], start, start + day)
+        rows.extend((sensor_key, t, value) for t, value in zip(ts.tolist(), _nullable(values)))
+    cursor.executemany("INSERT OR REPLACE INTO temp.archived_readings VALUES (?, ?, ?)", rows)
+    return True
+
+def _rebuild_rollups(cursor, touched, horizon, db_name=None):
+    """rollups.rebuild of touched, counting the archived readings of its days before the horizon"""
+    archived = _stage_archived_readings(cursor, touched, horizon, db_name or _database_file(cursor))
+    rollups.rebuild(cursor, touched, archived)
+
+@_resilient
+def db_add_sensor_data_batch(rows, db_name=DB_NAME):
+    """Add many (timestamp, id, data) readings in one transaction, same semantics as db_add_sensor_data"""
+    rows = list(rows)
+    if not rows:
+        return 0
+    with db_write_lock, db_connection(db_name) as conn:
+        cursor = conn.cursor()
+        rows = _write_readings(cursor, rows)
+
+        conn.commit()
+        print(f"Data added for {len(rows)} readings")
+        return len(rows)
+
+def _bulk_chunks(rows, chunk_rows):
+    """Lists of up to chunk_rows (timestamp, id, data) readings from db_bulk_ingest's rows"""
+    if isinstance(rows, tuple) and len(rows) == 3 and all(isinstance(column, np.ndarray) for column in rows):
+        sensor_ids, timestamps, values = rows
+        for start in range(0, len(values), chunk_rows):
+            stop = start + chunk_rows
+            chunk_timestamps = timestamps[start:stop]
+            if chunk_timestamps.dtype.kind in 'iuM':
+                # Sensors report at the same times, format each time once
+                unique, inverse = np.unique(chunk_timestamps.astype('datetime64[s]').astype(np.int64),
+                                            return_inverse=True)
+                chunk_timestamps = np.array(_from_ts(unique), dtype=object)[inverse.ravel()]
+            chunk_values = values[start:stop].astype(np.float64)
+            nullable = chunk_values.astype(object)
+            nullable[np.isnan(chunk_values)] = None
+            yield list(zip(chunk_timestamps.tolist(), sensor_ids[start:stop].tolist(), nullable.tolist()))
+        return
+    chunk = []
+    for sensor_id, timestamp, value in rows:
+        chunk.append((timestamp, sensor_id, value))
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _bulk_write(chunks, synchronous_off, db_name):
+    """Write each chunk of readings in its own transaction, returns (rows, transactions)"""
+    written = transactions = 0
+    failed = []
+
+    def write():
+        nonlocal written, transactions
+        # Committed chunks stay written, a retry carries on from the one that failed
+        remaining = itertools.chain(failed[:], chunks)
+        failed.clear()
+        with db_connection(db_name) as conn:
             cursor = conn.cursor()
-
+            synchronous = cursor.execute("PRAGMA synchronous").fetchone()[0]
+            if synchronous_off:
+                cursor.execute("PRAGMA synchronous=OFF")
             try:
-                cursor.execute("""
-                    INSERT INTO sensor_data (sensor_id, timestamp, sensor_value)
-                    VALUES (?, ?, ?)
-                """, (id, timestamp, data))
-                conn.commit()
-                print(f"Data added for timestamp: {timestamp}")
-            except sqlite3.IntegrityError:
-                print(f"Timestamp already exists, Updating: {timestamp}")
-                cursor.execute("""
-                    UPDATE sensor_data
-                    SET sensor_value = ?
-                    WHERE sensor_id = ? AND timestamp = ?
-                """, (data, id, timestamp))
-                cursor.execute("""
-                    UPDATE sensors
-                    SET last_val = ?
-                    WHERE id = ?
-                """, (data, id))
-                conn.commit()
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_add_sensor_data(timestamp, id, data, db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
-
+                for chunk in remaining:
+                    failed.append(chunk)
+                    # Other writers get the lock between chunks
+                    with db_write_lock:
+                        written += len(_write_readings(cursor, chunk))
+                        conn.commit()
+                    transactions += 1
+                    failed.clear()
+            finally:
+                # The connection goes back to the pool
+                cursor.execute(f"PRAGMA synchronous={synchronous}")
+
+    _db_call(write, db_name, 'db_bulk_ingest')
+    return written, transactions
+
+def db_bulk_ingest(rows, chunk_rows=BULK_INGEST_CHUNK_ROWS, synchronous_off=False, db_name=DB_NAME):
+    """
+    Write many readings with executemany, chunk_rows per transaction, same semantics as db_add_sensor_data.
+
+    rows is an iterable of (sensor_id, timestamp, value), or a tuple of NumPy
+    arrays (sensor_ids, timestamps, values). Array timestamps may be text,
+    datetime64 or seconds like readings.ts, NaN values are stored as NULL.
+    Rows are consumed lazily, so a generator is never held in memory at once.
+    synchronous_off skips the fsyncs for the duration of a bulk load: safe if
+    the process dies, but a power failure may lose or damage the last commits.
+    Returns {'rows', 'transactions', 'seconds', 'rows_per_sec'}
+    """
+    start = time.perf_counter()
+    written, transactions = _bulk_write(_bulk_chunks(rows, chunk_rows), synchronous_off, db_name)
+    seconds = time.perf_counter() - start
+    rows_per_sec = written / seconds if seconds > 0 else 0.0
+    print(f"Bulk ingested {written} readings in {transactions} transactions ({rows_per_sec:,.0f} rows/s)")
+    return {'rows': written, 'transactions': transactions, 'seconds': seconds, 'rows_per_sec': rows_per_sec}
+
+@_resilient
 def db_get_client_id(name, db_name=DB_NAME):
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
+    with db_connection(db_name) as conn:
+        cursor = conn.cursor()
 
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                SELECT client_id FROM sensors
-                WHERE name = ?
-            """, (name,))
-            result = cursor.fetchone()
+        cursor.execute("""
+            SELECT client_id FROM sensors
+            WHERE name = ?
+        """, (name,))
+        result = cursor.fetchone()
 
-            if result:
-                return result[0]  # Return client_id
-            else:
-                return None  # Not found or is a 'sensor'
-            
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
+        if result:
+            return result[0]  # Return client_id
         else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_get_client_id(name, db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
+            return None  # Not found or is a 'sensor'
 
+@_resilient
 def db_get_id(client_id, db_name=DB_NAME):
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
+    with db_connection(db_name) as conn:
+        cursor = conn.cursor()
 
-            cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id FROM sensors
+            WHERE client_id = ?
+        """, (client_id,))
+        result = cursor.fetchone()
 
-            cursor.execute("""
-                SELECT id FROM sensors
-                WHERE client_id = ?
-            """, (client_id,))
-            result = cursor.fetchone()
-
-            if result:
-                return result[0]  # Return client_id
-            else:
-                return None  # Not found or is a 'sensor'
-    
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
+        if result:
+            return result[0]  # Return client_id
         else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_get_id(client_id, db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
+            return None  # Not found or is a 'sensor'
 
+@_resilient
 def db_get_module_type(client_id, db_name=DB_NAME):
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
+    with db_connection(db_name) as conn:
+        cursor = conn.cursor()
 
-            cursor = conn.cursor()
+        cursor.execute("""
+            SELECT category FROM sensors
+            WHERE client_id = ?
+        """, (client_id,))
+        result = cursor.fetchone()
 
-            cursor.execute("""
-                SELECT category FROM sensors
-                WHERE client_id = ?
-            """, (client_id,))
-            result = cursor.fetchone()
-
-            if result:
-                return result[0]  # Return client_id
-            else:
-                return None  # Not found or is a 'sensor'
-
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
+        if result:
+            return result[0]  # Return client_id
         else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_get_module_type(client_id, db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
+            return None  # Not found or is a 'sensor'
 
+@_resilient
 def db_get_client_name(id, db_name=DB_NAME):
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
-
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                SELECT name FROM sensors
-                WHERE id = ?
-            """, (id,))
-            result = cursor.fetchone()
+    with db_connection(db_name) as conn:
+        cursor = conn.cursor()
 
-            if result:
-                return result[0]  # Return client_id
-            else:
-                return None  # Not found or is a 'sensor'
+        cursor.execute("""
+            SELECT name FROM sensors
+            WHERE id = ?
+        """, (id,))
+        result = cursor.fetchone()
 
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
+        if result:
+            return result[0]  # Return client_id
         else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_get_client_name(id, db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
+            return None  # Not found or is a 'sensor'
 
+@_resilient
 def db_add_sensor(sensor_id, name, category, db_name=DB_NAME):
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
     try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
-
+        with db_write_lock, db_connection(db_name) as conn:
             cursor = conn.cursor()
 
             # Original behavior: sensor_id is treated as a client_id
@@ -576,1015 +570,1080 @@ def db_add_sensor(sensor_id, name, category, db_name=DB_NAME):
             """, (sensor_id, client_id, name, category, None))
             conn.commit()
             print(f"Sensor added: {sensor_id} - {name}")
+            _notify_module_change(db_name)
             return sensor_id
             
     except sqlite3.IntegrityError:
         print(f"Sensor ID already exists: {sensor_id}")
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_add_sensor(sensor_id, name, category, db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
 
+@_resilient
 def db_get_sensor_id_by_client_id(client_id, db_name=DB_NAME):
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
-
-            cursor = conn.cursor()
+    with db_connection(db_name) as conn:
+        cursor = conn.cursor()
 
-            cursor.execute("""
-                SELECT id FROM sensors
-                WHERE client_id = ?
-            """, (client_id,))
-            result = cursor.fetchone()
+        cursor.execute("""
+            SELECT id FROM sensors
+            WHERE client_id = ?
+        """, (client_id,))
+        result = cursor.fetchone()
 
-            if result:
-                return result[0]  # UUID-based sensor ID
-            else:
-                return None  # Not found
-            
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
+        if result:
+            return result[0]  # UUID-based sensor ID
         else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_get_sensor_id_by_client_id(client_id, db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
+            return None  # Not found
 
 #train.py
+@_resilient
 def db_get_sensor_types(db_name=DB_NAME):
     """Get all sensors with their types from database"""
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
-
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                SELECT id, name, category
-                FROM sensors
-                WHERE name IS NOT NULL
-            """)
+    with db_connection(db_name) as conn:
+        cursor = conn.cursor()
 
-            sensors = cursor.fetchall()
+        cursor.execute("""
+            SELECT id, name, category
+            FROM sensors
+            WHERE name IS NOT NULL
+        """)
 
-            # Create mappings of sensor names to ids
-            sensor_map = {row[1]: row[0] for row in sensors}
-            sensor_categories = {row[0]: row[2] for row in sensors}
+        sensors = cursor.fetchall()
 
-            return sensor_map, sensor_categories
+        # Create mappings of sensor names to ids
+        sensor_map = {row[1]: row[0] for row in sensors}
+        sensor_categories = {row[0]: row[2] for row in sensors}
 
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_get_sensor_types(db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
+        return sensor_map, sensor_categories
 
+@_resilient
 def db_get_sensors_by_category(category, db_name=DB_NAME):
     """Get all sensors of a specific category"""
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
-
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                SELECT id, name
-                FROM sensors
-                WHERE category = ? AND name IS NOT NULL
-            """, (category,))
-
-            sensors = cursor.fetchall()
-
-            return {row[1]: row[0] for row in sensors}  # Map name to id
-
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_get_sensors_by_category(category, db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
-
+    with db_connection(db_name) as conn:
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT id, name
+            FROM sensors
+            WHERE category = ? AND name IS NOT NULL
+        """, (category,))
+
+        sensors = cursor.fetchall()
+
+        return {row[1]: row[0] for row in sensors}  # Map name to id
+
+def _to_ts(timestamp):
+    """Timestamp text -> seconds since 1970-01-01 00:00:00 of the same wall-clock time, like readings.ts"""
+    return int((datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S') - datetime(1970, 1, 1)).total_seconds())
+
+def _from_ts(ts):
+    """Array of readings.ts seconds -> list of timestamp text"""
+    return [timestamp.replace('T', ' ')
+            for timestamp in np.datetime_as_string(np.asarray(ts, dtype=np.int64).astype('datetime64[s]')).tolist()]
+
+def _nullable(values):
+    """Array of archived values -> list with None for NULL"""
+    return [None if value != value else value for value in values.tolist()]
+
+def _horizon(cursor, db_name):
+    """The archive horizon of the files and of sensor_chunks as a ts, None if nothing was archived"""
+    horizons = [archive.horizon(archive.archive_dir(db_name))]
+    if sensor_data_layout(cursor)['chunks']:
+        horizons.append(chunks.horizon(cursor))
+    horizons = [horizon for horizon in horizons if horizon is not None]
+    return max(horizons) if horizons else None
+
+def _archive_horizon(cursor, db_name, days_ago):
+    """The archive horizon as timestamp text if the window from days_ago starts before it, else None"""
+    horizon = _horizon(cursor, db_name)
+    if horizon is None or _to_ts(days_ago) >= horizon:
+        return None
+    return _from_ts([horizon])[0]
+
+def _override(base, override, num_sensors):
+    """Merge two (ts, sensor, value) array triples, override's readings replace base's at the same ts"""
+    ts, sensors, values = base
+    new_ts, new_sensors, new_values = override
+    if not len(new_ts):
+        return base
+    keep = ~np.isin(ts * num_sensors + sensors, new_ts * num_sensors + new_sensors)
+    ts = np.concatenate([ts[keep], new_ts])
+    sensors = np.concatenate([sensors[keep], new_sensors])
+    values = np.concatenate([values[keep], new_values])
+    order = np.argsort(ts, kind='stable')
+    return ts[order], sensors[order], values[order]
+
+def _archive_read(cursor, db_name, sensor_ids, start, end):
+    """Archived readings of sensor_ids with start <= ts < end, from the files and sensor_chunks (arrays as _override)"""
+    readings = archive.read(archive.archive_dir(db_name), sensor_ids, start, end)
+    if sensor_data_layout(cursor)['chunks']:
+        readings = _override(readings, chunks.read(cursor, sensor_ids, start, end), len(sensor_ids))
+    return readings
+
+def _archived_readings(cursor, db_name, sensor_ids, days_ago, horizon):
+    """
+    Readings of sensor_ids from days_ago up to the archive horizon: the archived
+    ones, overridden by rows written to SQLite below the horizon since. Returns
+    the arrays ts, sensor (an index into sensor_ids) and value, sorted by ts.
+    """
+    readings = _archive_read(cursor, db_name, sensor_ids, _to_ts(days_ago), _to_ts(horizon))
+    layout = sensor_data_layout(cursor)
+
+    cursor.execute(f"""
+        SELECT CAST(strftime('%s', {layout['time']}{layout['unixepoch']}) AS INTEGER), {layout['sensor_id']}, sensor_value
+        FROM {layout['table']}
+        WHERE {layout['time']} >= {layout['time_param']} AND {layout['time']} < {layout['time_param']}
+    """, (days_ago, horizon))
+    index = {sensor_id: i for i, sensor_id in enumerate(sensor_ids)}
+    late = [(t, index[sensor_id], np.nan if value is None else value)
+            for t, sensor_id, value in cursor.fetchall() if sensor_id in index]
+    if late:
+        readings = _override(readings, tuple(np.array(column) for column in zip(*late)), len(sensor_ids))
+    return readings
+
+def _sensor_readings(cursor, db_name, sensor_id, days_ago):
+    """(timestamp, value) readings of one sensor since days_ago, from the archive and SQLite"""
+    layout = sensor_data_layout(cursor)
+    data = []
+    horizon = _archive_horizon(cursor, db_name, days_ago)
+    if horizon:
+        ts, _, values = _archived_readings(cursor, db_name, [sensor_id], days_ago, horizon)
+        data = list(zip(_from_ts(ts), _nullable(values)))
+
+    cursor.execute(f"""
+        SELECT {layout['timestamp']}, sensor_value
+        FROM {layout['table']}
+        WHERE {layout['sensor']} = {layout['sensor_param']} AND {layout['time']} >= {layout['time_param']}
+        ORDER BY {layout['time']}
+    """, (sensor_id, horizon or days_ago))
+    return data + cursor.fetchall()
+
+@_resilient
 def db_get_sensor_data(sensor_id, days=7, db_name=DB_NAME):
-    """Get data for a specific sensor for the last X days"""
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
-
-            cursor = conn.cursor()
-
-            # Calculate date X days ago
-            days_ago = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
-
-            cursor.execute("""
-                SELECT timestamp, sensor_value
-                FROM sensor_data
-                WHERE sensor_id = ? AND timestamp >= ?
-                ORDER BY timestamp
-            """, (sensor_id, days_ago))
-
+    """Get data for a specific sensor for the last X days, archived readings included"""
+    with db_connection(db_name, snapshot=True) as conn:
+        cursor = conn.cursor()
+
+        # Calculate date X days ago
+        days_ago = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+        data = _sensor_readings(cursor, db_name, sensor_id, days_ago)
+
+        return data
+
+def _history_resolution(cursor, start, sensor_id, max_points):
+    """Raw readings or the finest rollup with at most max_points points since start, else the coarsest rollup"""
+    layout = sensor_data_layout(cursor)
+    if not layout['rollups']:
+        return 'raw'
+    resolution = 'raw'
+    for name, seconds in rollups.ROLLUP_RESOLUTIONS.items():
+        cursor.execute(f"""
+            SELECT COUNT(*), TOTAL(count)
+            FROM rollups
+            WHERE resolution = ? AND sensor_key = {layout['sensor_param']} AND bucket >= ?
+        """, (seconds, sensor_id, start - start % seconds))
+        buckets, readings = cursor.fetchone()
+        # The finest rollup counts the readings
+        if resolution == 'raw' and readings <= max_points:
+            return 'raw'
+        resolution = name
+        if buckets <= max_points:
+            break
+    return resolution
+
+@_resilient
+def db_get_sensor_history(sensor_id, days=7, max_points=SENSOR_HISTORY_MAX_POINTS, db_name=DB_NAME):
+    """
+    Get the history of a sensor for the last X days in about max_points points.
+
+    Returns {'resolution': 'raw', 'hour' or 'day', 'data': [(timestamp, avg,
+    min, max, count, last), ...]}. The readings are returned while they fit in
+    max_points, otherwise the finest rollup that does (the coarsest one if
+    none does), so a long range costs a row per bucket instead of a row per
+    reading. A bucket is returned whole when the range starts inside it.
+    Databases without rollups (schema version < 3) always return readings.
+    """
+    with db_connection(db_name, snapshot=True) as conn:
+        cursor = conn.cursor()
+
+        # Calculate date X days ago
+        days_ago = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+        cursor.execute("SELECT CAST(strftime('%s', ?) AS INTEGER)", (days_ago,))
+        start = cursor.fetchone()[0]
+
+        layout = sensor_data_layout(cursor)
+        resolution = _history_resolution(cursor, start, sensor_id, max_points)
+        if resolution == 'raw':
+            data = [(timestamp, value, value, value, 1, value)
+                    for timestamp, value in _sensor_readings(cursor, db_name, sensor_id, days_ago)
+                    if value is not None]
+        else:
+            # The rollups of archived readings are kept
+            seconds = rollups.ROLLUP_RESOLUTIONS[resolution]
+            cursor.execute(f"""
+                SELECT datetime(bucket, 'unixepoch'), sum / count, min, max, count, last
+                FROM rollups
+                WHERE resolution = ? AND sensor_key = {layout['sensor_param']} AND bucket >= ?
+                ORDER BY bucket
+            """, (seconds, sensor_id, start - start % seconds))
             data = cursor.fetchall()
 
-            return data
-
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_get_sensor_data(sensor_id, days, db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
+        return {'resolution': resolution, 'data': data}
+
+def _last_values_before(cursor, sensor_ids, timestamp, db_name=None):
+    """
+    Newest reading of each sensor before timestamp, the value carried into a
+    window starting there. With db_name the archive is searched as well.
+    """
+    layout = sensor_data_layout(cursor)
+    horizon = _horizon(cursor, db_name) if db_name else None
+    chunked = layout['chunks'] and horizon is not None
+    last_values = {}
+    for sensor_id in sensor_ids:
+        cursor.execute(f"""
+            SELECT sensor_value, CAST(strftime('%s', {layout['time']}{layout['unixepoch']}) AS INTEGER)
+            FROM {layout['table']}
+            WHERE {layout['sensor']} = {layout['sensor_param']} AND {layout['time']} < {layout['time_param']}
+            AND sensor_value IS NOT NULL
+            ORDER BY {layout['time']} DESC
+            LIMIT 1
+        """, (sensor_id, timestamp))
+        row = cursor.fetchone()
+        # Only a reading from before the horizon can be older than an archived one
+        if horizon is not None and (row is None or row[1] < horizon):
+            before = min(_to_ts(timestamp), horizon)
+            candidates = [archive.last_before(archive.archive_dir(db_name), sensor_id, before)]
+            if chunked:
+                candidates.append(chunks.last_before(cursor, sensor_id, before))
+            for archived in candidates:
+                if archived is not None and (row is None or archived[0] > row[1]):
+                    row = (archived[1], archived[0])
+        last_values[sensor_id] = row[0] if row else None
+    return last_values
+
+def _category_readings(cursor, db_name, days_ago, categories):
+    """
+    Archived readings of every sensor of the categories from days_ago. Returns
+    (sensor_ids, ts, sensor, value, hot_from): the arrays as _archived_readings
+    returns them and the timestamp the SQLite part of the window starts at.
+    """
+    horizon = _archive_horizon(cursor, db_name, days_ago) if db_name else None
+    if not horizon:
+        return [], np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0), days_ago
+    placeholders = ','.join('?' * len(categories))
+    cursor.execute(f"SELECT id FROM sensors WHERE category IN ({placeholders})", tuple(categories))
+    event_ids = [row[0] for row in cursor.fetchall()]
+    ts, sensors, values = _archived_readings(cursor, db_name, event_ids, days_ago, horizon)
+    return event_ids, ts, sensors, values, horizon
+
+def _as_of_rows(cursor, sensor_ids, days_ago, categories=('light', 'temp'), db_name=None):
+    """
+    Rebuild the dense rows from sparse readings. Yields (timestamp, values) for
+    every timestamp a sensor of these categories reported at since days_ago,
+    values holding each sensor's newest reading at or before it (None if it has
+    none yet). With db_name archived readings are included.
+    """
+    current = _last_values_before(cursor, sensor_ids, days_ago, db_name)
+    event_ids, ts, sensors, values, hot_from = _category_readings(cursor, db_name, days_ago, categories)
+    archived = list(zip(_from_ts(ts), [event_ids[i] for i in sensors.tolist()], _nullable(values)))
+    layout = sensor_data_layout(cursor)
+    placeholders = ','.join('?' * len(categories))
+    cursor.execute(f"""
+        SELECT {layout['timestamp']}, {layout['sensor_id']}, sensor_value
+        FROM {layout['table']}
+        WHERE {layout['time']} >= {layout['time_param']}
+        AND {layout['sensor']} IN ({layout['sensors_where']} s.category IN ({placeholders}))
+        ORDER BY {layout['time']}
+    """, (hot_from,) + tuple(categories))
+
+    timestamp = None
+    for ts, sensor_id, value in archived + cursor.fetchall():
+        if ts != timestamp:
+            if timestamp is not None:
+                yield timestamp, [current[sensor_id] for sensor_id in sensor_ids]
+            timestamp = ts
+        if sensor_id in current and value is not None:
+            current[sensor_id] = value
+    if timestamp is not None:
+        yield timestamp, [current[sensor_id] for sensor_id in sensor_ids]
+
+def _forward_fill(block, carry):
+    """Replace the NaNs in each column of block with the value above them, carry being the row before block"""
+    stacked = np.vstack([carry, block])
+    index = np.where(np.isnan(stacked), 0, np.arange(len(stacked))[:, None])
+    np.maximum.accumulate(index, axis=0, out=index)
+    block[:] = stacked[index, np.arange(stacked.shape[1])][1:]
+    return block[-1].copy()
 
 def db_get_all_sensor_data(days=7, db_name=DB_NAME):
-    """Get data for all sensors for the last X days"""
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
-
-            cursor = conn.cursor()
-
-            # Get all sensor IDs
-            cursor.execute("""
-                SELECT id, name, category
-                FROM sensors
-                WHERE name IS NOT NULL AND (category = 'light' OR category = 'temp')
-            """)
-
-            sensors = cursor.fetchall()
-
-            # Calculate date X days ago
-            days_ago = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
-
-            # Create a dictionary to store data for each sensor
-            sensor_data = {}
-
-            for sensor_id, sensor_name, sensor_category in sensors:
-                cursor.execute("""
-                    SELECT timestamp, sensor_value
-                    FROM sensor_data
-                    WHERE sensor_id = ? AND timestamp >= ?
-                    ORDER BY timestamp
-                """, (sensor_id, days_ago))
-
-                data = cursor.fetchall()
-                sensor_data[sensor_name] = {'id': sensor_id, 'category': sensor_category, 'data': data}
-
-            return sensor_data
-
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_get_all_sensor_data(days, db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
+    """
+    Get data for all sensors for the last X days, archived readings included.
+    Returns {name: {'id', 'category', 'data': [(timestamp, value), ...]}}, every
+    sensor holding its newest reading (None before its first) at each timestamp.
+    A thin wrapper around db_get_sensor_matrix, kept for the dict-of-lists callers.
+    """
+    matrix = db_get_sensor_matrix(days, dtype=np.float64, db_name=db_name)
+    timestamps = _from_ts(matrix['timestamps'].astype(np.int64))
+    sensor_data = {}
+    for column, (sensor_id, (sensor_name, sensor_category)) in enumerate(zip(matrix['sensor_ids'], matrix['sensors'])):
+        sensor_data[sensor_name] = {'id': sensor_id, 'category': sensor_category,
+                                    'data': list(zip(timestamps, _nullable(matrix['values'][:, column])))}
+    return sensor_data
+
+def _time_features(block, ts):
+    """Fill the hour and day_of_week columns of block from readings.ts seconds"""
+    # 1970-01-01 was a Thursday, day 3 counting from Monday like pandas' dayofweek
+    block[:, -2] = ts // 3600 % 24
+    block[:, -1] = (ts // 86400 + 3) % 7
+
+@_resilient
+def db_get_sensor_matrix(days=14, categories=('light', 'temp'), out_path=None, dtype=np.float32, db_name=DB_NAME):
+    """
+    Pivot the last X days of sensor data into a float32 (or dtype) matrix, one row per timestamp.
+
+    Columns are the named sensors of the given categories (grouped in that
+    order), followed by hour and day_of_week. Each sensor holds its newest
+    reading as of the row's timestamp, NaN before its first reading.
+    Archived readings are included.
+    The rows are streamed from a single query, SENSOR_MATRIX_FETCH_ROWS at a time.
+    With out_path the matrix is written to a .npy file and returned memory-mapped,
+    which costs a count of the rows first.
+    Returns {'sensors': [(name, category), ...], 'sensor_ids': [id, ...],
+    'timestamps': datetime64[s] ndarray, 'values': ndarray}
+    """
+    with db_connection(db_name, snapshot=True) as conn:
+        cursor = conn.cursor()
+
+        placeholders = ','.join('?' * len(categories))
+        cursor.execute(f"""
+            SELECT id, name, category
+            FROM sensors
+            WHERE name IS NOT NULL AND category IN ({placeholders})
+        """, tuple(categories))
+        rows = cursor.fetchall()
+        sensors = [row for category in categories for row in rows if row[2] == category]
+
+        days_ago = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+        sensor_ids = tuple(sensor_id for sensor_id, _, _ in sensors)
+        layout = sensor_data_layout(cursor)
+        # A row for every timestamp any sensor of these categories reported at
+        readings = f"{layout['sensor']} IN ({layout['sensors_where']} s.category IN ({placeholders}))"
+
+        # The window before the archive horizon comes from the archive
+        event_ids, ts, archived_sensors, archived_values, hot_from = _category_readings(
+            cursor, db_name, days_ago, categories)
+        archived_ts, archived_rows = np.unique(ts, return_inverse=True)
+
+        num_columns = len(sensors) + 2
+        num_rows = None
+        if out_path:
+            # The file needs its shape up front
+            cursor.execute(f"""
+                SELECT COUNT(DISTINCT {layout['time']})
+                FROM {layout['table']}
+                WHERE {layout['time']} >= {layout['time_param']} AND {readings}
+            """, (hot_from,) + tuple(categories))
+            num_rows = len(archived_ts) + cursor.fetchone()[0]
+            values = np.lib.format.open_memmap(out_path, mode='w+', dtype=dtype, shape=(num_rows, num_columns))
+        # Without a file the blocks are joined at the end
+        blocks, ts_blocks = [], []
+
+        # Readings are stored sparsely, carry each sensor's last value forward
+        last_values = _last_values_before(cursor, sensor_ids, days_ago, db_name)
+        carry = np.array([np.nan if last_values[sensor_id] is None else last_values[sensor_id]
+                          for sensor_id in sensor_ids], dtype=dtype)
+
+        filled = len(archived_ts)
+        if filled:
+            block = values[:filled] if out_path else np.empty((filled, num_columns), dtype=dtype)
+            # Column of each archived reading, -1 for sensors without one
+            columns = np.array([sensor_ids.index(sensor_id) if sensor_id in sensor_ids else -1
+                                for sensor_id in event_ids])[archived_sensors]
+            keep = (columns >= 0) & ~np.isnan(archived_values)
+            block[:, :-2] = np.nan
+            block[archived_rows[keep], columns[keep]] = archived_values[keep]
+            carry = _forward_fill(block[:, :-2], carry)
+            _time_features(block, archived_ts)
+            blocks.append(block)
+            ts_blocks.append(archived_ts)
+
+        # One column per sensor
+        # Resolve the sensor column values once instead of in every CASE
+        sensor_values = tuple(cursor.execute(f"SELECT {layout['sensor_param']}", (sensor_id,)).fetchone()[0]
+                              for sensor_id in sensor_ids)
+        pivot = ''.join(f", MAX(CASE WHEN {layout['sensor']} = ? THEN sensor_value END)" for _ in sensors)
+        time_column = layout['time'] + layout['unixepoch']
+        cursor.execute(f"""
+            SELECT CAST(strftime('%s', {time_column}) AS INTEGER){pivot}
+            FROM {layout['table']}
+            WHERE {layout['time']} >= {layout['time_param']} AND {readings}
+            GROUP BY {layout['time']}
+            ORDER BY {layout['time']}
+        """, sensor_values + (hot_from,) + tuple(categories))
+
+        while num_rows is None or filled < num_rows:
+            chunk = cursor.fetchmany(SENSOR_MATRIX_FETCH_ROWS)
+            if not chunk:
+                break
+            # float64 holds the ts exactly
+            chunk = np.array(chunk[:num_rows - filled] if out_path else chunk, dtype=np.float64)
+            end = filled + len(chunk)
+            block = values[filled:end] if out_path else np.empty((len(chunk), num_columns), dtype=dtype)
+            ts = chunk[:, 0].astype(np.int64)
+            block[:, :-2] = chunk[:, 1:]
+            carry = _forward_fill(block[:, :-2], carry)
+            _time_features(block, ts)
+            blocks.append(block)
+            ts_blocks.append(ts)
+            filled = end
+
+        if not out_path:
+            values = np.concatenate(blocks) if blocks else np.empty((0, num_columns), dtype=dtype)
+        timestamps = np.concatenate(ts_blocks).astype('datetime64[s]') if ts_blocks \
+            else np.empty(0, dtype='datetime64[s]')
+        return {'sensors': [(name, category) for _, name, category in sensors], 'sensor_ids': list(sensor_ids),
+                'timestamps': timestamps, 'values': values[:filled]}
 
 # predict.py
+@_resilient
 def db_get_sensor_data_for_prediction(days=1, db_name=DB_NAME):
     """Get the last X days of sensor data for prediction in the format needed by predict.py"""
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
-
-            cursor = conn.cursor()
-
-            # Get light and temperature sensors
-            cursor.execute("""
-                SELECT id, name, category 
-                FROM sensors 
-                WHERE category IN ('light', 'temp') AND name IS NOT NULL
-            """)
-            sensors = cursor.fetchall()
-
-            # Calculate timestamp for X days ago
-            days_ago = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
-
-            # Prepare data dictionary
-            data_dict = {'timestamp': []}
-
-            # Add column for each sensor
-            for sensor_id, name, category in sensors:
-                data_dict[name] = []
-
-            # Get unique timestamps (sorted)
-            cursor.execute("""
-                SELECT DISTINCT sd.timestamp
-                FROM sensor_data sd
-                JOIN sensors s ON sd.sensor_id = s.id
-                WHERE sd.timestamp >= ?
-                AND s.category IN ('light', 'temp')
-                ORDER BY sd.timestamp
-            """, (days_ago,))
-
-            timestamps = [row[0] for row in cursor.fetchall()]
-            data_dict['timestamp'] = timestamps
-
-            # For each timestamp, get sensor values
-            for ts in timestamps:
-                for sensor_id, name, category in sensors:
-                    cursor.execute("""
-                        SELECT sensor_value 
-                        FROM sensor_data 
-                        WHERE sensor_id = ? AND timestamp = ?
-                    """, (sensor_id, ts))
-
-                    result = cursor.fetchone()
-                    value = result[0] if result else None
-                    data_dict[name].append(value)
-
-            # Convert to DataFrame
-            df = pd.DataFrame(data_dict)
-
-            print(df)
-
-            # Extract time features
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-            df['hour'] = df['timestamp'].dt.hour
-            df['day_of_week'] = df['timestamp'].dt.dayofweek
-
-            return df
-
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_get_sensor_data_for_prediction(days, db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
-
+    with db_connection(db_name, snapshot=True) as conn:
+        cursor = conn.cursor()
+
+        # Get light and temperature sensors
+        cursor.execute("""
+            SELECT id, name, category 
+            FROM sensors 
+            WHERE category IN ('light', 'temp') AND name IS NOT NULL
+        """)
+        sensors = cursor.fetchall()
+
+        # Calculate timestamp for X days ago
+        days_ago = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+        # Readings are stored sparsely, forward-fill each sensor to every timestamp
+        sensor_ids = [sensor_id for sensor_id, _, _ in sensors]
+        timestamps = []
+        columns = [[] for _ in sensors]
+        for timestamp, values in _as_of_rows(cursor, sensor_ids, days_ago, db_name=db_name):
+            timestamps.append(timestamp)
+            for column, value in zip(columns, values):
+                column.append(value)
+
+        data_dict = {'timestamp': timestamps}
+        for (sensor_id, name, category), column in zip(sensors, columns):
+            data_dict[name] = column
+
+        # Convert to DataFrame
+        df = pd.DataFrame(data_dict)
+
+        print(df)
+
+        # Extract time features
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        df['hour'] = df['timestamp'].dt.hour
+        df['day_of_week'] = df['timestamp'].dt.dayofweek
+
+        return df
+
+@_resilient
 def db_get_light_and_temp_sensors(db_name=DB_NAME):
     """Get the names of all light and temperature sensors"""
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
-
-            cursor = conn.cursor()
-
-            # Get light sensors
-            cursor.execute("""
-                SELECT name FROM sensors 
-                WHERE category = 'light' AND name IS NOT NULL
-            """)
-            light_sensors = [row[0] for row in cursor.fetchall()]
-
-            # Get temperature sensors
-            cursor.execute("""
-                SELECT name FROM sensors 
-                WHERE category = 'temp' AND name IS NOT NULL
-            """)
-            temp_sensors = [row[0] for row in cursor.fetchall()]
-
-            return light_sensors, temp_sensors
-
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_get_light_and_temp_sensors(db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
-
+    with db_connection(db_name, snapshot=True) as conn:
+        cursor = conn.cursor()
+
+        # Get light sensors
+        cursor.execute("""
+            SELECT name FROM sensors 
+            WHERE category = 'light' AND name IS NOT NULL
+        """)
+        light_sensors = [row[0] for row in cursor.fetchall()]
+
+        # Get temperature sensors
+        cursor.execute("""
+            SELECT name FROM sensors 
+            WHERE category = 'temp' AND name IS NOT NULL
+        """)
+        temp_sensors = [row[0] for row in cursor.fetchall()]
+
+        return light_sensors, temp_sensors
+
+@_resilient
 def db_save_predicted_values(predictions_dict, db_name=DB_NAME):
     """Save predicted values to database"""
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
+    with db_write_lock, db_connection(db_name) as conn:
+        cursor = conn.cursor()
 
-            cursor = conn.cursor()
+        # Get mapping of sensor names to IDs
+        cursor.execute("""
+            SELECT name, id FROM sensors 
+            WHERE category IN ('light', 'temp') AND name IS NOT NULL
+        """)
+        name_to_id = {row[0]: row[1] for row in cursor.fetchall()}
 
-            # Get mapping of sensor names to IDs
-            cursor.execute("""
-                SELECT name, id FROM sensors 
-                WHERE category IN ('light', 'temp') AND name IS NOT NULL
-            """)
-            name_to_id = {row[0]: row[1] for row in cursor.fetchall()}
-
-            # Current timestamp for predictions
-            current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-            # Save light predictions
-            for light_name, value in predictions_dict['lights'].items():
-                if light_name in name_to_id:
-                    sensor_id = name_to_id[light_name]
-                    cursor.execute("""
-                        INSERT OR REPLACE INTO sensor_data (sensor_id, timestamp, sensor_value)
-                        VALUES (?, ?, ?)
-                    """, (sensor_id, current_time, value))
-
-            # Save temperature predictions
-            for temp_name, value in predictions_dict['temperatures'].items():
-                if temp_name in name_to_id:
-                    sensor_id = name_to_id[temp_name]
-                    cursor.execute("""
-                        INSERT OR REPLACE INTO sensor_data (sensor_id, timestamp, sensor_value)
-                        VALUES (?, ?, ?)
-                    """, (sensor_id, current_time, value))
+        # Current timestamp for predictions
+        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
-            conn.commit()
+        # Save light and temperature predictions
+        _write_readings(cursor, [(current_time, name_to_id[name], value)
+                                 for group in ('lights', 'temperatures')
+                                 for name, value in predictions_dict[group].items() if name in name_to_id])
 
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_save_predicted_values(predictions_dict, db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
+        conn.commit()
 
+@_resilient
 def db_get_radar_current_data(db_name=DB_NAME):
     """Get latest radar sensor data from the database"""
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
+    with db_connection(db_name) as conn:
+        cursor = conn.cursor()
 
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                SELECT last_val
-                FROM sensors
-                WHERE category = 'radar' AND name IS NOT NULL
-                ORDER BY name
-            """)
+        cursor.execute("""
+            SELECT last_val
+            FROM sensors
+            WHERE category = 'radar' AND name IS NOT NULL
+            ORDER BY name
+        """)
 
-            _sensors = [row[0].lower() for row in cursor.fetchall()]
+        _sensors = [row[0].lower() for row in cursor.fetchall()]
 
-            return _sensors
-
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_get_radar_current_data(db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
+        return _sensors
 
 # predictions database table
+@_resilient
 def db_save_predictions(timestamp, predictions_dict, db_name=DB_NAME):
-    """Save predictions to database instead of CSV, removing all previous predictions"""
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
+    """
+    Save predictions to database instead of CSV. From schema version 5 they are
+    appended to the prediction history, before that all previous predictions are removed.
+    """
+    with db_write_lock, db_connection(db_name) as conn:
+        cursor = conn.cursor()
 
-            cursor = conn.cursor()
+        try:
+            rows = [(name, value, category)
+                    for group, category in (('lights', 'light'), ('temperatures', 'temp'))
+                    for name, value in predictions_dict[group].items()]
+            if sensor_data_layout(cursor)['prediction_history']:
+                predictions.save(cursor, timestamp, rows)
+                conn.commit()
+                print(f"Predictions added to the history for timestamp: {timestamp}")
+                return
 
-            try:
-                # First, delete all existing prediction records
-                cursor.execute("DELETE FROM predictions")
-
-                # Save light predictions
-                for light_name, value in predictions_dict['lights'].items():
-                    cursor.execute("""
-                        INSERT INTO predictions (timestamp, sensor_name, predicted_value, category)
-                        VALUES (?, ?, ?, ?)
-                    """, (timestamp, light_name, value, 'light'))
-
-                # Save temperature predictions
-                for temp_name, value in predictions_dict['temperatures'].items():
-                    cursor.execute("""
-                        INSERT INTO predictions (timestamp, sensor_name, predicted_value, category)
-                        VALUES (?, ?, ?, ?)
-                    """, (timestamp, temp_name, value, 'temp'))
+            # First, delete all existing prediction records
+            cursor.execute("DELETE FROM predictions")
 
-                conn.commit()
-                print(f"Previous predictions cleared. New predictions saved to database for timestamp: {timestamp}")
-            except sqlite3.Error as e:
-                print(f"Error saving predictions to database: {e}")
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_save_predictions(timestamp, predictions_dict, db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
+            # Save light and temperature predictions
+            cursor.executemany("""
+                INSERT INTO predictions (timestamp, sensor_name, predicted_value, category)
+                VALUES (?, ?, ?, ?)
+            """, [(timestamp, name, value, category) for name, value, category in rows])
+
+            conn.commit()
+            print(f"Previous predictions cleared. New predictions saved to database for timestamp: {timestamp}")
+        except sqlite3.Error as e:
+            print(f"Error saving predictions to database: {e}")
 
 # mqtt publish
+@_resilient
 def db_get_latest_prediction_rows(db_name=DB_NAME):
-    """Get the latest 20 prediction rows from the database"""
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
-
-            cursor = conn.cursor()
+    """Get the latest 20 prediction rows from the database, all from the latest set with a history"""
+    with db_connection(db_name) as conn:
+        cursor = conn.cursor()
 
+        if sensor_data_layout(cursor)['prediction_history']:
             cursor.execute("""
-                SELECT timestamp, sensor_name, predicted_value 
-                FROM predictions 
-                ORDER BY timestamp DESC
+                SELECT timestamp, sensor_name, predicted_value
+                FROM prediction_history
+                WHERE timestamp = (SELECT timestamp FROM prediction_latest WHERE id = 1)
                 LIMIT 20
             """)
+            return cursor.fetchall()
 
-            prediction_rows = cursor.fetchall()
+        cursor.execute("""
+            SELECT timestamp, sensor_name, predicted_value 
+            FROM predictions 
+            ORDER BY timestamp DESC
+            LIMIT 20
+        """)
 
-            return prediction_rows
-        
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_get_latest_prediction_rows(db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
+        prediction_rows = cursor.fetchall()
 
+        return prediction_rows
+
+@_resilient
 def db_get_radar_sensor_data(db_name=DB_NAME):
     """Get latest radar sensor data from the database"""
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
+    with db_connection(db_name) as conn:
+        cursor = conn.cursor()
 
-            cursor = conn.cursor()
+        cursor.execute("""
+            SELECT s.name, sd.sensor_value, sd.timestamp
+            FROM sensor_data sd
+            JOIN sensors s ON sd.sensor_id = s.id
+            WHERE s.category = 'radar'
+            ORDER BY sd.timestamp DESC
+        """)
 
-            cursor.execute("""
-                SELECT s.name, sd.sensor_value, sd.timestamp
-                FROM sensor_data sd
-                JOIN sensors s ON sd.sensor_id = s.id
-                WHERE s.category = 'radar'
-                ORDER BY sd.timestamp DESC
-            """)
-
-            radar_rows = cursor.fetchall()
+        radar_rows = cursor.fetchall()
 
-            return radar_rows
-
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_get_radar_sensor_data(db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
+        return radar_rows
 
+@_resilient
 def db_get_light_sensor_names(db_name=DB_NAME):
     """Get all light sensor names from the database"""
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
-
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                SELECT name
-                FROM sensors
-                WHERE category = 'light' AND name IS NOT NULL
-                ORDER BY name
-            """)
+    with db_connection(db_name) as conn:
+        cursor = conn.cursor()
 
-            light_sensors = [row[0].lower() for row in cursor.fetchall()]
+        cursor.execute("""
+            SELECT name
+            FROM sensors
+            WHERE category = 'light' AND name IS NOT NULL
+            ORDER BY name
+        """)
 
-            return light_sensors
+        light_sensors = [row[0].lower() for row in cursor.fetchall()]
 
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_get_light_sensor_names(db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
+        return light_sensors
 
+@_resilient
 def db_get_latest_predictions(db_name=DB_NAME):
     """Get the most recent predictions from database"""
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
+    with db_connection(db_name, snapshot=True) as conn:
+        cursor = conn.cursor()
 
-            cursor = conn.cursor()
-
-            # Get the latest timestamp first
+        # Get the latest timestamp first, kept in prediction_latest with a history
+        if sensor_data_layout(cursor)['prediction_history']:
+            latest_time = predictions.latest_timestamp(cursor)
+        else:
             cursor.execute("SELECT MAX(timestamp) as latest_time FROM predictions")
             result = cursor.fetchone()
             latest_time = result[0] if result else None
 
-            if not latest_time:
-                return None
-
-            # Get all predictions for that timestamp
-            cursor.execute("""
-                SELECT sensor_name, predicted_value, category 
-                FROM predictions 
-                WHERE timestamp = ?
-                ORDER BY category, sensor_name
-            """, (latest_time,))
-
-            results = {
-                'lights': {},
-                'temperatures': {},
-                'timestamp': latest_time
-            }
-
-            for row in cursor.fetchall():
-                category = row[2]
-                sensor_name = row[0]
-                value = row[1]
-                
-                if category == 'light':
-                    results['lights'][sensor_name] = int(value)
-                elif category == 'temp':
-                    results['temperatures'][sensor_name] = float(value)
-
-            return results
-        
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_get_latest_predictions(db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
+        if not latest_time:
+            return None
+
+        # Get all predictions for that timestamp
+        cursor.execute("""
+            SELECT sensor_name, predicted_value, category 
+            FROM predictions 
+            WHERE timestamp = ?
+            ORDER BY category, sensor_name
+        """, (latest_time,))
+
+        results = {
+            'lights': {},
+            'temperatures': {},
+            'timestamp': latest_time
+        }
+
+        for row in cursor.fetchall():
+            category = row[2]
+            sensor_name = row[0]
+            value = row[1]
+            
+            if category == 'light':
+                results['lights'][sensor_name] = int(value)
+            elif category == 'temp':
+                results['temperatures'][sensor_name] = float(value)
+
+        return results
+
+def db_score_predictions(horizon_seconds=PREDICTION_HORIZON_SECONDS, batch_rows=PREDICTION_SCORE_BATCH_ROWS,
+                         db_name=DB_NAME):
+    """
+    Background job: join the predictions made more than horizon_seconds ago to
+    the sensor's value as of horizon_seconds after them, and fold the errors
+    into prediction_accuracy. Only rows not scored yet are read, batch_rows per
+    transaction. Returns the number of predictions scored, 0 before schema version 5.
+    """
+    scored_total = 0
+
+    def score():
+        nonlocal scored_total
+        while True:
+            with db_write_lock, db_connection(db_name) as conn:
+                cursor = conn.cursor()
+                if not sensor_data_layout(cursor)['prediction_history']:
+                    return
+
+                until = (datetime.now() - timedelta(seconds=horizon_seconds)).strftime('%Y-%m-%d %H:%M:%S')
+                rows = predictions.unscored(cursor, until, batch_rows)
+                if not rows:
+                    return
+
+                cursor.execute("SELECT name, id FROM sensors WHERE name IS NOT NULL")
+                name_to_id = dict(cursor.fetchall())
+                scored = []
+                for timestamp, group in itertools.groupby(rows, key=lambda row: row[0]):
+                    group = list(group)
+                    # As of the target time means before the second after it
+                    target = (datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
+                              + timedelta(seconds=horizon_seconds + 1)).strftime('%Y-%m-%d %H:%M:%S')
+                    sensor_ids = [name_to_id[name] for _, name, _ in group if name in name_to_id]
+                    actual = _last_values_before(cursor, sensor_ids, target, db_name)
+                    scored.extend((timestamp, name, predicted, actual.get(name_to_id.get(name)))
+                                  for _, name, predicted in group)
+                predictions.record(cursor, scored)
+                conn.commit()
+                scored_total += len(scored)
+                print(f"Scored {len(scored)} predictions up to {rows[-1][0]}")
+
+    _db_call(score, db_name, 'db_score_predictions')
+    return scored_total
+
+@_resilient
+def db_get_prediction_accuracy(db_name=DB_NAME):
+    """
+    Error metrics of the scored predictions per sensor name:
+    {name: {'count', 'mae', 'rmse', 'rolling_mae', 'last_timestamp'}}, empty before schema version 5
+    """
+    with db_connection(db_name, snapshot=True) as conn:
+        cursor = conn.cursor()
+        if not sensor_data_layout(cursor)['prediction_history']:
+            return {}
+
+        cursor.execute("""
+            SELECT sensor_name, count, abs_error_sum, squared_error_sum, rolling_abs_error, last_timestamp
+            FROM prediction_accuracy
+            ORDER BY sensor_name
+        """)
+        return {name: {'count': count, 'mae': abs_sum / count, 'rmse': (squared_sum / count) ** 0.5,
+                       'rolling_mae': rolling, 'last_timestamp': last_timestamp}
+                for name, count, abs_sum, squared_sum, rolling, last_timestamp in cursor.fetchall()}
+
+@_resilient
+def db_get_module_groups(db_name=DB_NAME):
+    """{client_id: [group names]} of the modules in a user-defined group, empty before schema version 6"""
+    with db_connection(db_name, snapshot=True) as conn:
+        cursor = conn.cursor()
+        if not sensor_data_layout(cursor)['module_groups']:
+            return {}
+
+        cursor.execute("SELECT client_id, group_name FROM module_groups ORDER BY client_id, group_name")
+        module_groups = {}
+        for client_id, group_name in cursor.fetchall():
+            module_groups.setdefault(client_id, []).append(group_name)
+        return module_groups
+
+@_resilient
+def db_set_module_groups(client_id, group_names, db_name=DB_NAME):
+    """
+    Make group_names the groups of the module, replacing its old ones.
+    Raises ValueError for names that can't be topic levels, DatabaseError
+    before schema version 6. Returns the sorted group names.
+    """
+    group_names = sorted({groups.check_name(name) for name in group_names})
+    with db_write_lock, db_connection(db_name) as conn:
+        cursor = conn.cursor()
+        if not sensor_data_layout(cursor)['module_groups']:
+            raise DatabaseError("Module groups need schema version 6, run python -m database.schema")
+
+        cursor.execute("DELETE FROM module_groups WHERE client_id = ?", (client_id,))
+        cursor.executemany("INSERT INTO module_groups (group_name, client_id) VALUES (?, ?)",
+                           [(name, client_id) for name in group_names])
+        conn.commit()
+    _notify_module_change(db_name)
+    return group_names
 
 # export files
+@_resilient
 def db_get_light_and_temp_sensors_with_details(db_name=DB_NAME):
     """Get all light and temperature sensors with their details"""
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
+    with db_connection(db_name) as conn:
+        cursor = conn.cursor()
 
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                SELECT id, name, category 
-                FROM sensors 
-                WHERE category IN ('light', 'temp') AND name IS NOT NULL
-                ORDER BY category, name
-            """)
-
-            sensors = cursor.fetchall()
+        cursor.execute("""
+            SELECT id, name, category 
+            FROM sensors 
+            WHERE category IN ('light', 'temp') AND name IS NOT NULL
+            ORDER BY category, name
+        """)
 
-            return sensors
+        sensors = cursor.fetchall()
 
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_get_light_and_temp_sensors_with_details(db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
+        return sensors
 
+@_resilient
 def db_get_recent_timestamps(limit=24, db_name=DB_NAME):
     """Get the most recent distinct timestamps"""
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
-
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                SELECT DISTINCT timestamp 
-                FROM sensor_data 
-                ORDER BY timestamp DESC 
+    with db_connection(db_name) as conn:
+        cursor = conn.cursor()
+
+        layout = sensor_data_layout(cursor)
+        cursor.execute(f"""
+            SELECT {layout['timestamp']}
+            FROM (
+                SELECT DISTINCT {layout['time']}
+                FROM {layout['table']}
+                ORDER BY {layout['time']} DESC
                 LIMIT ?
-            """, (limit,))
+            )
+            ORDER BY {layout['time']}
+        """, (limit,))
 
-            timestamps = [row[0] for row in cursor.fetchall()]
-            timestamps.reverse()  # Chronological order (oldest first)
+        timestamps = [row[0] for row in cursor.fetchall()]  # Chronological order (oldest first)
 
-            return timestamps
-
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_get_recent_timestamps(limit, db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
+        return timestamps
 
+@_resilient
 def db_get_timestamps_since(days_ago, db_name=DB_NAME):
     """Get all distinct timestamps from the past X days"""
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
+    with db_connection(db_name) as conn:
+        cursor = conn.cursor()
 
-            cursor = conn.cursor()
+        # Calculate date X days ago
+        days_ago_str = (datetime.now() - timedelta(days=days_ago)).strftime('%Y-%m-%d %H:%M:%S')
 
-            # Calculate date X days ago
-            days_ago_str = (datetime.now() - timedelta(days=days_ago)).strftime('%Y-%m-%d %H:%M:%S')
+        layout = sensor_data_layout(cursor)
+        cursor.execute(f"""
+            SELECT DISTINCT {layout['timestamp']}
+            FROM {layout['table']}
+            WHERE {layout['time']} >= {layout['time_param']}
+            ORDER BY {layout['time']}
+        """, (days_ago_str,))
 
-            cursor.execute("""
-                SELECT DISTINCT timestamp 
-                FROM sensor_data 
-                WHERE timestamp >= ?
-                ORDER BY timestamp
-            """, (days_ago_str,))
-
-            timestamps = [row[0] for row in cursor.fetchall()]
+        timestamps = [row[0] for row in cursor.fetchall()]
 
-            return timestamps
-        
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_get_timestamps_since(days_ago, db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
+        return timestamps
 
+@_resilient
 def db_get_sensor_readings_for_timestamp(timestamp, db_name=DB_NAME):
     """Get all sensor readings for a specific timestamp"""
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
-
-            cursor = conn.cursor()
+    with db_connection(db_name) as conn:
+        cursor = conn.cursor()
 
-            cursor.execute("""
-                SELECT s.name, sd.sensor_value, s.category
-                FROM sensor_data sd
-                JOIN sensors s ON sd.sensor_id = s.id
-                WHERE sd.timestamp = ? AND s.category IN ('light', 'temp')
-            """, (timestamp,))
-
-            readings = cursor.fetchall()
+        layout = sensor_data_layout(cursor)
+        cursor.execute(f"""
+            SELECT s.name, {layout['table']}.sensor_value, s.category
+            FROM {layout['table']}
+            JOIN sensors s ON {layout['sensor_id']} = s.id
+            WHERE {layout['time']} = {layout['time_param']} AND s.category IN ('light', 'temp')
+        """, (timestamp,))
 
-            return readings
+        readings = cursor.fetchall()
 
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_get_sensor_readings_for_timestamp(timestamp, db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
+        return readings
 
 # Triggers to  get the last_val for sensors table
 
+@_resilient
 def db_create_last_val_trigger(db_name=DB_NAME):
     """Create a trigger to automatically update last_val in sensors table when new data is inserted."""
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
-
-            cursor = conn.cursor()
-
-            # Drop the trigger if it already exists
-            cursor.execute("DROP TRIGGER IF EXISTS update_last_val")
-
-            # Create the trigger
-            cursor.execute("""
-            CREATE TRIGGER update_last_val
-            AFTER INSERT ON sensor_data
-            FOR EACH ROW
-            BEGIN
-                UPDATE sensors
-                SET last_val = NEW.sensor_value
-                WHERE id = NEW.sensor_id;
-            END
-            """)
-
-            conn.commit()
-            print("Trigger created successfully")
-
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_create_last_val_trigger(db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
-
+    with db_write_lock, db_connection(db_name) as conn:
+        cursor = conn.cursor()
+
+        # The compact schema's sensor_data_insert trigger already sets last_val
+        if sensor_data_layout(cursor)['table'] == 'readings':
+            return
+
+        # Drop the trigger if it already exists
+        cursor.execute("DROP TRIGGER IF EXISTS update_last_val")
+
+        # Create the trigger
+        cursor.execute("""
+        CREATE TRIGGER update_last_val
+        AFTER INSERT ON sensor_data
+        FOR EACH ROW
+        BEGIN
+            UPDATE sensors
+            SET last_val = NEW.sensor_value
+            WHERE id = NEW.sensor_id;
+        END
+        """)
+
+        conn.commit()
+        print("Trigger created successfully")
+
+@_resilient
 def db_update_last_vals(db_name=DB_NAME):
     """Update the last_val column in sensors table with the latest value from sensor_data table."""
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
-
-            cursor = conn.cursor()
-
-            # Update all sensors in one SQL statement
-            cursor.execute("""
-                UPDATE sensors
-                SET last_val = (
-                    SELECT sd.sensor_value
-                    FROM sensor_data sd
-                    WHERE sd.sensor_id = sensors.id
-                    ORDER BY sd.timestamp DESC
-                    LIMIT 1
+    with db_write_lock, db_connection(db_name) as conn:
+        cursor = conn.cursor()
+
+        # Update all sensors in one SQL statement
+        layout = sensor_data_layout(cursor)
+        cursor.execute(f"""
+            UPDATE sensors
+            SET last_val = (
+                SELECT sensor_value
+                FROM {layout['table']}
+                WHERE {layout['sensor']} IN ({layout['sensors_where']} s.id = sensors.id)
+                ORDER BY {layout['time']} DESC
+                LIMIT 1
+            )
+        """)
+
+        updated_count = cursor.rowcount
+        conn.commit()
+        print(f"Updated last_val for {updated_count} sensors")
+
+@_resilient
+def db_compact_sensor_data(db_name=DB_NAME):
+    """
+    Migrate light/temp history written one row per module per reading to sparse storage.
+
+    sensor_publish_handler used to store every light/temp module's last value
+    whenever one of them reported. A row repeating the value before it is such
+    a copy and is deleted; the as-of queries rebuild it. One row is kept at
+    timestamps with nothing else left, so every reading's timestamp survives.
+    Returns the number of rows deleted.
+    """
+    with db_write_lock, db_connection(db_name) as conn:
+        cursor = conn.cursor()
+
+        layout = sensor_data_layout(cursor)
+        cursor.execute("DROP TABLE IF EXISTS temp.compact_rows")
+        cursor.execute(f"""
+            CREATE TEMP TABLE compact_rows AS
+            SELECT {layout['sensor']} AS sensor, {layout['time']} AS time,
+                   sensor_value IS LAG(sensor_value) OVER (
+                       PARTITION BY {layout['sensor']} ORDER BY {layout['time']}) AS copied
+            FROM {layout['table']}
+            WHERE {layout['sensor']} IN ({layout['sensors_where']} s.category IN ('light', 'temp'))
+        """)
+        cursor.execute("CREATE INDEX temp.compact_rows_time ON compact_rows (time, copied, sensor)")
+        cursor.execute(f"""
+            DELETE FROM {layout['table']}
+            WHERE ({layout['sensor']}, {layout['time']}) IN (
+                SELECT sensor, time FROM compact_rows c
+                WHERE copied AND (
+                    EXISTS (SELECT 1 FROM compact_rows r WHERE r.time = c.time AND NOT r.copied)
+                    OR sensor != (SELECT MIN(sensor) FROM compact_rows r WHERE r.time = c.time)
                 )
-            """)
-
-            updated_count = cursor.rowcount
-            conn.commit()
-            print(f"Updated last_val for {updated_count} sensors")
+            )
+        """)
+        deleted = cursor.rowcount
+        if layout['rollups']:
+            # Copies count as readings in their buckets until rebuilt
+            _rebuild_rollups(cursor, "(SELECT sensor AS sensor_key, time AS ts FROM temp.compact_rows WHERE copied)",
+                             _horizon(cursor, db_name), db_name)
+        cursor.execute("DROP TABLE temp.compact_rows")
+        conn.commit()
+        print(f"Removed {deleted} copied sensor readings")
+        return deleted
+
+@_resilient
+def db_rebuild_rollups(db_name=DB_NAME):
+    """
+    Recompute the hourly and daily rollups from the readings, after readings
+    were written with SQL the db_* writers don't see. Returns False when the
+    database has no rollups (schema version < 3).
+    """
+    with db_write_lock, db_connection(db_name) as conn:
+        cursor = conn.cursor()
+
+        if not sensor_data_layout(cursor)['rollups']:
+            return False
+        horizon = _horizon(cursor, db_name)
+        if horizon is not None:
+            _stage_archived_readings(cursor, rollups.late_readings(horizon), horizon, db_name)
+        rollups.rebuild_all(cursor, horizon)
+        conn.commit()
+        print("Rebuilt the sensor rollups")
+        return True
+
+def db_archive_sensor_data(days_to_keep=SENSOR_DATA_RETENTION_DAYS, batch_rows=ARCHIVE_BATCH_ROWS, db_name=DB_NAME):
+    """
+    Move readings from before midnight days_to_keep days ago to the archive
+    (see archive.py) and delete them from SQLite, about batch_rows readings per
+    transaction so writers are never held up for long. From schema version 4
+    the archive is the sensor_chunks table (see chunks.py), written in the same
+    transaction. The rollups of archived readings are kept. Returns the number
+    of readings archived.
+    """
+    directory = archive.archive_dir(db_name)
+    # Whole days, so no rollup bucket is split between the archive and SQLite
+    cutoff = (datetime.now() - timedelta(days=days_to_keep)).strftime('%Y-%m-%d 00:00:00')
+    archived = 0
+
+    def archive_batches():
+        nonlocal archived
+        while True:
+            with db_write_lock, db_connection(db_name) as conn:
+                cursor = conn.cursor()
+                layout = sensor_data_layout(cursor)
+
+                # A batch ends after all readings of a timestamp, the last batch at the cutoff
+                cursor.execute(f"""
+                    SELECT {layout['timestamp']}
+                    FROM {layout['table']}
+                    WHERE {layout['time']} < {layout['time_param']}
+                    ORDER BY {layout['time']}
+                    LIMIT 1 OFFSET ?
+                """, (cutoff, batch_rows))
+                row = cursor.fetchone()
+                if row:
+                    before, end, horizon = '<=', row[0], _to_ts(row[0]) + 1
+                else:
+                    before, end, horizon = '<', cutoff, _to_ts(cutoff)
+
+                cursor.execute(f"""
+                    SELECT {layout['sensor_id']}, CAST(strftime('%s', {layout['time']}{layout['unixepoch']}) AS INTEGER),
+                           sensor_value
+                    FROM {layout['table']}
+                    WHERE {layout['time']} {before} {layout['time_param']}
+                """, (end,))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+
+                by_sensor = {}
+                for sensor_id, ts, value in rows:
+                    if sensor_id is not None and ts is not None:
+                        by_sensor.setdefault(sensor_id, []).append((ts, np.nan if value is None else value))
+                for sensor_id, readings in by_sensor.items():
+                    ts, values = zip(*readings)
+                    if layout['chunks']:
+                        chunks.write(cursor, sensor_id, ts, values)
+                    else:
+                        archive.write(directory, sensor_id, ts, values)
+                if not layout['chunks']:
+                    # The files and the horizon are in place before the rows go
+                    archive.set_horizon(directory, horizon)
+
+                cursor.execute(f"""
+                    DELETE FROM {layout['table']}
+                    WHERE {layout['time']} {before} {layout['time_param']}
+                """, (end,))
+                conn.commit()
+                archived += len(rows)
+                print(f"Archived {len(rows)} sensor readings up to {end}")
+            if not row:
+                break
 
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_update_last_vals(db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
+    _db_call(archive_batches, db_name, 'db_archive_sensor_data')
+    return archived
 
 # sensor_data_generator.py
+@_resilient
 def db_get_sensor_ids_by_category(db_name=DB_NAME):
     """Get all sensor IDs grouped by category"""
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
+    with db_connection(db_name) as conn:
+        cursor = conn.cursor()
 
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                SELECT id, category 
-                FROM sensors 
-                WHERE category IN ('light', 'temp', 'radar')
-            """)
-
-            results = cursor.fetchall()
+        cursor.execute("""
+            SELECT id, category 
+            FROM sensors 
+            WHERE category IN ('light', 'temp', 'radar')
+        """)
 
-            # Group by category
-            sensors = {'light': [], 'temp': [], 'radar': []}
-            for sensor_id, category in results:
-                if category in sensors:  # Check if category exists in dictionary
-                    sensors[category].append(sensor_id)
+        results = cursor.fetchall()
 
-            return sensors
+        # Group by category
+        sensors = {'light': [], 'temp': [], 'radar': []}
+        for sensor_id, category in results:
+            if category in sensors:  # Check if category exists in dictionary
+                sensors[category].append(sensor_id)
 
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_get_sensor_ids_by_category(db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
+        return sensors
 
 def db_insert_sensor_data_for_timestamp(timestamp, sensors_dict, db_name=DB_NAME):
-    """Insert data for all sensors for a specific timestamp"""
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
-
-            cursor = conn.cursor()
-
-            # Insert data for each sensor category
-            for category, sensor_ids in sensors_dict.items():
-                for sensor_id in sensor_ids:
-                    value = generate_random_sensor_value(category)
-                    cursor.execute("""
-                        INSERT OR REPLACE INTO sensor_data (sensor_id, timestamp, sensor_value)
-                        VALUES (?, ?, ?)
-                    """, (sensor_id, timestamp, value))
-
-            conn.commit()
-            print(f"Inserted data for timestamp: {timestamp}")
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_insert_sensor_data_for_timestamp(timestamp, sensors_dict, db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
+    """Insert random data for all sensors for one timestamp, or a list of timestamps, in one transaction"""
+    timestamps = [timestamp] if isinstance(timestamp, str) else list(timestamp)
+    db_bulk_ingest(((sensor_id, timestamp, generate_random_sensor_value(category))
+                    for timestamp in timestamps
+                    for category, sensor_ids in sensors_dict.items()
+                    for sensor_id in sensor_ids), db_name=db_name)
+    print(f"Inserted data for timestamps: {timestamps[0]} to {timestamps[-1]}" if len(timestamps) > 1
+          else f"Inserted data for timestamp: {timestamps[0]}")
 
 def generate_random_sensor_value(sensor_type):
     """Generate random sensor values based on sensor type"""
@@ -1598,36 +1657,15 @@ def generate_random_sensor_value(sensor_type):
     else:
         return 0
 
+@_resilient
 def db_select_debug(db_name=DB_NAME):
-    app_client_id = getattr(utils, 'client_id', None)
-    conn = None
-    try:
-        with db_lock:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA journal_mode=WAL;")
+    with db_connection(db_name) as conn:
+        cursor = conn.cursor()
 
-            cursor = conn.cursor()
-
-            # Select all rows from the table
-            cursor.execute("SELECT * FROM sensors")
-            rows = cursor.fetchall()
-
-            # Print the results
-            for row in rows:
-                print(row)
+        # Select all rows from the table
+        cursor.execute("SELECT * FROM sensors")
+        rows = cursor.fetchall()
 
-    except sqlite3.OperationalError:
-        if conn:
-            conn.close()
-        if ui_client_id == app_client_id:
-            raise DatabaseError("Database is broken!")
-        else:
-            print(f"{RED}DatabaseError : Retrying in 5 mins...{RESET}")
-            time.sleep(DB_ERROR_RETRY_TIMEOUT)
-            return db_select_debug(db_name)
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except:
-            pass
\ No newline at end of file
+        # Print the results
+        for row in rows:
+            print(row)
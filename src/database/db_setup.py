@@ -44,6 +44,7 @@ END
 """)
 
 
+# This is schema version 1, python -m database.schema moves sensor_data to the compact layout
 print("Database and table created: database.db")
 conn.commit()
 conn.close()
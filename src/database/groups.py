@@ -0,0 +1,30 @@
+"""
+User-defined module groups (rooms, floors, ...), from schema version 6.
+
+  module_groups   one row per (group_name, client_id) membership
+
+A module's groups are kept by client_id, the id its commands are addressed
+to, so a module that is replaced keeps none of the old one's groups. Group
+names become MQTT topic levels (sensor/group/<name>, see sensor/groups.py)
+and can't hold '/', '+' or '#'.
+"""
+GROUP_NAME_MAX_LENGTH = 64
+
+
+def create_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE module_groups (
+            group_name TEXT NOT NULL,
+            client_id TEXT NOT NULL,
+            PRIMARY KEY (group_name, client_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX module_groups_client_id ON module_groups (client_id)")
+
+
+def check_name(name):
+    """The group name stripped of surrounding spaces, ValueError if it can't be a topic level"""
+    name = str(name).strip()
+    if not name or len(name) > GROUP_NAME_MAX_LENGTH or any(c in name for c in '/+#'):
+        raise ValueError(f"Invalid group name: {name!r}")
+    return name
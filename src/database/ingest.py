@@ -0,0 +1,252 @@
+"""
+Write-behind ingest queue for sensor readings.
+
+MQTT callbacks enqueue readings and return immediately. A single writer
+thread drains the queue and commits one transaction per INGEST_BATCH_ROWS
+rows or every INGEST_FLUSH_MS milliseconds, whichever comes first. Rows
+queued together with put_batch are never split across transactions.
+
+While the database is unavailable, batches that fail with DatabaseError move
+to an in-memory backlog of up to INGEST_BACKLOG_ROWS readings (the oldest
+are dropped first, those of a put_batch only all together) and the queue
+keeps accepting readings. The backlog keeps the transactions as they were
+taken from the queue and replays them in order, at most every
+INGEST_REPLAY_SECONDS, before anything newer is written.
+"""
+import time
+import queue
+from collections import deque
+from threading import Thread, Event, Lock
+
+from .database import db_add_sensor_data_batch, DatabaseError
+
+INGEST_BATCH_ROWS = 200
+INGEST_FLUSH_MS = 250
+INGEST_QUEUE_SIZE = 10000
+INGEST_PUT_TIMEOUT = 5          # Seconds a producer may block when the queue is full
+INGEST_BACKLOG_ROWS = 100000
+INGEST_REPLAY_SECONDS = 5
+
+
+class _Batch(list):
+    """Rows queued with put_batch, one entry of the queue."""
+
+
+class IngestQueue:
+    """Bounded queue of (timestamp, sensor_id, value) rows flushed by a background writer."""
+    def __init__(self, write_batch=db_add_sensor_data_batch, batch_rows=INGEST_BATCH_ROWS,
+                 flush_ms=INGEST_FLUSH_MS, max_size=INGEST_QUEUE_SIZE, put_timeout=INGEST_PUT_TIMEOUT,
+                 backlog_rows=INGEST_BACKLOG_ROWS, replay_seconds=INGEST_REPLAY_SECONDS):
+        self.write_batch = write_batch
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_ms / 1000.0
+        self.put_timeout = put_timeout
+        self.replay_seconds = replay_seconds
+        self._queue = queue.Queue(maxsize=max_size)
+        # Only the writer thread (or _drain after it stopped) touches the backlog,
+        # one entry per transaction so that a put_batch stays whole
+        self._backlog = deque()
+        self._backlog_rows = 0
+        self.backlog_rows = backlog_rows
+        self._replay_at = 0
+        self._stop = Event()
+        self._thread = None
+        self._stats_lock = Lock()
+        self.stats = {'enqueued': 0, 'written': 0, 'dropped': 0, 'batches': 0, 'failed': 0,
+                      'backlogged': 0, 'replayed': 0}
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = Thread(target=self._run, name="ingest-writer", daemon=True)
+            self._thread.start()
+
+    def put(self, timestamp, sensor_id, value):
+        """
+        Queue one reading. Blocks for up to put_timeout seconds when the queue
+        is full (backpressure), then drops the reading. Returns True if queued.
+        """
+        try:
+            self._queue.put((timestamp, sensor_id, value), timeout=self.put_timeout)
+        except queue.Full:
+            self._count('dropped')
+            print(f"Ingest queue full, dropping reading for {sensor_id} at {timestamp}")
+            return False
+        self._count('enqueued')
+        return True
+
+    def put_many(self, rows):
+        return sum(self.put(*row) for row in rows)
+
+    def put_batch(self, rows):
+        """
+        Queue rows to be written in one transaction, e.g. the readings of one
+        batch message. They take one entry of the queue, with the same
+        backpressure as put. Returns the number of rows queued.
+        """
+        rows = _Batch(rows)
+        if not rows:
+            return 0
+        try:
+            self._queue.put(rows, timeout=self.put_timeout)
+        except queue.Full:
+            self._count('dropped', len(rows))
+            print(f"Ingest queue full, dropping a batch of {len(rows)} readings")
+            return 0
+        self._count('enqueued', len(rows))
+        return len(rows)
+
+    def pending(self):
+        return self._queue.qsize() + self._backlog_rows
+
+    def backlog(self):
+        """Readings waiting for the database to come back."""
+        return self._backlog_rows
+
+    def flush(self, timeout=None):
+        """
+        Block until every queued reading has been written or moved to the
+        backlog (or timeout seconds pass).
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._drain()
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stop(self, timeout=None):
+        """Flush what is queued and stop the writer thread. A backlog that can't be written is lost."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        # Anything enqueued after the writer exited
+        self._drain()
+        if self._backlog:
+            print(f"Ingest writer stopped with {self._backlog_rows} readings not written")
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def _take_batch(self, first, wait=True):
+        """
+        Rows of one transaction starting with the queue entry first, and the
+        number of entries taken. A _Batch if it holds rows of put_batch.
+        """
+        if isinstance(first, _Batch):
+            return first, 1
+        batch = [first]
+        entries = 1
+        deadline = time.monotonic() + (self.flush_interval if wait else 0)
+        while len(batch) < self.batch_rows:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0 and not self._stop.is_set():
+                    entry = self._queue.get(timeout=remaining)
+                else:
+                    # Don't leave already queued rows behind once the deadline has passed
+                    entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            entries += 1
+            if isinstance(entry, _Batch):
+                # Written whole, it ends the transaction
+                batch = _Batch(batch + entry)
+                break
+            batch.append(entry)
+        return batch, entries
+
+    def _write(self, batch, entries):
+        try:
+            # Nothing newer is written before the backlog
+            if self._backlog:
+                self._to_backlog(batch)
+                self._replay()
+                return
+            self.write_batch(batch)
+            self._count('written', len(batch))
+            self._count('batches')
+        except DatabaseError as e:
+            print(f"Ingest writer keeps {len(batch)} readings until the database is back: {e}")
+            self._to_backlog(batch)
+            self._replay_at = time.monotonic() + self.replay_seconds
+        except Exception as e:
+            self._count('failed', len(batch))
+            print(f"Ingest writer failed to store {len(batch)} readings: {e}")
+        finally:
+            for _ in range(entries):
+                self._queue.task_done()
+
+    def _to_backlog(self, batch):
+        self._backlog.append(batch)
+        self._backlog_rows += len(batch)
+        self._count('backlogged', len(batch))
+        dropped = 0
+        while self._backlog_rows > self.backlog_rows:
+            oldest = self._backlog[0]
+            excess = self._backlog_rows - self.backlog_rows
+            if isinstance(oldest, _Batch) or excess >= len(oldest):
+                # A put_batch is only dropped whole
+                dropped += self._pop_backlog()
+            else:
+                del oldest[:excess]
+                self._backlog_rows -= excess
+                dropped += excess
+        if dropped:
+            self._count('dropped', dropped)
+            print(f"Ingest backlog full, dropped the {dropped} oldest readings")
+
+    def _pop_backlog(self):
+        batch = self._backlog.popleft()
+        self._backlog_rows -= len(batch)
+        return len(batch)
+
+    def _replay(self, force=False):
+        """Write the backlog, oldest batch first, until it is empty or the database fails again."""
+        if not force and time.monotonic() < self._replay_at:
+            return
+        while self._backlog:
+            batch = self._backlog[0]
+            try:
+                self.write_batch(batch)
+            except DatabaseError as e:
+                print(f"Ingest backlog of {self._backlog_rows} readings not replayed yet: {e}")
+                self._replay_at = time.monotonic() + self.replay_seconds
+                return
+            except Exception as e:
+                self._count('failed', len(batch))
+                print(f"Ingest writer failed to store {len(batch)} readings: {e}")
+            else:
+                self._count('written', len(batch))
+                self._count('replayed', len(batch))
+                self._count('batches')
+            self._pop_backlog()
+
+    def _drain(self):
+        while True:
+            try:
+                first = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._write(*self._take_batch(first, wait=False))
+        self._replay(force=True)
+
+    def _run(self):
+        # Wake up at least twice a second to notice stop()
+        idle_wait = min(self.flush_interval, 0.5)
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=idle_wait)
+            except queue.Empty:
+                if self._backlog:
+                    self._replay()
+                continue
+            self._write(*self._take_batch(first))
+        self._drain()
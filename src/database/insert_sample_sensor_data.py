@@ -2,12 +2,15 @@
 FOR DEMONSTRATION
 -----------------
 To populate 'sensor_data' db table easily with sample sensor data .
+Run from src: python -m database.insert_sample_sensor_data
 """
 
 import sqlite3
 from datetime import datetime, timedelta
 import random
 
+from .database import DB_NAME, db_bulk_ingest
+
 # Mapping readable names to client IDs (must match insert_sample_sensor.py)
 client_id_map = {
     'L1': "L-21.09-0001",
@@ -35,7 +38,7 @@ client_id_map = {
 
 def get_sensor_ids():
     """Return mapping of logical sensor name (L1, T1...) to UUID from DB based on client_id"""
-    conn = sqlite3.connect("database.db")
+    conn = sqlite3.connect(DB_NAME)
     cursor = conn.cursor()
 
     placeholders = ','.join('?' for _ in client_id_map.values())
@@ -79,29 +82,14 @@ def insert_data_for_entire_week():
         print(" ERROR: Some client IDs were not found in DB. Insert sample sensors first.")
         return
 
-    conn = sqlite3.connect('database.db')
-    cursor = conn.cursor()
-
     now = datetime.now().replace(minute=0, second=0, microsecond=0)
 
-    for day in range(7):
-        for interval in range(96):  # 96 intervals per day
-            timestamp = now - timedelta(minutes=15 * interval)
-            data_rows = generate_sample_data(timestamp, sensor_ids)
+    # 96 intervals per day, generated as they are written
+    rows = (row for interval in range(7 * 96)
+            for row in generate_sample_data(now - timedelta(minutes=15 * interval), sensor_ids))
 
-            for row in data_rows:
-                try:
-                    cursor.execute('''
-                        INSERT INTO sensor_data (sensor_id, timestamp, sensor_value)
-                        VALUES (?, ?, ?)
-                    ''', row)
-                except sqlite3.IntegrityError:
-                    continue
-
-        now -= timedelta(days=1)
-
-    conn.commit()
-    conn.close()
+    # A bulk load, no need to fsync every chunk
+    db_bulk_ingest(rows, synchronous_off=True)
     print(" Sensor data for past 7 days inserted.")
 
 
@@ -0,0 +1,344 @@
+"""
+Timing of the db_* functions.
+
+Every db_* call (see _db_call in database.py) records, per function, in
+in-process histograms:
+
+  seconds      the whole call, retries included
+  lock_wait    time spent waiting for db_write_lock
+  lock_hold    time db_write_lock was held
+  rows         rows fetched with fetchone, fetchmany or fetchall
+
+Pooled connections hand out TracedCursor, which notes the time of each
+statement of the call. A call that takes longer than SLOW_QUERY_MS goes to
+the slow query log with its slowest statements and their EXPLAIN QUERY PLAN.
+Recording costs a few microseconds per call and per statement.
+
+The core, AI and web processes each have their own numbers. start_export
+writes them every METRICS_EXPORT_SECONDS to <database>_metrics/<process>.json,
+where read_exports picks them up for the web server.
+"""
+import os
+import json
+import time
+import sqlite3
+import bisect
+from collections import deque
+from datetime import datetime
+from threading import Lock, Thread, local
+
+SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", 250))
+SLOW_QUERY_LOG_SIZE = 50
+SLOW_QUERY_STATEMENTS = 3       # Slowest statements kept per slow call
+METRICS_EXPORT_SECONDS = 30
+# Upper bounds of the histogram buckets, the last bucket has none
+SECONDS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10)
+ROWS_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+enabled = True
+
+
+class Histogram:
+    """Counts of values per bucket, with their sum and maximum."""
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q quantile, the maximum for the last bucket."""
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {'count': self.count, 'total': self.total, 'max': self.max,
+                'p50': self.quantile(0.5), 'p95': self.quantile(0.95), 'p99': self.quantile(0.99),
+                'buckets': {('+inf' if i == len(self.bounds) else str(self.bounds[i])): count
+                            for i, count in enumerate(self.counts) if count}}
+
+
+class FunctionStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.seconds = Histogram(SECONDS_BUCKETS)
+        self.lock_wait = Histogram(SECONDS_BUCKETS)
+        self.lock_hold = Histogram(SECONDS_BUCKETS)
+        self.rows = Histogram(ROWS_BUCKETS)
+
+    def snapshot(self):
+        return {'calls': self.calls, 'errors': self.errors, 'seconds': self.seconds.snapshot(),
+                'lock_wait': self.lock_wait.snapshot(), 'lock_hold': self.lock_hold.snapshot(),
+                'rows': self.rows.snapshot()}
+
+
+class Call:
+    """What one db_* call did so far, kept in a thread local while it runs."""
+    __slots__ = ('name', 'db_name', 'lock_wait', 'lock_hold', 'held_since', 'rows', 'statements',
+                 'statement', 'statement_start')
+
+    def __init__(self, name, db_name):
+        self.name = name
+        self.db_name = db_name
+        self.lock_wait = 0.0
+        self.lock_hold = 0.0
+        self.held_since = None
+        self.rows = 0
+        self.statements = {}            # sql -> [count, seconds, parameters of the first run]
+        self.statement = None
+        self.statement_start = 0.0
+
+    def begin_statement(self, sql, parameters):
+        now = time.perf_counter()
+        self.end_statement(now)
+        entry = self.statements.get(sql)
+        if entry is None:
+            entry = self.statements[sql] = [0, 0.0, parameters]
+        entry[0] += 1
+        self.statement = entry
+        self.statement_start = now
+
+    def end_statement(self, now):
+        """A statement lasts until the next one starts, its rows are fetched in between."""
+        if self.statement is not None:
+            self.statement[1] += now - self.statement_start
+            self.statement = None
+
+
+_current = local()
+_lock = Lock()
+_functions = {}
+_slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+
+def current():
+    return getattr(_current, 'call', None)
+
+
+def measure(function, name, db_name):
+    """Run function() as the db_* call name and record it. Calls inside a measured call are part of it."""
+    if not enabled or current() is not None:
+        return function()
+    call = _current.call = Call(name, db_name)
+    start = time.perf_counter()
+    failed = True
+    try:
+        result = function()
+        failed = False
+        return result
+    finally:
+        seconds = time.perf_counter() - start
+        call.end_statement(start + seconds)
+        _current.call = None
+        _record(call, seconds, failed)
+
+
+def _record(call, seconds, failed):
+    with _lock:
+        stats = _functions.get(call.name)
+        if stats is None:
+            stats = _functions[call.name] = FunctionStats()
+        stats.calls += 1
+        stats.errors += failed
+        stats.seconds.add(seconds)
+        stats.lock_wait.add(call.lock_wait)
+        stats.lock_hold.add(call.lock_hold)
+        stats.rows.add(call.rows)
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        _log_slow(call, seconds)
+
+
+def _log_slow(call, seconds):
+    slowest = sorted(call.statements.items(), key=lambda item: item[1][1], reverse=True)[:SLOW_QUERY_STATEMENTS]
+    entry = {
+        'function': call.name,
+        'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'seconds': seconds,
+        'lock_wait': call.lock_wait,
+        'lock_hold': call.lock_hold,
+        'rows': call.rows,
+        'statements': [{'sql': ' '.join(sql.split()), 'count': count, 'seconds': statement_seconds,
+                        'plan': explain(call.db_name, sql, parameters)}
+                       for sql, (count, statement_seconds, parameters) in slowest],
+    }
+    print(f"Slow database call {call.name}: {seconds * 1000:.0f} ms "
+          f"(lock wait {call.lock_wait * 1000:.0f} ms, {call.rows} rows)")
+    with _lock:
+        _slow_queries.append(entry)
+
+
+def explain(db_name, sql, parameters=None):
+    """EXPLAIN QUERY PLAN of sql as detail lines, on a connection of its own."""
+    if parameters is None:
+        # Statements run with executemany: the plan doesn't depend on the values
+        parameters = (None,) * sql.count('?')
+    try:
+        conn = sqlite3.connect(db_name, timeout=1)
+        try:
+            return [detail for _, _, _, detail in conn.execute("EXPLAIN QUERY PLAN " + sql, parameters)]
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        # e.g. statements on the temp tables of another connection
+        return [f"not available: {e}"]
+
+
+def snapshot():
+    """{'functions': {name: stats}, 'slow_queries': [...], 'slow_query_ms'} of this process, as plain data"""
+    with _lock:
+        return {'functions': {name: stats.snapshot() for name, stats in sorted(_functions.items())},
+                'slow_queries': list(_slow_queries),
+                'slow_query_ms': SLOW_QUERY_MS}
+
+
+def reset():
+    with _lock:
+        _functions.clear()
+        _slow_queries.clear()
+
+
+class TracedCursor(sqlite3.Cursor):
+    """Cursor that adds its statements and fetched rows to the current call."""
+    def execute(self, sql, parameters=()):
+        call = getattr(_current, 'call', None)
+        if call is not None:
+            call.begin_statement(sql, parameters)
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        call = getattr(_current, 'call', None)
+        if call is not None:
+            call.begin_statement(sql, None)
+        return super().executemany(sql, seq_of_parameters)
+
+    def fetchone(self):
+        row = super().fetchone()
+        call = getattr(_current, 'call', None)
+        if call is not None and row is not None:
+            call.rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        call = getattr(_current, 'call', None)
+        if call is not None:
+            call.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        call = getattr(_current, 'call', None)
+        if call is not None:
+            call.rows += len(rows)
+        return rows
+
+
+class TracedConnection(sqlite3.Connection):
+    """Connection handing out TracedCursor, conn.execute included."""
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class TimedLock:
+    """Lock that adds the time spent waiting for it and holding it to the current call."""
+    def __init__(self):
+        self._lock = Lock()
+
+    def acquire(self, blocking=True, timeout=-1):
+        call = getattr(_current, 'call', None)
+        if call is None:
+            return self._lock.acquire(blocking, timeout)
+        start = time.perf_counter()
+        acquired = self._lock.acquire(blocking, timeout)
+        call.held_since = time.perf_counter()
+        call.lock_wait += call.held_since - start
+        if not acquired:
+            call.held_since = None
+        return acquired
+
+    def release(self):
+        call = getattr(_current, 'call', None)
+        if call is not None and call.held_since is not None:
+            call.lock_hold += time.perf_counter() - call.held_since
+            call.held_since = None
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def metrics_dir(db_name):
+    """database.db -> database_metrics"""
+    return os.path.splitext(db_name)[0] + '_metrics'
+
+
+def write_export(process, db_name):
+    """Write this process's snapshot for read_exports."""
+    directory = metrics_dir(db_name)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{process}.json")
+    data = dict(snapshot(), process=process, pid=os.getpid(), exported=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    # Readers never see a file half written
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(path + '.tmp', path)
+
+
+def start_export(process, db_name, interval=METRICS_EXPORT_SECONDS):
+    """Export this process's snapshot every interval seconds from a daemon thread."""
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                write_export(process, db_name)
+            except OSError as e:
+                print(f"Database metrics not exported: {e}")
+
+    thread = Thread(target=run, name="db-metrics-export", daemon=True)
+    thread.start()
+    return thread
+
+
+def read_exports(db_name):
+    """{process: snapshot} of the processes that export their metrics for db_name"""
+    directory = metrics_dir(db_name)
+    exports = {}
+    if not os.path.isdir(directory):
+        return exports
+    for file_name in sorted(os.listdir(directory)):
+        if file_name.endswith('.json'):
+            try:
+                with open(os.path.join(directory, file_name)) as f:
+                    exports[file_name[:-5]] = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Database metrics {file_name} not read: {e}")
+    return exports
@@ -0,0 +1,33 @@
+"""
+MIGRATION
+---------
+Drop the per-module copies from light/temp history written before readings
+were stored sparsely (see db_compact_sensor_data). Run once from src:
+
+    python -m database.migrate_sparse_sensor_data [database.db]
+"""
+
+import sys
+import sqlite3
+
+from database.database import DB_NAME, db_compact_sensor_data
+
+
+def count_rows(db_name):
+    conn = sqlite3.connect(db_name)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM sensor_data").fetchone()[0]
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    db_name = sys.argv[1] if len(sys.argv) > 1 else DB_NAME
+    before = count_rows(db_name)
+    db_compact_sensor_data(db_name)
+    after = count_rows(db_name)
+    print(f"sensor_data: {before} -> {after} rows")
+    # Give the freed pages back to the file system
+    conn = sqlite3.connect(db_name)
+    conn.execute("VACUUM")
+    conn.close()
@@ -0,0 +1,145 @@
+"""
+History of the model's predictions and how accurate they turned out, from
+schema version 5.
+
+  prediction_history   every set db_save_predictions was given, keyed by
+                       (timestamp, sensor_name). db_score_predictions fills
+                       in actual_value, the sensor's value a horizon later,
+                       and marks the row scored; unscored rows are indexed.
+  prediction_latest    one row holding the newest timestamp, so the latest
+                       set is read by key instead of scanning for MAX(timestamp)
+  prediction_accuracy  per sensor running sums of the absolute and squared
+                       errors, and their exponentially weighted mean, updated
+                       as rows are scored so the metrics never rescan history
+
+predictions stays as a view of prediction_history with the old columns.
+
+Run from src: python -m database.predictions [horizon_seconds] [database.db]
+"""
+import sys
+
+PREDICTION_ERROR_ALPHA = 0.1    # Weight of the newest error in the rolling mean
+
+
+def create_tables(cursor):
+    """Create the tables, moving the rows of the old predictions table into the history."""
+    cursor.execute("""
+        CREATE TABLE prediction_history (
+            timestamp TEXT NOT NULL,
+            sensor_name TEXT NOT NULL,
+            predicted_value REAL,
+            category TEXT,
+            actual_value REAL,
+            scored INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (timestamp, sensor_name)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX prediction_history_unscored ON prediction_history (timestamp) WHERE NOT scored")
+    cursor.execute("""
+        CREATE TABLE prediction_latest (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            timestamp TEXT NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE prediction_accuracy (
+            sensor_name TEXT PRIMARY KEY,
+            count INTEGER NOT NULL,
+            abs_error_sum REAL NOT NULL,
+            squared_error_sum REAL NOT NULL,
+            rolling_abs_error REAL NOT NULL,
+            last_timestamp TEXT NOT NULL
+        )
+    """)
+
+    cursor.execute("SELECT type FROM sqlite_master WHERE name = 'predictions'")
+    row = cursor.fetchone()
+    if row and row[0] == 'table':
+        # The old table only ever held the latest set, it has no history to score
+        cursor.execute("""
+            INSERT OR REPLACE INTO prediction_history (timestamp, sensor_name, predicted_value, category, scored)
+            SELECT timestamp, sensor_name, predicted_value, category, 1 FROM predictions
+            WHERE timestamp IS NOT NULL AND sensor_name IS NOT NULL
+        """)
+        cursor.execute("DROP TABLE predictions")
+    cursor.execute("""
+        CREATE VIEW predictions AS
+        SELECT timestamp, sensor_name, predicted_value, category FROM prediction_history
+    """)
+    cursor.execute("""
+        INSERT INTO prediction_latest (id, timestamp)
+        SELECT 1, MAX(timestamp) FROM prediction_history HAVING MAX(timestamp) IS NOT NULL
+    """)
+
+
+def save(cursor, timestamp, rows):
+    """Append (sensor_name, predicted_value, category) rows for timestamp and move the latest pointer."""
+    cursor.executemany("""
+        INSERT OR REPLACE INTO prediction_history (timestamp, sensor_name, predicted_value, category)
+        VALUES (?, ?, ?, ?)
+    """, [(timestamp, name, value, category) for name, value, category in rows])
+    cursor.execute("""
+        INSERT INTO prediction_latest (id, timestamp) VALUES (1, ?)
+        ON CONFLICT (id) DO UPDATE SET timestamp = MAX(timestamp, excluded.timestamp)
+    """, (timestamp,))
+
+
+def latest_timestamp(cursor):
+    cursor.execute("SELECT timestamp FROM prediction_latest WHERE id = 1")
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def unscored(cursor, until, limit):
+    """Up to limit unscored (timestamp, sensor_name, predicted_value) rows up to until, oldest first."""
+    cursor.execute("""
+        SELECT timestamp, sensor_name, predicted_value FROM prediction_history
+        WHERE NOT scored AND timestamp <= ?
+        ORDER BY timestamp
+        LIMIT ?
+    """, (until, limit))
+    return cursor.fetchall()
+
+
+def record(cursor, scored):
+    """
+    Store (timestamp, sensor_name, predicted_value, actual_value) rows, oldest
+    first, and fold their errors into prediction_accuracy. Rows without an
+    actual value are marked scored but not counted.
+    """
+    cursor.executemany("""
+        UPDATE prediction_history SET actual_value = ?, scored = 1
+        WHERE timestamp = ? AND sensor_name = ?
+    """, [(actual, timestamp, name) for timestamp, name, _, actual in scored])
+
+    errors = {}
+    for timestamp, name, predicted, actual in scored:
+        if predicted is not None and actual is not None:
+            errors.setdefault(name, []).append((timestamp, abs(float(predicted) - float(actual))))
+    for name, sensor_errors in errors.items():
+        cursor.execute("""
+            SELECT count, abs_error_sum, squared_error_sum, rolling_abs_error
+            FROM prediction_accuracy WHERE sensor_name = ?
+        """, (name,))
+        count, abs_sum, squared_sum, rolling = cursor.fetchone() or (0, 0.0, 0.0, None)
+        for _, error in sensor_errors:
+            count += 1
+            abs_sum += error
+            squared_sum += error * error
+            rolling = error if rolling is None else rolling + PREDICTION_ERROR_ALPHA * (error - rolling)
+        cursor.execute("""
+            INSERT OR REPLACE INTO prediction_accuracy
+                (sensor_name, count, abs_error_sum, squared_error_sum, rolling_abs_error, last_timestamp)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (name, count, abs_sum, squared_sum, rolling, sensor_errors[-1][0]))
+
+
+if __name__ == "__main__":
+    from .database import DB_NAME, PREDICTION_HORIZON_SECONDS, db_score_predictions, db_get_prediction_accuracy
+
+    horizon_seconds = int(sys.argv[1]) if len(sys.argv) > 1 else PREDICTION_HORIZON_SECONDS
+    db_name = sys.argv[2] if len(sys.argv) > 2 else DB_NAME
+    db_score_predictions(horizon_seconds, db_name=db_name)
+    for name, metrics in db_get_prediction_accuracy(db_name).items():
+        print(f"{name}: {metrics['count']} scored, MAE {metrics['mae']:.3f}, RMSE {metrics['rmse']:.3f}, "
+              f"rolling MAE {metrics['rolling_mae']:.3f}")
@@ -0,0 +1,138 @@
+"""
+In-memory module registry.
+
+Keeps the rows of the 'sensors' table in memory, indexed by client_id, id,
+name, category and user-defined group, so message handlers can resolve
+modules without SQL.
+
+The registry reloads lazily after it is invalidated. Changes made in this
+process invalidate it through db_add_module_change_listener; changes made by
+another process (the web UI) are announced on MQTT and the owner of the
+registry calls invalidate(). REGISTRY_MAX_AGE is a safety net in case such an
+announcement is missed. While the database is unavailable the last loaded
+modules keep being served.
+"""
+import time
+from threading import Lock
+
+from .database import (DB_NAME, DatabaseError, db_get_available_all_modules, db_get_new_modules,
+                       db_get_module_groups, db_add_module_change_listener)
+
+REGISTRY_MAX_AGE = 300  # Seconds
+
+
+class ModuleRegistry:
+    def __init__(self, db_name=DB_NAME, max_age=REGISTRY_MAX_AGE):
+        self.db_name = db_name
+        self.max_age = max_age
+        self._lock = Lock()
+        self._stale = True
+        self._loaded_at = 0
+        self.loads = 0
+        self._modules = []          # Named modules, in table order
+        self._by_client_id = {}
+        self._by_id = {}
+        self._by_name = {}
+        self._by_category = {}
+        self._groups = {}           # client_id -> group names
+        self._by_group = {}         # group name -> named modules
+        db_add_module_change_listener(self._on_module_change)
+
+    def _on_module_change(self, db_name):
+        if db_name == self.db_name:
+            self.invalidate()
+
+    def invalidate(self):
+        self._stale = True
+
+    def load(self):
+        """(Re)build every index from the database."""
+        with self._lock:
+            named = db_get_available_all_modules(self.db_name)
+            unnamed = db_get_new_modules(self.db_name)
+            groups = db_get_module_groups(self.db_name)
+
+            # Readings still in the ingest queue are newer than last_val in the table
+            for mod in named + unnamed:
+                old = self._by_id.get(mod['id'])
+                if old is not None and old['last_val'] is not None:
+                    mod['last_val'] = old['last_val']
+
+            by_category = {}
+            by_name = {}
+            for mod in named:
+                by_category.setdefault(mod['category'], []).append(mod)
+                by_name.setdefault(mod['name'], mod)
+            by_group = {}
+            for mod in named:
+                for group in groups.get(mod['client_id'], []):
+                    by_group.setdefault(group, []).append(mod)
+
+            self._modules = named
+            self._by_client_id = {mod['client_id']: mod for mod in named + unnamed}
+            self._by_id = {mod['id']: mod for mod in named + unnamed}
+            self._by_name = by_name
+            self._by_category = by_category
+            self._groups = groups
+            self._by_group = by_group
+            self._loaded_at = time.monotonic()
+            self._stale = False
+            self.loads += 1
+
+    def _ensure_loaded(self):
+        if self._stale or time.monotonic() - self._loaded_at > self.max_age:
+            try:
+                self.load()
+            except DatabaseError as e:
+                if not self.loads:
+                    raise
+                print(f"Module registry not reloaded, serving the last modules: {e}")
+
+    def get(self, client_id):
+        """Module with this client_id (named or not), or None."""
+        self._ensure_loaded()
+        return self._by_client_id.get(client_id)
+
+    def get_id(self, client_id):
+        mod = self.get(client_id)
+        return mod['id'] if mod else None
+
+    def get_by_id(self, id):
+        self._ensure_loaded()
+        return self._by_id.get(id)
+
+    def get_by_name(self, name):
+        self._ensure_loaded()
+        return self._by_name.get(name)
+
+    def by_category(self, *categories):
+        """Named modules in any of the given categories."""
+        self._ensure_loaded()
+        if len(categories) == 1:
+            return list(self._by_category.get(categories[0], []))
+        return [mod for mod in self._modules if mod['category'] in categories]
+
+    def groups_of(self, client_id):
+        """Names of the user-defined groups of the module."""
+        self._ensure_loaded()
+        return list(self._groups.get(client_id, []))
+
+    def group_members(self, group):
+        """Named modules in the user-defined group."""
+        self._ensure_loaded()
+        return list(self._by_group.get(group, []))
+
+    def module_groups(self):
+        """{client_id: group names}, as db_get_module_groups()."""
+        self._ensure_loaded()
+        return {client_id: list(names) for client_id, names in self._groups.items()}
+
+    def named(self):
+        """Same modules as db_get_available_all_modules()."""
+        self._ensure_loaded()
+        return list(self._modules)
+
+    def set_last_val(self, id, value):
+        mod = self._by_id.get(id)
+        if mod is not None:
+            mod['last_val'] = value
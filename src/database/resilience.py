@@ -0,0 +1,167 @@
+"""
+Failure handling shared by the db_* functions.
+
+A call that fails with sqlite3.OperationalError (locked, missing or broken
+file) is retried RETRY_ATTEMPTS times in all, waiting a random time of up to
+RETRY_BASE_SECONDS * 2 ** n, at most RETRY_MAX_SECONDS (exponential backoff
+with full jitter, so callers that failed together don't retry together).
+
+Every database file has a circuit breaker. BREAKER_FAILURE_THRESHOLD failed
+attempts in a row open it: for BREAKER_RESET_SECONDS every call fails at once
+with DatabaseUnavailable instead of waiting, so the MQTT thread is never held
+up by a database that is down. Then one trial call is let through, its
+success closes the breaker and its failure opens it again.
+"""
+import random
+import sqlite3
+import time
+from threading import Lock
+
+# Import from utils.console if available
+try:
+    from ..utils.console import RED, RESET
+except ImportError:
+    RED = "\033[91m"
+    RESET = "\033[0m"
+
+RETRY_ATTEMPTS = 4
+RETRY_BASE_SECONDS = 0.1
+RETRY_MAX_SECONDS = 2.0
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class DatabaseError(Exception):
+    """A custom DatabaseError class."""
+    def __init__(self, message):
+        super().__init__(message)
+
+
+class DatabaseUnavailable(DatabaseError):
+    """The database kept failing, or its circuit breaker is open."""
+
+
+class RetryPolicy:
+    """How often and after how long a failed call is tried again."""
+    def __init__(self, attempts=RETRY_ATTEMPTS, base_seconds=RETRY_BASE_SECONDS, max_seconds=RETRY_MAX_SECONDS,
+                 rng=random.random):
+        self.attempts = attempts
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self.rng = rng
+
+    def delay(self, failures):
+        """Seconds to wait after the given number of failed attempts."""
+        return self.rng() * min(self.max_seconds, self.base_seconds * 2 ** (failures - 1))
+
+
+class CircuitBreaker:
+    """Fails calls fast while a database is unhealthy, see the module docstring."""
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = Lock()
+
+    def allow(self):
+        """Whether a call may go ahead. In the half-open state only one trial call at a time does."""
+        with self._lock:
+            if self.state == OPEN and self.clock() - self.opened_at >= self.reset_seconds:
+                self.state = HALF_OPEN
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def retry_in(self):
+        """Seconds until the next trial call, 0 if calls go ahead."""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.reset_seconds - (self.clock() - self.opened_at))
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                print("Database recovered, circuit breaker closed")
+            self.state = CLOSED
+            self.failures = 0
+            self._trial = False
+
+    def record_failure(self):
+        """Count a failed attempt. Returns True if the breaker is open now."""
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    print(f"{RED}Database failing, circuit breaker open for {self.reset_seconds} s{RESET}")
+                self.state = OPEN
+                self.opened_at = self.clock()
+                self._trial = False
+            return self.state == OPEN
+
+    def release(self):
+        """End a trial call that neither succeeded nor failed with a database error."""
+        with self._lock:
+            self._trial = False
+
+
+def call(function, breaker, policy, fail_fast=False, sleep=time.sleep):
+    """
+    Run function() under the breaker, retrying sqlite3.OperationalError as the
+    policy says. fail_fast raises DatabaseError at the first failure, for
+    callers that report errors to a user instead of waiting. Raises
+    DatabaseUnavailable when the breaker is open or the attempts run out.
+    """
+    if not breaker.allow():
+        raise DatabaseUnavailable(f"Database unavailable, next try in {breaker.retry_in():.0f} s")
+    failures = 0
+    while True:
+        try:
+            result = function()
+        except sqlite3.OperationalError as e:
+            failures += 1
+            opened = breaker.record_failure()
+            if fail_fast:
+                raise DatabaseError("Database is broken!") from e
+            if opened or failures >= policy.attempts:
+                raise DatabaseUnavailable(f"Database unavailable after {failures} attempts: {e}") from e
+            delay = policy.delay(failures)
+            print(f"{RED}DatabaseError : {e}, retrying in {delay:.2f} s{RESET}")
+            sleep(delay)
+        except BaseException:
+            breaker.release()
+            raise
+        else:
+            breaker.record_success()
+            return result
+
+
+_breakers = {}
+_breakers_lock = Lock()
+
+def get_breaker(db_name):
+    with _breakers_lock:
+        breaker = _breakers.get(db_name)
+        if breaker is None:
+            breaker = _breakers[db_name] = CircuitBreaker()
+        return breaker
+
+def reset_breakers(db_name=None):
+    """Forget the state of db_name's breaker, or of every breaker if None."""
+    with _breakers_lock:
+        if db_name is None:
+            _breakers.clear()
+        else:
+            _breakers.pop(db_name, None)
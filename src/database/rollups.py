@@ -0,0 +1,149 @@
+"""
+Hourly and daily rollups of the readings table.
+
+Every bucket holds count, sum, min, max and the last value of one sensor's
+readings (NULL values are left out). The db_* writers keep them current in
+the same transaction as the readings: new readings are folded into their
+buckets, buckets with an overwritten or deleted reading are rebuilt from
+readings. SQL that writes readings directly should call rebuild_all
+afterwards. Archiving readings leaves their buckets in place.
+
+A bucket before the archive horizon also counts archived readings, so it is
+rebuilt from readings plus the archived readings of its day, which the
+caller stages in temp.archived_readings (create_archived_table). A reading
+in readings replaces the archived one with the same ts, as on the read side.
+
+The rollups table exists from schema version 3, see schema.py.
+"""
+
+ROLLUP_RESOLUTIONS = {'hour': 3600, 'day': 86400}
+DAY_SECONDS = ROLLUP_RESOLUTIONS['day']
+
+# The last value of a bucket, looked up by its primary key
+_LAST = "(SELECT r.sensor_value FROM readings r WHERE r.sensor_key = g.sensor_key AND r.ts = g.last_ts)"
+_LAST_ARCHIVED = f"""COALESCE({_LAST}, (SELECT a.sensor_value FROM temp.archived_readings a
+                                     WHERE a.sensor_key = g.sensor_key AND a.ts = g.last_ts))"""
+
+# Aggregates one bucket per (sensor_key, bucket) of the rows selected by {source}
+_BUCKETS = """
+    SELECT resolution, sensor_key, bucket, count, sum, min, max, {last}, last_ts
+    FROM (
+        SELECT ? AS resolution, sensor_key, ts - ts % ? AS bucket,
+               COUNT(*) AS count, TOTAL(sensor_value) AS sum, MIN(sensor_value) AS min,
+               MAX(sensor_value) AS max, MAX(ts) AS last_ts
+        FROM {source}
+        WHERE sensor_value IS NOT NULL
+        GROUP BY sensor_key, ts - ts % ?
+    ) g
+"""
+
+
+def create_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE rollups (
+            resolution INTEGER NOT NULL,
+            sensor_key INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            sum REAL NOT NULL,
+            min REAL,
+            max REAL,
+            last REAL,
+            last_ts INTEGER NOT NULL,
+            PRIMARY KEY (resolution, sensor_key, bucket)
+        ) WITHOUT ROWID
+    """)
+
+
+def create_archived_table(cursor):
+    """Create or empty temp.archived_readings, the archived readings rebuild counts in."""
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS archived_readings (
+            sensor_key INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            sensor_value REAL,
+            PRIMARY KEY (sensor_key, ts)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("DELETE FROM temp.archived_readings")
+
+
+def late_readings(horizon):
+    """Table of the readings in days that start before the horizon, whose buckets hold archived readings"""
+    return f"(SELECT sensor_key, ts FROM readings WHERE ts - ts % {DAY_SECONDS} < {int(horizon)})"
+
+
+def fold(cursor, source):
+    """
+    Add readings that are new to readings to their buckets. source is a table
+    with sensor_key, ts and sensor_value columns, holding each reading once,
+    none of them at the ts of an archived reading (those go to rebuild).
+    """
+    for seconds in ROLLUP_RESOLUTIONS.values():
+        # A reading of the source is only the bucket's last value if it is newer
+        cursor.execute(f"""
+            INSERT INTO rollups (resolution, sensor_key, bucket, count, sum, min, max, last, last_ts)
+            {_BUCKETS.format(source=source, last=_LAST)}
+            WHERE true
+            ON CONFLICT (resolution, sensor_key, bucket) DO UPDATE SET
+                count = count + excluded.count,
+                sum = sum + excluded.sum,
+                min = MIN(min, excluded.min),
+                max = MAX(max, excluded.max),
+                last = CASE WHEN excluded.last_ts >= last_ts THEN excluded.last ELSE last END,
+                last_ts = MAX(last_ts, excluded.last_ts)
+        """, (seconds, seconds, seconds))
+
+
+def rebuild(cursor, touched, archived=False):
+    """
+    Recompute the buckets of readings that were changed or deleted. touched is
+    a table with the sensor_key and ts of those readings. With archived, the
+    readings staged in temp.archived_readings for the days of touched before
+    the archive horizon are counted too.
+    """
+    for seconds in ROLLUP_RESOLUTIONS.values():
+        cursor.execute(f"""
+            DELETE FROM rollups
+            WHERE resolution = ? AND (sensor_key, bucket) IN (
+                SELECT sensor_key, ts - ts % ? FROM {touched}
+            )
+        """, (seconds, seconds))
+        source = f"""(
+            SELECT r.sensor_key, r.ts, r.sensor_value
+            FROM (SELECT DISTINCT sensor_key, ts - ts % {seconds} AS bucket FROM {touched}) t
+            JOIN readings r ON r.sensor_key = t.sensor_key AND r.ts >= t.bucket AND r.ts < t.bucket + {seconds}
+        )"""
+        if archived:
+            source = f"""(
+                SELECT sensor_key, ts, sensor_value FROM {source}
+                UNION ALL
+                SELECT a.sensor_key, a.ts, a.sensor_value
+                FROM (SELECT DISTINCT sensor_key, ts - ts % {seconds} AS bucket FROM {touched}) t
+                JOIN temp.archived_readings a
+                    ON a.sensor_key = t.sensor_key AND a.ts >= t.bucket AND a.ts < t.bucket + {seconds}
+                WHERE NOT EXISTS (SELECT 1 FROM readings r WHERE r.sensor_key = a.sensor_key AND r.ts = a.ts)
+            )"""
+        cursor.execute(f"""
+            INSERT INTO rollups (resolution, sensor_key, bucket, count, sum, min, max, last, last_ts)
+            {_BUCKETS.format(source=source, last=_LAST_ARCHIVED if archived else _LAST)}
+        """, (seconds, seconds, seconds))
+
+
+def rebuild_all(cursor, horizon=None):
+    """
+    Recompute every bucket from readings. Buckets that start before the archive
+    horizon hold archived readings: those with readings in their day are
+    rebuilt with the archived readings staged for late_readings(horizon), the
+    others are kept.
+    """
+    horizon = 0 if horizon is None else int(horizon)
+    cursor.execute("DELETE FROM rollups WHERE bucket >= ?", (horizon,))
+    for seconds in ROLLUP_RESOLUTIONS.values():
+        source = f"(SELECT sensor_key, ts, sensor_value FROM readings WHERE ts - ts % {seconds} >= {horizon})"
+        cursor.execute(f"""
+            INSERT INTO rollups (resolution, sensor_key, bucket, count, sum, min, max, last, last_ts)
+            {_BUCKETS.format(source=source, last=_LAST)}
+        """, (seconds, seconds, seconds))
+    if horizon:
+        rebuild(cursor, late_readings(horizon), archived=True)
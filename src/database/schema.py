@@ -0,0 +1,251 @@
+"""
+Versioned schema migrations, tracked in PRAGMA user_version.
+
+Version 1 is the layout db_setup.py creates: sensor_data keyed by the sensor's
+36 character UUID and a formatted TEXT timestamp. Version 2 stores readings
+compactly:
+
+  sensor_keys  a small integer key for every sensor id
+  readings     (sensor_key, ts, sensor_value), WITHOUT ROWID so the rows are
+               clustered on (sensor_key, ts), plus a covering index on
+               (ts, sensor_key, sensor_value) for time-range scans
+
+ts is the local wall-clock time sensor_data stored as text, counted in seconds
+from 1970-01-01 00:00:00, so datetime(ts, 'unixepoch') gives the same string
+back. sensor_data stays as a view with the old columns, and INSTEAD OF
+triggers keep inserts, updates and deletes through it working.
+
+Version 3 adds hourly and daily rollups of readings, see rollups.py.
+Version 4 archives old readings to the sensor_chunks table, see chunks.py.
+Version 5 keeps the history of predictions and their accuracy, see predictions.py.
+Version 6 adds user-defined module groups, see groups.py.
+
+The db_* functions run on every version: they build their SQL from
+sensor_data_layout(cursor).
+
+Run from src: python -m database.schema [database.db]
+"""
+import sys
+import sqlite3
+
+from . import chunks, groups, predictions, rollups
+
+SCHEMA_VERSION = 6
+COMPACT_SCHEMA_VERSION = 2
+ROLLUP_SCHEMA_VERSION = 3
+CHUNK_SCHEMA_VERSION = 4
+PREDICTION_SCHEMA_VERSION = 5
+GROUP_SCHEMA_VERSION = 6
+
+# SQL fragments for the readings of each layout:
+#   table, sensor, time   the table and its sensor and time columns
+#   sensor_param          a sensor id parameter, as a value of the sensor column
+#   time_param            a timestamp parameter, as a value of the time column
+#   sensor_id, timestamp  the sensor and time columns as sensor id and timestamp text
+#   unixepoch             strftime() modifier for the time column
+#   sensors_where         sensor column values of the sensors rows (alias s) matching a condition
+#   rollups               whether the rollups table is maintained
+#   chunks                whether readings are archived to sensor_chunks
+#   prediction_history    whether predictions are kept in prediction_history
+#   module_groups         whether the module_groups table exists
+SENSOR_DATA_LAYOUTS = {
+    1: {
+        'table': 'sensor_data',
+        'sensor': 'sensor_id',
+        'time': 'timestamp',
+        'sensor_param': '?',
+        'time_param': '?',
+        'sensor_id': 'sensor_id',
+        'timestamp': 'timestamp',
+        'unixepoch': '',
+        'sensors_where': 'SELECT s.id FROM sensors s WHERE ',
+        'rollups': False,
+        'chunks': False,
+        'prediction_history': False,
+        'module_groups': False,
+    },
+    2: {
+        'table': 'readings',
+        'sensor': 'sensor_key',
+        'time': 'ts',
+        'sensor_param': '(SELECT sensor_key FROM sensor_keys WHERE sensor_id = ?)',
+        'time_param': "CAST(strftime('%s', ?) AS INTEGER)",
+        'sensor_id': '(SELECT k.sensor_id FROM sensor_keys k WHERE k.sensor_key = readings.sensor_key)',
+        'timestamp': "datetime(ts, 'unixepoch')",
+        'unixepoch': ", 'unixepoch'",
+        'sensors_where': 'SELECT k.sensor_key FROM sensor_keys k JOIN sensors s ON s.id = k.sensor_id WHERE ',
+        'rollups': False,
+        'chunks': False,
+        'prediction_history': False,
+        'module_groups': False,
+    },
+}
+SENSOR_DATA_LAYOUTS[3] = dict(SENSOR_DATA_LAYOUTS[2], rollups=True)
+SENSOR_DATA_LAYOUTS[4] = dict(SENSOR_DATA_LAYOUTS[3], chunks=True)
+SENSOR_DATA_LAYOUTS[5] = dict(SENSOR_DATA_LAYOUTS[4], prediction_history=True)
+SENSOR_DATA_LAYOUTS[6] = dict(SENSOR_DATA_LAYOUTS[5], module_groups=True)
+
+
+def schema_version(cursor):
+    """Schema version of the database, databases from before versioning are version 1."""
+    cursor.execute("PRAGMA user_version")
+    return cursor.fetchone()[0] or 1
+
+
+def sensor_data_layout(cursor):
+    version = schema_version(cursor)
+    return SENSOR_DATA_LAYOUTS[max(v for v in SENSOR_DATA_LAYOUTS if v <= version)]
+
+
+def _migrate_to_v2(cursor):
+    """Move sensor_data into sensor_keys and readings, and replace it with a view."""
+    cursor.execute("""
+        CREATE TABLE sensor_keys (
+            sensor_key INTEGER PRIMARY KEY,
+            sensor_id TEXT NOT NULL UNIQUE
+        )
+    """)
+    cursor.execute("""
+        INSERT INTO sensor_keys (sensor_id)
+        SELECT id FROM sensors WHERE id IS NOT NULL
+        UNION
+        SELECT sensor_id FROM sensor_data WHERE sensor_id IS NOT NULL
+    """)
+    cursor.execute("""
+        CREATE TABLE readings (
+            sensor_key INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            sensor_value REAL,
+            PRIMARY KEY (sensor_key, ts)
+        ) WITHOUT ROWID
+    """)
+    # Rows without a sensor id or a parseable timestamp can't be keyed and are dropped
+    cursor.execute("""
+        INSERT OR REPLACE INTO readings (sensor_key, ts, sensor_value)
+        SELECT k.sensor_key, CAST(strftime('%s', sd.timestamp) AS INTEGER), sd.sensor_value
+        FROM sensor_data sd
+        JOIN sensor_keys k ON k.sensor_id = sd.sensor_id
+        WHERE strftime('%s', sd.timestamp) IS NOT NULL
+        ORDER BY 1, 2
+    """)
+    cursor.execute("CREATE INDEX readings_ts ON readings (ts, sensor_key, sensor_value)")
+
+    cursor.execute("DROP TRIGGER IF EXISTS update_last_val")
+    cursor.execute("DROP TABLE sensor_data")
+    cursor.execute("""
+        CREATE VIEW sensor_data AS
+        SELECT k.sensor_id AS sensor_id, datetime(r.ts, 'unixepoch') AS timestamp, r.sensor_value AS sensor_value
+        FROM readings r
+        JOIN sensor_keys k ON k.sensor_key = r.sensor_key
+    """)
+    # Inserting a duplicate through the view fails like it did on the table. The
+    # key is added with NOT EXISTS rather than OR IGNORE, since an outer
+    # INSERT OR REPLACE overrides the conflict policy inside the trigger.
+    # The trigger also does update_last_val's job.
+    cursor.execute("""
+        CREATE TRIGGER sensor_data_insert
+        INSTEAD OF INSERT ON sensor_data
+        FOR EACH ROW
+        BEGIN
+            INSERT INTO sensor_keys (sensor_id)
+            SELECT NEW.sensor_id
+            WHERE NOT EXISTS (SELECT 1 FROM sensor_keys WHERE sensor_id = NEW.sensor_id);
+            INSERT INTO readings (sensor_key, ts, sensor_value)
+            VALUES ((SELECT sensor_key FROM sensor_keys WHERE sensor_id = NEW.sensor_id),
+                    CAST(strftime('%s', NEW.timestamp) AS INTEGER), NEW.sensor_value);
+            UPDATE sensors
+            SET last_val = NEW.sensor_value
+            WHERE id = NEW.sensor_id;
+        END
+    """)
+    # Only sensor_value can be changed through the view
+    cursor.execute("""
+        CREATE TRIGGER sensor_data_update
+        INSTEAD OF UPDATE OF sensor_value ON sensor_data
+        FOR EACH ROW
+        BEGIN
+            UPDATE readings
+            SET sensor_value = NEW.sensor_value
+            WHERE sensor_key = (SELECT sensor_key FROM sensor_keys WHERE sensor_id = OLD.sensor_id)
+            AND ts = CAST(strftime('%s', OLD.timestamp) AS INTEGER);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER sensor_data_delete
+        INSTEAD OF DELETE ON sensor_data
+        FOR EACH ROW
+        BEGIN
+            DELETE FROM readings
+            WHERE sensor_key = (SELECT sensor_key FROM sensor_keys WHERE sensor_id = OLD.sensor_id)
+            AND ts = CAST(strftime('%s', OLD.timestamp) AS INTEGER);
+        END
+    """)
+
+
+def _migrate_to_v3(cursor):
+    """Create the rollups and fill them from the existing readings."""
+    rollups.create_tables(cursor)
+    rollups.rebuild_all(cursor)
+
+
+def _migrate_to_v4(cursor):
+    """Create sensor_chunks, archive files written before stay where they are."""
+    chunks.create_tables(cursor)
+
+
+def _migrate_to_v5(cursor):
+    """Create the prediction history, the old predictions table becomes a view of it."""
+    predictions.create_tables(cursor)
+
+
+def _migrate_to_v6(cursor):
+    """Create module_groups, modules start in no group."""
+    groups.create_tables(cursor)
+
+
+MIGRATIONS = {
+    2: _migrate_to_v2,
+    3: _migrate_to_v3,
+    4: _migrate_to_v4,
+    5: _migrate_to_v5,
+    6: _migrate_to_v6,
+}
+
+
+def migrate(db_name, target=SCHEMA_VERSION):
+    """
+    Apply the migrations up to target, each in its own transaction.
+    Returns the list of versions applied.
+    """
+    conn = sqlite3.connect(db_name, isolation_level=None)
+    applied = []
+    try:
+        cursor = conn.cursor()
+        version = schema_version(cursor)
+        for next_version in range(version + 1, target + 1):
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                MIGRATIONS[next_version](cursor)
+                cursor.execute(f"PRAGMA user_version = {next_version}")
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            applied.append(next_version)
+            print(f"Migrated {db_name} to schema version {next_version}")
+        return applied
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    from .database import DB_NAME
+
+    db_name = sys.argv[1] if len(sys.argv) > 1 else DB_NAME
+    if migrate(db_name):
+        # Give the space of the old table back to the file system
+        conn = sqlite3.connect(db_name)
+        conn.execute("VACUUM")
+        conn.close()
+    else:
+        print(f"{db_name} is already at schema version {SCHEMA_VERSION}")
@@ -1,5 +1,5 @@
 from flask import Flask, jsonify
-from sensor.s_module import get_module_current_power_data, get_available_all_modules_ctrl
+from sensor.s_module import get_module_current_power_data, get_available_all_modules_ctrl, get_fanout_stats
 
 app = Flask(__name__, template_folder='templates')
 
@@ -11,5 +11,9 @@ def data():
 def control():
     return jsonify(get_available_all_modules_ctrl())
 
+@app.route('/api/module/fanout', methods=['GET'])
+def fanout():
+    return jsonify(get_fanout_stats())
+
 def init_data_server():
     app.run(debug=False, host="0.0.0.0", use_reloader=False, threaded=True, port=5001)
\ No newline at end of file
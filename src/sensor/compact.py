@@ -0,0 +1,193 @@
+"""
+Compact binary form of the T_SENSOR_PUBLISH messages.
+
+A module opts in by publishing on T_SENSOR_PUBLISH_COMPACT instead of
+T_SENSOR_PUBLISH. The message is the same version 1 or 2 payload (see
+payload.py) encoded as MessagePack, with one letter keys and "time" as
+integer seconds since 1970-01-01 UTC, so the core neither parses JSON text
+nor the time string:
+
+    {"c": "L-21.09-0001", "k": "light", "t": 1746100800, "d": 3, "p": 30}
+    {"v": 2, "c": ..., "k": ..., "r": [{"t": ..., "d": ..., "p": ...}, ...]}
+
+The msgpack package is used when it is installed, otherwise the MessagePack
+subset below (nil, bool, int, float, str, bin, array, map), which
+esp32-modules/src/*/compact.py implements for MicroPython as well.
+"""
+import struct
+import calendar
+import time
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+KEYS = {"v": "v", "client_id": "c", "type": "k", "time": "t", "data": "d", "power": "p", "readings": "r"}
+LONG_KEYS = {short: key for key, short in KEYS.items()}
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _shorten(data):
+    short = {}
+    for key, value in data.items():
+        if key == "time" and isinstance(value, str):
+            value = calendar.timegm(time.strptime(value, TIME_FORMAT))
+        elif key == "readings":
+            value = [_shorten(reading) for reading in value]
+        short[KEYS.get(key, key)] = value
+    return short
+
+
+def _expand(data):
+    long = {}
+    for key, value in data.items():
+        key = LONG_KEYS.get(key, key)
+        if key == "readings":
+            value = [_expand(reading) for reading in value]
+        long[key] = value
+    return long
+
+
+def encode(data):
+    """Compact bytes of a payload dict, "time" given as a UTC time string or epoch seconds"""
+    data = _shorten(data)
+    if msgpack is not None:
+        return msgpack.packb(data, use_bin_type=True)
+    out = []
+    _pack(data, out)
+    return b''.join(out)
+
+
+def decode(message):
+    """Payload dict of compact bytes, with the usual keys and "time" as epoch seconds"""
+    if msgpack is not None:
+        data = msgpack.unpackb(message, raw=False, strict_map_key=False)
+    else:
+        data, end = _unpack(message, 0)
+        if end != len(message):
+            raise ValueError(f"{len(message) - end} bytes after the message")
+    if not isinstance(data, dict):
+        raise ValueError("Compact message is not a map")
+    return _expand(data)
+
+
+def _pack(obj, out):
+    if obj is None:
+        out.append(b'\xc0')
+    elif obj is True:
+        out.append(b'\xc3')
+    elif obj is False:
+        out.append(b'\xc2')
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x80:
+            out.append(bytes((obj,)))
+        elif -32 <= obj < 0:
+            out.append(bytes((obj & 0xff,)))
+        elif 0 <= obj <= 0xffffffff:
+            out.append(struct.pack('>BB', 0xcc, obj) if obj <= 0xff else
+                       struct.pack('>BH', 0xcd, obj) if obj <= 0xffff else struct.pack('>BI', 0xce, obj))
+        elif -0x80000000 <= obj < 0:
+            out.append(struct.pack('>Bb', 0xd0, obj) if obj >= -0x80 else
+                       struct.pack('>Bh', 0xd1, obj) if obj >= -0x8000 else struct.pack('>Bi', 0xd2, obj))
+        else:
+            out.append(struct.pack('>BQ', 0xcf, obj) if obj > 0 else struct.pack('>Bq', 0xd3, obj))
+    elif isinstance(obj, float):
+        # float 32 when it holds the value exactly (22.5, 3.0), float 64 otherwise (24.37)
+        single = struct.pack('>f', obj)
+        if struct.unpack('>f', single)[0] == obj:
+            out.append(b'\xca' + single)
+        else:
+            out.append(struct.pack('>Bd', 0xcb, obj))
+    elif isinstance(obj, str):
+        data = obj.encode('utf-8')
+        n = len(data)
+        out.append(bytes((0xa0 | n,)) if n < 32 else
+                   struct.pack('>BB', 0xd9, n) if n <= 0xff else
+                   struct.pack('>BH', 0xda, n) if n <= 0xffff else struct.pack('>BI', 0xdb, n))
+        out.append(data)
+    elif isinstance(obj, (bytes, bytearray)):
+        n = len(obj)
+        out.append(struct.pack('>BB', 0xc4, n) if n <= 0xff else
+                   struct.pack('>BH', 0xc5, n) if n <= 0xffff else struct.pack('>BI', 0xc6, n))
+        out.append(bytes(obj))
+    elif isinstance(obj, (list, tuple)):
+        n = len(obj)
+        out.append(bytes((0x90 | n,)) if n < 16 else
+                   struct.pack('>BH', 0xdc, n) if n <= 0xffff else struct.pack('>BI', 0xdd, n))
+        for item in obj:
+            _pack(item, out)
+    elif isinstance(obj, dict):
+        n = len(obj)
+        out.append(bytes((0x80 | n,)) if n < 16 else
+                   struct.pack('>BH', 0xde, n) if n <= 0xffff else struct.pack('>BI', 0xdf, n))
+        for key, value in obj.items():
+            _pack(key, out)
+            _pack(value, out)
+    else:
+        raise TypeError(f"Can't encode {type(obj).__name__}")
+
+
+# Fixed size types: first byte -> (struct format, size)
+_FIXED = {0xca: ('>f', 4), 0xcb: ('>d', 8), 0xcc: ('>B', 1), 0xcd: ('>H', 2), 0xce: ('>I', 4),
+          0xcf: ('>Q', 8), 0xd0: ('>b', 1), 0xd1: ('>h', 2), 0xd2: ('>i', 4), 0xd3: ('>q', 8)}
+# Length prefixed types: first byte -> (kind, struct format of the length, its size)
+_SIZED = {0xc4: ('bin', '>B', 1), 0xc5: ('bin', '>H', 2), 0xc6: ('bin', '>I', 4),
+          0xd9: ('str', '>B', 1), 0xda: ('str', '>H', 2), 0xdb: ('str', '>I', 4),
+          0xdc: ('array', '>H', 2), 0xdd: ('array', '>I', 4),
+          0xde: ('map', '>H', 2), 0xdf: ('map', '>I', 4)}
+
+
+def _unpack(data, i):
+    """(object, offset after it) of the MessagePack object at offset i"""
+    first = data[i]
+    i += 1
+    if first < 0x80:
+        return first, i
+    if first >= 0xe0:
+        return first - 0x100, i
+    if 0xa0 <= first <= 0xbf:
+        end = i + (first & 0x1f)
+        return data[i:end].decode('utf-8'), end
+    if 0x90 <= first <= 0x9f:
+        return _unpack_array(data, i, first & 0x0f)
+    if 0x80 <= first <= 0x8f:
+        return _unpack_map(data, i, first & 0x0f)
+    if first == 0xc0:
+        return None, i
+    if first == 0xc2:
+        return False, i
+    if first == 0xc3:
+        return True, i
+    fixed = _FIXED.get(first)
+    if fixed is not None:
+        return struct.unpack_from(fixed[0], data, i)[0], i + fixed[1]
+    sized = _SIZED.get(first)
+    if sized is None:
+        raise ValueError(f"Unsupported MessagePack type 0x{first:02x}")
+    kind, length_format, length_size = sized
+    n = struct.unpack_from(length_format, data, i)[0]
+    i += length_size
+    if kind == 'str':
+        return data[i:i + n].decode('utf-8'), i + n
+    if kind == 'bin':
+        return bytes(data[i:i + n]), i + n
+    if kind == 'array':
+        return _unpack_array(data, i, n)
+    return _unpack_map(data, i, n)
+
+
+def _unpack_array(data, i, n):
+    items = []
+    for _ in range(n):
+        item, i = _unpack(data, i)
+        items.append(item)
+    return items, i
+
+
+def _unpack_map(data, i, n):
+    items = {}
+    for _ in range(n):
+        key, i = _unpack(data, i)
+        items[key], i = _unpack(data, i)
+    return items, i
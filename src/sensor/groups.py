@@ -0,0 +1,155 @@
+"""
+Commands addressed to groups of modules.
+
+A batch command (ALL_LIGHTS, or every module of a user-defined group such as
+a room) used to be one publish per module on T_SENSOR_CTRL_PREFIX/<client_id>.
+Modules that know about groups also subscribe to
+
+    sensor/group/category/<category>    every module of its category
+    sensor/group/<name>                 each user-defined group it is in
+
+and announce the levels after T_SENSOR_GROUP_PREFIX they subscribed to with
+a retained message on T_SENSOR_GROUPS_REPORT/<client_id>:
+
+    {"groups": ["category/light", "living_room"]}
+
+GroupFanout sends a command once on the group topic for the modules that
+reported it, and one by one to the others, so firmware that predates groups
+keeps working. A module learns its user-defined groups from a
+{"groups": [...]} command on its control topic (sync()), and reports them
+again once it subscribed.
+
+Modules answer a command with a reading on T_SENSOR_PUBLISH, which counts as
+the acknowledgement: stats() has the publishes per command and the time
+until the last module of a command answered.
+"""
+import json
+import time
+from collections import deque
+from threading import Lock
+
+from sensor.topics import T_SENSOR_CTRL_PREFIX, T_SENSOR_GROUP_PREFIX
+
+CATEGORY_GROUP_PREFIX = "category/"
+FANOUT_ACK_TIMEOUT_SECONDS = 30     # A module that hasn't answered by then counts as unacknowledged
+
+
+def category_group(category):
+    """Group of every module of a category"""
+    return f"{CATEGORY_GROUP_PREFIX}{category}"
+
+
+def group_topic(group):
+    return f"{T_SENSOR_GROUP_PREFIX}/{group}"
+
+
+class _Command:
+    __slots__ = ('sent_at', 'pending')
+
+    def __init__(self, sent_at, pending):
+        self.sent_at = sent_at
+        self.pending = pending
+
+
+class GroupFanout:
+    """Publishes group commands, tracks which modules subscribed to which group and their answers."""
+    def __init__(self, ack_timeout=FANOUT_ACK_TIMEOUT_SECONDS, clock=time.monotonic):
+        self._reported = {}             # client_id -> groups it subscribed to
+        self._commands = deque()        # _Command, oldest first
+        self._lock = Lock()
+        self._ack_timeout = ack_timeout
+        self._clock = clock
+        self._stats = {'commands': 0, 'publishes': 0, 'group_publishes': 0, 'direct_publishes': 0,
+                       'acked': 0, 'unacked': 0, 'last_ack_seconds': None, 'max_ack_seconds': 0.0}
+
+    def on_report(self, client, userdata, msg):
+        """Handler of T_SENSOR_GROUPS_REPORT/<client_id>, returns the client_id"""
+        client_id = msg.topic.rsplit('/', 1)[1]
+        # An empty retained message clears the report
+        groups = set(json.loads(msg.payload.decode()).get("groups", [])) if msg.payload else None
+        with self._lock:
+            if groups is None:
+                self._reported.pop(client_id, None)
+            else:
+                self._reported[client_id] = groups
+        return client_id
+
+    def reported(self, client_id):
+        """Groups the module reported, None for modules that never did"""
+        with self._lock:
+            groups = self._reported.get(client_id)
+            return set(groups) if groups is not None else None
+
+    def publish(self, client, group, client_ids, command):
+        """
+        Send command to the modules client_ids of group: once on the group
+        topic for those subscribed to it, on the control topic of each of the
+        others. Returns the number of publishes.
+        """
+        client_ids = list(client_ids)
+        payload = json.dumps(command)
+        with self._lock:
+            direct = [cid for cid in client_ids if group not in self._reported.get(cid, ())]
+        grouped = len(direct) < len(client_ids)
+        if grouped:
+            client.publish(group_topic(group), payload)
+        for cid in direct:
+            client.publish(f"{T_SENSOR_CTRL_PREFIX}/{cid}", payload)
+
+        publishes = grouped + len(direct)
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            if client_ids:
+                self._commands.append(_Command(now, set(client_ids)))
+            self._stats['commands'] += 1
+            self._stats['publishes'] += publishes
+            self._stats['group_publishes'] += grouped
+            self._stats['direct_publishes'] += len(direct)
+        return publishes
+
+    def ack(self, client_id):
+        """A reading of the module arrived, it answered the commands it was sent"""
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            for command in list(self._commands):
+                if client_id not in command.pending:
+                    continue
+                command.pending.discard(client_id)
+                if not command.pending:
+                    self._commands.remove(command)
+                    seconds = now - command.sent_at
+                    self._stats['acked'] += 1
+                    self._stats['last_ack_seconds'] = seconds
+                    self._stats['max_ack_seconds'] = max(self._stats['max_ack_seconds'], seconds)
+
+    def _expire(self, now):
+        while self._commands and now - self._commands[0].sent_at > self._ack_timeout:
+            self._stats['unacked'] += len(self._commands.popleft().pending)
+
+    def sync(self, client, module_groups, client_ids=None):
+        """
+        Send its user-defined groups ({client_id: group names}) to each
+        module of client_ids (default all) that reported different ones.
+        Modules that never reported don't take the command. Returns the
+        client_ids it was sent to.
+        """
+        with self._lock:
+            reported = {cid: groups for cid, groups in self._reported.items()
+                        if client_ids is None or cid in client_ids}
+        sent = []
+        for cid, groups in reported.items():
+            wanted = set(module_groups.get(cid, []))
+            if {group for group in groups if not group.startswith(CATEGORY_GROUP_PREFIX)} != wanted:
+                client.publish(f"{T_SENSOR_CTRL_PREFIX}/{cid}", json.dumps({"groups": sorted(wanted)}))
+                sent.append(cid)
+        return sent
+
+    def stats(self):
+        with self._lock:
+            self._expire(self._clock())
+            stats = dict(self._stats, pending=sum(len(command.pending) for command in self._commands),
+                         reporting=len(self._reported))
+        stats['publishes_per_command'] = stats['publishes'] / stats['commands'] if stats['commands'] else 0.0
+        return stats
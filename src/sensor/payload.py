@@ -0,0 +1,51 @@
+"""
+Messages on T_SENSOR_PUBLISH.
+
+Version 1 carries one reading:
+
+    {"type": "light", "time": "2025-05-01 12:00:00", "client_id": "L-21.09-0001", "data": 3, "power": 30}
+
+Version 2 carries several readings of one module, e.g. the backlog an ESP32
+module kept while it was offline:
+
+    {"v": 2, "type": "light", "client_id": "L-21.09-0001",
+     "readings": [{"time": "2025-05-01 12:00:00", "data": 3, "power": 30}, ...]}
+
+Messages without "v" are version 1. The core stores the readings of a
+version 2 message in one transaction.
+
+Both versions can also be sent in the compact binary form of compact.py on
+T_SENSOR_PUBLISH_COMPACT.
+"""
+import json
+
+from sensor import compact
+from sensor.topics import T_SENSOR_PUBLISH_COMPACT
+
+PAYLOAD_VERSION = 2
+BATCH_MAX_READINGS = 1000       # Readings the core takes from one message
+
+
+def decode(topic, message):
+    """Payload dict of a message received on topic, JSON or compact"""
+    if topic == T_SENSOR_PUBLISH_COMPACT:
+        return compact.decode(message)
+    return json.loads(message.decode())
+
+
+def readings(data):
+    """The readings of a decoded message as version 1 dicts, in order"""
+    version = data.get("v", 1)
+    if version == 1:
+        return [data]
+    if version != PAYLOAD_VERSION:
+        raise ValueError(f"Unknown payload version {version}")
+    items = data["readings"]
+    if len(items) > BATCH_MAX_READINGS:
+        raise ValueError(f"Batch of {len(items)} readings, at most {BATCH_MAX_READINGS} are taken")
+    return [dict(item, type=data["type"], client_id=data["client_id"]) for item in items]
+
+
+def batch(category, client_id, readings):
+    """Version 2 message of readings ({"time", "data", ...} dicts) of one module"""
+    return {"v": PAYLOAD_VERSION, "type": category, "client_id": client_id, "readings": list(readings)}
@@ -2,7 +2,12 @@ import json
 from utils.mqtt import MQTTConnection
 from utils.utils import get_localtime
 from database.database import *
+from database.ingest import IngestQueue
+from database.registry import ModuleRegistry
 from sensor.topics import *
+from sensor.payload import readings as payload_readings, decode as decode_payload
+from sensor.groups import GroupFanout, category_group
+from utils.router import TopicRouter, TypeRouter
 from utils.console import *
 import time
 
@@ -10,63 +15,67 @@ client = MQTTConnection.get_client()
 
 light_power_data = {}
 
+# Readings are written by a background thread so a slow disk never blocks the MQTT loop
+ingest = IngestQueue()
+# Module lookups on the message path are served from memory
+registry = ModuleRegistry()
+# Batch commands go out once per group topic to the modules subscribed to it
+fanout = GroupFanout()
+
+# Message topics, reading types and module categories each dispatch through a
+# lookup table, a new device type only registers its handlers
+router = TopicRouter()
+
 def on_message(client, userdata, msg):
-    print(f"{GREEN} TOPIC : {msg.topic}, MSG : {msg.payload.decode()}")
-    try:
-        if msg.topic == T_SENSOR_PUBLISH:
-            sensor_publish_handler(client, userdata, msg)
-        elif msg.topic == T_SENSOR_MAIN_CTRL:
-            sensor_ctrl_handler(client, userdata, msg)
-        else:
-            print(f"Unhandled topic: {msg.topic}")
-    except Exception as e:
-        print("Error dispatching message:", e)
+    print(f"{GREEN} TOPIC : {msg.topic}, MSG : {msg.payload.decode(errors='replace')}")
+    router.dispatch(client, userdata, msg)
+
+# The value stored for a reading, by its type
+readings = TypeRouter("reading type", default=lambda data: data["data"])
+
+@readings.route('light')
+def light_reading(data):
+    light_power_data[data["client_id"]] = data.get("power", 0)
+    return data["data"]
+
+@readings.route('door')
+def door_reading(data):
+    return 1 if data["data"] == "LOCK" else 0
 
+# Modules coming online, other types need nothing besides being added
+online = TypeRouter("online type", default=lambda data: None)
+
+@online.route('light')
+def light_online(data):
+    light_power_data[data["client_id"]] = 0
+
+@router.route(T_SENSOR_PUBLISH, T_SENSOR_PUBLISH_COMPACT)
 def sensor_publish_handler(client, userdata, msg):
     try:
-        payload = str(msg.payload.decode())
-        data = json.loads(payload)
+        data = decode_payload(msg.topic, msg.payload)
         print(f"{BLUE} --> Received message from {msg.topic}: {data}{RESET}")
 
-        data["time"] = get_localtime(data["time"])
-        id = db_get_id(data["client_id"])
-
-        if data["data"] != "imOnline":
-            if data["type"] == 'switch':
-                pass
-            elif data["type"] == 'light':
-                modules = db_get_available_all_modules()
-                for mod in modules:
-                    if mod['category'] == 'temp' or mod['category'] == 'light':
-                        if mod['id'] == id:
-                            db_add_sensor_data(data["time"], mod['id'], data["data"])
-                        else:
-                            db_add_sensor_data(data["time"], mod['id'], mod["last_val"])
-                light_power_data[data["client_id"]] = data["power"]
-                return
-
-            elif data["type"] == 'radar':
-                pass
-            elif data["type"] == 'temp':
-                modules = db_get_available_all_modules()
-                for mod in modules:
-                    if mod['category'] == 'temp' or mod['category'] == 'light':
-                        if mod['id'] == id:
-                            db_add_sensor_data(data["time"], mod['id'], data["data"])
-                        else:
-                            db_add_sensor_data(data["time"], mod['id'], mod["last_val"])
-                return
-            elif data["type"] == 'door':
-                if data["data"] == "LOCK":
-                    data["data"] = 1
-                else:
-                    data["data"] = 0
-            
-            db_add_sensor_data(data["time"], id, data["data"])
-        else:
-            if data["type"] == 'light':
-                light_power_data[data["client_id"]] = 0
-            db_add_module(data["client_id"], None, data["type"])
+        # Only the readings themselves are stored, queries forward-fill the other sensors
+        rows = []
+        for reading in payload_readings(data):
+            reading["time"] = get_localtime(reading["time"])
+            id = registry.get_id(reading["client_id"])
+
+            if reading["data"] != "imOnline":
+                value = readings.dispatch(reading["type"], reading)
+                if id is not None:
+                    rows.append((reading["time"], id, value))
+                registry.set_last_val(id, value)
+                fanout.ack(reading["client_id"])
+            else:
+                online.dispatch(reading["type"], reading)
+                db_add_module(reading["client_id"], None, reading["type"])
+
+        # The readings of a batch message are written in one transaction
+        if len(rows) == 1:
+            ingest.put(*rows[0])
+        elif rows:
+            ingest.put_batch(rows)
 
     except json.JSONDecodeError as e:
         print("JSON decode failed:", e)
@@ -74,6 +83,38 @@ def sensor_publish_handler(client, userdata, msg):
     except Exception as e:
         print("Unexpected error in on_message:", e)
 
+def publish_ctrl(client, cid, command):
+    client.publish(f"{T_SENSOR_CTRL_PREFIX}/{cid}", json.dumps(command))
+
+# Commands for a single module, by its category
+controls = TypeRouter("module category")
+
+@controls.route('door', 'switch')
+def state_ctrl(client, cid, data):
+    state = data['state']
+    publish_ctrl(client, cid, {'state': state})
+    print(f"Command received. Setting client {cid} to state {state}.")
+
+@controls.route('light')
+def light_ctrl(client, cid, data):
+    if 'irgb' in data:
+        irgb = data['irgb']
+        print(f"Command received. Setting client {cid} to color {irgb}.")
+        publish_ctrl(client, cid, {'irgb': irgb})
+    elif 'state' in data:
+        state_ctrl(client, cid, data)
+
+@controls.route('temp')
+def temp_ctrl(client, cid, data):
+    value = data['value']
+    print(f"Command received. Setting client {cid} to value {value}C.")
+    publish_ctrl(client, cid, {'value': value})
+
+# Batch commands ("ALL_LIGHTS", ...) set the state of every module of a category,
+# with "group" only of those in that user-defined group
+BATCH_CATEGORIES = {'SWITCH': 'switch', 'LIGHT': 'light', 'DOOR': 'door'}
+
+@router.route(T_SENSOR_MAIN_CTRL)
 def sensor_ctrl_handler(client, userdata, msg):
     try:
         payload = str(msg.payload.decode())
@@ -81,54 +122,27 @@ def sensor_ctrl_handler(client, userdata, msg):
         name = data['name']
         if "ALL" not in name:
         # Single Mode
-            cid = db_get_client_id(name)
-            mod_type = db_get_module_type(cid)
-            
-            if mod_type == 'door':
-                state = data['state']
-                client.publish(f"{T_SENSOR_CTRL_PREFIX}/{cid}", json.dumps({'state': state}))
-                print(f"Command received. Setting client {cid} to state {state}.")
-            elif mod_type == 'light':
-                if 'irgb' in data:
-                    irgb = data['irgb']
-                    print(f"Command received. Setting client {cid} to color {irgb}.")
-                    client.publish(f"{T_SENSOR_CTRL_PREFIX}/{cid}", json.dumps({'irgb': irgb}))
-                elif 'state' in data:
-                    state = data['state']
-                    print(f"Command received. Setting client {cid} to state {state}.")
-                    client.publish(f"{T_SENSOR_CTRL_PREFIX}/{cid}", json.dumps({'state': state}))
-            elif mod_type == 'switch':
-                state = data['state']
-                print(f"Command received. Setting client {cid} to state {state}.")
-                client.publish(f"{T_SENSOR_CTRL_PREFIX}/{cid}", json.dumps({'state': state}))
-            elif mod_type == 'temp':
-                value = data['value']
-                print(f"Command received. Setting client {cid} to value {value}C.")
-                client.publish(f"{T_SENSOR_CTRL_PREFIX}/{cid}", json.dumps({'value': value}))
+            mod = registry.get_by_name(name)
+            if mod:
+                controls.dispatch(mod['category'], client, mod['client_id'], data)
         # Batch Mode
         else:
-            modules = db_get_available_all_modules()
-            if 'SWITCH' in name:
-                for i, mod in enumerate(modules):
-                    if mod['category'] == 'switch':
-                        state = data['state']
-                        cid = mod['client_id']
-                        client.publish(f"{T_SENSOR_CTRL_PREFIX}/{cid}", json.dumps({'state': state}))
-                print(f"Command received. Setting all switches to state {state}.")
-            elif 'LIGHT' in name:
-                for i, mod in enumerate(modules):
-                    if mod['category'] == 'light':
-                        state = data['state']
-                        cid = mod['client_id']
-                        client.publish(f"{T_SENSOR_CTRL_PREFIX}/{cid}", json.dumps({'state': state}))
-                print(f"Command received. Setting all lights to state {state}.")
-            elif 'DOOR' in name:
-                for i, mod in enumerate(modules):
-                    if mod['category'] == 'door':
-                        state = data['state']
-                        cid = mod['client_id']
-                        client.publish(f"{T_SENSOR_CTRL_PREFIX}/{cid}", json.dumps({'state': state}))
-                print(f"Command received. Setting all doors to state {state}.")
+            category = next((category for key, category in BATCH_CATEGORIES.items() if key in name), None)
+            if category is not None:
+                state = data['state']
+                group = data.get('group')
+                if group is None:
+                    mods = registry.by_category(category)
+                    publishes = fanout.publish(client, category_group(category),
+                                               [mod['client_id'] for mod in mods], {'state': state})
+                    print(f"Command received. Setting all {category} modules to state {state}.")
+                else:
+                    # The group topic reaches every category in the group, modules skip the others
+                    mods = [mod for mod in registry.group_members(group) if mod['category'] == category]
+                    publishes = fanout.publish(client, group, [mod['client_id'] for mod in mods],
+                                               {'state': state, 'category': category})
+                    print(f"Command received. Setting {category} modules of group {group} to state {state}.")
+                print(f"{len(mods)} modules, {publishes} publishes")
 
     except json.JSONDecodeError as e:
         print("JSON decode failed:", e)
@@ -136,6 +150,17 @@ def sensor_ctrl_handler(client, userdata, msg):
     except Exception as e:
         print("Unexpected error in on_message:", e)
 
+@router.route(f"{T_SENSOR_GROUPS_REPORT}/+")
+def groups_report_handler(client, userdata, msg):
+    client_id = fanout.on_report(client, userdata, msg)
+    # Tell the module its user-defined groups if it subscribed to others
+    fanout.sync(client, registry.module_groups(), [client_id])
+
+@router.route(T_MODULES_CHANGED)
+def modules_changed_handler(client, userdata, msg):
+    registry.invalidate()
+    fanout.sync(client, registry.module_groups())
+
 def get_module_current_power_data():
     results = db_get_module_current_power_data()
     for mod in results:
@@ -146,18 +171,29 @@ def get_module_current_power_data():
 def get_available_all_modules_ctrl():
     return db_get_available_all_modules_ctrl()
 
+def get_fanout_stats():
+    # Publishes per batch command and time until the last module answered
+    return fanout.stats()
+
 def init_modules():
+    ingest.start()
+    registry.load()
     client.subscribe(T_SENSOR_PUBLISH)
+    client.subscribe(T_SENSOR_PUBLISH_COMPACT)
     client.subscribe(T_SENSOR_MAIN_CTRL)
+    client.subscribe(T_MODULES_CHANGED)
+    client.subscribe(f"{T_SENSOR_GROUPS_REPORT}/+")
     client.on_message = on_message
 
     # Turn off all modules when load the system
-    modules = db_get_available_all_modules()
-    
-    for mod in modules:
-        if mod['category'] == 'light' or mod['category'] == 'switch':
-            cid = mod['client_id']
-            if mod['category'] == 'light':
+    # Modules whose group report hasn't arrived yet are sent the command one by one
+    for category in ('light', 'switch'):
+        cids = [mod['client_id'] for mod in registry.by_category(category)]
+        if category == 'light':
+            for cid in cids:
                 light_power_data[cid] = 0
-            client.publish(f"{T_SENSOR_CTRL_PREFIX}/{cid}", json.dumps({'state': 0}))
+        fanout.publish(client, category_group(category), cids, {'state': 0})
 
+def stop_modules():
+    # Write out readings still waiting in the ingest queue
+    ingest.stop()
@@ -1,4 +1,7 @@
 T_SENSOR_PUBLISH = "sensor/publish"
+T_SENSOR_PUBLISH_COMPACT = "sensor/publish/mp"    # Same messages, MessagePack (sensor/compact.py)
 T_SENSOR_MAIN_CTRL = "central_main/control"
 T_SENSOR_CTRL_PREFIX = "sensor/update"
-
+T_MODULES_CHANGED = "central_main/modules/changed"
+T_SENSOR_GROUP_PREFIX = "sensor/group"            # One publish for a group of modules (sensor/groups.py)
+T_SENSOR_GROUPS_REPORT = "sensor/groups"          # Retained, the group topics a module subscribed to
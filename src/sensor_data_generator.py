@@ -44,9 +44,8 @@ def main():
             # Generate 12 timestamps
             timestamps = generate_timestamps(12, 5)
 
-            # Insert data for each timestamp
-            for timestamp in timestamps:
-                db_insert_sensor_data_for_timestamp(timestamp, sensors_dict)
+            # Insert data for all timestamps in one transaction
+            db_insert_sensor_data_for_timestamp(timestamps, sensors_dict)
 
             print(f"Completed inserting {len(timestamps)} timestamps × {sum(len(ids) for ids in sensors_dict.values())} sensors")
             print(f"Sleeping for 5 seconds...")
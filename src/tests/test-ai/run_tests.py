@@ -11,6 +11,10 @@ from test_predict import TestPredictFunctions
 from test_train import TestTrainFunctions
 from test_ai import TestAI
 from test_integration import TestAiIntegration
+from test_scheduler import TestInferenceScheduler
+from test_feature_window import TestFeatureWindow
+from test_runtime import TestInferenceRuntime
+from test_model_manager import TestModelManager
 
 if __name__ == '__main__':
     # Create test suite
@@ -22,6 +26,10 @@ if __name__ == '__main__':
     test_suite.addTests(loader.loadTestsFromTestCase(TestTrainFunctions))
     test_suite.addTests(loader.loadTestsFromTestCase(TestAI))
     test_suite.addTests(loader.loadTestsFromTestCase(TestAiIntegration))
+    test_suite.addTests(loader.loadTestsFromTestCase(TestInferenceScheduler))
+    test_suite.addTests(loader.loadTestsFromTestCase(TestFeatureWindow))
+    test_suite.addTests(loader.loadTestsFromTestCase(TestInferenceRuntime))
+    test_suite.addTests(loader.loadTestsFromTestCase(TestModelManager))
     
     # print("\n\n\nTests to be run:\n")
     # print(test_suite)
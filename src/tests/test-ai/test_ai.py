@@ -2,6 +2,7 @@ import unittest
 from unittest.mock import patch, MagicMock, mock_open, ANY
 import os
 import json
+import numpy as np
 import sys
 import time
 from datetime import datetime
@@ -10,6 +11,8 @@ from datetime import datetime
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 
 from ai.ai import adjust_predictions, run_predictions_and_publish, init_ai
+from sensor.topics import T_SENSOR_PUBLISH, T_SENSOR_PUBLISH_COMPACT
+import ai.ai as ai_module
 
 class TestAI(unittest.TestCase):
     def test_adjust_predictions_standard_lights(self):
@@ -75,7 +78,8 @@ class TestAI(unittest.TestCase):
     @patch('ai.ai.ai_predict')
     @patch('ai.ai.db_get_light_sensor_names')
     @patch('ai.ai.db_get_radar_current_data')
-    def test_run_predictions_and_publish(self, mock_radar_data, mock_light_names, mock_ai_predict):
+    @patch('ai.ai.db_save_predictions')
+    def test_run_predictions_and_publish(self, mock_save, mock_radar_data, mock_light_names, mock_ai_predict):
         """Test run_predictions_and_publish function"""
         # Arrange
         mock_model = MagicMock()
@@ -96,6 +100,8 @@ class TestAI(unittest.TestCase):
         mock_ai_predict.assert_called_once_with(mock_model)
         mock_light_names.assert_called_once()
         mock_radar_data.assert_called_once()
+        # The model's output is saved before the lights are adjusted
+        mock_save.assert_called_once_with(ANY, mock_ai_predict.return_value)
         
         # Check MQTT publish calls
         # Should publish 2 temperature values and 2 light values
@@ -112,7 +118,7 @@ class TestAI(unittest.TestCase):
         # l2 should be adjusted to 0 due to no presence
         self.assertIn(json.dumps({"name": "l2", "irgb": "0,N,N,N"}), str(calls[3]))
 
-    @patch('ai.ai.load_model')
+    @patch('ai.ai.read_model')
     @patch('ai.ai.run_predictions_and_publish')
     @patch('os.path.isfile')
     @patch('os.remove')
@@ -147,14 +153,15 @@ class TestAI(unittest.TestCase):
         # Verify sleep was called
         mock_sleep.assert_called_once_with(10)
 
-    @patch('ai.ai.load_model')
+    @patch('ai.ai.read_model')
     @patch('ai.ai.run_predictions_and_publish')
+    @patch('ai.ai.db_get_light_and_temp_sensors')
     @patch('os.path.isfile')
     @patch('os.remove')
     @patch('os.rename')
     @patch('time.sleep')
     def test_init_ai_model_update(self, mock_sleep, mock_rename, mock_remove, 
-                                 mock_isfile, mock_run_predictions, mock_load_model):
+                                 mock_isfile, mock_get_sensors, mock_run_predictions, mock_load_model):
         """Test init_ai with model update"""
         # Arrange
         mock_client = MagicMock()
@@ -163,13 +170,23 @@ class TestAI(unittest.TestCase):
         
         # Return different models on subsequent calls
         mock_load_model.side_effect = [mock_model, mock_new_model]
+
+        # The new model has to match the current sensors to be swapped in
+        mock_get_sensors.return_value = (['l1'], ['t1'])
+        mock_new_model.input_shape = (None, 24, 4)
+        mock_new_model.predict.return_value = np.zeros((1, 2))
         
         # First call: new model exists, second call: no new model
         # Fix: Make isfile return True for any path to ensure the model update code runs
         mock_isfile.return_value = True
         
-        # Fix: Make sleep raise exception immediately to prevent multiple loops
-        mock_sleep.side_effect = Exception("Break loop")
+        # The new model loads in the background during the first sleep, the
+        # second sleep breaks the loop
+        def sleep(seconds):
+            if mock_sleep.call_count > 1:
+                raise Exception("Break loop")
+            ai_module.model_manager.wait()
+        mock_sleep.side_effect = sleep
         
         # Act/Assert
         with self.assertRaises(Exception):
@@ -190,5 +207,49 @@ class TestAI(unittest.TestCase):
         # Verify predictions were run with the new model
         mock_run_predictions.assert_called_with(mock_new_model, mock_client)
 
+    @patch('ai.ai.read_model')
+    @patch('ai.ai.run_predictions_and_publish')
+    @patch('os.path.isfile')
+    @patch('time.sleep')
+    def test_init_ai_skips_without_new_data(self, mock_sleep, mock_isfile, mock_run_predictions, mock_load_model):
+        """Test that init_ai only runs predictions again after new sensor data"""
+        # Arrange
+        mock_client = MagicMock()
+        mock_isfile.return_value = False
+        mock_sleep.side_effect = [None, None, Exception("Break loop")]
+
+        # Act
+        with self.assertRaises(Exception):
+            init_ai(mock_client)
+
+        # Assert
+        mock_client.subscribe.assert_any_call(T_SENSOR_PUBLISH)
+        mock_client.subscribe.assert_any_call(T_SENSOR_PUBLISH_COMPACT)
+        mock_run_predictions.assert_called_once()
+        self.assertEqual(ai_module.scheduler.stats['skipped'], 2)
+
+    @patch('ai.ai.read_model')
+    @patch('ai.ai.run_predictions_and_publish')
+    @patch('ai.ai.Thread')
+    @patch('ai.ai.PREDICTION_SCORE_SECONDS', 0)
+    @patch('os.path.isfile')
+    @patch('time.sleep')
+    def test_init_ai_scores_predictions(self, mock_sleep, mock_isfile, mock_thread, mock_run_predictions,
+                                        mock_load_model):
+        """Test that init_ai scores past predictions in the background"""
+        # Arrange
+        mock_client = MagicMock()
+        mock_isfile.return_value = False
+        mock_sleep.side_effect = Exception("Break loop")
+
+        # Act
+        with self.assertRaises(Exception):
+            init_ai(mock_client)
+
+        # Assert
+        mock_thread.assert_called_once_with(target=ai_module.db_score_predictions, name="prediction-scorer",
+                                            daemon=True)
+        mock_thread.return_value.start.assert_called_once()
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,180 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import numpy as np
+import pandas as pd
+import datetime
+import json
+import os
+import sys
+
+# Add the src directory to the path so we can import the modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from ai.feature_window import FeatureWindow
+from ai.predict import load_and_preprocess_data
+from sensor.payload import batch
+
+LIGHTS = ['light_sensor1', 'light_sensor2']
+TEMPS = ['temp_sensor1']
+MODULES = {'l1': 'light_sensor1', 'l2': 'light_sensor2', 't1': 'temp_sensor1', 'new': None}
+
+
+def prediction_df(rows):
+    """What db_get_sensor_data_for_prediction returns for rows of (timestamp, {name: value})."""
+    df = pd.DataFrame({
+        'timestamp': [ts for ts, _ in rows],
+        **{name: [values.get(name) for _, values in rows] for name in LIGHTS + TEMPS}
+    })
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    df['hour'] = df['timestamp'].dt.hour
+    df['day_of_week'] = df['timestamp'].dt.dayofweek
+    return df
+
+
+def message(client_id, category, local_time, value):
+    msg = MagicMock()
+    utc_time = local_time - datetime.timedelta(hours=5, minutes=30)
+    msg.payload = json.dumps({"type": category, "time": utc_time.strftime('%Y-%m-%d %H:%M:%S'),
+                              "client_id": client_id, "data": value}).encode()
+    return msg
+
+
+class TestFeatureWindow(unittest.TestCase):
+    def setUp(self):
+        self.registry = MagicMock()
+        self.registry.get.side_effect = lambda client_id: (
+            {'name': MODULES[client_id]} if client_id in MODULES else None)
+        self.window = FeatureWindow(registry=self.registry)
+        self.now = datetime.datetime.now().replace(microsecond=0)
+
+        # Rows as sensor_publish_handler stores them, every 15 minutes
+        self.rows = []
+        values = {'light_sensor1': 1, 'light_sensor2': 0, 'temp_sensor1': 22.0}
+        for i in range(30, 0, -1):
+            values = dict(values, light_sensor1=i % 4)
+            self.rows.append(((self.now - datetime.timedelta(minutes=15 * i)).strftime('%Y-%m-%d %H:%M:%S'), values))
+
+    def load_from_db(self, rows, window=None):
+        with patch('ai.predict.db_get_sensor_data_for_prediction', return_value=prediction_df(rows)) as mock_data, \
+                patch('ai.predict.db_get_light_and_temp_sensors', return_value=(LIGHTS, TEMPS)):
+            result = load_and_preprocess_data(window)
+        return result, mock_data
+
+    def replay(self, client_id, category, minutes_ago, value):
+        """Publish a reading to the window and store it the way sensor_publish_handler does."""
+        local_time = self.now - datetime.timedelta(minutes=minutes_ago)
+        timestamp = local_time.strftime('%Y-%m-%d %H:%M:%S')
+        values = dict(self.rows[-1][1])
+        if MODULES.get(client_id) is not None:
+            values[MODULES[client_id]] = value
+        if self.rows[-1][0] == timestamp:
+            self.rows[-1] = (timestamp, values)
+        else:
+            self.rows.append((timestamp, values))
+        self.window.on_message(None, None, message(client_id, category, local_time, value))
+
+    def assert_matches_db(self):
+        self.assertTrue(self.window.ready())
+        X, last_timestamp, light_sensors, temp_sensors = self.window.snapshot()
+        (expected_X, expected_ts, expected_lights, expected_temps), _ = self.load_from_db(self.rows)
+        np.testing.assert_array_equal(X, expected_X)
+        self.assertEqual(last_timestamp, expected_ts)
+        self.assertEqual((light_sensors, temp_sensors), (expected_lights, expected_temps))
+
+    def test_seed_and_replay_match_database(self):
+        """Test that replayed readings give the same X as reading the database again"""
+        (X, _, _, _), _ = self.load_from_db(self.rows, self.window)
+        self.assert_matches_db()
+
+        self.replay('l2', 'light', 10, 3)
+        self.replay('t1', 'temp', 9, 24.5)
+        self.replay('t1', 'temp', 9, 25.0)       # Same second, updates the newest row
+        self.replay('new', 'light', 5, 2)        # Unnamed module, stores the other sensors again
+        self.assert_matches_db()
+
+        for minutes_ago in range(4, 0, -1):
+            self.replay('l1', 'light', minutes_ago, minutes_ago % 4)
+        self.assert_matches_db()
+        self.assertEqual(self.window.stats['appended'], 7)
+        self.assertEqual(self.window.stats['updated'], 1)
+
+    def test_batch_message(self):
+        """Test that the readings of a batch message are replayed in order"""
+        self.load_from_db(self.rows, self.window)
+        readings = []
+        for minutes_ago in range(4, 0, -1):
+            local_time = self.now - datetime.timedelta(minutes=minutes_ago)
+            self.rows.append((local_time.strftime('%Y-%m-%d %H:%M:%S'),
+                              dict(self.rows[-1][1], light_sensor1=minutes_ago % 4)))
+            utc_time = local_time - datetime.timedelta(hours=5, minutes=30)
+            readings.append({"time": utc_time.strftime('%Y-%m-%d %H:%M:%S'), "data": minutes_ago % 4})
+        msg = MagicMock()
+        msg.payload = json.dumps(batch('light', 'l1', readings)).encode()
+        self.window.on_message(None, None, msg)
+        self.assert_matches_db()
+        self.assertEqual(self.window.stats['appended'], 4)
+
+    def test_zero_padding(self):
+        """Test that a short history keeps the database path's zero padding"""
+        self.rows = self.rows[-5:]
+        self.load_from_db(self.rows, self.window)
+        self.replay('t1', 'temp', 1, 21.0)
+        self.assert_matches_db()
+        X, _, _, _ = self.window.snapshot()
+        self.assertFalse(X[0, :18].any())
+
+    def test_rows_older_than_a_day_become_padding(self):
+        """Test that rows falling out of the history window are zeroed"""
+        old = [((self.now - datetime.timedelta(days=1, minutes=i)).strftime('%Y-%m-%d %H:%M:%S'), values)
+               for i, (_, values) in zip(range(5, 0, -1), self.rows[:5])]
+        self.rows = old + self.rows[-3:]
+        self.load_from_db(self.rows, self.window)
+
+        X, _, _, _ = self.window.snapshot()
+        self.assertFalse(X[0, :21].any())
+        self.assertTrue(X[0, 21:].any())
+
+    def test_served_without_database(self):
+        """Test that a ready window answers load_and_preprocess_data without a query"""
+        self.load_from_db(self.rows, self.window)
+        (X, _, _, _), mock_data = self.load_from_db(self.rows, self.window)
+        mock_data.assert_not_called()
+        self.assertEqual(X.shape, (1, 24, 5))
+        self.assertEqual(self.window.stats['seeds'], 1)
+
+    def test_invalidation(self):
+        """Test the cases the window can't replay"""
+        self.load_from_db(self.rows, self.window)
+        self.replay('l1', 'light', 60, 2)        # Older than the newest row
+        self.assertFalse(self.window.ready())
+
+        self.load_from_db(self.rows, self.window)
+        MODULES['l3'] = 'light_sensor3'
+        try:
+            self.replay('l3', 'light', 1, 2)     # Sensor not in the features
+        finally:
+            del MODULES['l3']
+        self.assertFalse(self.window.ready())
+
+        self.load_from_db(self.rows, self.window)
+        self.window.on_modules_changed(None, None, None)
+        self.assertFalse(self.window.ready())
+        self.registry.invalidate.assert_called_once()
+
+    def test_ignored_messages(self):
+        """Test that radar, door and imOnline messages don't add rows"""
+        self.load_from_db(self.rows, self.window)
+        self.window.on_message(None, None, message('r1', 'radar', self.now, 1))
+        self.window.on_message(None, None, message('l1', 'light', self.now, "imOnline"))
+        self.assertEqual(self.window.stats['appended'], 0)
+        self.assertTrue(self.window.ready())
+
+    def test_reseed_after_max_age(self):
+        """Test that the window is reseeded periodically"""
+        window = FeatureWindow(reseed_seconds=0, registry=self.registry)
+        self.load_from_db(self.rows, window)
+        self.assertFalse(window.ready())
+
+
+if __name__ == '__main__':
+    unittest.main()
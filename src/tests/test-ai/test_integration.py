@@ -68,7 +68,8 @@ class TestAiIntegration(unittest.TestCase):
         self.assertEqual(len(results['temperatures']), 1)
     
     @patch('ai.ai.ai_predict')
-    def test_run_predictions_and_publish_integration(self, mock_predict):
+    @patch('ai.ai.db_save_predictions')
+    def test_run_predictions_and_publish_integration(self, mock_save, mock_predict):
         """Test the prediction and publishing integration."""
         # Setup
         mock_model = MagicMock()
@@ -92,25 +93,18 @@ class TestAiIntegration(unittest.TestCase):
         mock_predict.assert_called_once_with(mock_model)
         self.assertTrue(mock_client.publish.called)
     
-    @patch('ai.train.db_get_all_sensor_data')
+    @patch('ai.train.db_get_sensor_matrix')
     @patch('ai.train.create_lstm_model')
     @patch('ai.train.save_model')
-    def test_train_to_predict_workflow(self, mock_save, mock_create_model, mock_get_data):
+    def test_train_to_predict_workflow(self, mock_save, mock_create_model, mock_get_matrix):
         """Test the end-to-end workflow from training to prediction."""
         # Setup - mock database data with varied timestamps
         base_time = pd.Timestamp('2025-05-01 12:00:00')
-        timestamps = [base_time - pd.Timedelta(hours=i) for i in range(50)]
-        mock_sensor_data = {
-            'light_sensor1': {
-                'category': 'light',
-                'data': [(timestamps[i], 2) for i in range(50)]
-            },
-            'temp_sensor1': {
-                'category': 'temp',
-                'data': [(timestamps[i], 22.5) for i in range(50)]
-            }
+        timestamps = sorted(base_time - pd.Timedelta(hours=i) for i in range(50))
+        mock_get_matrix.return_value = {
+            'sensors': [('light_sensor1', 'light'), ('temp_sensor1', 'temp')],
+            'values': np.array([[2, 22.5, ts.hour, ts.dayofweek] for ts in timestamps], dtype=np.float32)
         }
-        mock_get_data.return_value = mock_sensor_data
         
         # Mock model creation to return our test model
         mock_create_model.return_value = self.test_model
@@ -122,7 +116,7 @@ class TestAiIntegration(unittest.TestCase):
         mock_save.assert_called_once()
         
         # Now simulate loading this model for prediction
-        with patch('ai.predict.keras.models.load_model', return_value=self.test_model):
+        with patch('tensorflow.keras.models.load_model', return_value=self.test_model):
             with patch('ai.predict.db_get_sensor_data_for_prediction') as mock_get_pred_data:
                 with patch('ai.predict.db_get_light_and_temp_sensors') as mock_get_pred_sensors:
                     # Setup test data for prediction
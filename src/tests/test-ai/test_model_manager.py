@@ -0,0 +1,150 @@
+import unittest
+import numpy as np
+import json
+import os
+import sys
+import shutil
+import tempfile
+import threading
+
+# Add the src directory to the path so we can import the modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from ai.model_manager import ModelManager
+from ai.predict import read_model
+
+
+class FakeModel:
+    def __init__(self, name, features, outputs):
+        self.name = name
+        self.input_shape = (None, 24, features)
+        self.outputs = outputs
+
+    def predict(self, X):
+        return np.zeros((len(X), self.outputs))
+
+
+def fake_load(path):
+    with open(path) as f:
+        spec = json.load(f)
+    return FakeModel(spec['name'], spec['features'], spec['outputs'])
+
+
+class TestModelManager(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.model_path = os.path.join(self.temp_dir, "model.h5")
+        self.candidate_path = os.path.join(self.temp_dir, "model_new.h5")
+        self.write(self.model_path, "v1", features=5, outputs=3)
+        # 2 lights + 1 temp -> 5 features (with hour and day_of_week), 3 outputs
+        self.manager = ModelManager(self.model_path, self.candidate_path, load=fake_load,
+                                    layout=lambda: (['l1', 'l2'], ['t1']))
+        self.manager.load_initial()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, path, name, features, outputs):
+        with open(path, 'w') as f:
+            json.dump({'name': name, 'features': features, 'outputs': outputs}, f)
+
+    def file_name(self, path):
+        with open(path) as f:
+            return json.load(f)['name']
+
+    def test_background_swap(self):
+        """Test that the candidate is loaded in the background and swapped in on a later poll"""
+        self.assertFalse(self.manager.poll())
+        self.write(self.candidate_path, "v2", features=5, outputs=3)
+
+        self.assertFalse(self.manager.poll())        # Starts loading
+        self.assertEqual(self.manager.current.name, "v1")
+        self.manager.wait()
+        self.assertEqual(self.manager.current.name, "v1")
+        self.assertTrue(self.manager.poll())         # Swaps
+
+        self.assertEqual(self.manager.current.name, "v2")
+        self.assertEqual(self.manager.previous.name, "v1")
+        self.assertEqual(self.file_name(self.model_path), "v2")
+        self.assertEqual(self.file_name(os.path.join(self.temp_dir, "model_prev.h5")), "v1")
+        self.assertFalse(os.path.exists(self.candidate_path))
+        self.assertEqual(self.manager.stats['swaps'], 1)
+        self.assertIsNotNone(self.manager.stats['load_seconds'])
+        self.assertIsNotNone(self.manager.stats['first_inference_seconds'])
+        self.assertFalse(self.manager.poll())
+
+    def test_rejects_wrong_layout(self):
+        """Test that a model trained for other sensors is never served"""
+        self.write(self.candidate_path, "v2", features=6, outputs=4)
+        self.manager.poll()
+        self.manager.wait()
+        self.assertFalse(self.manager.poll())
+
+        self.assertEqual(self.manager.current.name, "v1")
+        self.assertEqual(self.manager.stats['rejected'], 1)
+        self.assertEqual(self.file_name(self.model_path), "v1")
+        self.assertEqual(self.file_name(os.path.join(self.temp_dir, "model_rejected.h5")), "v2")
+        self.assertFalse(os.path.exists(self.candidate_path))
+
+    def test_rejects_corrupt_file(self):
+        """Test that a file read_model can't read doesn't stop the AI process"""
+        manager = ModelManager(self.model_path, self.candidate_path, load=read_model, background=False)
+        manager.current = "serving"
+        with open(self.candidate_path, 'wb') as f:
+            f.write(b"not a model")
+
+        self.assertFalse(manager.poll())
+        self.assertEqual(manager.current, "serving")
+        self.assertEqual(manager.stats['rejected'], 1)
+        self.assertEqual(manager.history[-1]['event'], 'rejected')
+        # The loader's own error, not an exit code
+        self.assertNotEqual(manager.history[-1]['error'], '1')
+        self.assertTrue(os.path.isfile(os.path.join(self.temp_dir, "model_rejected.h5")))
+
+    def test_rollback(self):
+        """Test that rollback serves and restores the previous model"""
+        self.assertFalse(self.manager.rollback())
+        self.write(self.candidate_path, "v2", features=5, outputs=3)
+        self.manager.poll()
+        self.manager.wait()
+        self.manager.poll()
+
+        self.assertTrue(self.manager.rollback())
+        self.assertEqual(self.manager.current.name, "v1")
+        self.assertEqual(self.file_name(self.model_path), "v1")
+        self.assertEqual(self.file_name(os.path.join(self.temp_dir, "model_rejected.h5")), "v2")
+        self.assertEqual(self.manager.stats['rollbacks'], 1)
+
+    def test_tflite_export_promoted(self):
+        """Test that a model_new.tflite is promoted with the .h5"""
+        self.write(self.candidate_path, "v2", features=5, outputs=3)
+        self.write(os.path.join(self.temp_dir, "model.tflite"), "v1", features=5, outputs=3)
+        self.write(os.path.join(self.temp_dir, "model_new.tflite"), "v2", features=5, outputs=3)
+        manager = ModelManager(self.model_path, self.candidate_path, load=fake_load, background=False)
+        manager.load_initial()
+
+        self.assertTrue(manager.poll())
+        self.assertEqual(self.file_name(os.path.join(self.temp_dir, "model.tflite")), "v2")
+        self.assertEqual(self.file_name(os.path.join(self.temp_dir, "model_prev.tflite")), "v1")
+
+    def test_serving_continues_during_load(self):
+        """Test that poll() returns immediately while the candidate loads"""
+        release = threading.Event()
+
+        def slow_load(path):
+            release.wait()
+            return fake_load(path)
+
+        self.manager.load = slow_load
+        self.write(self.candidate_path, "v2", features=5, outputs=3)
+        self.assertFalse(self.manager.poll())
+        self.assertTrue(self.manager.loading())
+        self.assertFalse(self.manager.poll())
+        self.assertEqual(self.manager.current.name, "v1")
+        release.set()
+        self.manager.wait()
+        self.assertTrue(self.manager.poll())
+
+
+if __name__ == '__main__':
+    unittest.main()
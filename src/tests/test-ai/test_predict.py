@@ -18,7 +18,7 @@ from ai.predict import (
 
 class TestPredictFunctions(unittest.TestCase):
 
-    @patch('ai.predict.keras.models.load_model')
+    @patch('tensorflow.keras.models.load_model')
     def test_load_model(self, mock_load_model):
         mock_model = MagicMock()
         mock_load_model.return_value = mock_model
@@ -29,7 +29,7 @@ class TestPredictFunctions(unittest.TestCase):
         mock_load_model.assert_called_once_with(test_path, compile=False)
         self.assertEqual(result, mock_model)
 
-    @patch('ai.predict.keras.models.load_model')
+    @patch('tensorflow.keras.models.load_model')
     def test_load_model_exception(self, mock_load_model):
         mock_load_model.side_effect = Exception("Model loading error")
         test_path = "test_model.h5"
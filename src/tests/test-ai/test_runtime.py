@@ -0,0 +1,112 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import numpy as np
+import os
+import sys
+import shutil
+import tempfile
+import tensorflow as tf
+
+# Add the src directory to the path so we can import the modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from ai.runtime import make_runtime, load_runtime, export_tflite, CompiledModel, TFLiteModel
+from ai.predict import make_predictions
+
+
+class TestInferenceRuntime(unittest.TestCase):
+    def setUp(self):
+        tf.keras.utils.set_random_seed(1)
+        self.model = tf.keras.Sequential([
+            tf.keras.layers.Input(shape=(24, 6)),
+            tf.keras.layers.LSTM(16, return_sequences=False),
+            tf.keras.layers.Dense(4)
+        ])
+        self.temp_dir = tempfile.mkdtemp()
+        self.model_path = os.path.join(self.temp_dir, "model.h5")
+        self.model.save(self.model_path)
+        self.X = np.random.rand(1, 24, 6).astype(np.float32)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_keras_backend_is_the_model(self):
+        self.assertIs(make_runtime(self.model, 'keras', self.model_path), self.model)
+
+    def test_function_backend_matches_keras(self):
+        runtime = make_runtime(self.model, 'function', self.model_path)
+        self.assertIsInstance(runtime, CompiledModel)
+        expected = self.model.predict(self.X, verbose=0)
+        np.testing.assert_allclose(make_predictions(runtime, self.X), expected, rtol=1e-5, atol=1e-6)
+        # Attributes like output_shape come from the wrapped model
+        self.assertEqual(runtime.output_shape, (None, 4))
+
+    def test_tflite_backend_matches_keras(self):
+        runtime = make_runtime(self.model, 'tflite', self.model_path)
+        self.assertIsInstance(runtime, TFLiteModel)
+        self.assertTrue(os.path.isfile(os.path.join(self.temp_dir, "model.tflite")))
+        self.assertEqual(runtime.input_shape, (None, 24, 6))
+        self.assertEqual(runtime.output_shape, (None, 4))
+
+        for _ in range(3):
+            X = np.random.rand(1, 24, 6).astype(np.float32)
+            expected = self.model.predict(X, verbose=0)
+            np.testing.assert_allclose(make_predictions(runtime, X), expected, rtol=1e-5, atol=1e-6)
+
+    def test_tflite_export_reused(self):
+        make_runtime(self.model, 'tflite', self.model_path)
+        with patch('ai.runtime.export_tflite') as mock_export:
+            make_runtime(self.model, 'tflite', self.model_path)
+            mock_export.assert_not_called()
+
+            # A newer .h5 makes the export stale
+            tflite_mtime = os.path.getmtime(os.path.join(self.temp_dir, "model.tflite"))
+            os.utime(self.model_path, (tflite_mtime + 10, tflite_mtime + 10))
+            mock_export.side_effect = lambda model, path: export_tflite(model, path)
+            make_runtime(self.model, 'tflite', self.model_path)
+            mock_export.assert_called_once()
+
+    def test_load_runtime_skips_the_h5(self):
+        """Test that an up-to-date export is run without loading the Keras model"""
+        load = MagicMock(return_value=self.model)
+        self.assertIsInstance(load_runtime(self.model_path, 'tflite', load), TFLiteModel)
+        load.assert_called_once_with(self.model_path)
+
+        load.reset_mock()
+        runtime = load_runtime(self.model_path, 'tflite', load)
+        load.assert_not_called()
+        np.testing.assert_allclose(make_predictions(runtime, self.X), self.model.predict(self.X, verbose=0),
+                                   rtol=1e-5, atol=1e-6)
+
+        # The other backends need the Keras model
+        self.assertIs(load_runtime(self.model_path, 'keras', load), self.model)
+        load.assert_called_once_with(self.model_path)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            make_runtime(self.model, 'onnx', self.model_path)
+        with self.assertRaises(ValueError):
+            make_runtime(self.model, 'tflite')
+
+    @patch('ai.ai.read_model')
+    @patch('ai.ai.load_runtime')
+    @patch('ai.ai.run_predictions_and_publish')
+    @patch('os.path.isfile')
+    @patch('time.sleep')
+    def test_init_ai_backend(self, mock_sleep, mock_isfile, mock_run_predictions, mock_load_runtime, mock_read_model):
+        from ai.ai import init_ai
+        mock_isfile.return_value = False
+        mock_sleep.side_effect = Exception("Break loop")
+        mock_client = MagicMock()
+
+        with self.assertRaises(Exception):
+            init_ai(mock_client, backend='tflite')
+
+        mock_load_runtime.assert_called_once()
+        model_path, backend, load = mock_load_runtime.call_args[0]
+        self.assertEqual((os.path.basename(model_path), backend, load), ("model.h5", 'tflite', mock_read_model))
+        mock_run_predictions.assert_called_with(mock_load_runtime.return_value, mock_client)
+
+
+if __name__ == '__main__':
+    unittest.main()
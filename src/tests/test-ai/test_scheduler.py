@@ -0,0 +1,86 @@
+import unittest
+import os
+import sys
+
+# Add the src directory to the path so we can import the modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from ai.scheduler import InferenceScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestInferenceScheduler(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = InferenceScheduler(debounce=5, min_interval=60, max_staleness=900, clock=self.clock)
+
+    def test_first_run_then_skip_without_data(self):
+        """Test that inference runs once at startup and is skipped while nothing changes"""
+        self.assertTrue(self.scheduler.should_run())
+        for _ in range(10):
+            self.clock.now += 10
+            self.assertFalse(self.scheduler.should_run())
+        self.assertEqual(self.scheduler.stats['executed'], 1)
+        self.assertEqual(self.scheduler.stats['skipped'], 10)
+
+    def test_debounce(self):
+        """Test that a burst of readings triggers one run after it settles"""
+        self.scheduler.should_run()
+        self.clock.now += 120
+        for _ in range(12):
+            self.scheduler.notify(None, None, None)   # MQTT callback signature
+            self.clock.now += 1
+        self.assertIsNone(self.scheduler.due())
+        self.clock.now += 4
+        self.assertEqual(self.scheduler.due(), 'data')
+        self.assertTrue(self.scheduler.should_run())
+        self.assertFalse(self.scheduler.should_run())
+        self.assertEqual(self.scheduler.stats['events'], 12)
+
+    def test_min_interval(self):
+        """Test that readings echoed right after a run wait for min_interval"""
+        self.scheduler.should_run()
+        self.scheduler.notify()
+        self.clock.now += 30
+        self.assertIsNone(self.scheduler.due())
+        self.clock.now += 30
+        self.assertEqual(self.scheduler.due(), 'data')
+
+    def test_steady_stream_does_not_starve(self):
+        """Test that readings arriving faster than the debounce still trigger a run"""
+        self.scheduler.should_run()
+        self.clock.now += 120
+        runs = 0
+        for _ in range(120):
+            self.scheduler.notify()
+            self.clock.now += 1
+            runs += self.scheduler.should_run()
+        self.assertEqual(runs, 2)
+
+    def test_max_staleness(self):
+        """Test that inference runs after max_staleness even without readings"""
+        self.scheduler.should_run()
+        self.clock.now += 899
+        self.assertFalse(self.scheduler.should_run())
+        self.clock.now += 1
+        self.assertTrue(self.scheduler.should_run())
+        self.assertEqual(self.scheduler.stats['executed_stale'], 1)
+
+    def test_request(self):
+        """Test that request() forces the next check to run"""
+        self.scheduler.should_run()
+        self.scheduler.request()
+        self.assertEqual(self.scheduler.due(), 'requested')
+        self.assertTrue(self.scheduler.should_run())
+        self.assertFalse(self.scheduler.should_run())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,6 +13,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
 from ai.train import (
     load_and_preprocess_data,
     prepare_sequences,
+    make_dataset,
     create_lstm_model,
     train_model,
     save_model,
@@ -22,24 +23,15 @@ from ai.train import (
 
 class TestTrainFunctions(unittest.TestCase):
 
-    @patch('ai.train.db_get_all_sensor_data')
-    def test_load_and_preprocess_data(self, mock_get_data):
-        # Mock the return value of db_get_all_sensor_data
-        mock_get_data.return_value = {
-            'light_sensor1': {
-                'category': 'light',
-                'data': [
-                    (pd.Timestamp('2025-05-01 12:00:00'), 2),
-                    (pd.Timestamp('2025-05-01 13:00:00'), 3)
-                ]
-            },
-            'temp_sensor1': {
-                'category': 'temp',
-                'data': [
-                    (pd.Timestamp('2025-05-01 12:00:00'), 22.5),
-                    (pd.Timestamp('2025-05-01 13:00:00'), 23.0)
-                ]
-            }
+    @patch('ai.train.db_get_sensor_matrix')
+    def test_load_and_preprocess_data(self, mock_get_matrix):
+        # Mock the return value of db_get_sensor_matrix (light, temp, hour, day_of_week)
+        mock_get_matrix.return_value = {
+            'sensors': [('light_sensor1', 'light'), ('temp_sensor1', 'temp')],
+            'values': np.array([
+                [2, 22.5, 12, 3],
+                [3, 23.0, 13, 3]
+            ], dtype=np.float32)
         }
 
         # Execute
@@ -51,6 +43,27 @@ class TestTrainFunctions(unittest.TestCase):
         self.assertEqual(len(features), 4)
         self.assertEqual(len(target_features), 2)
 
+    @patch('ai.train.db_get_sensor_matrix')
+    def test_load_and_preprocess_data_normalization(self, mock_get_matrix):
+        mock_get_matrix.return_value = {
+            'sensors': [('light_sensor1', 'light'), ('temp_sensor1', 'temp')],
+            'values': np.array([
+                [2, 20.0, 23, 6],
+                [np.nan, 21.0, 0, 0],   # Dropped
+                [1, 22.0, 0, 0],
+                [0, 24.0, 0, 0]
+            ], dtype=np.float32)
+        }
+
+        data, features, target_features = load_and_preprocess_data()
+
+        self.assertEqual(features, ['light_sensor1', 'temp_sensor1', 'hour', 'day_of_week'])
+        self.assertEqual(data.shape, (3, 4))
+        np.testing.assert_allclose(data[0, 2:], [1.0, 1.0])
+        temps = pd.Series([20.0, 21.0, 22.0, 24.0])
+        expected = ((temps - temps.mean()) / temps.std()).values[[0, 2, 3]]
+        np.testing.assert_allclose(data[:, 1], expected, rtol=1e-6)
+
     def test_prepare_sequences(self):
         # Create sample data
         features = ['light_sensor1', 'temp_sensor1', 'hour', 'day_of_week']
@@ -65,6 +78,46 @@ class TestTrainFunctions(unittest.TestCase):
         self.assertEqual(X.shape, (6, 24, 4))  # 30 - 24 = 6 sequences
         self.assertEqual(y.shape, (6, 2))  # 6 target values, 2 target features
 
+    def test_prepare_sequences_matches_loop(self):
+        features = ['light_sensor1', 'temp_sensor1', 'hour', 'day_of_week']
+        target_features = ['temp_sensor1', 'light_sensor1']
+        data = np.random.rand(40, 4).astype(np.float32)
+
+        X, y, SEQ_LEN = prepare_sequences(data, features, target_features)
+
+        expected_X = np.array([data[i:i + SEQ_LEN] for i in range(len(data) - SEQ_LEN)])
+        expected_y = np.array([[data[i + SEQ_LEN][1], data[i + SEQ_LEN][0]] for i in range(len(data) - SEQ_LEN)])
+        np.testing.assert_array_equal(X, expected_X)
+        np.testing.assert_array_equal(y, expected_y)
+        self.assertTrue(np.shares_memory(X, data))  # Windows are a view
+
+    def test_prepare_sequences_too_short(self):
+        features = ['light_sensor1', 'hour', 'day_of_week']
+        X, y, SEQ_LEN = prepare_sequences(np.random.rand(10, 3).astype(np.float32), features, ['light_sensor1'])
+        self.assertEqual(X.shape, (0, 24, 3))
+        self.assertEqual(y.shape, (0, 1))
+
+    def test_make_dataset(self):
+        features = ['light_sensor1', 'temp_sensor1', 'hour', 'day_of_week']
+        target_features = ['light_sensor1', 'temp_sensor1']
+        data = np.random.rand(100, 4).astype(np.float32)
+        X, y, _ = prepare_sequences(data, features, target_features)
+
+        for mode in ('generator', 'tfdata'):
+            dataset = make_dataset(data, features, target_features, mode=mode, batch_size=32, shuffle=False)
+            batches = list(dataset.as_numpy_iterator())
+            self.assertEqual([len(batch_y) for _, batch_y in batches], [32, 32, 12])
+            np.testing.assert_allclose(np.concatenate([batch_X for batch_X, _ in batches]), X)
+            np.testing.assert_allclose(np.concatenate([batch_y for _, batch_y in batches]), y)
+
+        # Shuffled batches still cover every window once
+        dataset = make_dataset(data, features, target_features, mode='generator', batch_size=32)
+        batch_y = np.concatenate([batch_y for _, batch_y in dataset.as_numpy_iterator()])
+        np.testing.assert_allclose(np.sort(batch_y, axis=0), np.sort(y, axis=0))
+
+        with self.assertRaises(ValueError):
+            make_dataset(data, features, target_features, mode='unknown')
+
     def test_create_lstm_model(self):
         SEQ_LEN = 24
         features = ['light_sensor1', 'temp_sensor1', 'hour', 'day_of_week']
@@ -137,6 +190,30 @@ class TestTrainFunctions(unittest.TestCase):
         mock_train.assert_called_once()
         mock_save.assert_called_once()
 
+    @patch('ai.train.load_and_preprocess_data')
+    @patch('ai.train.prepare_sequences')
+    @patch('ai.train.make_dataset')
+    @patch('ai.train.create_lstm_model')
+    @patch('ai.train.train_model')
+    @patch('ai.train.save_model')
+    def test_main_streaming(self, mock_save, mock_train, mock_create, mock_dataset, mock_prepare, mock_load):
+        mock_load.return_value = (
+            np.random.rand(30, 4),
+            ['light_sensor1', 'temp_sensor1', 'hour', 'day_of_week'],
+            ['light_sensor1', 'temp_sensor1']
+        )
+        mock_model = MagicMock()
+        mock_create.return_value = mock_model
+        mock_train.return_value = mock_model
+
+        main(days=30, input_mode='generator', mmap_path='/tmp/train.npy')
+
+        mock_load.assert_called_once_with(30, '/tmp/train.npy')
+        mock_prepare.assert_not_called()
+        mock_dataset.assert_called_once()
+        mock_train.assert_called_once_with(mock_model, mock_dataset.return_value)
+        mock_save.assert_called_once()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -17,6 +17,17 @@ from test_category_queries import TestDatabaseCategoryQueries
 from test_error_handling import TestDatabaseErrorHandling
 from test_delete_tables import TestDeleteTables
 from test_db_setup import TestDatabaseSetup
+from test_connection_pool import TestConnectionPool
+from test_ingest import TestIngestQueue, TestBulkIngest, TestBulkIngestCompact
+from test_registry import TestModuleRegistry
+from test_schema import TestCompactSchema, TestDatabaseCoreCompact, TestDatabasePredictionCompact
+from test_rollups import TestRollups
+from test_archive import TestArchive, TestArchiveCompact
+from test_codec import TestCodec, TestChunks
+from test_predictions import TestPredictionHistory
+from test_resilience import TestCircuitBreaker, TestDatabaseResilience
+from test_metrics import TestMetrics
+from test_groups import TestModuleGroups
 
 def run_all_tests():
     """Run all database tests."""
@@ -32,6 +43,24 @@ def run_all_tests():
     test_suite.addTest(unittest.makeSuite(TestDatabaseErrorHandling))
     test_suite.addTest(unittest.makeSuite(TestDeleteTables))
     test_suite.addTest(unittest.makeSuite(TestDatabaseSetup))
+    test_suite.addTest(unittest.makeSuite(TestConnectionPool))
+    test_suite.addTest(unittest.makeSuite(TestIngestQueue))
+    test_suite.addTest(unittest.makeSuite(TestBulkIngest))
+    test_suite.addTest(unittest.makeSuite(TestBulkIngestCompact))
+    test_suite.addTest(unittest.makeSuite(TestModuleRegistry))
+    test_suite.addTest(unittest.makeSuite(TestCompactSchema))
+    test_suite.addTest(unittest.makeSuite(TestRollups))
+    test_suite.addTest(unittest.makeSuite(TestArchive))
+    test_suite.addTest(unittest.makeSuite(TestArchiveCompact))
+    test_suite.addTest(unittest.makeSuite(TestCodec))
+    test_suite.addTest(unittest.makeSuite(TestChunks))
+    test_suite.addTest(unittest.makeSuite(TestPredictionHistory))
+    test_suite.addTest(unittest.makeSuite(TestCircuitBreaker))
+    test_suite.addTest(unittest.makeSuite(TestDatabaseResilience))
+    test_suite.addTest(unittest.makeSuite(TestMetrics))
+    test_suite.addTest(unittest.makeSuite(TestModuleGroups))
+    test_suite.addTest(unittest.makeSuite(TestDatabaseCoreCompact))
+    test_suite.addTest(unittest.makeSuite(TestDatabasePredictionCompact))
     
     # Create a test runner
     test_runner = unittest.TextTestRunner(verbosity=2)
@@ -0,0 +1,189 @@
+import os
+import shutil
+import calendar
+import sqlite3
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from test_base import DatabaseTestBase
+from test_schema import CompactSchemaMixin
+from src.database import database
+from src.database import archive
+from src.database import chunks
+from src.database import schema
+
+
+class TestArchive(DatabaseTestBase):
+    """Tests for moving old readings to the archive and reading them back."""
+
+    def setUp(self):
+        super().setUp()
+        self.archive_dir = archive.archive_dir(self.test_db_path)
+        self.light = database.db_add_sensor("light1", "Living Room Light", "light", self.test_db_path)
+        self.temp = database.db_add_sensor("temp1", "Living Room Temp", "temp", self.test_db_path)
+        # Off the minute grid, so the query windows never start on a reading
+        self.now = datetime.now().replace(microsecond=0) + timedelta(seconds=30)
+        rows = []
+        for i in range(60 * 12, 0, -1):
+            timestamp = (self.now - timedelta(hours=2 * i)).strftime('%Y-%m-%d %H:%M:%S')
+            rows.append((timestamp, self.light, i % 4))
+            if i % 3 == 0:
+                rows.append((timestamp, self.temp, 20 + i % 8 / 2))
+        database.db_add_sensor_data_batch(rows, self.test_db_path)
+        self.num_rows = len(rows)
+
+    def tearDown(self):
+        shutil.rmtree(self.archive_dir, ignore_errors=True)
+        super().tearDown()
+
+    def snapshot(self):
+        return {
+            'sensor_data': database.db_get_sensor_data(self.temp, 70, self.test_db_path),
+            'all_sensor_data': database.db_get_all_sensor_data(70, self.test_db_path),
+            'prediction': database.db_get_sensor_data_for_prediction(40, self.test_db_path),
+            'matrix': database.db_get_sensor_matrix(45, db_name=self.test_db_path),
+        }
+
+    def assert_same_snapshot(self, before, after):
+        pd.testing.assert_frame_equal(after.pop('prediction'), before.pop('prediction'))
+        matrix_before, matrix_after = before.pop('matrix'), after.pop('matrix')
+        np.testing.assert_array_equal(matrix_after['values'], matrix_before['values'])
+        self.assertEqual(after, before)
+
+    def assert_archived(self, sensor_id, day):
+        """The month file of the day holds readings of the sensor"""
+        self.assertIn(day[:7] + '.npz', os.listdir(os.path.join(self.archive_dir, sensor_id)))
+
+    def count_rows(self):
+        with sqlite3.connect(self.test_db_path) as conn:
+            return conn.execute("SELECT COUNT(*) FROM sensor_data").fetchone()[0]
+
+    def test_archive_keeps_results(self):
+        """Test that the long-range read functions return the same data from the archive"""
+        before = self.snapshot()
+        archived = database.db_archive_sensor_data(30, batch_rows=100, db_name=self.test_db_path)
+        self.assertGreater(archived, 100)
+        self.assertEqual(self.count_rows(), self.num_rows - archived)
+
+        # Everything before midnight 30 days ago is gone from SQLite
+        cutoff = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d 00:00:00')
+        with sqlite3.connect(self.test_db_path) as conn:
+            self.assertEqual(conn.execute("SELECT MIN(timestamp) >= ? FROM sensor_data", (cutoff,)).fetchone()[0], 1)
+        self.assert_archived(self.temp, (self.now - timedelta(hours=2 * 60 * 12)).strftime('%Y-%m-%d'))
+
+        self.assert_same_snapshot(before, self.snapshot())
+
+        # Nothing left to archive
+        self.assertEqual(database.db_archive_sensor_data(30, db_name=self.test_db_path), 0)
+
+    def test_late_rows_override_archive(self):
+        """Test that rows written below the horizon after archiving win, and are archived again"""
+        database.db_archive_sensor_data(30, db_name=self.test_db_path)
+        old = database.db_get_sensor_data(self.temp, 70, self.test_db_path)
+        timestamp, value = old[5]
+        database.db_add_sensor_data_batch([(timestamp, self.temp, value + 100)], self.test_db_path)
+
+        expected = old[:5] + [(timestamp, value + 100)] + old[6:]
+        self.assertEqual(database.db_get_sensor_data(self.temp, 70, self.test_db_path), expected)
+        self.assertEqual(database.db_archive_sensor_data(30, db_name=self.test_db_path), 1)
+        self.assertEqual(database.db_get_sensor_data(self.temp, 70, self.test_db_path), expected)
+
+    def test_window_after_horizon(self):
+        """Test that windows after the horizon don't read the archive"""
+        database.db_archive_sensor_data(30, db_name=self.test_db_path)
+        with patch.object(archive, 'read', side_effect=AssertionError), \
+                patch.object(chunks, 'read', side_effect=AssertionError):
+            self.assertEqual(len(database.db_get_sensor_data(self.temp, 7, self.test_db_path)), 7 * 12 // 3)
+
+
+class TestArchiveCompact(CompactSchemaMixin, TestArchive):
+    """The same tests with the archive in sensor_chunks."""
+
+    def assert_archived(self, sensor_id, day):
+        """A chunk of the day holds readings of the sensor, and no files were written"""
+        self.assertFalse(os.path.exists(self.archive_dir))
+        with sqlite3.connect(self.test_db_path) as conn:
+            self.assertEqual(conn.execute("""
+                SELECT COUNT(*) FROM sensor_chunks c JOIN sensor_keys k ON k.sensor_key = c.sensor_key
+                WHERE k.sensor_id = ? AND date(c.chunk_start, 'unixepoch') = ?
+            """, (sensor_id, day)).fetchone()[0], 1)
+
+    def test_files_and_chunks(self):
+        """Test that files archived before the migration to chunks are still read"""
+        self.tearDown()
+        TestArchive.setUp(self)
+        schema.migrate(self.test_db_path, schema.ROLLUP_SCHEMA_VERSION)
+        before = self.snapshot()
+        database.db_archive_sensor_data(45, db_name=self.test_db_path)
+        schema.migrate(self.test_db_path)
+        database.db_archive_sensor_data(30, db_name=self.test_db_path)
+        self.assertTrue(os.path.isdir(self.archive_dir))
+        self.assert_same_snapshot(before, self.snapshot())
+
+    def test_rollups_kept(self):
+        """Test that the rollups of archived readings survive archiving and rebuilding"""
+        history = database.db_get_sensor_history(self.temp, 60, max_points=100, db_name=self.test_db_path)
+        self.assertEqual(history['resolution'], 'day')
+        database.db_archive_sensor_data(30, db_name=self.test_db_path)
+        self.assertEqual(database.db_get_sensor_history(self.temp, 60, max_points=100, db_name=self.test_db_path),
+                         history)
+        database.db_rebuild_rollups(self.test_db_path)
+        self.assertEqual(database.db_get_sensor_history(self.temp, 60, max_points=100, db_name=self.test_db_path),
+                         history)
+
+    def rollup(self, sensor_id, resolution, start):
+        """(count, sum, last) of the sensor's bucket"""
+        with sqlite3.connect(self.test_db_path) as conn:
+            return conn.execute("""
+                SELECT r.count, r.sum, r.last FROM rollups r JOIN sensor_keys k ON k.sensor_key = r.sensor_key
+                WHERE k.sensor_id = ? AND r.resolution = ? AND r.bucket = ?
+            """, (sensor_id, resolution, calendar.timegm(start.timetuple()))).fetchone()
+
+    def check_late_writes(self):
+        day = (self.now - timedelta(days=60)).replace(hour=0, minute=0, second=0)
+        at = lambda hour, minute=0: (day + timedelta(hours=hour, minutes=minute)).strftime('%Y-%m-%d %H:%M:%S')
+        database.db_add_sensor_data_batch([(at(9), self.power, 10), (at(10), self.power, 20), (at(11), self.power, 30)],
+                                          self.test_db_path)
+        database.db_archive_sensor_data(30, db_name=self.test_db_path)
+        hour = day + timedelta(hours=10)
+        self.assertEqual(self.rollup(self.power, 86400, day), (3, 60.0, 30.0))
+
+        # A new reading on the archived day is added to the archived ones
+        database.db_add_sensor_data_batch([(at(10, 30), self.power, 40)], self.test_db_path)
+        self.assertEqual(self.rollup(self.power, 86400, day), (4, 100.0, 30.0))
+        # Overwriting it rebuilds the buckets from SQLite and the archive
+        database.db_bulk_ingest([(self.power, at(10, 30), 51)], db_name=self.test_db_path)
+        self.assertEqual(self.rollup(self.power, 86400, day), (4, 111.0, 30.0))
+        self.assertEqual(self.rollup(self.power, 3600, hour), (2, 71.0, 51.0))
+        # A write at the time of an archived reading replaces it
+        database.db_add_sensor_data_batch([(at(11), self.power, 35)], self.test_db_path)
+        self.assertEqual(self.rollup(self.power, 86400, day), (4, 116.0, 35.0))
+
+        database.db_rebuild_rollups(self.test_db_path)
+        self.assertEqual(self.rollup(self.power, 86400, day), (4, 116.0, 35.0))
+        self.assertEqual(self.rollup(self.power, 3600, hour), (2, 71.0, 51.0))
+        # And once the late rows are archived as well
+        database.db_archive_sensor_data(30, db_name=self.test_db_path)
+        database.db_rebuild_rollups(self.test_db_path)
+        self.assertEqual(self.rollup(self.power, 86400, day), (4, 116.0, 35.0))
+
+    def test_late_writes_keep_rollups(self):
+        """Test that writes into an archived day count its archived readings, in sensor_chunks"""
+        self.power = database.db_add_sensor("switch1", "Kitchen Switch", "switch", self.test_db_path)
+        self.check_late_writes()
+
+    def test_late_writes_keep_rollups_in_files(self):
+        """Test that writes into an archived day count its archived readings, in the archive files"""
+        self.tearDown()
+        TestArchive.setUp(self)
+        schema.migrate(self.test_db_path, schema.ROLLUP_SCHEMA_VERSION)
+        self.power = database.db_add_sensor("switch1", "Kitchen Switch", "switch", self.test_db_path)
+        self.check_late_writes()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -61,6 +61,7 @@ class DatabaseTestBase(unittest.TestCase):
 
     def tearDown(self):
         """Clean up the temporary test database."""
+        database.db_close_connections()
         gc.collect()
         try:
             os.remove(self.test_db_path)
@@ -0,0 +1,103 @@
+import sqlite3
+import unittest
+
+import numpy as np
+
+from test_base import DatabaseTestBase
+from src.database import database
+from src.database import chunks
+from src.database import codec
+from src.database import schema
+
+
+class TestCodec(unittest.TestCase):
+    """Tests for the compressed encoding of a sensor's readings."""
+
+    def assert_round_trip(self, ts, values):
+        data = codec.encode(ts, values)
+        decoded_ts, decoded_values = codec.decode(data)
+        np.testing.assert_array_equal(decoded_ts, ts)
+        # Compares the bits, so NaN, inf and -0.0 must come back exactly
+        np.testing.assert_array_equal(decoded_values.view(np.uint64), np.asarray(values, dtype=np.float64).view(np.uint64))
+        return data
+
+    def test_regular_readings(self):
+        """Test that regular repeated readings cost about two bits each"""
+        ts = 1700000000 + 900 * np.arange(96)
+        data = self.assert_round_trip(ts, np.full(96, 3.0))
+        self.assertLess(len(data), 60)
+
+    def test_irregular_readings(self):
+        """Test timestamps with gaps of every width and arbitrary values"""
+        rng = np.random.default_rng(0)
+        gaps = np.concatenate([rng.integers(1, 200, 300), [1, 10 ** 6, 1, 10 ** 9, 2]])
+        ts = -10 ** 6 + np.cumsum(gaps)
+        values = np.array([round(value, digits) for value, digits in
+                           zip(rng.uniform(-40, 40, len(ts)), rng.integers(0, 5, len(ts)))])
+        self.assert_round_trip(ts, values)
+
+    def test_special_values(self):
+        """Test NULL (NaN), infinities, signed zeros and a single reading"""
+        self.assert_round_trip([0, 60, 120, 180, 240, 300], [np.nan, 0.0, -0.0, np.inf, -np.inf, np.nan])
+        self.assert_round_trip([1700000000], [21.5])
+
+    def test_bad_data(self):
+        """Test the errors for nothing to encode, truncated data and unknown versions"""
+        with self.assertRaises(ValueError):
+            codec.encode([], [])
+        data = codec.encode(np.arange(0, 6000, 60), np.arange(100) / 3)
+        with self.assertRaises(ValueError):
+            codec.decode(data[:-10])
+        with self.assertRaises(ValueError):
+            codec.decode(bytes([codec.VERSION + 1]) + data[1:])
+
+
+class TestChunks(DatabaseTestBase):
+    """Tests for the sensor_chunks table of schema version 4."""
+
+    def setUp(self):
+        super().setUp()
+        self.temp = database.db_add_sensor("temp1", "Living Room Temp", "temp", self.test_db_path)
+        self.light = database.db_add_sensor("light1", "Living Room Light", "light", self.test_db_path)
+        schema.migrate(self.test_db_path)
+        self.conn = sqlite3.connect(self.test_db_path)
+        self.cursor = self.conn.cursor()
+
+    def tearDown(self):
+        self.conn.close()
+        super().tearDown()
+
+    def test_write_merges_chunks(self):
+        """Test that writes split into day chunks and replace readings with the same ts"""
+        ts = np.arange(0, 3 * 86400, 3600)
+        chunks.write(self.cursor, self.temp, ts, ts / 3600)
+        chunks.write(self.cursor, self.temp, [7200, 7201], [-1.0, np.nan])
+        self.cursor.execute("SELECT chunk_start, last_ts, count FROM sensor_chunks ORDER BY chunk_start")
+        self.assertEqual(self.cursor.fetchall(), [(0, 82800, 25), (86400, 169200, 24), (172800, 255600, 24)])
+
+        read_ts, sensors, values = chunks.read(self.cursor, [self.temp], 3600, 2 * 86400)
+        self.assertEqual(read_ts[:4].tolist(), [3600, 7200, 7201, 10800])
+        np.testing.assert_array_equal(values[:4], [1.0, -1.0, np.nan, 3.0])
+        self.assertEqual(read_ts[-1], 2 * 86400 - 3600)
+        self.assertTrue((sensors == 0).all())
+        self.assertEqual(chunks.horizon(self.cursor), 255601)
+
+    def test_read_several_sensors(self):
+        """Test that readings of several sensors come back sorted by ts, with the sensor index"""
+        chunks.write(self.cursor, self.temp, [100, 300], [20.0, 21.0])
+        chunks.write(self.cursor, self.light, [200, 86500], [1.0, 2.0])
+        ts, sensors, values = chunks.read(self.cursor, [self.light, self.temp], 0, 86400)
+        self.assertEqual(ts.tolist(), [100, 200, 300])
+        self.assertEqual(sensors.tolist(), [1, 0, 1])
+        self.assertEqual(values.tolist(), [20.0, 1.0, 21.0])
+
+    def test_last_before(self):
+        """Test that the newest reading that is not NULL is found across chunks"""
+        self.assertIsNone(chunks.last_before(self.cursor, self.temp, 86400))
+        chunks.write(self.cursor, self.temp, [100, 200, 86500], [20.0, np.nan, np.nan])
+        self.assertEqual(chunks.last_before(self.cursor, self.temp, 90000), (100, 20.0))
+        self.assertIsNone(chunks.last_before(self.cursor, self.temp, 100))
+
+
+if __name__ == '__main__':
+    unittest.main()
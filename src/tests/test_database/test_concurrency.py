@@ -1,5 +1,6 @@
 import threading
 import sqlite3
+import time
 
 from test_base import DatabaseTestBase
 from src.database import database
@@ -86,5 +87,80 @@ class TestDatabaseConcurrency(DatabaseTestBase):
         
         self.assertEqual(count, 2)
 
+    def test_reads_not_blocked_by_writer(self):
+        """Test that readers do not wait for the write lock."""
+        database.db_add_module("reader_client", "Reader Light", "light", self.test_db_path)
+
+        result = {}
+        def read_modules():
+            result['modules'] = database.db_get_available_all_modules(self.test_db_path)
+
+        # Hold the write lock as a writer would and read from another thread
+        with database.db_write_lock:
+            reader = threading.Thread(target=read_modules)
+            reader.start()
+            reader.join(timeout=2)
+            self.assertFalse(reader.is_alive(), "Reader blocked behind the write lock")
+
+        self.assertEqual(len(result['modules']), 1)
+
+    def test_read_latency_under_write_load(self):
+        """Stress test: report read p99 while a writer inserts continuously."""
+        for i in range(8):
+            database.db_add_module(f"stress_l{i}", f"Stress Light {i}", "light", self.test_db_path)
+        for i in range(4):
+            database.db_add_module(f"stress_s{i}", f"Stress Switch {i}", "switch", self.test_db_path)
+        sensor_ids = [m['id'] for m in database.db_get_available_all_modules(self.test_db_path)]
+
+        stop = threading.Event()
+        writes = [0]
+        errors = []
+
+        def writer():
+            i = 0
+            try:
+                while not stop.is_set():
+                    timestamp = f"2023-01-01 {i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}"
+                    database.db_add_sensor_data(timestamp, sensor_ids[i % len(sensor_ids)], i % 4, self.test_db_path)
+                    writes[0] += 1
+                    i += 1
+            except Exception as e:
+                errors.append(e)
+
+        latencies = []
+        latencies_lock = threading.Lock()
+
+        def reader(n):
+            try:
+                for _ in range(n):
+                    start = time.perf_counter()
+                    database.db_get_available_all_modules(self.test_db_path)
+                    database.db_get_module_current_power_data(self.test_db_path)
+                    elapsed = time.perf_counter() - start
+                    with latencies_lock:
+                        latencies.append(elapsed)
+            except Exception as e:
+                errors.append(e)
+
+        writer_thread = threading.Thread(target=writer)
+        writer_thread.start()
+        readers = [threading.Thread(target=reader, args=(100,)) for _ in range(4)]
+        for thread in readers:
+            thread.start()
+        for thread in readers:
+            thread.join()
+        stop.set()
+        writer_thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(latencies), 400)
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        print(f"\nRead p50 {p50 * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms under {writes[0]} concurrent writes")
+
+        self.assertGreater(writes[0], 0)
+        self.assertLess(p99, 1.0)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
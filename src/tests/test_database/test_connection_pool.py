@@ -0,0 +1,79 @@
+import sqlite3
+import threading
+import unittest
+
+from test_base import DatabaseTestBase
+from src.database import database
+from src.database import connection
+
+class TestConnectionPool(DatabaseTestBase):
+    """Tests for the pooled connection layer."""
+
+    def test_connection_reused_across_calls(self):
+        """Test that repeated queries share one connection."""
+        database.db_add_sensor("pool1", "Pool Sensor", "temp", self.test_db_path)
+        for _ in range(20):
+            database.db_get_available_all_modules(self.test_db_path)
+
+        pool = connection.get_pool(self.test_db_path)
+        self.assertEqual(pool.created, 1)
+
+    def test_pragmas_applied(self):
+        """Test that new connections are in WAL mode with NORMAL sync."""
+        with connection.db_connection(self.test_db_path) as conn:
+            journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+            synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+
+        self.assertEqual(journal_mode.lower(), "wal")
+        self.assertEqual(synchronous, 1)  # NORMAL
+
+    def test_uncommitted_work_rolled_back(self):
+        """Test that a released connection does not keep an open transaction."""
+        sensor_id = database.db_add_sensor("pool2", "Pool Sensor 2", "temp", self.test_db_path)
+
+        with connection.db_connection(self.test_db_path) as conn:
+            conn.execute("INSERT INTO sensor_data VALUES (?, ?, ?)", (sensor_id, "2023-01-01 00:00:00", 1.0))
+
+        with sqlite3.connect(self.test_db_path) as conn:
+            count = conn.execute("SELECT COUNT(*) FROM sensor_data").fetchone()[0]
+        self.assertEqual(count, 0)
+
+        # A write from another connection must not be blocked by a leftover lock
+        database.db_add_sensor_data("2023-01-01 01:00:00", sensor_id, 2.0, self.test_db_path)
+        self.assertEqual(len(database.db_get_sensor_data(sensor_id, days=100000, db_name=self.test_db_path)), 1)
+
+    def test_operational_error_discards_connection(self):
+        """Test that a connection is not reused after an OperationalError."""
+        with self.assertRaises(sqlite3.OperationalError):
+            with connection.db_connection(self.test_db_path) as conn:
+                conn.execute("SELECT * FROM missing_table")
+
+        pool = connection.get_pool(self.test_db_path)
+        self.assertEqual(len(pool._idle), 0)
+
+    def test_connections_shared_between_threads(self):
+        """Test that threads can borrow pooled connections."""
+        sensor_id = database.db_add_sensor("pool3", "Pool Sensor 3", "temp", self.test_db_path)
+
+        def add_data(i):
+            database.db_add_sensor_data(f"2023-01-01 00:{i:02d}:00", sensor_id, i, self.test_db_path)
+
+        threads = [threading.Thread(target=add_data, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        pool = connection.get_pool(self.test_db_path)
+        self.assertLessEqual(pool.created, connection.POOL_MAX_IDLE)
+        self.assertEqual(len(database.db_get_sensor_data(sensor_id, days=100000, db_name=self.test_db_path)), 20)
+
+    def test_close_connections(self):
+        """Test that closing the pool drops idle connections."""
+        database.db_get_available_all_modules(self.test_db_path)
+        database.db_close_connections(self.test_db_path)
+
+        self.assertEqual(connection.get_pool(self.test_db_path).created, 0)
+
+if __name__ == '__main__':
+    unittest.main()
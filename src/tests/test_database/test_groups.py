@@ -0,0 +1,64 @@
+import unittest
+
+from test_base import DatabaseTestBase
+from src.database import database
+from src.database import schema
+from src.database.registry import ModuleRegistry
+from src.database.resilience import DatabaseError
+
+
+class TestModuleGroups(DatabaseTestBase):
+    """Tests for the user-defined module groups of schema version 6."""
+
+    def setUp(self):
+        super().setUp()
+        self.light = database.db_add_sensor("light1", "Living Room Light", "light", self.test_db_path)
+        self.switch = database.db_add_sensor("switch1", "Living Room Switch", "switch", self.test_db_path)
+        database.db_add_sensor("light2", "Kitchen Light", "light", self.test_db_path)
+
+    def test_older_schema(self):
+        """Test that there are no groups before version 6 and setting them fails"""
+        schema.migrate(self.test_db_path, schema.GROUP_SCHEMA_VERSION - 1)
+        self.assertEqual(database.db_get_module_groups(self.test_db_path), {})
+        with self.assertRaises(DatabaseError):
+            database.db_set_module_groups("light1", ["living_room"], self.test_db_path)
+
+    def test_set_and_get(self):
+        """Test that setting the groups of a module replaces its old ones"""
+        schema.migrate(self.test_db_path)
+        self.assertEqual(database.db_set_module_groups("light1", [" living_room", "downstairs", "living_room"],
+                                                       self.test_db_path), ["downstairs", "living_room"])
+        database.db_set_module_groups("switch1", ["living_room"], self.test_db_path)
+        database.db_set_module_groups("light1", ["living_room"], self.test_db_path)
+        self.assertEqual(database.db_get_module_groups(self.test_db_path),
+                         {"light1": ["living_room"], "switch1": ["living_room"]})
+
+        database.db_set_module_groups("switch1", [], self.test_db_path)
+        self.assertEqual(database.db_get_module_groups(self.test_db_path), {"light1": ["living_room"]})
+
+    def test_invalid_names(self):
+        """Test that names that can't be MQTT topic levels are refused"""
+        schema.migrate(self.test_db_path)
+        for name in ["", "  ", "a/b", "room+", "#", "x" * 65]:
+            with self.assertRaises(ValueError):
+                database.db_set_module_groups("light1", [name], self.test_db_path)
+        self.assertEqual(database.db_get_module_groups(self.test_db_path), {})
+
+    def test_registry(self):
+        """Test that the registry resolves the members of a group and reloads when groups change"""
+        schema.migrate(self.test_db_path)
+        registry = ModuleRegistry(self.test_db_path)
+        try:
+            registry.load()
+            self.assertEqual(registry.group_members("living_room"), [])
+            database.db_set_module_groups("light1", ["living_room"], self.test_db_path)
+            database.db_set_module_groups("switch1", ["living_room", "hall"], self.test_db_path)
+            self.assertEqual({mod['id'] for mod in registry.group_members("living_room")}, {self.light, self.switch})
+            self.assertEqual(registry.groups_of("switch1"), ["hall", "living_room"])
+            self.assertEqual(registry.module_groups(), database.db_get_module_groups(self.test_db_path))
+        finally:
+            database.db_remove_module_change_listener(registry._on_module_change)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+import sqlite3
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from test_base import DatabaseTestBase
+from test_schema import CompactSchemaMixin
+from src.database import database
+from src.database.ingest import IngestQueue
+
+class TestIngestQueue(DatabaseTestBase):
+    """Tests for batched sensor data writes and the write-behind ingest queue."""
+
+    def setUp(self):
+        super().setUp()
+        self.sensor_id = database.db_add_sensor("ingest1", "Ingest Light", "light", self.test_db_path)
+
+    def _count_rows(self):
+        with sqlite3.connect(self.test_db_path) as conn:
+            return conn.execute("SELECT COUNT(*) FROM sensor_data").fetchone()[0]
+
+    def _write_batch(self, rows):
+        return database.db_add_sensor_data_batch(rows, self.test_db_path)
+
+    def test_db_add_sensor_data_batch(self):
+        """Test that a batch is inserted and duplicates update in place."""
+        rows = [(f"2023-01-01 00:00:{i:02d}", self.sensor_id, i) for i in range(10)]
+        database.db_add_sensor_data_batch(rows, self.test_db_path)
+        database.db_add_sensor_data_batch([("2023-01-01 00:00:05", self.sensor_id, 3)], self.test_db_path)
+
+        data = dict(database.db_get_sensor_data(self.sensor_id, days=100000, db_name=self.test_db_path))
+        self.assertEqual(len(data), 10)
+        self.assertEqual(data["2023-01-01 00:00:05"], 3)
+
+        with sqlite3.connect(self.test_db_path) as conn:
+            last_val = conn.execute("SELECT last_val FROM sensors WHERE id = ?", (self.sensor_id,)).fetchone()[0]
+        self.assertEqual(float(last_val), 3)
+
+    def test_queue_flushes_by_size(self):
+        """Test that a full batch is written without waiting for the timer."""
+        batches = []
+        def write_batch(rows):
+            batches.append(len(rows))
+            return self._write_batch(rows)
+
+        ingest = IngestQueue(write_batch=write_batch, batch_rows=5, flush_ms=10000)
+        ingest.start()
+        try:
+            ingest.put_many((f"2023-01-01 00:00:{i:02d}", self.sensor_id, i) for i in range(5))
+            self.assertTrue(ingest.flush(timeout=2))
+        finally:
+            ingest.stop()
+
+        self.assertEqual(batches, [5])
+        self.assertEqual(self._count_rows(), 5)
+
+    def test_put_batch_is_one_transaction(self):
+        """Test that rows queued with put_batch are written together, whatever batch_rows is."""
+        batches = []
+        def write_batch(rows):
+            batches.append(len(rows))
+            return self._write_batch(rows)
+
+        ingest = IngestQueue(write_batch=write_batch, batch_rows=5, flush_ms=200)
+        ingest.start()
+        try:
+            ingest.put("2023-01-01 00:00:00", self.sensor_id, 0)
+            self.assertEqual(ingest.put_batch((f"2023-01-01 00:01:{i:02d}", self.sensor_id, i) for i in range(12)), 12)
+            ingest.put("2023-01-01 00:02:00", self.sensor_id, 0)
+            self.assertTrue(ingest.flush(timeout=2))
+        finally:
+            ingest.stop()
+
+        # The single reading queued before the batch joins its transaction
+        self.assertEqual(batches, [13, 1])
+        self.assertEqual(self._count_rows(), 14)
+        self.assertEqual(ingest.stats['enqueued'], 14)
+
+    def test_queue_flushes_by_time(self):
+        """Test that a partial batch is written after flush_ms."""
+        ingest = IngestQueue(write_batch=self._write_batch, batch_rows=1000, flush_ms=50)
+        ingest.start()
+        try:
+            ingest.put("2023-01-01 00:00:00", self.sensor_id, 1)
+            deadline = time.monotonic() + 2
+            while self._count_rows() == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            ingest.stop()
+
+        self.assertEqual(self._count_rows(), 1)
+        self.assertEqual(ingest.stats['batches'], 1)
+
+    def test_stop_flushes_pending_rows(self):
+        """Test that stopping the queue writes everything still queued."""
+        ingest = IngestQueue(write_batch=self._write_batch, batch_rows=1000, flush_ms=10000)
+        ingest.start()
+        ingest.put_many((f"2023-01-01 00:{i // 60:02d}:{i % 60:02d}", self.sensor_id, i % 4) for i in range(300))
+        ingest.stop()
+
+        self.assertEqual(self._count_rows(), 300)
+        self.assertEqual(ingest.pending(), 0)
+
+    def test_backpressure_and_drop(self):
+        """Test that a full queue blocks producers, then drops after put_timeout."""
+        release = threading.Event()
+        def slow_write(rows):
+            release.wait()
+            return self._write_batch(rows)
+
+        ingest = IngestQueue(write_batch=slow_write, batch_rows=1, flush_ms=10, max_size=2, put_timeout=0.1)
+        ingest.start()
+        try:
+            results = [ingest.put(f"2023-01-01 00:00:{i:02d}", self.sensor_id, i) for i in range(6)]
+        finally:
+            release.set()
+            ingest.stop()
+
+        self.assertIn(False, results)
+        self.assertEqual(ingest.stats['dropped'], results.count(False))
+        self.assertEqual(self._count_rows(), results.count(True))
+
+class TestBulkIngest(DatabaseTestBase):
+    """Tests for db_bulk_ingest and the writers built on it."""
+
+    def setUp(self):
+        super().setUp()
+        self.light = database.db_add_sensor("bulk1", "Bulk Light", "light", self.test_db_path)
+        self.temp = database.db_add_sensor("bulk2", "Bulk Temp", "temp", self.test_db_path)
+
+    def _data(self, sensor_id):
+        return dict(database.db_get_sensor_data(sensor_id, days=100000, db_name=self.test_db_path))
+
+    def test_rows_in_chunks(self):
+        """Test that an iterable is written chunk_rows per transaction and duplicates update in place"""
+        rows = ((self.light, f"2023-01-01 00:{i // 60:02d}:{i % 60:02d}", i % 4) for i in range(23))
+        stats = database.db_bulk_ingest(rows, chunk_rows=5, db_name=self.test_db_path)
+        self.assertEqual((stats['rows'], stats['transactions']), (23, 5))
+        self.assertGreater(stats['rows_per_sec'], 0)
+
+        database.db_bulk_ingest([(self.light, "2023-01-01 00:00:05", 3)], db_name=self.test_db_path)
+        data = self._data(self.light)
+        self.assertEqual(len(data), 23)
+        self.assertEqual(data["2023-01-01 00:00:05"], 3)
+        with sqlite3.connect(self.test_db_path) as conn:
+            last_val = conn.execute("SELECT last_val FROM sensors WHERE id = ?", (self.light,)).fetchone()[0]
+        self.assertEqual(float(last_val), 3)
+
+    def test_numpy_arrays(self):
+        """Test columns of NumPy arrays with ts seconds, datetime64 and NaN for NULL"""
+        ts = database._to_ts("2023-01-01 00:00:00") + 60 * np.arange(4)
+        sensor_ids = np.array([self.temp, self.temp, self.light, self.temp])
+        values = np.array([21.5, np.nan, 2, 22.25])
+        self.assertEqual(database.db_bulk_ingest((sensor_ids, ts, values), chunk_rows=3,
+                                                 db_name=self.test_db_path)['rows'], 4)
+        self.assertEqual(self._data(self.temp), {"2023-01-01 00:00:00": 21.5, "2023-01-01 00:01:00": None,
+                                                 "2023-01-01 00:03:00": 22.25})
+        database.db_bulk_ingest((sensor_ids[:1], ts[:1].astype('datetime64[s]'), np.array([19.0])),
+                                db_name=self.test_db_path)
+        self.assertEqual(self._data(self.temp)["2023-01-01 00:00:00"], 19.0)
+
+    def test_synchronous_off(self):
+        """Test that synchronous=OFF only lasts for the bulk load"""
+        modes = []
+        write_readings = database._write_readings
+        def recording_write(cursor, rows):
+            modes.append(cursor.execute("PRAGMA synchronous").fetchone()[0])
+            return write_readings(cursor, rows)
+
+        with patch.object(database, '_write_readings', recording_write):
+            database.db_bulk_ingest([(self.light, "2023-01-01 00:00:00", 1)], synchronous_off=True,
+                                    db_name=self.test_db_path)
+            database.db_bulk_ingest([(self.light, "2023-01-01 00:00:01", 1)], db_name=self.test_db_path)
+        # OFF is 0, the pool's NORMAL is 1
+        self.assertEqual(modes, [0, 1])
+
+    def test_generator_and_predictions(self):
+        """Test the generator's writer with several timestamps and the prediction writers"""
+        timestamps = ["2023-01-01 00:00:00", "2023-01-01 00:05:00", "2023-01-01 00:10:00"]
+        database.db_insert_sensor_data_for_timestamp(timestamps, {'light': [self.light], 'temp': [self.temp]},
+                                                     self.test_db_path)
+        self.assertEqual(list(self._data(self.light)), timestamps)
+        self.assertEqual(list(self._data(self.temp)), timestamps)
+
+        database.db_save_predicted_values({'lights': {'Bulk Light': 2, 'Unknown': 1},
+                                           'temperatures': {'Bulk Temp': 24.5}}, self.test_db_path)
+        self.assertEqual(len(self._data(self.light)), 4)
+        self.assertEqual(list(self._data(self.temp).values())[-1], 24.5)
+
+
+class TestBulkIngestCompact(CompactSchemaMixin, TestBulkIngest):
+    pass
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import shutil
+import sqlite3
+import threading
+import time
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+from test_base import DatabaseTestBase
+from src.database import database
+from src.database import metrics
+from src.database import resilience
+
+
+class TestMetrics(DatabaseTestBase):
+    """Tests for the timing of the db_* functions and the slow query log."""
+
+    def setUp(self):
+        super().setUp()
+        self.sensor_id = database.db_add_sensor("light1", "Living Room Light", "light", self.test_db_path)
+        metrics.reset()
+
+    def tearDown(self):
+        shutil.rmtree(metrics.metrics_dir(self.test_db_path), ignore_errors=True)
+        resilience.reset_breakers()
+        metrics.reset()
+        super().tearDown()
+
+    def functions(self):
+        return metrics.snapshot()['functions']
+
+    def test_histogram(self):
+        """Test the buckets and the quantiles read from them"""
+        histogram = metrics.Histogram((1, 10, 100))
+        for value in [0.5] * 50 + [5] * 45 + [50] * 4 + [500]:
+            histogram.add(value)
+        snapshot = histogram.snapshot()
+        self.assertEqual((snapshot['p50'], snapshot['p95'], snapshot['p99']), (1, 10, 100))
+        self.assertEqual(snapshot['buckets'], {'1': 50, '10': 45, '100': 4, '+inf': 1})
+        self.assertEqual((snapshot['count'], snapshot['max']), (100, 500))
+        self.assertEqual(histogram.quantile(1), 500)
+
+    def test_calls_rows_and_lock(self):
+        """Test that calls, fetched rows and the time the write lock was held are recorded per function"""
+        for _ in range(3):
+            database.db_get_sensors_by_category('light', self.test_db_path)
+        database.db_bulk_ingest([(self.sensor_id, '2024-01-01 00:00:00', 1)], db_name=self.test_db_path)
+
+        functions = self.functions()
+        self.assertNotIn('db_add_sensor', functions)
+        reads = functions['db_get_sensors_by_category']
+        self.assertEqual((reads['calls'], reads['errors']), (3, 0))
+        self.assertEqual(reads['rows']['total'], 3)
+        self.assertEqual(reads['lock_hold']['max'], 0)
+        self.assertGreater(reads['seconds']['total'], 0)
+        writes = functions['db_bulk_ingest']
+        self.assertEqual(writes['calls'], 1)
+        self.assertGreater(writes['lock_hold']['total'], 0)
+
+    def test_lock_wait(self):
+        """Test that the time spent waiting for the write lock is recorded"""
+        database.db_write_lock.acquire()
+        writer = threading.Thread(target=database.db_add_sensor_data_batch,
+                                  args=([('2024-01-01 00:00:00', self.sensor_id, 1)], self.test_db_path))
+        writer.start()
+        time.sleep(0.2)
+        database.db_write_lock.release()
+        writer.join()
+
+        batch = self.functions()['db_add_sensor_data_batch']
+        self.assertGreaterEqual(batch['lock_wait']['max'], 0.15)
+        self.assertLess(batch['lock_hold']['max'], batch['lock_wait']['max'])
+
+    def test_errors(self):
+        """Test that failed calls are counted, retries included in their time"""
+        def broken(*args, **kwargs):
+            raise sqlite3.OperationalError("database is locked")
+
+        with patch.object(database, 'db_retry_policy', resilience.RetryPolicy(rng=lambda: 0.0)), \
+                patch.object(database, 'db_connection', broken):
+            with self.assertRaises(database.DatabaseUnavailable):
+                database.db_get_sensor_types(self.test_db_path)
+        types = self.functions()['db_get_sensor_types']
+        self.assertEqual((types['calls'], types['errors']), (1, 1))
+
+    def test_slow_query_log(self):
+        """Test that slow calls are logged with their statements and query plans"""
+        database.db_add_sensor_data_batch([(datetime.now().strftime('%Y-%m-%d %H:%M:%S'), self.sensor_id, 1)],
+                                          self.test_db_path)
+        database.db_get_sensor_data(self.sensor_id, 7, self.test_db_path)
+        self.assertEqual(metrics.snapshot()['slow_queries'], [])
+
+        with patch.object(metrics, 'SLOW_QUERY_MS', 0):
+            database.db_get_sensor_data(self.sensor_id, 7, self.test_db_path)
+        slow, = metrics.snapshot()['slow_queries']
+        self.assertEqual(slow['function'], 'db_get_sensor_data')
+        self.assertGreaterEqual(slow['rows'], 1)
+        self.assertLessEqual(len(slow['statements']), metrics.SLOW_QUERY_STATEMENTS)
+        plans = [line for statement in slow['statements'] for line in statement['plan']]
+        self.assertTrue(any('sensor_data' in line for line in plans), plans)
+
+    def test_explain(self):
+        """Test plans for statements run with executemany and for statements that can't be explained"""
+        self.assertIn('SEARCH sensors',
+                      metrics.explain(self.test_db_path, "UPDATE sensors SET last_val = ? WHERE id = ?")[0])
+        self.assertTrue(metrics.explain(self.test_db_path, "SELECT * FROM missing_table")[0]
+                        .startswith('not available'))
+
+    def test_export(self):
+        """Test that exported snapshots are read back per process"""
+        database.db_get_sensors_by_category('light', self.test_db_path)
+        metrics.write_export('core', self.test_db_path)
+        exports = metrics.read_exports(self.test_db_path)
+        self.assertEqual(list(exports), ['core'])
+        self.assertEqual(exports['core']['functions']['db_get_sensors_by_category']['calls'], 1)
+
+    def test_disabled(self):
+        """Test that nothing is recorded while metrics are off"""
+        with patch.object(metrics, 'enabled', False):
+            database.db_get_sensors_by_category('light', self.test_db_path)
+        self.assertEqual(self.functions(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,11 @@
 import sqlite3
 import uuid
 from datetime import datetime, timedelta
+import os
+import tempfile
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
 
 from test_base import DatabaseTestBase
 from src.database import database
@@ -84,5 +89,167 @@ class TestDatabasePrediction(DatabaseTestBase):
         self.assertEqual(light_sensors[0], "Living Room Light")
         self.assertEqual(temp_sensors[0], "Living Room Temp")
 
+    def _legacy_data_for_prediction(self, days):
+        """The original per-(timestamp, sensor) query loop, used as the reference output."""
+        conn = sqlite3.connect(self.test_db_path)
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, name, category
+            FROM sensors
+            WHERE category IN ('light', 'temp') AND name IS NOT NULL
+        """)
+        sensors = cursor.fetchall()
+        days_ago = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+        data_dict = {'timestamp': []}
+        for sensor_id, name, category in sensors:
+            data_dict[name] = []
+        cursor.execute("""
+            SELECT DISTINCT sd.timestamp
+            FROM sensor_data sd
+            JOIN sensors s ON sd.sensor_id = s.id
+            WHERE sd.timestamp >= ?
+            AND s.category IN ('light', 'temp')
+            ORDER BY sd.timestamp
+        """, (days_ago,))
+        timestamps = [row[0] for row in cursor.fetchall()]
+        data_dict['timestamp'] = timestamps
+        for ts in timestamps:
+            for sensor_id, name, category in sensors:
+                cursor.execute("SELECT sensor_value FROM sensor_data WHERE sensor_id = ? AND timestamp = ?", (sensor_id, ts))
+                result = cursor.fetchone()
+                data_dict[name].append(result[0] if result else None)
+        conn.close()
+        df = pd.DataFrame(data_dict)
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        df['hour'] = df['timestamp'].dt.hour
+        df['day_of_week'] = df['timestamp'].dt.dayofweek
+        return df
+
+    def _publish(self, messages, dense):
+        """
+        Store (minutes_ago, sensor_id, value) readings like sensor_publish_handler:
+        sparse stores the reading only, dense also copies every other named module's last value.
+        """
+        named = [self.light_sensor_id, self.second_light, self.temp_sensor_id]
+        last_vals = {}
+        for minutes_ago, sensor_id, value in messages:
+            timestamp = (self.now - timedelta(minutes=minutes_ago)).strftime('%Y-%m-%d %H:%M:%S')
+            if dense and sensor_id != self.radar:
+                rows = [(timestamp, mod, value if mod == sensor_id else last_vals.get(mod)) for mod in named]
+            else:
+                rows = [(timestamp, sensor_id, value)]
+            database.db_add_sensor_data_batch(rows, self.test_db_path)
+            last_vals[sensor_id] = value
+
+    def _clear_sensor_data(self):
+        with sqlite3.connect(self.test_db_path) as conn:
+            conn.execute("DELETE FROM sensor_data")
+
+    def _sensor_data_rows(self):
+        with sqlite3.connect(self.test_db_path) as conn:
+            return conn.execute("SELECT COUNT(*) FROM sensor_data").fetchone()[0]
+
+    def test_sparse_readings_match_dense_rows(self):
+        """Test that forward-filled sparse readings give the DataFrame the old dense rows did."""
+        self.second_light = database.db_add_sensor("light2", "Hall Light", "light", self.test_db_path)
+        unnamed_temp = database.db_add_module("temp_unnamed", None, "temp", self.test_db_path)
+        self.radar = database.db_add_sensor("radar1", "Hall Radar", "radar", self.test_db_path)
+        # Off the 15 minute grid, so no reading sits on a window boundary while the test runs
+        self.now = datetime.now().replace(microsecond=0) + timedelta(seconds=30)
+
+        messages = [(4000, self.temp_sensor_id, 30.0)]          # Only known from before the window
+        for i in range(120, 0, -1):
+            minutes_ago = 15 * i
+            messages.append((minutes_ago, self.light_sensor_id, i % 4))
+            if i % 7 == 0:
+                messages.append((minutes_ago + 3, self.temp_sensor_id, 20 + i / 10))
+            if i % 5 == 0:
+                messages.append((minutes_ago, self.second_light, i % 2))     # Same second as another module
+            if i % 11 == 0:
+                messages.append((minutes_ago - 5, self.light_sensor_id, i % 4))  # Repeats its value
+            if i % 13 == 0:
+                messages.append((minutes_ago - 7, unnamed_temp, 21.0))
+            if i % 3 == 0:
+                messages.append((minutes_ago - 1, self.radar, i % 2))     # Not a light/temp timestamp
+        messages.sort(key=lambda message: -message[0])
+
+        self._clear_sensor_data()
+        self._publish(messages, dense=True)
+        dense_rows = self._sensor_data_rows()
+        expected = {days: self._legacy_data_for_prediction(days) for days in (1, 2, 3)}
+
+        # Existing history, migrated
+        deleted = database.db_compact_sensor_data(self.test_db_path)
+        self.assertGreater(deleted, dense_rows // 2)
+        for days in (1, 2, 3):
+            actual = database.db_get_sensor_data_for_prediction(days=days, db_name=self.test_db_path)
+            pd.testing.assert_frame_equal(actual, expected[days])
+        self.assertEqual(database.db_compact_sensor_data(self.test_db_path), 0)
+
+        # New readings, stored sparsely
+        self._clear_sensor_data()
+        self._publish(messages, dense=False)
+        self.assertEqual(self._sensor_data_rows(), len({(m, s) for m, s, _ in messages}))
+        for days in (1, 2, 3):
+            actual = database.db_get_sensor_data_for_prediction(days=days, db_name=self.test_db_path)
+            pd.testing.assert_frame_equal(actual, expected[days])
+
+        all_data = database.db_get_all_sensor_data(days=1, db_name=self.test_db_path)
+        self.assertEqual([value for _, value in all_data["Living Room Temp"]['data']],
+                         expected[1]["Living Room Temp"].tolist())
+        self.assertEqual(len(all_data["Hall Light"]['data']), len(expected[1]))
+
+        matrix = database.db_get_sensor_matrix(days=1, db_name=self.test_db_path)
+        columns = [name for name, _ in matrix['sensors']] + ['hour', 'day_of_week']
+        np.testing.assert_array_equal(matrix['values'], expected[1][columns].values.astype(np.float32))
+
+    def test_db_get_sensor_matrix(self):
+        """Test that the training matrix matches the prediction DataFrame, light sensors first."""
+        temp2 = database.db_add_sensor("temp2", "Hall Temp", "temp", self.test_db_path)
+        light2 = database.db_add_sensor("light2", "Hall Light", "light", self.test_db_path)
+        now = datetime.now().replace(microsecond=0)
+        for i in range(1, 40):
+            timestamp = (now - timedelta(minutes=15 * i)).strftime('%Y-%m-%d %H:%M:%S')
+            database.db_add_sensor_data(timestamp, self.light_sensor_id, i % 4, self.test_db_path)
+            database.db_add_sensor_data(timestamp, temp2, 20 + i / 4, self.test_db_path)
+            if i % 5:
+                database.db_add_sensor_data(timestamp, light2, (i + 2) % 4, self.test_db_path)
+
+        matrix = database.db_get_sensor_matrix(days=1, db_name=self.test_db_path)
+
+        self.assertEqual(matrix['sensors'], [("Living Room Light", "light"), ("Hall Light", "light"),
+                                             ("Living Room Temp", "temp"), ("Hall Temp", "temp")])
+        self.assertEqual(matrix['values'].dtype, np.float32)
+
+        df = database.db_get_sensor_data_for_prediction(days=1, db_name=self.test_db_path)
+        columns = [name for name, _ in matrix['sensors']] + ['hour', 'day_of_week']
+        np.testing.assert_array_equal(matrix['values'], df[columns].values.astype(np.float32))
+        np.testing.assert_array_equal(matrix['timestamps'], df['timestamp'].values.astype('datetime64[s]'))
+        self.assertEqual(matrix['sensor_ids'], [self.light_sensor_id, light2, self.temp_sensor_id, temp2])
+
+        # Streamed in chunks smaller than the window
+        with patch.object(database, 'SENSOR_MATRIX_FETCH_ROWS', 7):
+            chunked = database.db_get_sensor_matrix(days=1, db_name=self.test_db_path)
+        np.testing.assert_array_equal(chunked['values'], matrix['values'])
+        np.testing.assert_array_equal(chunked['timestamps'], matrix['timestamps'])
+
+        # The dict-of-lists wrapper keeps the stored values exactly
+        all_data = database.db_get_all_sensor_data(days=1, db_name=self.test_db_path)
+        self.assertEqual(all_data["Hall Temp"]['id'], temp2)
+        self.assertEqual(all_data["Hall Temp"]['data'][-1], (df['timestamp'].iloc[-1].strftime('%Y-%m-%d %H:%M:%S'), 20.25))
+        self.assertEqual([value for _, value in all_data["Hall Light"]['data']],
+                         [None if np.isnan(value) else value for value in df["Hall Light"]])
+
+        # Same matrix, written to a memory-mapped file
+        out_path = os.path.join(tempfile.mkdtemp(), "matrix.npy")
+        try:
+            mapped = database.db_get_sensor_matrix(days=1, out_path=out_path, db_name=self.test_db_path)
+            self.assertIsInstance(mapped['values'], np.memmap)
+            np.testing.assert_array_equal(mapped['values'], matrix['values'])
+            del mapped
+        finally:
+            os.remove(out_path)
+            os.rmdir(os.path.dirname(out_path))
+
 if __name__ == '__main__':
     unittest.main()
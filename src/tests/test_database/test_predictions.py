@@ -0,0 +1,126 @@
+import sqlite3
+import unittest
+from datetime import datetime, timedelta
+
+from test_base import DatabaseTestBase
+from src.database import database
+from src.database import predictions
+from src.database import schema
+
+
+class TestPredictionHistory(DatabaseTestBase):
+    """Tests for the prediction history and accuracy tables of schema version 5."""
+
+    def setUp(self):
+        super().setUp()
+        self.light = database.db_add_sensor("light1", "Living Room Light", "light", self.test_db_path)
+        self.temp = database.db_add_sensor("temp1", "Living Room Temp", "temp", self.test_db_path)
+        self.now = datetime.now().replace(microsecond=0)
+        schema.migrate(self.test_db_path)
+
+    def at(self, minutes_ago):
+        return (self.now - timedelta(minutes=minutes_ago)).strftime('%Y-%m-%d %H:%M:%S')
+
+    def save(self, minutes_ago, light, temp):
+        database.db_save_predictions(self.at(minutes_ago), {
+            'lights': {'Living Room Light': light},
+            'temperatures': {'Living Room Temp': temp, 'Removed Temp': 20.0},
+        }, self.test_db_path)
+
+    def history(self):
+        with sqlite3.connect(self.test_db_path) as conn:
+            return conn.execute("""
+                SELECT timestamp, sensor_name, actual_value, scored FROM prediction_history
+                ORDER BY timestamp, sensor_name
+            """).fetchall()
+
+    def test_history_and_latest(self):
+        """Test that saves append to the history and the latest set is read through the pointer"""
+        self.save(60, 1, 21.0)
+        self.save(30, 2, 22.0)
+        # A set saved late doesn't move the pointer back
+        self.save(45, 3, 23.0)
+        self.assertEqual(len(self.history()), 9)
+
+        latest = database.db_get_latest_predictions(self.test_db_path)
+        self.assertEqual(latest['timestamp'], self.at(30))
+        self.assertEqual(latest['lights'], {'Living Room Light': 2})
+        self.assertEqual(latest['temperatures'], {'Living Room Temp': 22.0, 'Removed Temp': 20.0})
+        rows = database.db_get_latest_prediction_rows(self.test_db_path)
+        self.assertEqual({row[0] for row in rows}, {self.at(30)})
+        self.assertEqual(len(rows), 3)
+
+    def test_migrate_legacy_predictions(self):
+        """Test that the rows of the old predictions table are moved into the history, already scored"""
+        self.tearDown()
+        super().setUp()
+        database.db_save_predictions('2024-01-01 12:00:00', {
+            'lights': {'Living Room Light': 1}, 'temperatures': {}}, self.test_db_path)
+        schema.migrate(self.test_db_path)
+
+        self.assertEqual(self.history(), [('2024-01-01 12:00:00', 'Living Room Light', None, 1)])
+        self.assertEqual(database.db_get_latest_predictions(self.test_db_path)['timestamp'], '2024-01-01 12:00:00')
+        self.assertEqual(database.db_score_predictions(db_name=self.test_db_path), 0)
+
+    def test_score_predictions(self):
+        """Test that predictions are scored against the value a horizon later, once"""
+        database.db_add_sensor_data_batch([
+            (self.at(100), self.temp, 20.0),
+            (self.at(50), self.temp, 24.0),
+            (self.at(40), self.temp, 26.0),
+            (self.at(100), self.light, 1),
+        ], self.test_db_path)
+        self.save(70, 2, 21.0)   # Scored against the readings as of 55 minutes ago
+        self.save(55, 0, 25.0)   # ... as of 40 minutes ago, the reading at that second counts
+        self.save(5, 1, 30.0)    # Too recent to score
+
+        self.assertEqual(database.db_score_predictions(horizon_seconds=15 * 60, db_name=self.test_db_path), 6)
+        history = self.history()
+        self.assertEqual(history[:3], [(self.at(70), 'Living Room Light', 1.0, 1),
+                                       (self.at(70), 'Living Room Temp', 20.0, 1),
+                                       (self.at(70), 'Removed Temp', None, 1)])
+        self.assertEqual(history[4][2:], (26.0, 1))
+        self.assertEqual([row[3] for row in history[6:]], [0, 0, 0])
+
+        accuracy = database.db_get_prediction_accuracy(self.test_db_path)
+        # A sensor without readings to compare against is scored but not counted
+        self.assertEqual(set(accuracy), {'Living Room Light', 'Living Room Temp'})
+        temp = accuracy['Living Room Temp']
+        self.assertEqual(temp['count'], 2)
+        self.assertAlmostEqual(temp['mae'], 1.0)
+        self.assertAlmostEqual(temp['rmse'], 1.0)
+        self.assertEqual(temp['last_timestamp'], self.at(55))
+        self.assertEqual(accuracy['Living Room Light']['mae'], 1.0)
+
+        # Nothing is rescored
+        self.assertEqual(database.db_score_predictions(horizon_seconds=15 * 60, db_name=self.test_db_path), 0)
+        self.assertEqual(database.db_get_prediction_accuracy(self.test_db_path), accuracy)
+
+    def test_score_in_batches(self):
+        """Test that scoring in small batches gives the same running metrics"""
+        database.db_add_sensor_data_batch([(self.at(200), self.temp, 20.0)], self.test_db_path)
+        errors = [0.5, 3.0, 1.0, 2.0]
+        for i, error in enumerate(errors):
+            self.save(100 - i, 1, 20.0 + error)
+        self.assertEqual(database.db_score_predictions(batch_rows=2, db_name=self.test_db_path), 12)
+
+        temp = database.db_get_prediction_accuracy(self.test_db_path)['Living Room Temp']
+        self.assertEqual(temp['count'], 4)
+        self.assertAlmostEqual(temp['mae'], sum(errors) / 4)
+        self.assertAlmostEqual(temp['rmse'], (sum(e * e for e in errors) / 4) ** 0.5)
+        rolling = errors[0]
+        for error in errors[1:]:
+            rolling += predictions.PREDICTION_ERROR_ALPHA * (error - rolling)
+        self.assertAlmostEqual(temp['rolling_mae'], rolling)
+
+    def test_without_history(self):
+        """Test that scoring does nothing before schema version 5"""
+        self.tearDown()
+        super().setUp()
+        self.save(60, 1, 21.0)
+        self.assertEqual(database.db_score_predictions(db_name=self.test_db_path), 0)
+        self.assertEqual(database.db_get_prediction_accuracy(self.test_db_path), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import sqlite3
+import unittest
+import uuid
+from unittest.mock import patch
+
+from test_base import DatabaseTestBase
+from src.database import database
+from src.database.registry import ModuleRegistry
+
+class TestModuleRegistry(DatabaseTestBase):
+    """Tests for the in-memory module registry."""
+
+    def setUp(self):
+        super().setUp()
+        self.light_id = database.db_add_module("light1", "Living Room Light", "light", self.test_db_path)
+        self.temp_id = database.db_add_module("temp1", "Living Room Temp", "temp", self.test_db_path)
+        self.switch_id = database.db_add_module("switch1", "Kitchen Switch", "switch", self.test_db_path)
+        self.new_id = database.db_add_module("new1", None, "light", self.test_db_path)
+        self.registry = ModuleRegistry(self.test_db_path)
+        self.registry.load()
+
+    def tearDown(self):
+        database.db_remove_module_change_listener(self.registry._on_module_change)
+        super().tearDown()
+
+    def test_indexes(self):
+        """Test lookups by client_id, id, name and category."""
+        self.assertEqual(self.registry.get_id("light1"), self.light_id)
+        self.assertEqual(self.registry.get_id("new1"), self.new_id)  # Unnamed modules resolve too
+        self.assertIsNone(self.registry.get_id("missing"))
+        self.assertEqual(self.registry.get_by_id(self.temp_id)['client_id'], "temp1")
+        self.assertEqual(self.registry.get_by_name("Kitchen Switch")['category'], "switch")
+
+        self.assertEqual({m['id'] for m in self.registry.by_category('temp', 'light')}, {self.light_id, self.temp_id})
+        self.assertEqual([m['id'] for m in self.registry.by_category('switch')], [self.switch_id])
+        self.assertEqual(len(self.registry.named()), len(database.db_get_available_all_modules(self.test_db_path)))
+
+    def test_no_sql_on_lookup(self):
+        """Test that cached lookups do not query the database."""
+        with patch('src.database.registry.db_get_available_all_modules') as mock_named:
+            for _ in range(100):
+                self.registry.get_id("light1")
+                self.registry.by_category('temp', 'light')
+                self.registry.get_by_name("Living Room Light")
+            mock_named.assert_not_called()
+        self.assertEqual(self.registry.loads, 1)
+
+    def test_invalidated_by_module_changes(self):
+        """Test that add, assign, replace and delete refresh the registry."""
+        database.db_assign_module("new1", "Hall Light", self.test_db_path)
+        self.assertEqual(self.registry.get_by_name("Hall Light")['id'], self.new_id)
+
+        database.db_add_module("placeholder", None, "light", self.test_db_path)
+        database.db_replace_module(self.light_id, "placeholder", self.test_db_path)
+        self.assertEqual(self.registry.get_id("placeholder"), self.light_id)
+        self.assertIsNone(self.registry.get_id("light1"))
+
+        database.db_delete_module(self.switch_id, self.test_db_path)
+        self.assertIsNone(self.registry.get_by_name("Kitchen Switch"))
+
+    def test_external_change_after_invalidate(self):
+        """Test that a change made by another process shows up after invalidate()."""
+        other_id = str(uuid.uuid4())
+        with sqlite3.connect(self.test_db_path) as conn:
+            conn.execute("INSERT INTO sensors VALUES (?, ?, ?, ?, ?)", (other_id, "door1", "Front Door", "door", None))
+
+        self.assertIsNone(self.registry.get_id("door1"))
+        self.registry.invalidate()
+        self.assertEqual(self.registry.get_id("door1"), other_id)
+
+    def test_max_age_reload(self):
+        """Test that the registry reloads once it is older than max_age."""
+        registry = ModuleRegistry(self.test_db_path, max_age=0)
+        try:
+            registry.get_id("light1")
+            registry.get_id("light1")
+            self.assertEqual(registry.loads, 2)
+        finally:
+            database.db_remove_module_change_listener(registry._on_module_change)
+
+    def test_last_val_kept_across_reload(self):
+        """Test that in-memory last values survive a reload."""
+        self.registry.set_last_val(self.light_id, 3)
+        self.registry.invalidate()
+        self.assertEqual(self.registry.get("light1")['last_val'], 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,246 @@
+import os
+import sqlite3
+import unittest
+import uuid
+from unittest.mock import patch
+
+from test_base import DatabaseTestBase
+from src.database import database
+from src.database import resilience
+from src.database.ingest import IngestQueue
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Tests for the retry policy and the circuit breaker."""
+
+    def setUp(self):
+        self.clock = Clock()
+        self.breaker = resilience.CircuitBreaker(failure_threshold=3, reset_seconds=10, clock=self.clock)
+        self.sleeps = []
+
+    def call(self, function, attempts=2):
+        policy = resilience.RetryPolicy(attempts=attempts, base_seconds=1, max_seconds=3, rng=lambda: 1.0)
+        return resilience.call(function, self.breaker, policy, sleep=self.sleeps.append)
+
+    def fail(self):
+        raise sqlite3.OperationalError("database is locked")
+
+    def test_backoff(self):
+        """Test that the delays double up to the maximum, scaled by the jitter"""
+        policy = resilience.RetryPolicy(base_seconds=0.5, max_seconds=3, rng=lambda: 1.0)
+        self.assertEqual([policy.delay(n) for n in range(1, 6)], [0.5, 1, 2, 3, 3])
+        self.assertEqual(resilience.RetryPolicy(rng=lambda: 0.25).delay(3), 0.1)
+
+    def test_retry_then_succeed(self):
+        """Test that a transient failure is retried and a success resets the count"""
+        results = iter([sqlite3.OperationalError("database is locked"), 'ok'])
+
+        def function():
+            result = next(results)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        self.assertEqual(self.call(function), 'ok')
+        self.assertEqual(self.sleeps, [1])
+        self.assertEqual((self.breaker.state, self.breaker.failures), (resilience.CLOSED, 0))
+
+    def test_open_half_open_closed(self):
+        """Test that failures open the breaker, calls then fail fast until a trial call succeeds"""
+        with self.assertRaises(resilience.DatabaseUnavailable):
+            self.call(self.fail)
+        with self.assertRaises(resilience.DatabaseUnavailable):
+            self.call(self.fail)
+        self.assertEqual(self.breaker.state, resilience.OPEN)
+        # The second call stopped at the third failure, when the breaker opened
+        self.assertEqual(self.sleeps, [1])
+
+        calls = []
+        with self.assertRaises(resilience.DatabaseUnavailable):
+            self.call(lambda: calls.append(1))
+        self.assertEqual(calls, [])
+        self.assertEqual(self.breaker.retry_in(), 10)
+
+        # A failed trial opens it again at once
+        self.clock.now = 10
+        with self.assertRaises(resilience.DatabaseUnavailable):
+            self.call(self.fail)
+        self.assertEqual(len(self.sleeps), 1)
+        self.assertEqual(self.breaker.state, resilience.OPEN)
+
+        self.clock.now = 20
+        self.assertTrue(self.breaker.allow())
+        # Only one trial at a time
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.call(lambda: 'ok'), 'ok')
+
+    def test_other_errors(self):
+        """Test that errors other than OperationalError pass through and end a trial"""
+        with self.assertRaises(KeyError):
+            self.call(lambda: {}['missing'])
+        self.assertEqual(self.breaker.failures, 0)
+
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.clock.now = 10
+        with self.assertRaises(KeyError):
+            self.call(lambda: {}['missing'])
+        self.assertEqual(self.breaker.state, resilience.HALF_OPEN)
+        self.assertTrue(self.breaker.allow())
+
+
+class TestDatabaseResilience(DatabaseTestBase):
+    """Tests for the retries of the db_* functions and the ingest backlog."""
+
+    def setUp(self):
+        super().setUp()
+        self.sensor_id = database.db_add_sensor("light1", "Living Room Light", "light", self.test_db_path)
+        # No waiting between attempts
+        self.policy = patch.object(database, 'db_retry_policy', resilience.RetryPolicy(rng=lambda: 0.0))
+        self.policy.start()
+
+    def tearDown(self):
+        self.policy.stop()
+        resilience.reset_breakers()
+        super().tearDown()
+
+    def failing_connection(self, failures):
+        """db_connection that raises OperationalError the first failures times it is used"""
+        real = database.db_connection
+        calls = []
+
+        def connection(db_name, **kwargs):
+            calls.append(db_name)
+            if len(calls) <= failures:
+                raise sqlite3.OperationalError("database is locked")
+            return real(db_name, **kwargs)
+        return connection, calls
+
+    def test_retry_without_recursion(self):
+        """Test that a db_* call is retried after a failure and returns its result"""
+        connection, calls = self.failing_connection(2)
+        with patch.object(database, 'db_connection', connection):
+            self.assertEqual(database.db_get_sensors_by_category('light', self.test_db_path),
+                             {'Living Room Light': self.sensor_id})
+        self.assertEqual(len(calls), 3)
+
+    def test_fail_fast_while_unavailable(self):
+        """Test that a broken database raises DatabaseUnavailable, then fails without trying"""
+        bad_db = os.path.join("/nonexistent_dir_" + str(uuid.uuid4()), "database.db")
+        connection, calls = self.failing_connection(100)
+        with patch.object(database, 'db_connection', connection):
+            with self.assertRaises(database.DatabaseUnavailable):
+                database.db_get_available_all_modules(bad_db)
+            self.assertEqual(len(calls), resilience.RETRY_ATTEMPTS)
+            with self.assertRaises(database.DatabaseUnavailable):
+                database.db_get_available_all_modules(bad_db)
+            self.assertEqual(len(calls), resilience.BREAKER_FAILURE_THRESHOLD)
+            with self.assertRaises(database.DatabaseUnavailable):
+                database.db_get_available_all_modules(bad_db)
+            self.assertEqual(len(calls), resilience.BREAKER_FAILURE_THRESHOLD)
+
+        # Other databases are not affected
+        self.assertEqual(len(database.db_get_available_all_modules(self.test_db_path)), 1)
+
+    def test_bulk_ingest_resumes(self):
+        """Test that a retried bulk ingest carries on from the chunk that failed"""
+        real = database._write_readings
+        calls = []
+
+        def write_readings(cursor, rows):
+            calls.append(len(rows))
+            if len(calls) == 2:
+                raise sqlite3.OperationalError("database is locked")
+            return real(cursor, rows)
+
+        rows = ((self.sensor_id, f"2024-01-01 00:{i // 60:02d}:{i % 60:02d}", i) for i in range(25))
+        with patch.object(database, '_write_readings', write_readings):
+            result = database.db_bulk_ingest(rows, chunk_rows=10, db_name=self.test_db_path)
+        self.assertEqual(calls, [10, 10, 10, 5])
+        self.assertEqual((result['rows'], result['transactions']), (25, 3))
+        self.assertEqual(len(database.db_get_sensor_data(self.sensor_id, 100000, self.test_db_path)), 25)
+
+    def test_ingest_backlog(self):
+        """Test that the ingest queue keeps readings while the database is down and replays them in order"""
+        down = [True]
+        written = []
+
+        def write_batch(rows):
+            if down[0]:
+                raise database.DatabaseUnavailable("Database unavailable")
+            written.extend(rows)
+
+        ingest = IngestQueue(write_batch=write_batch, batch_rows=3, flush_ms=10, replay_seconds=0.05,
+                             backlog_rows=8)
+        ingest.start()
+        try:
+            rows = [(f"2024-01-01 00:00:{i:02d}", self.sensor_id, i) for i in range(10)]
+            self.assertEqual(ingest.put_many(rows[:5]), 5)
+            self.assertTrue(ingest.flush(timeout=2))
+            self.assertEqual(ingest.backlog(), 5)
+            self.assertEqual(ingest.put_many(rows[5:]), 5)
+            self.assertTrue(ingest.flush(timeout=2))
+            # The oldest readings make room
+            self.assertEqual(ingest.backlog(), 8)
+            self.assertEqual(ingest.stats['dropped'], 2)
+
+            # Newer readings join the backlog until it has been replayed
+            down[0] = False
+            ingest.put_many([("2024-01-01 00:01:00", self.sensor_id, 10)])
+            self.assertTrue(ingest.flush(timeout=2))
+        finally:
+            ingest.stop()
+
+        self.assertEqual(written, rows[3:] + [("2024-01-01 00:01:00", self.sensor_id, 10)])
+        self.assertEqual(ingest.backlog(), 0)
+        self.assertEqual((ingest.stats['dropped'], ingest.stats['replayed']), (3, 8))
+
+    def test_ingest_backlog_keeps_batches(self):
+        """Test that a backlogged put_batch larger than batch_rows is replayed in one transaction"""
+        down = [True]
+        batches = []
+
+        def write_batch(rows):
+            if down[0]:
+                raise database.DatabaseUnavailable("Database unavailable")
+            batches.append(list(rows))
+
+        ingest = IngestQueue(write_batch=write_batch, batch_rows=3, flush_ms=10, replay_seconds=0.05,
+                             backlog_rows=6)
+        ingest.start()
+        try:
+            rows = [(f"2024-01-01 00:00:{i:02d}", self.sensor_id, i) for i in range(9)]
+            self.assertEqual(ingest.put_batch(rows[:5]), 5)
+            self.assertTrue(ingest.flush(timeout=2))
+            self.assertEqual(ingest.backlog(), 5)
+
+            # The newer reading waits for the batch, written on its own
+            down[0] = False
+            ingest.put_many([rows[5]])
+            self.assertTrue(ingest.flush(timeout=2))
+        finally:
+            ingest.stop()
+
+        self.assertEqual(batches, [rows[:5], [rows[5]]])
+        self.assertEqual(ingest.stats['replayed'], 6)
+
+        # A full backlog drops a put_batch whole, not its oldest rows
+        down[0] = True
+        ingest = IngestQueue(write_batch=write_batch, batch_rows=3, flush_ms=10, backlog_rows=6)
+        ingest.put_batch(rows[:5])
+        ingest.put_batch(rows[5:9])
+        ingest.flush()
+        self.assertEqual((ingest.backlog(), ingest.stats['dropped']), (4, 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import sqlite3
+import unittest
+from datetime import datetime, timedelta
+
+from test_base import DatabaseTestBase
+from src.database import database
+from src.database import schema
+
+
+class TestRollups(DatabaseTestBase):
+    """Tests for the hourly and daily rollups of schema version 3."""
+
+    def setUp(self):
+        super().setUp()
+        self.light = database.db_add_sensor("light1", "Living Room Light", "light", self.test_db_path)
+        self.temp = database.db_add_sensor("temp1", "Living Room Temp", "temp", self.test_db_path)
+        schema.migrate(self.test_db_path)
+        self.now = datetime.now().replace(microsecond=0)
+
+    def timestamp(self, minutes_ago):
+        return (self.now - timedelta(minutes=minutes_ago)).strftime('%Y-%m-%d %H:%M:%S')
+
+    def rollups(self):
+        with sqlite3.connect(self.test_db_path) as conn:
+            return conn.execute("SELECT * FROM rollups ORDER BY resolution, sensor_key, bucket").fetchall()
+
+    def assert_rollups_current(self):
+        """The incrementally maintained rollups equal the ones rebuilt from the readings"""
+        maintained = self.rollups()
+        self.assertTrue(database.db_rebuild_rollups(self.test_db_path))
+        self.assertEqual(maintained, self.rollups())
+        return maintained
+
+    def test_writers_maintain_rollups(self):
+        """Test the batch writer, the single writer and the generator's writer"""
+        # Values are multiples of 1/2, so the sums don't depend on the order they are added in
+        database.db_add_sensor_data_batch([(self.timestamp(10 * i), self.temp, 20 + (i % 8) / 2)
+                                           for i in range(300, 0, -1)], self.test_db_path)
+        maintained = self.assert_rollups_current()
+        self.assertEqual(sum(row[3] for row in maintained if row[0] == 86400), 300)
+
+        # Readings newer and older than the rollups, and a NULL value
+        database.db_add_sensor_data(self.timestamp(0), self.temp, 30, self.test_db_path)
+        database.db_add_sensor_data(self.timestamp(10 * 400), self.temp, 10, self.test_db_path)
+        database.db_add_sensor_data(self.timestamp(5), self.light, None, self.test_db_path)
+        self.assert_rollups_current()
+
+        database.db_insert_sensor_data_for_timestamp(self.timestamp(1), {'light': [self.light]}, self.test_db_path)
+        self.assert_rollups_current()
+
+    def test_overwrites_rebuild_buckets(self):
+        """Test that replaced readings leave no trace in their buckets"""
+        database.db_add_sensor_data_batch([(self.timestamp(i), self.light, 1) for i in range(60)], self.test_db_path)
+
+        # Overwrite the maximum, twice in one batch
+        database.db_add_sensor_data_batch([(self.timestamp(0), self.light, 3), (self.timestamp(0), self.light, 0)],
+                                          self.test_db_path)
+        database.db_add_sensor_data(self.timestamp(1), self.light, 2, self.test_db_path)
+        maintained = self.assert_rollups_current()
+        day = [row for row in maintained if row[0] == 86400]
+        self.assertEqual(sum(row[3] for row in day), 60)
+        self.assertEqual(max(row[6] for row in day), 2)
+
+    def test_compaction_rebuilds_buckets(self):
+        """Test that db_compact_sensor_data takes the copies out of the rollups"""
+        database.db_add_sensor_data_batch([(self.timestamp(i), self.light, i // 10) for i in range(60)], self.test_db_path)
+        database.db_add_sensor_data_batch([(self.timestamp(i), self.temp, 21) for i in range(60)], self.test_db_path)
+        deleted = database.db_compact_sensor_data(self.test_db_path)
+        self.assertGreater(deleted, 0)
+        maintained = self.assert_rollups_current()
+        self.assertEqual(sum(row[3] for row in maintained if row[0] == 86400), 120 - deleted)
+
+    def test_history_resolution(self):
+        """Test that db_get_sensor_history picks the finest resolution within the point budget"""
+        rows = [(self.timestamp(10 * i), self.temp, 20 + i % 2) for i in range(10 * 24 * 6, 0, -1)]
+        database.db_add_sensor_data_batch(rows, self.test_db_path)
+
+        history = database.db_get_sensor_history(self.temp, days=1, max_points=200, db_name=self.test_db_path)
+        self.assertEqual(history['resolution'], 'raw')
+        self.assertEqual(history['data'][-1][1:], (21.0, 21.0, 21.0, 1, 21.0))
+        self.assertEqual([row[0] for row in history['data']],
+                         [timestamp for timestamp, _ in database.db_get_sensor_data(self.temp, 1, self.test_db_path)])
+
+        history = database.db_get_sensor_history(self.temp, days=7, max_points=200, db_name=self.test_db_path)
+        self.assertEqual(history['resolution'], 'hour')
+        self.assertLessEqual(len(history['data']), 200)
+        full_hours = [row for row in history['data'][1:-1]]
+        self.assertTrue(all(row[4] == 6 and row[1] == 20.5 and (row[2], row[3]) == (20, 21) for row in full_hours))
+
+        history = database.db_get_sensor_history(self.temp, days=10, max_points=100, db_name=self.test_db_path)
+        self.assertEqual(history['resolution'], 'day')
+        self.assertEqual(sum(row[4] for row in history['data']), len(rows))
+        self.assertEqual(history['data'][-1][5], 21.0)
+
+        # Nothing fits, the coarsest rollup is returned
+        history = database.db_get_sensor_history(self.temp, days=10, max_points=1, db_name=self.test_db_path)
+        self.assertEqual(history['resolution'], 'day')
+
+    def test_history_without_rollups(self):
+        """Test that databases before schema version 3 return the readings"""
+        self.tearDown()
+        DatabaseTestBase.setUp(self)
+        sensor = database.db_add_sensor("temp1", "Living Room Temp", "temp", self.test_db_path)
+        database.db_add_sensor_data_batch([(self.timestamp(i), sensor, 20) for i in range(50)], self.test_db_path)
+        self.assertFalse(database.db_rebuild_rollups(self.test_db_path))
+
+        history = database.db_get_sensor_history(sensor, days=1, max_points=10, db_name=self.test_db_path)
+        self.assertEqual(history['resolution'], 'raw')
+        self.assertEqual(len(history['data']), 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
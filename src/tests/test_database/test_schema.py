@@ -0,0 +1,143 @@
+import sqlite3
+import unittest
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from test_base import DatabaseTestBase
+import test_database_core
+import test_prediction
+from src.database import database
+from src.database import schema
+
+
+class CompactSchemaMixin:
+    """Runs a test case against a database migrated to the newest schema after its setUp."""
+    def setUp(self):
+        super().setUp()
+        self.assertEqual(schema.migrate(self.test_db_path), list(range(2, schema.SCHEMA_VERSION + 1)))
+
+
+class TestDatabaseCoreCompact(CompactSchemaMixin, test_database_core.TestDatabaseCore):
+    pass
+
+
+class TestDatabasePredictionCompact(CompactSchemaMixin, test_prediction.TestDatabasePrediction):
+    pass
+
+
+class TestCompactSchema(DatabaseTestBase):
+    """Tests for the migration to the compact sensor_data layout."""
+
+    def setUp(self):
+        super().setUp()
+        self.light = database.db_add_sensor("light1", "Living Room Light", "light", self.test_db_path)
+        self.temp = database.db_add_sensor("temp1", "Living Room Temp", "temp", self.test_db_path)
+        self.radar = database.db_add_sensor("radar1", "Hall Radar", "radar", self.test_db_path)
+        now = datetime.now().replace(microsecond=0)
+        rows = []
+        for i in range(100, 0, -1):
+            timestamp = (now - timedelta(minutes=20 * i)).strftime('%Y-%m-%d %H:%M:%S')
+            rows.append((timestamp, self.light, i % 4))
+            if i % 3 == 0:
+                rows.append((timestamp, self.temp, 20 + i / 10))
+            if i % 2 == 0:
+                rows.append((timestamp, self.radar, i % 2))
+        database.db_add_sensor_data_batch(rows, self.test_db_path)
+        self.timestamp = rows[-1][0]
+
+    def snapshot(self):
+        """Everything the db_* read functions return for the test data."""
+        return {
+            'sensor_data': database.db_get_sensor_data(self.light, 1, self.test_db_path),
+            'all_sensor_data': database.db_get_all_sensor_data(2, self.test_db_path),
+            'prediction': database.db_get_sensor_data_for_prediction(1, self.test_db_path),
+            'matrix': database.db_get_sensor_matrix(2, db_name=self.test_db_path),
+            'recent': database.db_get_recent_timestamps(10, self.test_db_path),
+            'since': database.db_get_timestamps_since(1, self.test_db_path),
+            'readings': sorted(database.db_get_sensor_readings_for_timestamp(self.timestamp, self.test_db_path)),
+        }
+
+    def assert_same_snapshot(self, before, after):
+        pd.testing.assert_frame_equal(after.pop('prediction'), before.pop('prediction'))
+        matrix_before, matrix_after = before.pop('matrix'), after.pop('matrix')
+        self.assertEqual(matrix_after['sensors'], matrix_before['sensors'])
+        np.testing.assert_array_equal(matrix_after['values'], matrix_before['values'])
+        self.assertEqual(after, before)
+
+    def test_migration_keeps_results(self):
+        """Test that the db_* functions return the same data after the migration"""
+        before = self.snapshot()
+        self.assertEqual(len(before['recent']), 10)
+
+        self.assertEqual(schema.migrate(self.test_db_path, schema.COMPACT_SCHEMA_VERSION), [2])
+        self.assert_same_snapshot(dict(before), self.snapshot())
+        self.assertEqual(schema.migrate(self.test_db_path), list(range(3, schema.SCHEMA_VERSION + 1)))
+        self.assert_same_snapshot(before, self.snapshot())
+
+        # Already migrated
+        self.assertEqual(schema.migrate(self.test_db_path), [])
+
+    def test_compact_layout(self):
+        """Test the tables and the index the migration creates"""
+        schema.migrate(self.test_db_path, schema.COMPACT_SCHEMA_VERSION)
+        with sqlite3.connect(self.test_db_path) as conn:
+            self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], 2)
+            objects = dict(conn.execute("SELECT name, type FROM sqlite_master WHERE name NOT LIKE 'sqlite_%'"))
+            self.assertEqual(objects['sensor_data'], 'view')
+            self.assertEqual(objects['readings_ts'], 'index')
+            readings_sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'readings'").fetchone()[0]
+            self.assertIn('WITHOUT ROWID', readings_sql)
+            self.assertEqual(conn.execute("SELECT typeof(ts), typeof(sensor_key) FROM readings LIMIT 1").fetchone(),
+                             ('integer', 'integer'))
+
+            # Time-range scans are served by the covering index
+            plan = ' '.join(row[-1] for row in conn.execute(
+                "EXPLAIN QUERY PLAN SELECT ts, sensor_key, sensor_value FROM readings WHERE ts >= 0 ORDER BY ts"))
+            self.assertIn('COVERING INDEX readings_ts', plan)
+
+    def test_writes_after_migration(self):
+        """Test the batch writer, the single writer and raw SQL on the view"""
+        schema.migrate(self.test_db_path, schema.COMPACT_SCHEMA_VERSION)
+        new_sensor = database.db_add_sensor("light2", "Hall Light", "light", self.test_db_path)
+
+        # Upsert, a new sensor gets a key, readings without a sensor are skipped
+        written = database.db_add_sensor_data_batch([
+            (self.timestamp, self.light, 3),
+            (self.timestamp, new_sensor, 1),
+            (self.timestamp, None, 1),
+        ], self.test_db_path)
+        self.assertEqual(written, 2)
+        readings = dict((name, value) for name, value, _ in
+                        database.db_get_sensor_readings_for_timestamp(self.timestamp, self.test_db_path))
+        self.assertEqual(readings['Living Room Light'], 3)
+        self.assertEqual(readings['Hall Light'], 1)
+
+        database.db_add_sensor_data(self.timestamp, new_sensor, 2, self.test_db_path)
+        database.db_add_sensor_data("2024-01-01 12:00:00", new_sensor, 0, self.test_db_path)
+        with sqlite3.connect(self.test_db_path) as conn:
+            self.assertEqual(conn.execute("SELECT sensor_value FROM sensor_data WHERE sensor_id = ? AND timestamp = ?",
+                                          (new_sensor, self.timestamp)).fetchone()[0], 2)
+            self.assertEqual(conn.execute("SELECT last_val FROM sensors WHERE id = ?", (new_sensor,)).fetchone()[0], '0.0')
+
+            # The view keeps the table's primary key behavior
+            with self.assertRaises(sqlite3.IntegrityError):
+                conn.execute("INSERT INTO sensor_data VALUES (?, ?, ?)", (new_sensor, "2024-01-01 12:00:00", 5))
+            conn.execute("INSERT OR REPLACE INTO sensor_data VALUES (?, ?, ?)", (new_sensor, "2024-01-01 12:00:00", 5))
+            conn.execute("DELETE FROM sensor_data WHERE sensor_id = ? AND timestamp = ?", (new_sensor, self.timestamp))
+            rows = conn.execute("SELECT timestamp, sensor_value FROM sensor_data WHERE sensor_id = ?", (new_sensor,)).fetchall()
+        self.assertEqual(rows, [("2024-01-01 12:00:00", 5.0)])
+
+    def test_compaction_after_migration(self):
+        """Test db_compact_sensor_data on the compact layout"""
+        # A copy of the last temperature next to the newest light reading
+        database.db_add_sensor_data_batch([(self.timestamp, self.temp, 20.3)], self.test_db_path)
+        schema.migrate(self.test_db_path, schema.COMPACT_SCHEMA_VERSION)
+        before = database.db_get_sensor_data_for_prediction(1, self.test_db_path)
+        self.assertEqual(database.db_compact_sensor_data(self.test_db_path), 1)
+        pd.testing.assert_frame_equal(database.db_get_sensor_data_for_prediction(1, self.test_db_path), before)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+import sys
+import os
+
+# Get the absolute path to the directory containing this file
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Add the parent directory to the path so Python can find the test modules
+sys.path.insert(0, current_dir)
+
+# Import all test modules with absolute imports
+from test_compact import TestCompact
+from test_group_fanout import TestGroupFanout
+
+def run_all_tests():
+    """Run all sensor tests."""
+    # Create a test suite
+    test_suite = unittest.TestSuite()
+
+    # Add test cases from each module
+    test_suite.addTest(unittest.makeSuite(TestCompact))
+    test_suite.addTest(unittest.makeSuite(TestGroupFanout))
+
+    # Create a test runner
+    test_runner = unittest.TextTestRunner(verbosity=2)
+
+    # Run the tests
+    result = test_runner.run(test_suite)
+
+    # Return the result
+    return result
+
+if __name__ == '__main__':
+    # Run all tests
+    result = run_all_tests()
+
+    # Exit with appropriate code
+    sys.exit(not result.wasSuccessful())
@@ -0,0 +1,86 @@
+import json
+import unittest
+import os
+import sys
+from unittest.mock import patch
+
+# Add the src directory to the path so we can import the modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from sensor import compact, payload
+from sensor.topics import T_SENSOR_PUBLISH, T_SENSOR_PUBLISH_COMPACT
+from utils.utils import get_localtime
+
+ESP32_COMPACT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../esp32-modules/src/esp-smart-light'))
+
+
+class TestCompact(unittest.TestCase):
+    """Tests for the compact binary form of the sensor/publish messages."""
+
+    def setUp(self):
+        # The MessagePack subset of the module, msgpack or not
+        patcher = patch.object(compact, 'msgpack', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_round_trip(self):
+        """Test that both payload versions decode to the same dicts as JSON, with epoch times"""
+        single = {"type": "light", "time": "2025-05-01 12:00:00", "client_id": "L-21.09-0001", "data": 3,
+                  "power": 30}
+        message = compact.encode(single)
+        self.assertEqual(compact.decode(message), dict(single, time=1746100800))
+        self.assertLess(len(message), len(json.dumps(single)) / 2)
+
+        batch = payload.batch('temp', 'T-1', [{"time": 1746100800 + i, "data": 20 + i / 8} for i in range(40)])
+        self.assertEqual(compact.decode(compact.encode(batch)), batch)
+
+    def test_types(self):
+        """Test the MessagePack encodings of the subset"""
+        values = [None, True, False, 0, 127, 128, 65535, 70000, 2 ** 40, -1, -33, -200, -40000, -2 ** 40,
+                  22.5, 24.37, "", "x" * 40, "y" * 300, b"\x00\xff", list(range(20)), {"k": [1, {"n": None}]},
+                  {str(i): i for i in range(20)}]
+        for value in values:
+            out = []
+            compact._pack(value, out)
+            data = b''.join(out)
+            self.assertEqual(compact._unpack(data, 0), (value, len(data)), value)
+        # Known bytes from the MessagePack specification
+        self.assertEqual(compact.encode({"data": -1}), b'\x81\xa1d\xff')
+
+    def test_invalid(self):
+        """Test that truncated and non-map messages are refused"""
+        message = compact.encode({"type": "temp", "data": 21.5})
+        with self.assertRaises(Exception):
+            compact.decode(message[:-3])
+        with self.assertRaises(ValueError):
+            compact.decode(message + b'\xc0')
+        with self.assertRaises(ValueError):
+            compact.decode(b'\x93\x01\x02\x03')
+
+    def test_decode_by_topic(self):
+        """Test that the topic says which form a message is in, and both give the same local time"""
+        data = {"type": "door", "time": "2025-05-01 12:00:00", "client_id": "D-1", "data": "LOCK"}
+        from_json = payload.decode(T_SENSOR_PUBLISH, json.dumps(data).encode())
+        from_compact = payload.decode(T_SENSOR_PUBLISH_COMPACT, compact.encode(data))
+        self.assertEqual(get_localtime(from_json["time"]), get_localtime(from_compact["time"]))
+        self.assertEqual(get_localtime(from_compact["time"]), "2025-05-01 17:30:00")
+
+    def test_micropython_codec(self):
+        """Test that the ESP32 encoder writes what the core decodes"""
+        sys.path.insert(0, ESP32_COMPACT)
+        try:
+            import compact as esp32_compact
+        finally:
+            sys.path.remove(ESP32_COMPACT)
+            sys.modules.pop('compact', None)
+        data = {"type": "light", "time": "2025-05-01 12:00:00", "client_id": "L-21.09-0001", "data": 3,
+                "power": '0'}
+        self.assertEqual(esp32_compact.encode(data), compact.encode(data))
+        batch = payload.batch('light', 'L-1', [{"time": "2025-05-01 12:00:00", "data": 0, "power": '0'},
+                                               {"time": "2025-05-01 12:00:01", "data": 24.37}])
+        self.assertEqual(compact.decode(esp32_compact.encode(batch))["readings"][1],
+                         {"time": 1746100801, "data": 24.37})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import json
+import unittest
+import os
+import sys
+
+# Add the src directory to the path so we can import the modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from sensor.groups import GroupFanout, category_group
+from sensor.topics import T_SENSOR_CTRL_PREFIX, T_SENSOR_GROUPS_REPORT
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeMessage:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+class FakeClient:
+    def __init__(self):
+        self.sent = []
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.sent.append((topic, json.loads(payload)))
+
+
+class TestGroupFanout(unittest.TestCase):
+    """Tests for the group commands and their fallback to per-module publishes."""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.fanout = GroupFanout(ack_timeout=30, clock=self.clock)
+        self.client = FakeClient()
+        self.lights = ["L-1", "L-2", "L-3"]
+
+    def report(self, client_id, groups):
+        payload = json.dumps({"groups": groups}).encode() if groups is not None else b''
+        return self.fanout.on_report(self.client, None, FakeMessage(f"{T_SENSOR_GROUPS_REPORT}/{client_id}", payload))
+
+    def test_fallback_without_reports(self):
+        """Test that modules that never reported get the command on their own topic"""
+        publishes = self.fanout.publish(self.client, category_group("light"), self.lights, {"state": "off"})
+        self.assertEqual(publishes, 3)
+        self.assertEqual(self.client.sent, [(f"{T_SENSOR_CTRL_PREFIX}/{cid}", {"state": "off"}) for cid in self.lights])
+
+    def test_group_publish(self):
+        """Test that one publish on the group topic replaces those of the modules subscribed to it"""
+        self.assertEqual(self.report("L-1", ["category/light"]), "L-1")
+        self.report("L-2", ["category/light", "living_room"])
+        publishes = self.fanout.publish(self.client, category_group("light"), self.lights, {"state": "on"})
+        self.assertEqual(publishes, 2)
+        self.assertEqual(self.client.sent, [("sensor/group/category/light", {"state": "on"}),
+                                            (f"{T_SENSOR_CTRL_PREFIX}/L-3", {"state": "on"})])
+
+        # Cleared retained report: back to the module's own topic
+        self.report("L-1", None)
+        self.assertIsNone(self.fanout.reported("L-1"))
+        self.assertEqual(self.fanout.publish(self.client, "living_room", ["L-1", "L-2"], {"state": "off"}), 2)
+        stats = self.fanout.stats()
+        self.assertEqual((stats['commands'], stats['publishes'], stats['group_publishes']), (2, 4, 2))
+
+    def test_ack_times(self):
+        """Test that a command is answered when its last module sent a reading, or times out"""
+        self.fanout.publish(self.client, category_group("light"), self.lights, {"state": "on"})
+        self.clock.now += 0.2
+        self.fanout.ack("L-1")
+        self.fanout.ack("L-2")
+        self.assertEqual(self.fanout.stats()['pending'], 1)
+        self.clock.now += 0.3
+        self.fanout.ack("L-3")
+        stats = self.fanout.stats()
+        self.assertEqual((stats['acked'], stats['pending']), (1, 0))
+        self.assertAlmostEqual(stats['last_ack_seconds'], 0.5)
+
+        self.fanout.publish(self.client, category_group("light"), self.lights, {"state": "off"})
+        self.fanout.ack("L-1")
+        self.clock.now += 31
+        stats = self.fanout.stats()
+        self.assertEqual((stats['acked'], stats['unacked'], stats['pending']), (1, 2, 0))
+
+    def test_sync(self):
+        """Test that modules that reported other user-defined groups are sent theirs"""
+        self.report("L-1", ["category/light", "kitchen"])
+        self.report("L-2", ["category/light", "living_room"])
+        sent = self.fanout.sync(self.client, {"L-1": ["living_room"], "L-2": ["living_room"], "L-3": ["hall"]})
+        # L-3 never reported, its firmware doesn't take the command
+        self.assertEqual(sent, ["L-1"])
+        self.assertEqual(self.client.sent, [(f"{T_SENSOR_CTRL_PREFIX}/L-1", {"groups": ["living_room"]})])
+        self.assertEqual(self.fanout.sync(self.client, {}, ["L-2"]), ["L-2"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+import sys
+import os
+
+# Get the absolute path to the directory containing this file
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Add the parent directory to the path so Python can find the test modules
+sys.path.insert(0, current_dir)
+
+# Import all test modules with absolute imports
+from test_mqtt import TestResilientClient, TestMQTTConnection
+from test_router import TestTopicRouter, TestTypeRouter
+
+def run_all_tests():
+    """Run all utils tests."""
+    # Create a test suite
+    test_suite = unittest.TestSuite()
+
+    # Add test cases from each module
+    test_suite.addTest(unittest.makeSuite(TestResilientClient))
+    test_suite.addTest(unittest.makeSuite(TestMQTTConnection))
+    test_suite.addTest(unittest.makeSuite(TestTopicRouter))
+    test_suite.addTest(unittest.makeSuite(TestTypeRouter))
+
+    # Create a test runner
+    test_runner = unittest.TextTestRunner(verbosity=2)
+
+    # Run the tests
+    result = test_runner.run(test_suite)
+
+    # Return the result
+    return result
+
+if __name__ == '__main__':
+    # Run all tests
+    result = run_all_tests()
+
+    # Exit with appropriate code
+    sys.exit(not result.wasSuccessful())
@@ -0,0 +1,158 @@
+import unittest
+import os
+import sys
+from unittest.mock import patch
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.reasoncodes import ReasonCode
+
+# Add the src directory to the path so we can import the modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from utils.mqtt import MQTTConnection, ResilientClient
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeInfo:
+    def __init__(self, rc):
+        self.rc = rc
+
+
+class TestResilientClient(unittest.TestCase):
+    """Tests for the resubscribing and the offline publish queue, without a broker."""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.client = ResilientClient("test_client", queue_size=3, max_age=60, clock=self.clock)
+        self.connected = False
+        self.sent = []
+        self.subscribed = []
+        patches = [
+            patch.object(ResilientClient, 'is_connected', lambda client: self.connected),
+            patch.object(mqtt.Client, 'publish', lambda client, *args, **kwargs: self.fake_publish(*args, **kwargs)),
+            patch.object(mqtt.Client, 'subscribe', lambda client, *args, **kwargs: self.fake_subscribe(*args, **kwargs)),
+            patch.object(mqtt.Client, 'unsubscribe', lambda client, topic, properties=None: (0, 1)),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def fake_publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        if not self.connected:
+            return FakeInfo(mqtt.MQTT_ERR_NO_CONN)
+        self.sent.append((topic, payload))
+        return FakeInfo(mqtt.MQTT_ERR_SUCCESS)
+
+    def fake_subscribe(self, topic, qos=0, options=None, properties=None):
+        self.subscribed.append(topic)
+        return (mqtt.MQTT_ERR_SUCCESS if self.connected else mqtt.MQTT_ERR_NO_CONN, 1)
+
+    def connect(self, reason="Success"):
+        self.connected = reason == "Success"
+        self.client.on_connect(self.client, None, None, ReasonCode(PacketTypes.CONNACK, reason), None)
+
+    def disconnect(self):
+        self.connected = False
+        self.client.on_disconnect(self.client, None, None, ReasonCode(PacketTypes.DISCONNECT, "Unspecified error"),
+                                  None)
+
+    def test_resubscribe_on_every_connect(self):
+        """Test that subscriptions made before and between connects are replayed, unsubscribed ones are not"""
+        self.client.subscribe("sensor/publish")
+        self.client.subscribe([("sensor/ctrl/a", 1), ("sensor/ctrl/b", 0)])
+        self.client.unsubscribe("sensor/ctrl/b")
+        self.connect()
+        self.assertEqual(self.subscribed[-1], [("sensor/publish", 0), ("sensor/ctrl/a", 1)])
+
+        self.disconnect()
+        self.connect()
+        self.assertEqual(self.subscribed[-1], [("sensor/publish", 0), ("sensor/ctrl/a", 1)])
+
+    def test_offline_queue(self):
+        """Test that publishes wait while disconnected, the oldest make room, and are sent in order"""
+        self.connect()
+        self.client.publish("t", "live")
+        self.disconnect()
+        for i in range(5):
+            self.assertIsNone(self.client.publish("t", str(i)))
+        self.assertEqual(self.sent, [("t", "live")])
+
+        self.connect()
+        self.assertEqual(self.sent, [("t", "live"), ("t", "2"), ("t", "3"), ("t", "4")])
+        stats = self.client.connection_stats()
+        self.assertEqual((stats['queued'], stats['dropped'], stats['replayed'], stats['offline']), (5, 2, 3, 0))
+
+    def test_expired_messages(self):
+        """Test that messages older than the maximum age are not sent after a long outage"""
+        self.client.publish("t", "old")
+        self.clock.now += 120
+        self.client.publish("t", "new")
+        self.connect()
+        self.assertEqual(self.sent, [("t", "new")])
+        self.assertEqual(self.client.stats['expired'], 1)
+
+    def test_qos_1_left_to_paho(self):
+        """Test that QoS 1 messages are not queued here, paho keeps them"""
+        self.client.publish("t", "kept by paho", qos=1)
+        self.assertEqual(self.client.connection_stats()['offline'], 0)
+
+    def test_time_to_recover(self):
+        """Test that reconnects are counted with the time from the disconnect"""
+        self.connect()
+        self.clock.now += 5
+        self.disconnect()
+        self.clock.now += 2
+        # Failed attempts in between don't restart the clock
+        self.client.on_connect_fail(self.client, None)
+        self.disconnect()
+        self.clock.now += 3
+        self.connect()
+        stats = self.client.connection_stats()
+        self.assertEqual((stats['connects'], stats['reconnects'], stats['disconnects']), (2, 1, 1))
+        self.assertEqual(stats['last_recover_seconds'], 5)
+        self.assertTrue(stats['connected'])
+
+    def test_refused_connect(self):
+        """Test that a refused connect is neither counted nor replays anything"""
+        self.client.subscribe("t")
+        subscribed = list(self.subscribed)
+        self.connect("Not authorized")
+        self.assertEqual(self.subscribed, subscribed)
+        self.assertEqual(self.client.stats['connects'], 0)
+
+
+class TestMQTTConnection(unittest.TestCase):
+    """Tests for the clients of a process."""
+
+    def setUp(self):
+        patches = [
+            patch.object(MQTTConnection, '_clients', {}),
+            patch.object(ResilientClient, 'connect_async'),
+            patch.object(ResilientClient, 'loop_start'),
+            patch('utils.mqtt.MQTT_PORT', '1883'),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_client_per_id(self):
+        """Test that each client_id gets its own client, which connects without waiting for the broker"""
+        core = MQTTConnection.get_client()
+        ui = MQTTConnection.get_client("central_main_ui")
+        self.assertIsNot(core, ui)
+        self.assertIs(MQTTConnection.get_client("central_main_ui"), ui)
+        self.assertEqual(ui._client_id, b"central_main_ui")
+        self.assertEqual(ResilientClient.connect_async.call_count, 2)
+        self.assertEqual(set(MQTTConnection.stats()), {"central_main", "central_main_ui"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import os
+import sys
+from types import SimpleNamespace
+
+# Add the src directory to the path so we can import the modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from utils.router import TopicRouter, TypeRouter
+
+
+def message(topic):
+    return SimpleNamespace(topic=topic, payload=b'{}')
+
+
+class TestTopicRouter(unittest.TestCase):
+    """Tests for the topic filters and the dispatch of messages."""
+
+    def setUp(self):
+        self.router = TopicRouter()
+        self.calls = []
+
+    def handler(self, name):
+        return lambda client, userdata, msg: self.calls.append((name, msg.topic))
+
+    def matches(self, topic):
+        return [route.key for route in self.router.match(topic)]
+
+    def test_wildcards(self):
+        """Test that + matches one level and # any number of levels, like the broker does"""
+        for topic_filter in ("sensor/publish", "sensor/update/+", "sensor/#", "+/update/#", "#"):
+            self.router.add(topic_filter, self.handler(topic_filter))
+        self.assertEqual(self.matches("sensor/publish"), ["sensor/publish", "sensor/#", "#"])
+        self.assertEqual(self.matches("sensor/update/LT-1"), ["sensor/update/+", "sensor/#", "+/update/#", "#"])
+        self.assertEqual(self.matches("sensor/update/LT-1/x"), ["sensor/#", "+/update/#", "#"])
+        self.assertEqual(self.matches("sensor"), ["sensor/#", "#"])
+        self.assertEqual(self.matches("central_main/control"), ["#"])
+        self.assertEqual(self.matches("$SYS/broker/uptime"), [])
+
+    def test_invalid_filters(self):
+        """Test that wildcards inside a level and # before the last level are refused"""
+        for topic_filter in ("sensor/up+", "sensor/#/x", "sensor#"):
+            with self.assertRaises(ValueError):
+                self.router.add(topic_filter, self.handler(topic_filter))
+
+    def test_dispatch_and_stats(self):
+        """Test that every matching handler runs, errors are counted and don't stop the others"""
+        @self.router.route("sensor/update/+")
+        def broken(client, userdata, msg):
+            raise KeyError('state')
+        self.router.add("sensor/#", self.handler("all"))
+
+        self.router.dispatch(None, None, message("sensor/update/LT-1"))
+        self.router.dispatch(None, None, message("sensor/update/LT-2"))
+        self.router.dispatch(None, None, message("other"))
+        self.assertEqual(self.calls, [("all", "sensor/update/LT-1"), ("all", "sensor/update/LT-2")])
+
+        stats = self.router.stats()
+        self.assertEqual(stats['unhandled'], 1)
+        self.assertEqual((stats['routes']['sensor/update/+']['calls'], stats['routes']['sensor/update/+']['errors']),
+                         (2, 2))
+        self.assertEqual(stats['routes']['sensor/#']['errors'], 0)
+
+    def test_cache(self):
+        """Test that a route added after a topic was seen is found for it"""
+        self.router.add("a/b", self.handler("exact"))
+        self.assertEqual(self.matches("a/b"), ["a/b"])
+        self.router.add("a/+", self.handler("wildcard"))
+        self.assertEqual(self.matches("a/b"), ["a/b", "a/+"])
+        # Adding a filter again replaces its handler
+        self.router.add("a/b", self.handler("replaced"))
+        self.router.dispatch(None, None, message("a/b"))
+        self.assertEqual(self.calls, [("replaced", "a/b"), ("wildcard", "a/b")])
+
+
+class TestTypeRouter(unittest.TestCase):
+    """Tests for the dispatch by module type."""
+
+    def test_dispatch(self):
+        """Test that registered types get their handler, the others the default one"""
+        router = TypeRouter("reading type", default=lambda value: ('stored', value))
+
+        @router.route('door', 'switch')
+        def state(value):
+            return ('state', value)
+
+        self.assertEqual(router.dispatch('door', 1), ('state', 1))
+        self.assertEqual(router.dispatch('radar', 2), ('stored', 2))
+        self.assertIn('switch', router)
+        self.assertEqual(router.stats()['routes']['*']['calls'], 1)
+
+    def test_unhandled(self):
+        """Test that types without a handler and without a default are counted"""
+        router = TypeRouter("module category")
+        self.assertIsNone(router.dispatch(None, 'data'))
+        self.assertEqual(router.stats(), {'routes': {}, 'unhandled': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
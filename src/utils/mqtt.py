@@ -1,7 +1,25 @@
+"""
+MQTT clients that survive broker restarts.
+
+MQTTConnection.get_client(client_id) gives each process one client per
+client_id. The client connects in the background: while the broker is down
+paho's network thread tries again after MQTT_RECONNECT_MIN_SECONDS, doubling
+the wait up to MQTT_RECONNECT_MAX_SECONDS.
+
+The broker forgets the subscriptions of a client when it reconnects (clean
+session), so every topic passed to subscribe is subscribed again on each
+connect. QoS 0 publishes made while disconnected wait in a queue of
+MQTT_OFFLINE_QUEUE_SIZE messages (the oldest make room) and are sent in order
+on the next connect, unless they are older than MQTT_OFFLINE_MAX_AGE_SECONDS:
+a light toggled during an outage shouldn't switch long after. paho keeps
+QoS 1 and 2 messages itself.
+"""
 import paho.mqtt.client as mqtt
 from utils.utils import *
 from utils.console import *
 from dotenv import load_dotenv
+from collections import deque
+from threading import Lock
 import os, time
 
 load_dotenv(dotenv_path='config/.env')
@@ -9,23 +27,148 @@ MQTT_USERNAME = os.getenv("MQTT_USERNAME")
 MQTT_PASSWORD = os.getenv("MQTT_PASSWORD")
 MQTT_PORT = os.getenv("MQTT_PORT")
 
+MQTT_RECONNECT_MIN_SECONDS = 1
+MQTT_RECONNECT_MAX_SECONDS = 60
+MQTT_OFFLINE_QUEUE_SIZE = 1000
+MQTT_OFFLINE_MAX_AGE_SECONDS = 300
+
+
+def _topic_qos(topic, qos):
+    """The (topic, qos) pairs of the topic argument of subscribe"""
+    if isinstance(topic, str):
+        return [(topic, qos)]
+    if isinstance(topic, tuple):
+        return [topic]
+    return list(topic)
+
+
+class ResilientClient(mqtt.Client):
+    """paho client that resubscribes on every connect and queues publishes while disconnected."""
+    def __init__(self, client_id, queue_size=MQTT_OFFLINE_QUEUE_SIZE, max_age=MQTT_OFFLINE_MAX_AGE_SECONDS,
+                 clock=time.monotonic):
+        super().__init__(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+        self._subscriptions = {}        # topic -> qos
+        self._offline = deque(maxlen=queue_size)
+        self._offline_lock = Lock()
+        self._max_age = max_age
+        self._clock = clock
+        self._disconnected_at = None
+        self._started_at = clock()
+        self.stats = {'connects': 0, 'reconnects': 0, 'disconnects': 0, 'connect_failures': 0,
+                      'queued': 0, 'replayed': 0, 'dropped': 0, 'expired': 0,
+                      'last_recover_seconds': None, 'max_recover_seconds': 0.0, 'connected': False}
+        self.on_connect = self._on_broker_connect
+        self.on_disconnect = self._on_broker_disconnect
+        self.on_connect_fail = self._on_broker_connect_fail
+        self.reconnect_delay_set(MQTT_RECONNECT_MIN_SECONDS, MQTT_RECONNECT_MAX_SECONDS)
+
+    def subscribe(self, topic, qos=0, options=None, properties=None):
+        with self._offline_lock:
+            for name, topic_qos in _topic_qos(topic, qos):
+                self._subscriptions[name] = topic_qos
+        # Not connected: subscribed on the next connect
+        return super().subscribe(topic, qos, options, properties)
+
+    def unsubscribe(self, topic, properties=None):
+        with self._offline_lock:
+            for name in ([topic] if isinstance(topic, str) else topic):
+                self._subscriptions.pop(name, None)
+        return super().unsubscribe(topic, properties)
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        """paho's publish, or None when the message was queued until the next connect"""
+        if qos == 0:
+            with self._offline_lock:
+                # Behind queued messages while they are being sent
+                if self._offline or not self.is_connected():
+                    self._queue(topic, payload, retain)
+                    return None
+                info = super().publish(topic, payload, qos, retain, properties)
+                if info.rc != mqtt.MQTT_ERR_NO_CONN:
+                    return info
+                self._queue(topic, payload, retain)
+                return None
+        return super().publish(topic, payload, qos, retain, properties)
+
+    def _queue(self, topic, payload, retain):
+        if len(self._offline) == self._offline.maxlen:
+            self.stats['dropped'] += 1
+        self._offline.append((self._clock(), topic, payload, retain))
+        self.stats['queued'] += 1
+
+    def _flush_offline(self):
+        with self._offline_lock:
+            now = self._clock()
+            while self._offline:
+                queued_at, topic, payload, retain = self._offline[0]
+                if now - queued_at > self._max_age:
+                    self._offline.popleft()
+                    self.stats['expired'] += 1
+                    continue
+                if super().publish(topic, payload, 0, retain).rc == mqtt.MQTT_ERR_NO_CONN:
+                    return
+                self._offline.popleft()
+                self.stats['replayed'] += 1
+
+    def _on_broker_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            print(f"{RED}MQTT connection refused: {reason_code}{RESET}")
+            return
+        now = self._clock()
+        self.stats['connects'] += 1
+        self.stats['connected'] = True
+        if self._disconnected_at is not None:
+            seconds = now - self._disconnected_at
+            self._disconnected_at = None
+            self.stats['reconnects'] += 1
+            self.stats['last_recover_seconds'] = seconds
+            self.stats['max_recover_seconds'] = max(self.stats['max_recover_seconds'], seconds)
+            print(f"MQTT reconnected after {seconds:.1f} s ({self.stats['reconnects']} reconnects)")
+        elif self.stats['connect_failures']:
+            print(f"MQTT connected after {now - self._started_at:.1f} s")
+        with self._offline_lock:
+            topics = list(self._subscriptions.items())
+        if topics:
+            super().subscribe(topics)
+        self._flush_offline()
+
+    def _on_broker_disconnect(self, client, userdata, flags, reason_code, properties):
+        self.stats['connected'] = False
+        if self._disconnected_at is None:
+            self._disconnected_at = self._clock()
+            self.stats['disconnects'] += 1
+            print(f"{RED}MQTT disconnected ({reason_code}), reconnecting{RESET}")
+
+    def _on_broker_connect_fail(self, client, userdata):
+        self.stats['connect_failures'] += 1
+        if self.stats['connect_failures'] == 1 and not self.stats['connects']:
+            print(f"{RED}MQTT service error{RESET}\nMake sure that mqtt broker is running, retrying in the background")
+
+    def connection_stats(self):
+        with self._offline_lock:
+            return dict(self.stats, offline=len(self._offline), subscriptions=len(self._subscriptions))
+
+
 class MQTTConnection:
-    _client = None
+    _clients = {}                   # client_id -> ResilientClient
+    _lock = Lock()
 
     @staticmethod
     def get_client(client_id="central_main"):
-        if MQTTConnection._client is None:
-            try:
-                MQTTConnection._client = mqtt.Client(client_id=client_id)  # Set your own ID
-                MQTTConnection._client.username_pw_set(str(MQTT_USERNAME), str(MQTT_PASSWORD))
-                MQTTConnection._client.connect(get_local_ip(), int(MQTT_PORT))
-                MQTTConnection._client.loop_start()                        # Run network loop in background
-            except Exception as e:
-                print(f"{RED}MQTT service error{RESET}\nMake sure that mqtt broker is running")
-                print("Press CTRL+C to quit")
-                try:
-                    while True:
-                        time.sleep(1)
-                except KeyboardInterrupt:
-                    exit()
-        return MQTTConnection._client
+        with MQTTConnection._lock:
+            client = MQTTConnection._clients.get(client_id)
+            if client is None:
+                client = ResilientClient(client_id)                        # Set your own ID
+                client.username_pw_set(str(MQTT_USERNAME), str(MQTT_PASSWORD))
+                # Doesn't wait for the broker, the network loop connects and reconnects
+                client.connect_async(get_local_ip(), int(MQTT_PORT))
+                client.loop_start()                                        # Run network loop in background
+                MQTTConnection._clients[client_id] = client
+        return client
+
+    @staticmethod
+    def stats():
+        """{client_id: connection stats} of this process's clients"""
+        with MQTTConnection._lock:
+            clients = dict(MQTTConnection._clients)
+        return {client_id: client.connection_stats() for client_id, client in clients.items()}
@@ -0,0 +1,219 @@
+"""
+Dispatch of MQTT messages and module types through lookup tables.
+
+TopicRouter maps topic filters to handlers the way the broker matches
+subscriptions: '+' stands for one topic level, '#' as the last level for
+any number of them, e.g. "sensor/update/+". Exact topics are a dict lookup,
+filters with wildcards are kept in a tree of topic levels, and the handlers
+found for a topic are cached, so a message costs one dict lookup once its
+topic has been seen.
+
+TypeRouter maps a key (the "type" of a reading, the category of a module)
+to one handler, with a default for the keys nobody registered.
+
+New device types plug in by registering a handler:
+
+    readings = TypeRouter("reading", default=store_reading)
+
+    @readings.route('door')
+    def door_reading(data, sensor_id): ...
+
+Both count the calls, errors and time of each route (stats()).
+"""
+import time
+from threading import Lock
+
+TOPIC_CACHE_SIZE = 4096
+
+
+class RouteStats:
+    """Calls, failed calls and time of one route."""
+    __slots__ = ('calls', 'errors', 'seconds', 'max_seconds')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    def add(self, seconds, failed):
+        self.calls += 1
+        self.errors += failed
+        self.seconds += seconds
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+
+    def snapshot(self):
+        return {'calls': self.calls, 'errors': self.errors, 'seconds': self.seconds,
+                'mean_ms': self.seconds / self.calls * 1000 if self.calls else 0.0,
+                'max_ms': self.max_seconds * 1000}
+
+
+class Route:
+    __slots__ = ('key', 'handler', 'stats')
+
+    def __init__(self, key, handler):
+        self.key = key
+        self.handler = handler
+        self.stats = RouteStats()
+
+    def __call__(self, *args):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = self.handler(*args)
+            failed = False
+            return result
+        finally:
+            self.stats.add(time.perf_counter() - start, failed)
+
+
+class TypeRouter:
+    """One handler per key, the default handler for the others."""
+    def __init__(self, name, default=None):
+        self.name = name
+        self._routes = {}
+        self._default = Route('*', default) if default is not None else None
+        self.unhandled = 0
+
+    def route(self, *keys):
+        """Decorator registering the handler for each of keys"""
+        def register(handler):
+            for key in keys:
+                self.add(key, handler)
+            return handler
+        return register
+
+    def add(self, key, handler):
+        self._routes[key] = Route(key, handler)
+
+    def __contains__(self, key):
+        return key in self._routes
+
+    def dispatch(self, key, *args):
+        """handler(*args) of key, None if no handler takes key"""
+        route = self._routes.get(key, self._default)
+        if route is None:
+            self.unhandled += 1
+            print(f"Unhandled {self.name}: {key}")
+            return None
+        return route(*args)
+
+    def stats(self):
+        routes = list(self._routes.values()) + ([self._default] if self._default else [])
+        return {'routes': {route.key: route.stats.snapshot() for route in routes}, 'unhandled': self.unhandled}
+
+
+class _Level:
+    """Node of the topic tree: the routes of the filters ending here, the next levels."""
+    __slots__ = ('children', 'routes', 'rest')
+
+    def __init__(self):
+        self.children = {}              # level or '+' -> _Level
+        self.routes = []
+        self.rest = []                  # routes of the filters ending in '#' here
+
+
+def _check_filter(topic_filter):
+    levels = topic_filter.split('/')
+    for i, level in enumerate(levels):
+        if ('+' in level and level != '+') or ('#' in level and (level != '#' or i != len(levels) - 1)):
+            raise ValueError(f"Invalid topic filter: {topic_filter}")
+    return levels
+
+
+class TopicRouter:
+    """Handlers of MQTT topic filters, dispatch is an on_message callback."""
+    def __init__(self, cache_size=TOPIC_CACHE_SIZE):
+        self._exact = {}                # topic -> Route
+        self._tree = _Level()
+        self._routes = {}               # topic filter -> Route, in the order they were added
+        self._cache = {}                # topic -> (Route, ...)
+        self._cache_size = cache_size
+        self._lock = Lock()
+        self.unhandled = 0
+
+    def route(self, *topic_filters):
+        """Decorator registering the handler for each of topic_filters"""
+        def register(handler):
+            for topic_filter in topic_filters:
+                self.add(topic_filter, handler)
+            return handler
+        return register
+
+    def add(self, topic_filter, handler):
+        """Handle the topics matching topic_filter with handler(client, userdata, msg), instead of its old handler"""
+        levels = _check_filter(topic_filter)
+        with self._lock:
+            route = self._routes.get(topic_filter)
+            if route is not None:
+                route.handler = handler
+                return route
+            route = self._routes[topic_filter] = Route(topic_filter, handler)
+            if '+' not in levels and '#' not in levels:
+                self._exact[topic_filter] = route
+            else:
+                node = self._tree
+                for level in levels:
+                    if level == '#':
+                        node.rest.append(route)
+                        break
+                    node = node.children.setdefault(level, _Level())
+                else:
+                    node.routes.append(route)
+            self._cache.clear()
+        return route
+
+    def match(self, topic):
+        """Routes of the filters matching topic, in the order they were added"""
+        routes = self._cache.get(topic)
+        if routes is not None:
+            return routes
+        with self._lock:
+            found = []
+            exact = self._exact.get(topic)
+            if exact is not None:
+                found.append(exact)
+            nodes = [self._tree]
+            for i, level in enumerate(topic.split('/')):
+                # Wildcards don't match the first level of the broker's own $SYS/... topics
+                wildcards = i > 0 or not level.startswith('$')
+                next_nodes = []
+                for node in nodes:
+                    if wildcards:
+                        found.extend(node.rest)
+                    child = node.children.get(level)
+                    if child is not None:
+                        next_nodes.append(child)
+                    child = node.children.get('+') if wildcards else None
+                    if child is not None:
+                        next_nodes.append(child)
+                nodes = next_nodes
+            for node in nodes:
+                # "a/#" matches "a" too
+                found.extend(node.routes)
+                found.extend(node.rest)
+            order = {route: i for i, route in enumerate(self._routes.values())}
+            routes = tuple(sorted(set(found), key=order.__getitem__))
+            if len(self._cache) >= self._cache_size:
+                self._cache.clear()
+            self._cache[topic] = routes
+        return routes
+
+    def dispatch(self, client, userdata, msg):
+        """on_message: every handler of msg.topic, an error in one doesn't stop the others"""
+        routes = self.match(msg.topic)
+        if not routes:
+            self.unhandled += 1
+            print(f"Unhandled topic: {msg.topic}")
+            return
+        for route in routes:
+            try:
+                route(client, userdata, msg)
+            except Exception as e:
+                print("Error dispatching message:", e)
+
+    def stats(self):
+        with self._lock:
+            routes = list(self._routes.values())
+        return {'routes': {route.key: route.stats.snapshot() for route in routes}, 'unhandled': self.unhandled}
@@ -1,11 +1,17 @@
 from datetime import datetime, timedelta
 import socket
+import time
+
+# Sri Lanka timezone
+LOCAL_UTC_OFFSET = timedelta(hours=5, minutes=30)
 
 def get_localtime(utc_time_str):
+    # Compact messages carry seconds since the epoch, nothing to parse
+    if isinstance(utc_time_str, (int, float)):
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(utc_time_str + LOCAL_UTC_OFFSET.total_seconds()))
     # Parse the UTC time string
     utc_time = datetime.strptime(utc_time_str, "%Y-%m-%d %H:%M:%S")
-    # Add 5 hours 30 minutes for Sri Lanka timezone
-    local_time = utc_time + timedelta(hours=5, minutes=30)
+    local_time = utc_time + LOCAL_UTC_OFFSET
     local_time_str = local_time.strftime("%Y-%m-%d %H:%M:%S")
     return local_time_str
 
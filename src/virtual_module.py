@@ -2,6 +2,9 @@ from utils.mqtt import MQTTConnection
 from threading import Thread
 from database.database import *
 from sensor.topics import *
+from utils.router import TopicRouter, TypeRouter
+from sensor.payload import batch
+from sensor.groups import category_group, group_topic
 from utils.console import *
 from datetime import datetime
 import ast, json
@@ -16,10 +19,83 @@ Light_Brightness = {}
 
 
 
+# Control topics of the virtual modules, and their answer by category
+router = TopicRouter()
+categories = {}                 # client_id -> category
+subscribers = {}                # group -> client_ids of the virtual modules in it
+responses = TypeRouter("module category", default=lambda client_id, _data: None)
+
+@responses.route('switch')
+def switch_response(client_id, _data):
+    if (_data['state'] == 'on'):
+        return random.randint(2, 40)
+    return 0
+
+@responses.route('light')
+def light_response(client_id, _data):
+    data_val = None
+    if 'state' in _data:
+        if (_data['state'] == 'on'):
+            if client_id in Light_Brightness:
+                data_val = Light_Brightness[client_id]
+            else:
+                data_val = Light_Brightness[client_id] = 3
+        else:
+            data_val = 0
+    elif 'irgb' in _data:
+        values = _data['irgb'].strip("()").split(",")
+        val = int(values[0])
+        if (val > 0):
+            Light_Brightness[client_id] = val
+            data_val = val
+        elif val == 0:
+            data_val = 0
+        print(f" --> Color changed to {_data['irgb']}, I {data_val}")
+    return data_val
+
+@responses.route('door')
+def door_response(client_id, _data):
+    if _data['state'] == "lock":
+        return "LOCK"
+    return "UNLOCK"
+
+@responses.route('temp')
+def temp_response(client_id, _data):
+    return _data['value']
+
 def on_message(client, userdata, msg):
     print(f"{BLUE}\n --> Received message from {msg.topic}: {msg.payload.decode()}")
+    router.dispatch(client, userdata, msg)
 
+@router.route(f"{T_SENSOR_CTRL_PREFIX}/+")
+def ctrl_handler(client, userdata, msg):
     client_id = msg.topic.split('/')[2]
+    _data = ast.literal_eval(msg.payload.decode())
+    if 'groups' in _data:
+        subscribe_groups(client_id, _data['groups'])
+    else:
+        respond(client, client_id, _data)
+
+@router.route(f"{T_SENSOR_GROUP_PREFIX}/#")
+def group_handler(client, userdata, msg):
+    group = msg.topic[len(T_SENSOR_GROUP_PREFIX) + 1:]
+    _data = ast.literal_eval(msg.payload.decode())
+    for client_id in list(subscribers.get(group, ())):
+        # A group command reaches the other categories of the group too
+        if _data.get('category', categories[client_id]) == categories[client_id]:
+            respond(client, client_id, _data)
+
+def subscribe_groups(client_id, groups):
+    # As the ESP32 modules do: the category group and the user-defined ones, then the retained report
+    for members in subscribers.values():
+        members.discard(client_id)
+    subscribed = [category_group(categories[client_id])] + list(groups)
+    for group in subscribed:
+        subscribers.setdefault(group, set()).add(client_id)
+        client.subscribe(group_topic(group))
+    client.publish(f"{T_SENSOR_GROUPS_REPORT}/{client_id}", json.dumps({"groups": subscribed}), retain=True)
+
+def respond(client, client_id, _data):
     # Current time
     timestamp = datetime.now()
 
@@ -29,57 +105,8 @@ def on_message(client, userdata, msg):
     # Format to string if needed
     formatted = adjusted_time.strftime("%Y-%m-%d %H:%M:%S")
 
-    S_TYPE = None
-    for mod in modules:
-        if mod['client_id'] == client_id:
-            S_TYPE = mod['category']
-    _data = ast.literal_eval(msg.payload.decode())
-    data_val = None
-
-    if S_TYPE == 'switch':
-        if (_data['state'] == 'on'):
-            data_val = random.randint(2, 40)
-        else:
-            data_val = 0
-    elif S_TYPE == 'light':
-        if 'state' in _data:
-            if (_data['state'] == 'on'):
-                if client_id in Light_Brightness:
-                    data_val = Light_Brightness[client_id]
-                else:
-                    data_val = Light_Brightness[client_id] = 3
-            else:
-                data_val = 0
-        elif 'irgb' in _data:
-            values = _data['irgb'].strip("()").split(",")
-            val = int(values[0])
-            if (val > 0):
-                Light_Brightness[client_id] = val
-                data_val = val
-            elif val == 0:
-                data_val = 0
-            print(f" --> Color changed to {_data['irgb']}, I {data_val}")
-
-        data = {
-                "type": S_TYPE,
-                "time": formatted,
-                'client_id': client_id,
-                "data": data_val,
-                "power": data_val * random.randint(8, 11)
-        }
-        
-        client.publish(T_SENSOR_PUBLISH, json.dumps(data))
-        print(f'{RESET}')
-        return
-    
-    elif S_TYPE == 'door':
-        if _data['state'] == "lock":
-            data_val = "LOCK"
-        else:
-            data_val = "UNLOCK"
-
-    elif S_TYPE == 'temp':
-        data_val = _data['value']
+    S_TYPE = categories.get(client_id)
+    data_val = responses.dispatch(S_TYPE, client_id, _data)
 
     data = {
             "type": S_TYPE,
@@ -87,19 +114,21 @@ def on_message(client, userdata, msg):
             'client_id': client_id,
             "data": data_val
     }
-    
+    if S_TYPE == 'light':
+        data["power"] = data_val * random.randint(8, 11)
+
     client.publish(T_SENSOR_PUBLISH, json.dumps(data))
     print(f'{RESET}')
 
 def load_modules():
     global modules
-    modules = db_get_available_all_modules()
     # Exclusions
+    modules = [module for module in db_get_available_all_modules() if module['client_id'] not in Exclusions]
+    module_groups = db_get_module_groups()
     for module in modules:
-        if module['client_id'] in Exclusions:
-            modules.remove(module)
-        else:
-            client.subscribe(f"{T_SENSOR_CTRL_PREFIX}/{module['client_id']}")
+        categories[module['client_id']] = module['category']
+        client.subscribe(f"{T_SENSOR_CTRL_PREFIX}/{module['client_id']}")
+        subscribe_groups(module['client_id'], module_groups.get(module['client_id'], []))
     client.on_message = on_message
 
 def main_page():
@@ -134,26 +163,34 @@ def update_page(modIndex):
     print(f"\nSelected sensor\nName : {name}\nCategory : {category}\nvalue : {last_val}")
   
     try:
-        print(f"\n{RESET}Set new value (type exit to terminate): ", end='')
-        _input = int(input())
+        # Several values (e.g. 1,2,3) are sent as one batch message, a second apart
+        print(f"\n{RESET}Set new value, or values separated by commas (type exit to terminate): ", end='')
+        _input = [int(value) for value in input().split(',')]
 
         if (str(_input).upper() == 'EXIT'):
             return -1
         
-        if (0 <=  _input and _input < 5000):
+        if all(0 <=  value and value < 5000 for value in _input):
             timestamp = datetime.now()
 
             # Subtract 5 hours and 30 minutes
             adjusted_time = timestamp - timedelta(hours=5, minutes=30)
 
-            # Format to string if needed
-            formatted = adjusted_time.strftime("%Y-%m-%d %H:%M:%S")
-            data = {
-                    "type": category,
-                    "time": formatted,
-                    'client_id': client_id,
-                    "data": _input
-            }
+            readings = []
+            for i, value in enumerate(_input):
+                # Format to string if needed
+                formatted = (adjusted_time - timedelta(seconds=len(_input) - 1 - i)).strftime("%Y-%m-%d %H:%M:%S")
+                readings.append({"time": formatted, "data": value})
+
+            if len(readings) == 1:
+                data = {
+                        "type": category,
+                        "time": readings[0]["time"],
+                        'client_id': client_id,
+                        "data": readings[0]["data"]
+                }
+            else:
+                data = batch(category, client_id, readings)
 
             client.publish(T_SENSOR_PUBLISH, json.dumps(data))
             time.sleep(2)
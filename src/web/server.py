@@ -1,6 +1,7 @@
 from flask import Flask, jsonify, render_template, request, make_response
 from flask import request, redirect, url_for
 from database.database import *
+from database import metrics
 from sensor.topics import *
 import json
 from dotenv import load_dotenv
@@ -52,6 +53,14 @@ def jwt_required(f):
     return decorated_function
 
 
+def notify_modules_changed():
+    # Let the core drop its cached module registry
+    try:
+        client.publish(T_MODULES_CHANGED, json.dumps({'source': 'web'}))
+    except Exception as e:
+        print(f"Failed to announce module change: {e}")
+
+
 @app.route('/')
 def login_page1():
     return render_template('login.html')
@@ -130,6 +139,7 @@ def assign_module():
         result = db_assign_module(client_id, name)
         # Respond with the result
         if result > 0:
+            notify_modules_changed()
             return jsonify({'message': 'Sensor name updated successfully.'}), 200
         else:
             return jsonify({'error': 'No sensor found with the given client_id.'}), 404
@@ -155,6 +165,7 @@ def replace_module():
 
         # Respond with the result
         if result > 0:
+            notify_modules_changed()
             return jsonify({'message': 'Sensor client_id updated successfully.'}), 200
         else:
             return jsonify({'error': 'No sensor found with the given client_id.'}), 404
@@ -181,6 +192,7 @@ def delete_module():
 
         # Respond with the result
         if result > 0:
+            notify_modules_changed()
             return jsonify({'message': 'Sensor client_id updated successfully.'}), 200
         else:
             return jsonify({'error': 'No sensor found with the given client_id.'}), 404
@@ -218,6 +230,50 @@ def toggle_module():
 
     
 
+@app.route('/api/groups', methods=['GET'])
+@jwt_required
+def get_groups():
+    try:
+        return jsonify(db_get_module_groups())
+    except DatabaseError:
+        return jsonify({"error": "DatabaseError: Please reinstall database"}), 500
+
+@app.route('/api/set-module-groups', methods=['POST'])
+@jwt_required
+def set_module_groups():
+    # Get the JSON data from the POST request
+    data = request.get_json()
+
+    # Ensure that the data contains the expected fields
+    if not data or 'client_id' not in data or not isinstance(data.get('groups'), list):
+        return jsonify({'error': 'Missing required fields'}), 400
+
+    try:
+        groups = db_set_module_groups(str(data['client_id']), data['groups'])
+        # The core tells the module which group topics to subscribe to
+        notify_modules_changed()
+        return jsonify({'message': 'Module groups updated.', 'groups': groups}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except DatabaseError:
+        return jsonify({"error": "DatabaseError: Please reinstall database"}), 500
+
+@app.route('/api/toggle-group', methods=['POST'])
+@jwt_required
+def toggle_group():
+    # Get the JSON data from the POST request
+    data = request.get_json()
+
+    # Ensure that the data contains the expected fields
+    if not data or 'group' not in data or 'category' not in data or 'state' not in data:
+        return jsonify({'error': 'Missing required fields'}), 400
+
+    # A batch command ("ALL_LIGHT") limited to the modules of the group
+    name = f"ALL_{str(data['category']).upper()}"
+    client.publish(T_SENSOR_MAIN_CTRL, json.dumps({'name': name, 'group': str(data['group']),
+                                                   'state': str(data['state'])}))
+    return jsonify({'message': 'Group Updated.'}), 200
+
 @app.route('/api/set-color', methods=['POST'])
 @jwt_required
 def set_color():
@@ -282,6 +338,14 @@ def set_temp():
 def live_cam():
     return render_template('camera.html')
 
+@app.route('/api/db-metrics', methods=['GET'])
+@jwt_required
+def get_db_metrics():
+    # Call counts, timings and slow queries of the db_* functions, per process
+    snapshots = metrics.read_exports(DB_NAME)
+    snapshots['web'] = metrics.snapshot()
+    return jsonify(snapshots)
+
 @app.route('/api/camera_url')
 @jwt_required
 def get_camera_url():